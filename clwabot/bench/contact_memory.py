@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Benchmark de memoria de los contactos: dict anidado vs `ContactRecord`.
+
+Uso:
+  python3 -m clwabot.bench.contact_memory
+  python3 -m clwabot.bench.contact_memory --sizes 1000,10000 --messages 10
+
+Por cada tamaño arma N contactos con el layout de antes (dict con `stats` y
+`last_messages` como dicts con timestamp ISO) y con `ContactRecord`, y mide
+con `tracemalloc` la memoria que ocupan. También compara el tamaño en disco
+(`state.json` indentado de antes vs arreglos compactos) y cuánto cuesta cargar
+el archivo y leer un contacto con `ContactTable` (a pedido).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from clwabot.core.contact_record import ContactRecord, ContactTable
+from clwabot.core.persist import dumps
+
+_BASE = datetime(2026, 2, 22, 12, 0, tzinfo=timezone.utc)
+
+
+def _msisdn(idx: int) -> str:
+    return f"+569{idx:08d}"
+
+
+def build_legacy(contacts: int, messages: int) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for idx in range(contacts):
+        msisdn = _msisdn(idx)
+        out[msisdn] = {
+            "name": "",
+            "priority": "normal",
+            "last_seen_at": (_BASE + timedelta(seconds=idx, microseconds=idx % 999_999)).isoformat(),
+            "last_intent": "meeting" if idx % 3 else "general",
+            "last_messages": [
+                {
+                    "at": (_BASE + timedelta(seconds=idx + n, microseconds=n)).isoformat(),
+                    "text": f"mensaje {n} de {msisdn}",
+                }
+                for n in range(messages)
+            ],
+            "tags": [],
+            "stats": {"inbound": messages, "auto_replies": 0},
+        }
+    return out
+
+
+def build_records(contacts: int, messages: int) -> Dict[str, ContactRecord]:
+    out = {}
+    base = int(_BASE.timestamp())
+    for idx in range(contacts):
+        msisdn = _msisdn(idx)
+        record = ContactRecord()
+        record.last_seen = base + idx
+        record.intent = "meeting" if idx % 3 else "general"
+        record.inbound = messages
+        for n in range(messages):
+            record.push_message(base + idx + n, f"mensaje {n} de {msisdn}")
+        out[msisdn] = record
+    return out
+
+
+def measure(build: Callable[[], Any]) -> "tuple[Any, int]":
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return obj, size
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de memoria de contactos")
+    parser.add_argument("--sizes", default="10000,100000", help="cantidades de contactos, separadas por coma")
+    parser.add_argument("--messages", type=int, default=10, help="mensajes en el historial de cada contacto")
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'contactos':>10} | {'dict MB':>8} | {'record MB':>9} | {'ahorro':>6}"
+        f" | {'json antes MB':>13} | {'compacto MB':>11} | {'carga+1 contacto ms':>19}"
+    )
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        legacy, legacy_mem = measure(lambda: build_legacy(size, args.messages))
+        legacy_bytes = len(json.dumps({"contacts": legacy}, ensure_ascii=False, indent=2).encode("utf-8"))
+        del legacy
+        records, record_mem = measure(lambda: build_records(size, args.messages))
+        compact = dumps({"contacts": records}, indent=None)
+        del records
+
+        start = time.perf_counter()
+        table = ContactTable(json.loads(compact)["contacts"])
+        table[_msisdn(size // 2)].inbound += 1
+        load_ms = (time.perf_counter() - start) * 1000
+
+        print(
+            f"{size:>10,} | {legacy_mem / 1e6:>8.1f} | {record_mem / 1e6:>9.1f} | {1 - record_mem / legacy_mem:>6.0%}"
+            f" | {legacy_bytes / 1e6:>13.1f} | {len(compact) / 1e6:>11.1f} | {load_ms:>19.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
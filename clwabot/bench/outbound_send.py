@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Benchmark de envíos: conexión persistente al gateway vs proceso por envío.
+
+Uso:
+  python3 -m clwabot.bench.outbound_send
+  python3 -m clwabot.bench.outbound_send --messages 500 --spawn 20
+
+Los envíos van al gateway de prueba (`gateway_stub`), así que mide el costo
+del transporte, no el de WhatsApp. La referencia "proceso por envío" lanza un
+`python3 -c pass` por mensaje: es un piso optimista del camino CLI (el
+`node openclaw.mjs` real arranca bastante más lento).
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+from typing import Optional
+
+from clwabot.hooks.gateway_client import GatewayClient
+from clwabot.hooks.gateway_stub import StubGateway
+
+
+def bench_gateway(messages: int) -> float:
+    stub = StubGateway().start()
+    client = GatewayClient(stub.url)
+    try:
+        start = time.perf_counter()
+        for idx in range(messages):
+            client.send_message("+56911111111", f"mensaje {idx}")
+        elapsed = time.perf_counter() - start
+    finally:
+        client.close()
+        stub.close()
+    return elapsed / messages
+
+
+def bench_spawn(messages: int) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        subprocess.run([sys.executable, "-c", "pass"], check=False)
+    return (time.perf_counter() - start) / messages
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de transporte outbound")
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--spawn", type=int, default=10, help="envíos de referencia con proceso por envío")
+    args = parser.parse_args(argv)
+
+    per_gateway = bench_gateway(max(1, args.messages))
+    per_spawn = bench_spawn(max(1, args.spawn))
+    print(f"gateway persistente : {per_gateway * 1000:8.2f} ms/envío  ({1 / per_gateway:,.0f} envíos/s)")
+    print(f"proceso por envío   : {per_spawn * 1000:8.2f} ms/envío  (piso, sin node)")
+    print(f"speedup             : {per_spawn / per_gateway:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Micro-benchmark del parser de líneas del router (líneas/segundo).
+
+Uso:
+  python3 -m clwabot.bench.router_parse
+  python3 -m clwabot.bench.router_parse --corpus /ruta/openclaw.log --repeat 50
+
+Compara el camino actual (pre-filtro por bytes + parse único) contra el
+camino previo (json.loads de toda línea `{...}` + lower() + 3 regex).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from clwabot.hooks.whatsapp_router_watch import parse_inbound_bytes
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / "corpus" / "openclaw_follow_sample.log"
+
+_FROM_RE = re.compile(r"from\s+(\+?\d{8,15})", re.IGNORECASE)
+_ANY_PHONE_RE = re.compile(r"(\+?\d{8,15})")
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+
+
+def _baseline_parse(raw: bytes) -> Optional[tuple[str, str]]:
+    """Réplica del parser anterior, solo como referencia de comparación."""
+    line = raw.decode("utf-8", errors="replace").strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        try:
+            payload = json.loads(line)
+        except Exception:
+            payload = None
+        if isinstance(payload, dict):
+            data = payload.get("1")
+            if isinstance(data, dict) and "inbound" in str(payload.get("2", "")).lower():
+                msisdn = str(data.get("from", "")).strip()
+                body = str(data.get("body", "")).strip()
+                if msisdn and body:
+                    return (msisdn, body)
+    lower = line.lower()
+    if "[whatsapp]" not in lower or "inbound" not in lower:
+        return None
+    m_from = _FROM_RE.search(line) or _ANY_PHONE_RE.search(line)
+    if not m_from:
+        return None
+    quoted = _QUOTED_RE.findall(line)
+    return (m_from.group(1), quoted[-1] if quoted else line)
+
+
+def load_corpus(path: Path) -> list[bytes]:
+    return path.read_bytes().splitlines(keepends=True)
+
+
+def bench(parse: Callable[[bytes], object], lines: list[bytes], repeat: int) -> tuple[float, int]:
+    hits = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in lines:
+            if parse(raw) is not None:
+                hits += 1
+    elapsed = time.perf_counter() - start
+    return (len(lines) * repeat) / elapsed if elapsed > 0 else 0.0, hits // max(1, repeat)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del parser del router")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    lines = load_corpus(args.corpus)
+    repeat = max(1, args.repeat)
+    current_lps, current_hits = bench(parse_inbound_bytes, lines, repeat)
+    baseline_lps, baseline_hits = bench(_baseline_parse, lines, repeat)
+
+    print(f"corpus: {args.corpus} ({len(lines)} líneas x {repeat})")
+    print(f"baseline  : {baseline_lps:>12,.0f} líneas/s  inbound={baseline_hits}")
+    print(f"prefiltro : {current_lps:>12,.0f} líneas/s  inbound={current_hits}")
+    if baseline_lps > 0:
+        print(f"speedup   : {current_lps / baseline_lps:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Benchmark del estado: `state.json` vs sqlite, costo por mensaje inbound.
+
+Uso:
+  python3 -m clwabot.bench.state_backend
+  python3 -m clwabot.bench.state_backend --sizes 100,10000 --messages 500
+
+Por cada tamaño arma un estado con N contactos (3 mensajes cada uno) y mide
+lo que hace `handle_incoming` con el estado para un contacto al azar:
+`load_state`, `append_contact_message`, `set_contact_intent`,
+`add_metric_event` y `save_state` (el evento va al log de métricas). Todo en
+un directorio temporal; `data/` no se toca.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from clwabot.core import metrics_log, state_store
+from clwabot.core.state_db import close_state_db, open_state_db
+
+
+def build_state(contacts: int) -> dict:
+    state = state_store.default_state()
+    for idx in range(contacts):
+        msisdn = f"+569{idx:08d}"
+        contact = state_store.ensure_contact(state, msisdn)
+        contact["last_seen_at"] = "2026-02-22T12:00:00+00:00"
+        contact["last_messages"] = [
+            {"at": "2026-02-22T12:00:00+00:00", "text": f"mensaje {n} de {msisdn}"} for n in range(3)
+        ]
+        contact["stats"]["inbound"] = 3
+    return state
+
+
+@contextmanager
+def backend(name: str, base: Path) -> Iterator[None]:
+    saved = (state_store.STATE_BACKEND, state_store.STATE_PATH, state_store.STATE_DB_PATH, metrics_log.METRICS_DIR)
+    state_store.STATE_BACKEND = name
+    state_store.STATE_PATH = base / "state.json"
+    state_store.STATE_DB_PATH = base / "state.sqlite3"
+    metrics_log.METRICS_DIR = base / "metrics"
+    try:
+        yield
+    finally:
+        (
+            state_store.STATE_BACKEND,
+            state_store.STATE_PATH,
+            state_store.STATE_DB_PATH,
+            metrics_log.METRICS_DIR,
+        ) = saved
+
+
+def one_message(msisdn: str) -> None:
+    state = state_store.load_state()
+    state_store.append_contact_message(state, msisdn, "hola, ¿podemos agendar?")
+    state_store.set_contact_intent(state, msisdn, "meeting")
+    state_store.add_metric_event(state, {"kind": "inbound", "msisdn": msisdn, "intent": "meeting"})
+    state_store.save_state(state)
+
+
+def bench(contacts: int, messages: int, rng: random.Random) -> float:
+    start = time.perf_counter()
+    for _ in range(messages):
+        one_message(f"+569{rng.randrange(max(1, contacts)):08d}")
+    return (time.perf_counter() - start) / messages
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de backends de estado")
+    parser.add_argument("--sizes", default="100,10000,100000", help="cantidades de contactos, separadas por coma")
+    parser.add_argument("--messages", type=int, default=200, help="mensajes medidos por backend (sqlite)")
+    parser.add_argument(
+        "--json-budget", type=int, default=200_000, help="contactos x mensajes para JSON (acota el caso grande)"
+    )
+    args = parser.parse_args(argv)
+    rng = random.Random(7)
+
+    print(f"{'contactos':>10} | {'json ms/msg':>12} | {'sqlite ms/msg':>13} | {'speedup':>8} | tamaño json / sqlite")
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        seed = build_state(size)
+        with tempfile.TemporaryDirectory(prefix="clwabot-bench-") as tmp:
+            base = Path(tmp)
+            # Copias: cada escritura versionada marca `_version` en el doc que recibe.
+            state_store._write_state(base / "state.json", dict(seed))
+            json_size = (base / "state.json").stat().st_size
+
+            with backend("json", base):
+                json_messages = max(3, min(args.messages, args.json_budget // max(1, size)))
+                per_json = bench(size, json_messages, rng)
+
+            # Migración única (no entra en la medición).
+            (base / "state.json").unlink()
+            state_store._write_state(base / "state.json", dict(seed))
+            with backend("sqlite", base):
+                open_state_db(base / "state.sqlite3").migrate_once(base / "state.json", state_store._read_state)
+                per_sqlite = bench(size, max(1, args.messages), rng)
+                close_state_db(base / "state.sqlite3")
+            db_size = (base / "state.sqlite3").stat().st_size
+
+        print(
+            f"{size:>10,} | {per_json * 1000:>12.2f} | {per_sqlite * 1000:>13.3f} | {per_json / per_sqlite:>7.0f}x"
+            f" | {json_size / 1e6:.1f} MB / {db_size / 1e6:.1f} MB"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Micro-benchmark del render de respuestas (µs por mensaje).
+
+Uso:
+  python3 -m clwabot.bench.templates_render
+  python3 -m clwabot.bench.templates_render --repeat 20000
+
+Compara el registro de plantillas precompiladas (`core.templates`) contra el
+camino previo: releer `scripts.yaml` y armar el string en cada llamada.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, Optional
+
+import yaml
+
+from clwabot.core.templates import SCRIPTS_PATH, TemplateRegistry
+
+_SUMMARY = {
+    "topic": "Revisión de propuesta comercial",
+    "date_text": "lunes",
+    "time_text": "10:30",
+    "duration_text": "1 hora",
+    "mode_text": "videollamada",
+}
+
+
+def _baseline_intro() -> str:
+    """Réplica del `_intro_message` anterior, solo como referencia."""
+    scripts = yaml.safe_load(SCRIPTS_PATH.read_text(encoding="utf-8")) or {}
+    identity = scripts.get("identity", {})
+    meeting_script = scripts.get("scripts", {}).get("meeting_request", "").strip()
+    base = (
+        f"Hola 👋 Soy {identity.get('agent_name', 'asistente')}, asistente de {identity.get('user_name', 'Lucas')}.\n"
+        "Te ayudo a agendar una reunión en formato rápido.\n\n"
+        "Ejemplo de respuesta para tema:\n"
+        "Revisión de propuesta comercial\n\n"
+        "Primero: ¿cuál es el tema de la reunión?"
+    )
+    return f"{base}\n\nReferencia:\n{meeting_script}" if meeting_script else base
+
+
+def _baseline_script() -> str:
+    scripts = yaml.safe_load(SCRIPTS_PATH.read_text(encoding="utf-8")) or {}
+    return scripts.get("scripts", {}).get("tech_help", "")
+
+
+def _baseline_summary() -> str:
+    s = _SUMMARY
+    return (
+        "Perfecto, este es el borrador de la reunión:\n"
+        f"- Tema: {s['topic']}\n"
+        f"- Fecha: {s['date_text']}\n"
+        f"- Hora: {s['time_text']}\n"
+        f"- Duración: {s['duration_text']}\n"
+        f"- Modalidad: {s['mode_text']}\n\n"
+        "Responde:\n"
+        "1) Confirmar y agendar\n"
+        "2) Editar datos\n"
+        "o escribe 'cancelar'."
+    )
+
+
+def bench(fn: Callable[[], str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    return repeat / elapsed if elapsed > 0 else 0.0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del render de plantillas")
+    parser.add_argument("--repeat", type=int, default=5000)
+    args = parser.parse_args(argv)
+    repeat = max(1, args.repeat)
+
+    registry = TemplateRegistry()
+
+    def intro() -> str:
+        base = registry.render("meeting.intro")
+        script = registry.script("meeting_request").strip()
+        return f"{base}\n\nReferencia:\n{script}" if script else base
+
+    cases = [
+        ("intro reunión", _baseline_intro, intro, max(1, repeat // 10)),
+        ("guion auto_reply", _baseline_script, lambda: registry.script("tech_help"), max(1, repeat // 10)),
+        ("resumen reunión", _baseline_summary, lambda: registry.render_map("meeting.summary", _SUMMARY), repeat * 20),
+    ]
+    print(f"plantillas: {SCRIPTS_PATH}")
+    for label, baseline, current, n in cases:
+        if baseline() != current():
+            print(f"{label:<17}: ¡salida distinta al camino previo!")
+        baseline_us = 1e6 / bench(baseline, n)
+        current_us = 1e6 / bench(current, n)
+        print(f"{label:<17}: previo {baseline_us:>10,.2f} µs/msg  registro {current_us:>8,.2f} µs/msg")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
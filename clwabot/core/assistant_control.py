@@ -15,6 +15,7 @@ from .oscp_agent import (
     set_lab_status,
 )
 from .state_store import load_state, save_state
+from .unit_of_work import unit_of_work
 from .urgencia_session import get_active_session
 
 
@@ -40,11 +41,13 @@ def is_within_business_hours(state: dict) -> bool:
 
 
 def owner_status_text() -> str:
-    state = load_state()
-    assistant = state.get("assistant", {})
-    contacts = state.get("contacts", {})
-    active_urg = sum(1 for msisdn in contacts if get_active_session(msisdn) is not None)
-    active_meet = sum(1 for msisdn in contacts if get_active_meeting_session(msisdn) is not None)
+    # Un solo load por store aunque se consulte la sesión de cada contacto.
+    with unit_of_work():
+        state = load_state()
+        assistant = state.get("assistant", {})
+        contacts = state.get("contacts", {})
+        active_urg = sum(1 for msisdn in contacts if get_active_session(msisdn) is not None)
+        active_meet = sum(1 for msisdn in contacts if get_active_meeting_session(msisdn) is not None)
     return (
         "Estado asistente\n"
         f"- paused: {assistant.get('paused', False)}\n"
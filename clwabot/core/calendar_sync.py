@@ -1,25 +1,33 @@
 from __future__ import annotations
 
-import json
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
 from typing import Dict
 
+from .persist import read_json, verify_version, write_json
+from .unit_of_work import read_store, write_store
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 QUEUE_PATH = BASE_DIR / "data" / "google_calendar_queue.json"
 
 
 def queue_calendar_sync(payload: Dict[str, str]) -> None:
-    """Encola eventos para sync externo (Google Calendar u otro worker)."""
-    state = {"events": []}
-    if QUEUE_PATH.exists():
-        try:
-            state = json.loads(QUEUE_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            state = {"events": []}
+    """Encola eventos para sync externo (Google Calendar u otro worker).
 
+    Dentro de un unit of work la cola se escribe con el resto al commit (y se
+    descarta si el mensaje se reintenta).
+    """
+    state = read_store(QUEUE_PATH, partial(_read_queue, QUEUE_PATH))
     state.setdefault("events", []).append(
         {"created_at": datetime.now(timezone.utc).isoformat(), "status": "pending", **payload}
     )
-    QUEUE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    QUEUE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_store(QUEUE_PATH, state, partial(_write_queue, QUEUE_PATH), verify=partial(verify_version, QUEUE_PATH))
+
+
+def _read_queue(path: Path) -> dict:
+    return read_json(path, lambda: {"events": []})
+
+
+def _write_queue(path: Path, state: dict) -> None:
+    write_json(path, state, versioned=True)
@@ -0,0 +1,389 @@
+"""Registro compacto de un contacto (`state["contacts"][msisdn]`).
+
+Antes cada contacto era un dict anidado (`stats` adentro, `last_messages` como
+lista de dicts con el timestamp ISO completo, recortada con `del msgs[:-10]`).
+Con decenas de miles de contactos eso pesa en memoria y en `state.json`.
+
+`ContactRecord` guarda lo mismo con `__slots__`:
+- timestamps como epoch (segundos, int),
+- historial en un ring buffer de `MESSAGE_HISTORY` pares `(epoch, texto)`
+  (epochs en un `array('q')`, sin un objeto por timestamp),
+- intent y prioridad como códigos chicos internados (`INTENTS`, `PRIORITIES`).
+
+En disco cada contacto es un arreglo (`pack()`/`unpack()`):
+
+  [name, priority, last_seen, intent, inbound, auto_replies, [[epoch, text], ...], tags?, extra?]
+
+donde intent/prioridad van como su código si son conocidos (o el string si
+no). `ContactTable` carga `state["contacts"]` a pedido: el JSON se parsea
+igual, pero un registro se arma solo cuando se pide ese msisdn y los que no se
+tocaron se vuelven a escribir tal cual.
+
+Compatibilidad: el registro también se usa como el dict de antes
+(`contact["stats"]["inbound"]`, `contact.get("priority")`,
+`contact["last_messages"]`, `update(...)`); `last_messages` y `last_seen_at`
+se devuelven con el formato ISO de siempre.
+"""
+
+from __future__ import annotations
+
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MESSAGE_HISTORY = 10
+
+# Orden fijo: el código en disco es el índice. Agregar siempre al final.
+INTENTS = ("", "general", "meeting", "urgency", "support", "sales", "personal")
+PRIORITIES = ("normal", "low", "high", "critical")
+
+_FIXED_KEYS = ("name", "priority", "last_seen_at", "last_intent", "last_messages", "tags", "stats")
+_COUNTERS = ("inbound", "auto_replies")
+
+
+class _Codes:
+    """Tabla de strings internados -> código int (conocidos primero, luego los nuevos)."""
+
+    def __init__(self, known: Tuple[str, ...]) -> None:
+        self.known = len(known)
+        self._values: List[str] = [sys.intern(v) for v in known]
+        self._codes: Dict[str, int] = {v: i for i, v in enumerate(self._values)}
+
+    def code(self, value: Any) -> int:
+        value = str(value or "")
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(sys.intern(value))
+        return code
+
+    def value(self, code: int) -> str:
+        return self._values[code]
+
+    def pack(self, code: int) -> Any:
+        # Los conocidos van como número; los demás como string (el código no es estable).
+        return code if code < self.known else self._values[code]
+
+    def unpack(self, raw: Any) -> int:
+        if isinstance(raw, int) and 0 <= raw < self.known:
+            return raw
+        return self.code(raw)
+
+
+_INTENTS = _Codes(INTENTS)
+_PRIORITIES = _Codes(PRIORITIES)
+
+
+def _epoch(value: Any) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        at = datetime.fromisoformat(str(value))
+    except ValueError:
+        return 0
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return int(at.timestamp())
+
+
+def _iso(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat() if epoch else ""
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Stats(MutableMapping):
+    """`contact["stats"]`: los contadores viven en el registro."""
+
+    __slots__ = ("_record",)
+
+    def __init__(self, record: "ContactRecord") -> None:
+        self._record = record
+
+    def _other(self) -> Dict[str, Any]:
+        extra = self._record.extra
+        return extra.get("stats", {}) if extra else {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _COUNTERS:
+            return getattr(self._record, key)
+        return self._other()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _COUNTERS:
+            setattr(self._record, key, _int(value))
+            return
+        self._record._extra().setdefault("stats", {})[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _COUNTERS:
+            setattr(self._record, key, 0)
+            return
+        del self._other()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _COUNTERS
+        yield from self._other()
+
+    def __len__(self) -> int:
+        return len(_COUNTERS) + len(self._other())
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class ContactRecord(MutableMapping):
+    __slots__ = (
+        "name",
+        "priority_code",
+        "last_seen",
+        "intent_code",
+        "inbound",
+        "auto_replies",
+        "tags",
+        "extra",
+        "_times",
+        "_texts",
+        "_head",
+    )
+
+    def __init__(self) -> None:
+        self.name = ""
+        self.priority_code = 0
+        self.last_seen = 0
+        self.intent_code = 0
+        self.inbound = 0
+        self.auto_replies = 0
+        self.tags: Optional[List[Any]] = None
+        self.extra: Optional[Dict[str, Any]] = None
+        # Ring buffer: crece hasta MESSAGE_HISTORY y después se sobrescribe en `_head`.
+        self._times: Optional[array] = None
+        self._texts: Optional[List[str]] = None
+        self._head = 0
+
+    # -- API compacta -----------------------------------------------------------
+
+    @property
+    def priority(self) -> str:
+        return _PRIORITIES.value(self.priority_code)
+
+    @priority.setter
+    def priority(self, value: str) -> None:
+        self.priority_code = _PRIORITIES.code(value)
+
+    @property
+    def intent(self) -> str:
+        return _INTENTS.value(self.intent_code)
+
+    @intent.setter
+    def intent(self, value: str) -> None:
+        self.intent_code = _INTENTS.code(value)
+
+    def push_message(self, epoch: int, text: str) -> None:
+        if self._times is None or self._texts is None:
+            self._times, self._texts = array("q", [epoch]), [text]
+        elif len(self._texts) < MESSAGE_HISTORY:
+            self._times.append(epoch)
+            self._texts.append(text)
+        else:
+            self._times[self._head] = epoch
+            self._texts[self._head] = text
+            self._head = (self._head + 1) % MESSAGE_HISTORY
+
+    def messages(self) -> List[Tuple[int, str]]:
+        """Historial del más antiguo al más nuevo."""
+        if self._times is None or self._texts is None:
+            return []
+        pairs = list(zip(self._times, self._texts))
+        return pairs[self._head:] + pairs[:self._head]
+
+    def set_messages(self, messages: Iterable[Tuple[int, str]]) -> None:
+        self._times, self._texts, self._head = None, None, 0
+        for epoch, text in list(messages)[-MESSAGE_HISTORY:]:
+            self.push_message(int(epoch), str(text))
+
+    def _extra(self) -> Dict[str, Any]:
+        if self.extra is None:
+            self.extra = {}
+        return self.extra
+
+    # -- serialización ----------------------------------------------------------
+
+    def pack(self) -> List[Any]:
+        out: List[Any] = [
+            self.name,
+            _PRIORITIES.pack(self.priority_code),
+            self.last_seen,
+            _INTENTS.pack(self.intent_code),
+            self.inbound,
+            self.auto_replies,
+            [[epoch, text] for epoch, text in self.messages()],
+        ]
+        if self.tags or self.extra:
+            out.append(self.tags or [])
+        if self.extra:
+            out.append(self.extra)
+        return out
+
+    __json__ = pack
+
+    @classmethod
+    def unpack(cls, raw: List[Any]) -> "ContactRecord":
+        record = cls()
+        name, priority, last_seen, intent, inbound, auto_replies, messages = (list(raw) + [None] * 7)[:7]
+        record.name = str(name or "")
+        record.priority_code = _PRIORITIES.unpack(priority or 0)
+        record.last_seen = _int(last_seen)
+        record.intent_code = _INTENTS.unpack(intent or 0)
+        record.inbound = _int(inbound)
+        record.auto_replies = _int(auto_replies)
+        record.set_messages((m[0], m[1]) for m in messages or [] if isinstance(m, list) and len(m) == 2)
+        if len(raw) > 7 and raw[7]:
+            record.tags = list(raw[7])
+        if len(raw) > 8 and isinstance(raw[8], dict) and raw[8]:
+            record.extra = dict(raw[8])
+        return record
+
+    @classmethod
+    def from_dict(cls, contact: Mapping[str, Any]) -> "ContactRecord":
+        """Desde el formato dict de antes (o cualquier mapping con esas claves)."""
+        if isinstance(contact, ContactRecord):
+            return contact
+        record = cls()
+        record.update(contact)
+        return record
+
+    @classmethod
+    def load(cls, raw: Any) -> "ContactRecord":
+        if isinstance(raw, list):
+            return cls.unpack(raw)
+        if isinstance(raw, Mapping):
+            return cls.from_dict(raw)
+        return cls()
+
+    # -- vista dict (compatibilidad) -------------------------------------------
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "name":
+            return self.name
+        if key == "priority":
+            return self.priority
+        if key == "last_seen_at":
+            return _iso(self.last_seen)
+        if key == "last_intent":
+            return self.intent
+        if key == "last_messages":
+            # Copia: para agregar usar `push_message` (o asignar la lista completa).
+            return [{"at": _iso(epoch), "text": text} for epoch, text in self.messages()]
+        if key == "tags":
+            if self.tags is None:
+                self.tags = []
+            return self.tags
+        if key == "stats":
+            return _Stats(self)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key == "name":
+            self.name = str(value or "")
+        elif key == "priority":
+            self.priority = value
+        elif key == "last_seen_at":
+            self.last_seen = _epoch(value) if value else 0
+        elif key == "last_intent":
+            self.intent = value
+        elif key == "last_messages":
+            self.set_messages(
+                (_epoch(m.get("at", "")), str(m.get("text", ""))) for m in value or [] if isinstance(m, Mapping)
+            )
+        elif key == "tags":
+            self.tags = list(value or [])
+        elif key == "stats":
+            stats = dict(value or {})
+            for counter in _COUNTERS:
+                setattr(self, counter, _int(stats.pop(counter, 0)))
+            if stats:
+                self._extra()["stats"] = stats
+            elif self.extra:
+                self.extra.pop("stats", None)
+        else:
+            self._extra()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _FIXED_KEYS:
+            # Los campos fijos siempre existen: borrar vuelve al valor por defecto.
+            self[key] = {} if key == "stats" else ("normal" if key == "priority" else None)
+            return
+        if not self.extra or key not in self.extra:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _FIXED_KEYS
+        if self.extra:
+            yield from (key for key in self.extra if key != "stats")
+
+    def __len__(self) -> int:
+        return len(_FIXED_KEYS) + sum(1 for key in (self.extra or ()) if key != "stats")
+
+    def __repr__(self) -> str:
+        return f"ContactRecord({self.pack()!r})"
+
+
+class ContactTable(MutableMapping):
+    """`state["contacts"]` del backend JSON: cada registro se arma al pedirlo."""
+
+    __slots__ = ("_raw", "_loaded")
+
+    def __init__(self, raw: Optional[Dict[str, Any]] = None) -> None:
+        # msisdn -> entrada tal como vino del JSON (arreglo compacto o dict legacy).
+        self._raw: Dict[str, Any] = dict(raw or {})
+        self._loaded: Dict[str, ContactRecord] = {}
+
+    def __getitem__(self, msisdn: str) -> ContactRecord:
+        record = self._loaded.get(msisdn)
+        if record is None:
+            record = self._loaded[msisdn] = ContactRecord.load(self._raw[msisdn])
+        return record
+
+    def __setitem__(self, msisdn: str, contact: Any) -> None:
+        self._raw.setdefault(msisdn, None)
+        self._loaded[msisdn] = ContactRecord.load(contact)
+
+    def __delitem__(self, msisdn: str) -> None:
+        del self._raw[msisdn]
+        self._loaded.pop(msisdn, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._raw)
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def __contains__(self, msisdn: object) -> bool:
+        return msisdn in self._raw
+
+    def __repr__(self) -> str:
+        return f"<contacts: {len(self._raw)}, {len(self._loaded)} cargados>"
+
+    def __json__(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for msisdn, raw in self._raw.items():
+            record = self._loaded.get(msisdn)
+            if record is not None:
+                out[msisdn] = record.pack()
+            elif isinstance(raw, list):
+                # Sin tocar y ya compacto: tal cual.
+                out[msisdn] = raw
+            else:
+                out[msisdn] = ContactRecord.load(raw).pack()
+        return out
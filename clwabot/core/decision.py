@@ -0,0 +1,152 @@
+"""Decisión tipada de `handle_incoming` y sus envíos.
+
+`Decision` es inmutable y con `__slots__`: los delays son enteros y los
+envíos (`actions`) quedan calculados una sola vez al construirla, así el
+listener los despacha directo sin volver a parsear strings.
+
+Para código que todavía espera el dict de antes, `Decision` responde a
+`decision["policy"]` / `decision.get(...)` y `to_dict()` devuelve el formato
+legacy (delays como string). `as_decision()` hace el camino inverso.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+from typing import Any, Literal, Mapping, Union
+
+Policy = Literal["owner", "alert_owner", "reply_to_vip", "silence"]
+
+
+@dataclass(frozen=True, slots=True)
+class OutboundMessage:
+    target: str
+    message: str
+    role: str  # vip | owner | contact
+    ics_path: str = ""
+    delay_sec: int = 0
+    priority: int = 1
+
+
+@dataclass(frozen=True, slots=True)
+class Decision:
+    """Qué hacer con un inbound.
+
+    - policy: "owner" (responde el agente normal), "reply_to_vip" (mensaje al
+      VIP/contacto, alerta opcional al owner), "alert_owner" o "silence".
+    - target_msisdn: destinatario de `message`.
+    - owner_message: texto adicional SOLO para el owner.
+    - severity: severidad de la urgencia VIP cuando aplica.
+    - actions: envíos ya planificados (inmediatos y diferidos).
+    """
+
+    policy: Policy = "silence"
+    target_msisdn: str = ""
+    message: str = ""
+    owner_message: str = ""
+    vip_ics_path: str = ""
+    owner_ics_path: str = ""
+    owner_retry_message: str = ""
+    owner_retry_delay_sec: int = 0
+    followup_message: str = ""
+    followup_delay_sec: int = 0
+    severity: str = ""
+    actions: tuple[OutboundMessage, ...] = ()
+
+    @classmethod
+    def make(cls, owner_msisdn: str, vip_msisdn: str, **values: Any) -> "Decision":
+        """Construye la decisión y planifica sus envíos."""
+        decision = cls(**values)
+        object.__setattr__(decision, "actions", _plan(decision, owner_msisdn, vip_msisdn))
+        return decision
+
+    # -- compatibilidad con el dict legacy -----------------------------------
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _LEGACY_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _LEGACY_KEYS else default
+
+    def to_dict(self) -> dict[str, str]:
+        return {key: str(getattr(self, key)) for key in _LEGACY_KEYS}
+
+
+_LEGACY_KEYS = tuple(f.name for f in fields(Decision) if f.name != "actions")
+
+SILENCE = Decision()
+
+
+def delay_seconds(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def as_decision(
+    decision: Union[Decision, Mapping[str, Any]],
+    owner_msisdn: str,
+    vip_msisdn: str,
+) -> Decision:
+    """Acepta una `Decision` o el dict legacy de `handle_incoming`."""
+    if isinstance(decision, Decision):
+        return decision
+    values = {key: decision.get(key) or "" for key in _LEGACY_KEYS if key in decision}
+    values["policy"] = decision.get("policy") or "silence"
+    for key in ("owner_retry_delay_sec", "followup_delay_sec"):
+        values[key] = delay_seconds(decision.get(key))
+    return Decision.make(owner_msisdn, vip_msisdn, **values)
+
+
+def _role_for(target: str, owner_msisdn: str, vip_msisdn: str) -> str:
+    if target == owner_msisdn:
+        return "owner"
+    if target == vip_msisdn:
+        return "vip"
+    return "contact"
+
+
+def _plan(decision: Decision, owner_msisdn: str, vip_msisdn: str) -> tuple[OutboundMessage, ...]:
+    owner_alert_priority = 0 if decision.severity == "critical" else 1
+    plan: list[OutboundMessage] = []
+
+    if decision.policy == "reply_to_vip":
+        reply_target = decision.target_msisdn or vip_msisdn
+        role = _role_for(reply_target, owner_msisdn, vip_msisdn)
+        if decision.message:
+            plan.append(OutboundMessage(reply_target, decision.message, role, ics_path=decision.vip_ics_path))
+        if decision.owner_message:
+            # Cada destinatario con su adjunto; si es el mismo archivo el listener
+            # reusa el handle ya subido (caché por contenido).
+            plan.append(
+                OutboundMessage(
+                    owner_msisdn,
+                    decision.owner_message,
+                    "owner",
+                    ics_path=decision.owner_ics_path,
+                    priority=owner_alert_priority,
+                )
+            )
+        if decision.owner_retry_message and decision.owner_retry_delay_sec > 0:
+            plan.append(
+                OutboundMessage(
+                    owner_msisdn, decision.owner_retry_message, "owner", delay_sec=decision.owner_retry_delay_sec
+                )
+            )
+        if decision.followup_message and decision.followup_delay_sec > 0:
+            plan.append(
+                OutboundMessage(reply_target, decision.followup_message, role, delay_sec=decision.followup_delay_sec)
+            )
+    elif decision.policy == "alert_owner" and decision.owner_message:
+        plan.append(
+            OutboundMessage(
+                owner_msisdn,
+                decision.owner_message,
+                "owner",
+                ics_path=decision.owner_ics_path,
+                priority=owner_alert_priority,
+            )
+        )
+    return tuple(plan)
@@ -0,0 +1,109 @@
+"""Locks entre procesos para los archivos de `data/`.
+
+Varios procesos (listener, router, panel, scripts) hacen read-modify-write
+sobre los mismos JSON. `locked(path, ...)` toma un lock exclusivo `fcntl`
+(advisory) por archivo, sobre un `<archivo>.lock` al lado: el archivo de datos
+no sirve porque cada escritura lo reemplaza (`os.replace`) y el lock quedaría
+en el inodo viejo.
+
+Dentro de un proceso el lock es reentrante para el hilo que lo tiene y excluye
+a los demás hilos. Varios paths se toman siempre en orden, así dos procesos
+que piden los mismos archivos no se cruzan. Sin `fcntl` (Windows) solo queda
+la exclusión entre hilos.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - sin fcntl
+    fcntl = None  # type: ignore[assignment]
+
+LOCK_TIMEOUT_SECONDS = 30.0
+_POLL_SECONDS = 0.005
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+def lock_path(path: Path) -> Path:
+    return path.with_name(path.name + ".lock")
+
+
+class _FileLock:
+    def __init__(self, path: Path) -> None:
+        self.path = lock_path(path)
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.fd: Optional[int] = None
+
+    def acquire(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        if not self.thread_lock.acquire(timeout=timeout):
+            raise LockTimeout(f"lock de hilo para {self.path.name}")
+        try:
+            if self.depth == 0:
+                self._acquire_fd(deadline)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+        self.depth += 1
+
+    def _acquire_fd(self, deadline: float) -> None:
+        if fcntl is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(f"{self.path.name} tomado por otro proceso")
+                    time.sleep(_POLL_SECONDS)
+        except BaseException:
+            os.close(fd)
+            raise
+        self.fd = fd
+
+    def release(self) -> None:
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            # Cerrar el fd suelta el flock.
+            fd, self.fd = self.fd, None
+            os.close(fd)
+        self.thread_lock.release()
+
+
+_LOCKS: Dict[Path, _FileLock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def _lock_for(path: Path) -> _FileLock:
+    key = Path(os.path.abspath(path))
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(key)
+        if lock is None:
+            lock = _LOCKS[key] = _FileLock(key)
+        return lock
+
+
+@contextmanager
+def locked(*paths: Path, timeout: Optional[float] = None) -> Iterator[None]:
+    """Lock exclusivo de todos los `paths` (en orden de path) mientras dure el bloque."""
+    wait = LOCK_TIMEOUT_SECONDS if timeout is None else timeout
+    with ExitStack() as stack:
+        for lock in sorted({_lock_for(p) for p in paths}, key=lambda item: str(item.path)):
+            lock.acquire(wait)
+            stack.callback(lock.release)
+        yield
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""Journal append-only de inbound despachados, re-ejecutable por día.
+
+Cada inbound que el router despacha se agrega como una línea JSON a un
+segmento diario (`inbound-YYYY-MM-DD.jsonl`, con sufijo `.N` si supera
+`MAX_SEGMENT_BYTES`). `index.json` lista los segmentos y conteos por día; solo
+se reescribe al abrir/cerrar un segmento, nunca por mensaje.
+
+A diferencia de `pending_inbox.json` (500 eventos, reescrito completo), el
+journal no se trunca y sirve para:
+
+  # prueba de capacidad: re-ejecuta el día contra una copia de data/
+  python3 -m clwabot.core.inbound_journal replay --day 2026-02-22 --dry-run
+
+  # recuperación post-crash: re-ejecuta desde un instante sobre el estado real
+  python3 -m clwabot.core.inbound_journal replay --day 2026-02-22 --since-ts 1771770000
+
+El replay solo pasa por `handle_incoming` (decisiones + estado); no envía
+mensajes.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from .persist import read_json, write_json
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+JOURNAL_DIR = BASE_DIR / "data" / "journal"
+DATA_DIR = BASE_DIR / "data"
+MAX_SEGMENT_BYTES = 32 * 1024 * 1024
+
+EVENT_FIELDS = ("msisdn", "text", "message_id", "received_ts", "routed_ts", "chat_type", "has_media")
+
+
+def _day_of(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+
+class InboundJournal:
+    """Escritor de segmentos; seguro para varios hilos."""
+
+    def __init__(self, journal_dir: Path = JOURNAL_DIR, max_segment_bytes: int = MAX_SEGMENT_BYTES) -> None:
+        self.journal_dir = journal_dir
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.Lock()
+        self._fh = None
+        self._day = ""
+        self._segment = ""
+        self._count = 0
+
+    def append(self, event: Any, ts: Optional[float] = None) -> None:
+        """Agrega un inbound (InboundEvent o dict con los mismos campos)."""
+        ts = time.time() if ts is None else ts
+        record: Dict[str, Any] = {"ts": ts}
+        for name in EVENT_FIELDS:
+            value = event.get(name) if isinstance(event, dict) else getattr(event, name, None)
+            if value not in (None, "", 0, 0.0, False):
+                record[name] = value
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            day = _day_of(ts)
+            if self._fh is None or day != self._day or self._fh.tell() + len(line) > self.max_segment_bytes:
+                self._rotate(day)
+            self._fh.write(line)
+            self._fh.flush()
+            self._count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    def _rotate(self, day: str) -> None:
+        self._close_segment()
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        index = load_index(self.journal_dir)
+        segments = index.setdefault(day, {"segments": [], "count": 0})["segments"]
+        # Tras un reinicio seguimos en el último segmento del día si aún tiene espacio.
+        name = segments[-1] if segments else f"inbound-{day}.jsonl"
+        path = self.journal_dir / name
+        if path.exists() and path.stat().st_size >= self.max_segment_bytes:
+            name = f"inbound-{day}.{len(segments)}.jsonl"
+            path = self.journal_dir / name
+        if name not in segments:
+            segments.append(name)
+            _save_index(self.journal_dir, index)
+        self._fh = open(path, "ab")
+        self._day = day
+        self._segment = name
+        self._count = 0
+
+    def _close_segment(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        if self._count:
+            index = load_index(self.journal_dir)
+            entry = index.setdefault(self._day, {"segments": [self._segment], "count": 0})
+            entry["count"] = int(entry.get("count", 0)) + self._count
+            _save_index(self.journal_dir, index)
+        self._count = 0
+
+
+def load_index(journal_dir: Path = JOURNAL_DIR) -> Dict[str, dict]:
+    raw = read_json(journal_dir / "index.json", dict)
+    return raw if isinstance(raw, dict) else {}
+
+
+def _save_index(journal_dir: Path, index: Dict[str, dict]) -> None:
+    write_json(journal_dir / "index.json", dict(sorted(index.items())))
+
+
+def iter_day(day: str, journal_dir: Path = JOURNAL_DIR, since_ts: float = 0.0) -> Iterator[dict]:
+    """Recorre los inbound de un día en orden de escritura."""
+    segments = load_index(journal_dir).get(day, {}).get("segments", [])
+    for name in segments:
+        path = journal_dir / name
+        if not path.exists():
+            continue
+        with open(path, "rb") as fh:
+            for raw in fh:
+                try:
+                    record = json.loads(raw)
+                except Exception:
+                    # Última línea a medio escribir si el proceso murió.
+                    continue
+                if float(record.get("ts", 0)) >= since_ts:
+                    yield record
+
+
+@contextmanager
+def sandboxed_data(base: Optional[Path] = None) -> Iterator[Path]:
+    """Redirige los paths de estado de core/ a una copia temporal de data/.
+
+    Con `base` usa ese directorio tal cual (sin copiar nada) y lo conserva.
+    """
+    if base is not None:
+        base.mkdir(parents=True, exist_ok=True)
+        with _redirected_data(base):
+            yield base
+        return
+    from clwabot.core import state_store
+    from clwabot.core.state_db import open_state_db
+
+    with tempfile.TemporaryDirectory(prefix="clwabot-replay-") as tmp:
+        base = Path(tmp)
+        for path in DATA_DIR.glob("*.json"):
+            shutil.copy2(path, base / path.name)
+        if state_store.STATE_DB_PATH.exists():
+            open_state_db(state_store.STATE_DB_PATH).backup_to(base / "state.sqlite3")
+        with _redirected_data(base):
+            yield base
+
+
+@contextmanager
+def _redirected_data(base: Path) -> Iterator[None]:
+    from clwabot.core import (
+        calendar_sync,
+        ics_maker,
+        meeting_session,
+        metrics_log,
+        reporter,
+        state_store,
+        urgencia_handler,
+        urgencia_session,
+        vip_handler,
+    )
+    from clwabot.core.state_db import close_state_db
+
+    (base / "calendar").mkdir(exist_ok=True)
+    targets = [
+        (state_store, "STATE_PATH", base / "state.json"),
+        (state_store, "STATE_DB_PATH", base / "state.sqlite3"),
+        (vip_handler, "STATE_PATH", base / "state.json"),
+        (urgencia_session, "SESSIONS_PATH", base / "urgencia_sessions.json"),
+        (meeting_session, "SESSIONS_PATH", base / "meeting_sessions.json"),
+        (urgencia_handler, "DATA_PATH", base / "urgencias.json"),
+        (urgencia_handler, "CALENDAR_DIR", base / "calendar"),
+        (ics_maker, "CAL_DIR", base / "calendar"),
+        (calendar_sync, "QUEUE_PATH", base / "google_calendar_queue.json"),
+        (reporter, "REPORTS_DIR", base / "reports"),
+        (metrics_log, "METRICS_DIR", base / "metrics"),
+    ]
+    originals = [(module, attr, getattr(module, attr)) for module, attr, _ in targets]
+    try:
+        for module, attr, value in targets:
+            setattr(module, attr, value)
+        yield
+    finally:
+        for module, attr, value in originals:
+            setattr(module, attr, value)
+        close_state_db(base / "state.sqlite3")
+
+
+@dataclass
+class ReplayReport:
+    day: str
+    dry_run: bool
+    messages: int = 0
+    errors: int = 0
+    elapsed_sec: float = 0.0
+    policies: Counter = field(default_factory=Counter)
+
+    @property
+    def rate(self) -> float:
+        return self.messages / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+
+def replay(
+    day: str,
+    dry_run: bool = True,
+    journal_dir: Path = JOURNAL_DIR,
+    since_ts: float = 0.0,
+    limit: int = 0,
+) -> ReplayReport:
+    """Re-ejecuta los inbound del día por `handle_incoming` a máxima velocidad."""
+    from clwabot.core.whatsapp_agent import handle_incoming
+
+    report = ReplayReport(day=day, dry_run=dry_run)
+    sandbox = sandboxed_data() if dry_run else _noop_context()
+    with sandbox:
+        start = time.perf_counter()
+        for record in iter_day(day, journal_dir=journal_dir, since_ts=since_ts):
+            if limit and report.messages >= limit:
+                break
+            try:
+                decision = handle_incoming(record.get("msisdn", ""), record.get("text", ""))
+                report.policies[decision.policy] += 1
+            except Exception as exc:
+                report.errors += 1
+                print(f"[inbound_journal] replay error ({record.get('msisdn')}): {exc}", file=sys.stderr)
+            report.messages += 1
+        report.elapsed_sec = time.perf_counter() - start
+    return report
+
+
+@contextmanager
+def _noop_context() -> Iterator[None]:
+    yield None
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Journal de inbound de clwabot")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("days", help="lista días y conteos del journal")
+
+    rp = sub.add_parser("replay", help="re-ejecuta un día por handle_incoming")
+    rp.add_argument("--day", default=datetime.now().strftime("%Y-%m-%d"))
+    rp.add_argument("--dry-run", action="store_true", help="sobre una copia temporal de data/")
+    rp.add_argument("--since-ts", type=float, default=0.0, help="solo inbound posteriores a este epoch")
+    rp.add_argument("--limit", type=int, default=0)
+    rp.add_argument("--journal-dir", type=Path, default=JOURNAL_DIR)
+
+    args = parser.parse_args(argv)
+    if args.cmd == "days":
+        for day, entry in sorted(load_index().items()):
+            print(f"{day}: {entry.get('count', 0)} mensajes en {len(entry.get('segments', []))} segmento(s)")
+        return 0
+
+    report = replay(
+        args.day,
+        dry_run=args.dry_run,
+        journal_dir=args.journal_dir,
+        since_ts=args.since_ts,
+        limit=args.limit,
+    )
+    mode = "dry-run" if report.dry_run else "real"
+    print(
+        f"replay {report.day} ({mode}): {report.messages} mensajes en {report.elapsed_sec:.2f}s "
+        f"({report.rate:,.0f} msg/s), errores={report.errors}"
+    )
+    for policy, count in report.policies.most_common():
+        print(f"  {policy or '-'}: {count}")
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,21 +1,21 @@
 from __future__ import annotations
 
-import json
 import re
 import unicodedata
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from pathlib import Path
 from typing import Dict, Optional
 
-import yaml
-
 from .calendar_sync import queue_calendar_sync
 from .ics_maker import TZ, make_ics
+from .persist import read_json, verify_version, write_json
+from .templates import TEMPLATES
+from .unit_of_work import read_store, write_store
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SESSIONS_PATH = BASE_DIR / "data" / "meeting_sessions.json"
-SCRIPTS_PATH = BASE_DIR / "config" / "scripts.yaml"
 
 TRIGGER_WORDS = {
     "reunion",
@@ -58,27 +58,25 @@ def _normalize(text: str) -> str:
     return " ".join(_strip_accents(text).lower().split())
 
 
-def _load_scripts() -> dict:
-    if not SCRIPTS_PATH.exists():
-        return {}
-    try:
-        return yaml.safe_load(SCRIPTS_PATH.read_text(encoding="utf-8")) or {}
-    except Exception:
-        return {}
-
-
 def _load_sessions() -> Dict[str, list]:
-    if not SESSIONS_PATH.exists():
-        return {"sessions": []}
-    try:
-        return json.loads(SESSIONS_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return {"sessions": []}
+    return read_store(SESSIONS_PATH, partial(_read_sessions, SESSIONS_PATH))
 
 
 def _save_sessions(state: Dict[str, list]) -> None:
-    SESSIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    SESSIONS_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_store(
+        SESSIONS_PATH,
+        state,
+        partial(_write_sessions, SESSIONS_PATH),
+        verify=partial(verify_version, SESSIONS_PATH),
+    )
+
+
+def _read_sessions(path: Path) -> Dict[str, list]:
+    return read_json(path, lambda: {"sessions": []})
+
+
+def _write_sessions(path: Path, state: Dict[str, list]) -> None:
+    write_json(path, state, versioned=True)
 
 
 def _new_session_id() -> str:
@@ -125,20 +123,8 @@ def has_meeting_trigger(text: str) -> bool:
 
 
 def _intro_message() -> str:
-    scripts = _load_scripts()
-    identity = scripts.get("identity", {})
-    scripts_block = scripts.get("scripts", {})
-    agent_name = identity.get("agent_name", "asistente")
-    user_name = identity.get("user_name", "Lucas")
-    meeting_script = scripts_block.get("meeting_request", "").strip()
-
-    base = (
-        f"Hola 👋 Soy {agent_name}, asistente de {user_name}.\n"
-        "Te ayudo a agendar una reunión en formato rápido.\n\n"
-        "Ejemplo de respuesta para tema:\n"
-        "Revisión de propuesta comercial\n\n"
-        "Primero: ¿cuál es el tema de la reunión?"
-    )
+    base = TEMPLATES.render("meeting.intro")
+    meeting_script = TEMPLATES.script("meeting_request").strip()
     if meeting_script:
         return f"{base}\n\nReferencia:\n{meeting_script}"
     return base
@@ -219,18 +205,7 @@ def _build_start_datetime(date_text: str, time_text: str) -> datetime:
 
 
 def _summary(sess: MeetingSession) -> str:
-    return (
-        "Perfecto, este es el borrador de la reunión:\n"
-        f"- Tema: {sess.topic}\n"
-        f"- Fecha: {sess.date_text}\n"
-        f"- Hora: {sess.time_text}\n"
-        f"- Duración: {sess.duration_text}\n"
-        f"- Modalidad: {sess.mode_text}\n\n"
-        "Responde:\n"
-        "1) Confirmar y agendar\n"
-        "2) Editar datos\n"
-        "o escribe 'cancelar'."
-    )
+    return TEMPLATES.render_map("meeting.summary", sess.__dict__)
 
 
 def _finalize_ics(sess: MeetingSession) -> Dict[str, str]:
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Log append-only de eventos de métricas, segmentado por día (UTC).
+
+Cada evento es una línea JSON en `data/metrics/metrics-YYYY-MM-DD.jsonl`
+(el día sale de su `at`). Escribir es un solo `write` en modo append: no se
+lee ni se reescribe nada, y nada se trunca (antes `state.json` guardaba solo
+los últimos 5000 y los reescribía completos en cada `save_state`).
+
+Al lado de cada segmento vive un índice chico (`metrics-YYYY-MM-DD.idx.json`)
+con conteos por `kind` e `intent` y los bytes ya contados. No lo mantiene el
+escritor: quien lo lee cuenta solo la cola nueva del segmento y lo actualiza.
+
+Las lecturas abren solo los segmentos de los días de la ventana pedida:
+
+  python3 -m clwabot.core.metrics_log days
+  python3 -m clwabot.core.metrics_log summary --days 7
+  python3 -m clwabot.core.metrics_log tail --limit 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+METRICS_DIR = BASE_DIR / "data" / "metrics"
+
+_SEGMENT_RE = re.compile(r"^metrics-(\d{4}-\d{2}-\d{2})\.jsonl$")
+_WRITE_LOCK = threading.Lock()
+
+
+def _dir(metrics_dir: Optional[Path]) -> Path:
+    return metrics_dir if metrics_dir is not None else METRICS_DIR
+
+
+def _parse_at(value: Any) -> Optional[datetime]:
+    try:
+        at = datetime.fromisoformat(str(value))
+    except Exception:
+        return None
+    return at if at.tzinfo is not None else at.replace(tzinfo=timezone.utc)
+
+
+def _day_of(event: Dict[str, Any]) -> str:
+    at = _parse_at(event.get("at", "")) or datetime.now(timezone.utc)
+    return at.astimezone(timezone.utc).strftime("%Y-%m-%d")
+
+
+def segment_path(day: str, metrics_dir: Optional[Path] = None) -> Path:
+    return _dir(metrics_dir) / f"metrics-{day}.jsonl"
+
+
+def _index_path(day: str, metrics_dir: Optional[Path] = None) -> Path:
+    return _dir(metrics_dir) / f"metrics-{day}.idx.json"
+
+
+def append_events(events: Iterable[Dict[str, Any]], metrics_dir: Optional[Path] = None) -> int:
+    """Agrega eventos (con `at` ISO) a los segmentos de su día; O(1) por evento."""
+    by_day: Dict[str, List[bytes]] = {}
+    for event in events:
+        line = json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+        by_day.setdefault(_day_of(event), []).append(line.encode("utf-8"))
+    if not by_day:
+        return 0
+    base = _dir(metrics_dir)
+    base.mkdir(parents=True, exist_ok=True)
+    with _WRITE_LOCK:
+        for day, lines in by_day.items():
+            # Un solo write con O_APPEND: las líneas de otros procesos no se mezclan.
+            fd = os.open(segment_path(day, base), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, b"".join(lines))
+            finally:
+                os.close(fd)
+    return sum(len(lines) for lines in by_day.values())
+
+
+def days(metrics_dir: Optional[Path] = None) -> List[str]:
+    """Días con segmento, ordenados."""
+    base = _dir(metrics_dir)
+    if not base.exists():
+        return []
+    out = []
+    for path in base.iterdir():
+        match = _SEGMENT_RE.match(path.name)
+        if match:
+            out.append(match.group(1))
+    return sorted(out)
+
+
+def _window_days(since: Optional[datetime], until: Optional[datetime], metrics_dir: Optional[Path]) -> List[str]:
+    first = since.astimezone(timezone.utc).strftime("%Y-%m-%d") if since else ""
+    last = until.astimezone(timezone.utc).strftime("%Y-%m-%d") if until else "9999-12-31"
+    return [day for day in days(metrics_dir) if first <= day <= last]
+
+
+def _read_segment(day: str, metrics_dir: Optional[Path]) -> Iterator[Dict[str, Any]]:
+    path = segment_path(day, metrics_dir)
+    try:
+        fh = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with fh:
+        for raw in fh:
+            if not raw.endswith(b"\n"):
+                # Línea a medio escribir por otro proceso.
+                break
+            try:
+                event = json.loads(raw)
+            except Exception:
+                continue
+            if isinstance(event, dict):
+                yield event
+
+
+def iter_events(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    metrics_dir: Optional[Path] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Eventos con `since <= at <= until`, leyendo solo los días de la ventana."""
+    for day in _window_days(since, until, metrics_dir):
+        for event in _read_segment(day, metrics_dir):
+            if since is None and until is None:
+                yield event
+                continue
+            at = _parse_at(event.get("at", ""))
+            if at is None or (since is not None and at < since) or (until is not None and at > until):
+                continue
+            yield event
+
+
+def recent_events(limit: int, metrics_dir: Optional[Path] = None) -> List[Dict[str, Any]]:
+    """Los últimos `limit` eventos; lee segmentos hacia atrás hasta juntarlos."""
+    if limit <= 0:
+        return []
+    out: List[Dict[str, Any]] = []
+    for day in reversed(days(metrics_dir)):
+        out[:0] = list(_read_segment(day, metrics_dir))[-(limit - len(out)):]
+        if len(out) >= limit:
+            break
+    return out
+
+
+def day_index(day: str, metrics_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """Conteos del día (`count`, `kinds`, `intents`); cuenta solo lo nuevo del segmento."""
+    path = segment_path(day, metrics_dir)
+    index_path = _index_path(day, metrics_dir)
+    empty = {"bytes": 0, "count": 0, "kinds": {}, "intents": {}}
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+    except Exception:
+        index = dict(empty)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return dict(empty)
+    covered = int(index.get("bytes", 0))
+    if covered == size:
+        return index
+    if covered > size:
+        # El segmento se reemplazó: se recuenta entero.
+        index, covered = dict(empty), 0
+
+    kinds, intents = Counter(index.get("kinds", {})), Counter(index.get("intents", {}))
+    count = int(index.get("count", 0))
+    with open(path, "rb") as fh:
+        fh.seek(covered)
+        for raw in fh:
+            if not raw.endswith(b"\n"):
+                break
+            covered += len(raw)
+            try:
+                event = json.loads(raw)
+            except Exception:
+                continue
+            if not isinstance(event, dict):
+                continue
+            count += 1
+            kinds[str(event.get("kind", "unknown"))] += 1
+            if event.get("intent"):
+                intents[str(event["intent"])] += 1
+    index = {"bytes": covered, "count": count, "kinds": dict(kinds), "intents": dict(intents)}
+    tmp = index_path.with_name(index_path.name + ".tmp")
+    try:
+        tmp.write_text(json.dumps(index, ensure_ascii=False, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, index_path)
+    except OSError as exc:
+        print(f"[metrics_log] no se pudo guardar {index_path.name}: {exc}", file=sys.stderr)
+    return index
+
+
+def summary(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    metrics_dir: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """Suma de los índices de los días `since..until` (sin leer eventos ya contados)."""
+    first = since.isoformat() if since else ""
+    last = until.isoformat() if until else "9999-12-31"
+    kinds: Counter = Counter()
+    intents: Counter = Counter()
+    count = 0
+    for day in days(metrics_dir):
+        if not first <= day <= last:
+            continue
+        index = day_index(day, metrics_dir)
+        count += int(index.get("count", 0))
+        kinds.update(index.get("kinds", {}))
+        intents.update(index.get("intents", {}))
+    return {"count": count, "kinds": dict(kinds), "intents": dict(intents)}
+
+
+def event_count(days_back: Optional[int] = None, metrics_dir: Optional[Path] = None) -> int:
+    """Eventos de los últimos `days_back` días calendario (todos si es None)."""
+    since = None
+    if days_back is not None:
+        since = datetime.now(timezone.utc).date() - timedelta(days=max(0, days_back - 1))
+    return int(summary(since=since, metrics_dir=metrics_dir)["count"])
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Log segmentado de métricas")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("days", help="días con segmento y su conteo")
+    summ = sub.add_parser("summary", help="conteos por kind/intent")
+    summ.add_argument("--days", type=int, default=7)
+    tail = sub.add_parser("tail", help="últimos eventos")
+    tail.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "days":
+        for day in days():
+            print(f"{day}  {day_index(day).get('count', 0)}")
+    elif args.cmd == "summary":
+        since = datetime.now(timezone.utc).date() - timedelta(days=max(0, args.days - 1))
+        print(json.dumps(summary(since=since), ensure_ascii=False, indent=2, sort_keys=True))
+    else:
+        for event in recent_events(args.limit):
+            print(json.dumps(event, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""Outbox durable de envíos WhatsApp (sqlite, stdlib).
+
+Cada envío de una decisión se registra antes de intentarlo, con una clave de
+idempotencia derivada del inbound que lo originó: si la misma decisión se
+vuelve a procesar (reinicio, re-run del listener) el envío no se duplica. La
+clave también va al transporte (`idempotencyKey` del gateway), así un
+reintento tras un ack perdido no sale dos veces.
+
+Estados:
+  pending    espera su turno (`next_attempt_ts`), incluye diferidos
+  sending    tomado por un worker/drainer hasta `lease_until`
+  delivered  entregado (`transport`, `delivered_ts`)
+  dead       agotó `MAX_ATTEMPTS`; visible en el panel para reintentar
+
+Un intento fallido vuelve a `pending` con backoff exponencial + jitter. El
+`OutboxDrainer` (hilo del router) reintenta lo vencido y despacha los
+diferidos; un `sending` cuyo lease venció (proceso muerto a medio envío) se
+vuelve a tomar.
+
+Coalescing: los envíos con el mismo `batch_key` que vencen juntos salen como
+un solo mensaje resumen (`digest_message`). `coalesce_due` decide cuándo: a lo
+más un envío por `batch_key` cada `window` segundos; lo que llega entre medio
+espera y se agrupa.
+
+  python3 -m clwabot.core.outbox list
+  python3 -m clwabot.core.outbox retry <key>
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from hashlib import sha1
+from pathlib import Path
+from typing import Callable, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+OUTBOX_PATH = BASE_DIR / "data" / "outbox.sqlite3"
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_CAP_SECONDS = 300.0
+LEASE_SECONDS = 60.0
+DRAIN_INTERVAL_SECONDS = 1.0
+DRAIN_BATCH = 50
+DELIVERED_RETENTION_SECONDS = 7 * 24 * 3600
+
+UNDELIVERED = ("pending", "sending", "dead")
+
+# (target, message, ics_path, idempotency_key) -> (transporte, ok). La clave es
+# la del outbox: el transporte la usa para que un reintento no duplique el envío.
+SendFn = Callable[[str, str, str, str], "tuple[str, bool]"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    target TEXT NOT NULL,
+    message TEXT NOT NULL,
+    ics_path TEXT NOT NULL DEFAULT '',
+    role TEXT NOT NULL DEFAULT '',
+    msisdn TEXT NOT NULL DEFAULT '',
+    policy TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_ts REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created_ts REAL NOT NULL,
+    updated_ts REAL NOT NULL,
+    delivered_ts REAL,
+    transport TEXT NOT NULL DEFAULT '',
+    last_error TEXT NOT NULL DEFAULT '',
+    batch_key TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_ts, priority);
+"""
+_BATCH_INDEX = "CREATE INDEX IF NOT EXISTS outbox_batch ON outbox (batch_key, status)"
+
+
+def outbox_key(origin: str, target: str, message: str, ics_path: str = "", delay_sec: int = 0) -> str:
+    """Clave de idempotencia: mismo inbound + mismo envío = misma clave."""
+    raw = f"{origin}|{target}|{int(delay_sec)}|{ics_path}|{message.strip()}"
+    return sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def digest_message(messages: list[str]) -> str:
+    """Un solo mensaje para varias alertas agrupadas."""
+    if len(messages) == 1:
+        return messages[0]
+    return f"🗂️ {len(messages)} alertas agrupadas:\n\n" + "\n\n———\n\n".join(m.strip() for m in messages)
+
+
+def backoff_delay(attempts: int, rng: Callable[[], float] = random.random) -> float:
+    """Backoff exponencial con jitter ("equal jitter": nunca reintenta al tiro)."""
+    ceiling = min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return ceiling / 2 + rng() * ceiling / 2
+
+
+@dataclass
+class OutboxItem:
+    key: str
+    target: str
+    message: str
+    ics_path: str
+    role: str
+    msisdn: str
+    policy: str
+    priority: int
+    status: str
+    attempts: int
+    next_attempt_ts: float
+    created_ts: float
+    delivered_ts: Optional[float]
+    transport: str
+    last_error: str
+    batch_key: str = ""
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+_ITEM_COLUMNS = (
+    "key, target, message, ics_path, role, msisdn, policy, priority, status, attempts, "
+    "next_attempt_ts, created_ts, delivered_ts, transport, last_error, batch_key"
+)
+
+
+class Outbox:
+    """Tabla `outbox` en sqlite (WAL), compartible entre procesos."""
+
+    def __init__(self, path: Path = OUTBOX_PATH) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        if "batch_key" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN batch_key TEXT NOT NULL DEFAULT ''")
+        self._conn.execute(_BATCH_INDEX)
+
+    # -- escritura ------------------------------------------------------------
+
+    def enqueue(
+        self,
+        key: str,
+        target: str,
+        message: str,
+        ics_path: str = "",
+        role: str = "",
+        msisdn: str = "",
+        policy: str = "",
+        priority: int = 1,
+        delay_sec: float = 0,
+        batch_key: str = "",
+        now: Optional[float] = None,
+    ) -> bool:
+        """Registra un envío; False si la clave ya existía (no se duplica)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, target, message, ics_path, role, msisdn, policy, priority, "
+                "next_attempt_ts, created_ts, updated_ts, batch_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    target,
+                    message,
+                    ics_path,
+                    role,
+                    msisdn,
+                    policy,
+                    int(priority),
+                    now + delay_sec,
+                    now,
+                    now,
+                    batch_key,
+                ),
+            )
+            return cur.rowcount == 1
+
+    def coalesce_due(self, batch_key: str, window: float, now: Optional[float] = None) -> Optional[float]:
+        """Hora a la que debe salir un envío agrupable, o None si puede salir ya.
+
+        Si hay un resumen pendiente para `batch_key`, se suma a ese. Si no, y el
+        último envío entregado fue hace menos de `window`, espera al siguiente
+        turno. Así sale a lo más un mensaje por ventana.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT MIN(next_attempt_ts) FROM outbox WHERE batch_key = ? AND status = 'pending'",
+                (batch_key,),
+            ).fetchone()[0]
+            if pending is not None:
+                return max(float(pending), now)
+            last = self._conn.execute(
+                "SELECT MAX(delivered_ts) FROM outbox WHERE batch_key = ? AND status = 'delivered' "
+                "AND delivered_ts > ?",
+                (batch_key, now - window),
+            ).fetchone()[0]
+        return float(last) + window if last is not None else None
+
+    def claim(self, key: str, now: Optional[float] = None) -> bool:
+        """Toma un envío concreto (envío inline) si está vencido y libre."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE outbox SET status = 'sending', lease_until = ?, updated_ts = ? "
+                "WHERE key = ? AND next_attempt_ts <= ? "
+                "AND (status = 'pending' OR (status = 'sending' AND lease_until < ?))",
+                (now + LEASE_SECONDS, now, key, now, now),
+            )
+            return cur.rowcount == 1
+
+    def claim_due(self, limit: int = DRAIN_BATCH, now: Optional[float] = None) -> list[OutboxItem]:
+        """Toma hasta `limit` envíos vencidos, por prioridad y antigüedad."""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT {_ITEM_COLUMNS} FROM outbox "
+                    "WHERE next_attempt_ts <= ? "
+                    "AND (status = 'pending' OR (status = 'sending' AND lease_until < ?)) "
+                    "ORDER BY priority, next_attempt_ts LIMIT ?",
+                    (now, now, int(limit)),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET status = 'sending', lease_until = ?, updated_ts = ? WHERE key = ?",
+                    [(now + LEASE_SECONDS, now, row[0]) for row in rows],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [OutboxItem(*row) for row in rows]
+
+    def mark_delivered(self, key: str, transport: str, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'delivered', attempts = attempts + 1, delivered_ts = ?, "
+                "updated_ts = ?, transport = ?, last_error = '' WHERE key = ?",
+                (now, now, transport, key),
+            )
+
+    def mark_failed(self, key: str, error: str, transport: str = "", now: Optional[float] = None) -> str:
+        """Registra un intento fallido; devuelve el nuevo estado (pending | dead)."""
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM outbox WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return ""
+            attempts = int(row[0]) + 1
+            status = "dead" if attempts >= MAX_ATTEMPTS else "pending"
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_ts = ?, lease_until = 0, "
+                "updated_ts = ?, transport = ?, last_error = ? WHERE key = ?",
+                (status, attempts, now + backoff_delay(attempts), now, transport, error[:500], key),
+            )
+            return status
+
+    def requeue(self, key: str, now: Optional[float] = None) -> bool:
+        """Vuelve a poner en cola un envío no entregado (p. ej. `dead`) desde cero."""
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_ts = ?, lease_until = 0, "
+                "updated_ts = ? WHERE key = ? AND status != 'delivered'",
+                (now, now, key),
+            )
+            return cur.rowcount == 1
+
+    def prune(self, older_than_sec: float = DELIVERED_RETENTION_SECONDS, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM outbox WHERE status = 'delivered' AND delivered_ts < ?",
+                (now - older_than_sec,),
+            )
+            return cur.rowcount
+
+    # -- lectura --------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[OutboxItem]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_ITEM_COLUMNS} FROM outbox WHERE key = ?", (key,)).fetchone()
+        return OutboxItem(*row) if row else None
+
+    def undelivered(self, limit: int = 100) -> list[OutboxItem]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_ITEM_COLUMNS} FROM outbox WHERE status IN (?, ?, ?) "
+                "ORDER BY created_ts DESC LIMIT ?",
+                (*UNDELIVERED, int(limit)),
+            ).fetchall()
+        return [OutboxItem(*row) for row in rows]
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {status: int(count) for status, count in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def send_item(outbox: Outbox, item: OutboxItem, send: SendFn) -> tuple[str, bool, str]:
+    """Un intento de envío ya tomado (`claim`); deja el resultado en el outbox."""
+    try:
+        transport, ok = send(item.target, item.message, item.ics_path, item.key)
+        error = "" if ok else f"{transport} falló"
+    except Exception as exc:
+        transport, ok, error = "error", False, str(exc)
+    if ok:
+        outbox.mark_delivered(item.key, transport)
+    else:
+        status = outbox.mark_failed(item.key, error, transport=transport)
+        print(f"[outbox] {item.target} intento {item.attempts + 1}: {error} -> {status}", file=sys.stderr)
+    return transport, ok, error
+
+
+class OutboxDrainer:
+    """Hilo que reintenta lo fallido y despacha los diferidos vencidos."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: SendFn,
+        interval: float = DRAIN_INTERVAL_SECONDS,
+        batch: int = DRAIN_BATCH,
+    ) -> None:
+        self.outbox = outbox
+        self.send = send
+        self.interval = interval
+        self.batch = batch
+        self.delivered = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="clwabot-outbox", daemon=True)
+
+    def start(self) -> "OutboxDrainer":
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def drain_once(self, now: Optional[float] = None) -> int:
+        items = self.outbox.claim_due(limit=self.batch, now=now)
+        groups: dict[str, list[OutboxItem]] = {}
+        for item in items:
+            groups.setdefault(item.batch_key or item.key, []).append(item)
+        for group in groups.values():
+            if len(group) == 1:
+                _, ok, _ = send_item(self.outbox, group[0], self.send)
+            else:
+                ok = self._send_digest(group)
+            if ok:
+                self.delivered += len(group)
+            else:
+                self.failed += len(group)
+        return len(items)
+
+    def _send_digest(self, group: list[OutboxItem]) -> bool:
+        head = group[0]
+        message = digest_message([item.message for item in group])
+        # Mismo grupo -> misma clave: el reintento de un resumen tampoco se duplica.
+        key = outbox_key("|".join(item.key for item in group), head.target, message)
+        try:
+            transport, ok = self.send(head.target, message, "", key)
+            error = "" if ok else f"{transport} falló"
+        except Exception as exc:
+            transport, ok, error = "error", False, str(exc)
+        for item in group:
+            if ok:
+                self.outbox.mark_delivered(item.key, f"{transport}+digest")
+            else:
+                self.outbox.mark_failed(item.key, error, transport=transport)
+        if not ok:
+            print(f"[outbox] resumen a {head.target} ({len(group)}): {error}", file=sys.stderr)
+        return ok
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                handled = self.drain_once()
+            except Exception as exc:
+                print(f"[outbox] drainer: {exc}", file=sys.stderr)
+                handled = 0
+            if handled >= self.batch:
+                continue
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def close(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Outbox de envíos WhatsApp")
+    parser.add_argument("--db", type=Path, default=OUTBOX_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    list_p = sub.add_parser("list", help="envíos no entregados")
+    list_p.add_argument("--limit", type=int, default=50)
+    retry_p = sub.add_parser("retry", help="re-encolar un envío")
+    retry_p.add_argument("key")
+    sub.add_parser("prune", help="borra entregados antiguos")
+    args = parser.parse_args(argv)
+
+    outbox = Outbox(args.db)
+    try:
+        if args.cmd == "list":
+            print(f"{outbox.counts()}")
+            for item in outbox.undelivered(limit=args.limit):
+                print(f"{item.key} {item.status:<8} x{item.attempts} {item.target} {item.last_error or '-'}")
+            return 0
+        if args.cmd == "retry":
+            ok = outbox.requeue(args.key)
+            print("re-encolado" if ok else "no encontrado o ya entregado")
+            return 0 if ok else 1
+        print(f"borrados: {outbox.prune()}")
+        return 0
+    finally:
+        outbox.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
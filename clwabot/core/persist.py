@@ -0,0 +1,402 @@
+"""Escritura segura de los stores JSON locales.
+
+`write_json` nunca deja un archivo a medias: escribe un temporal en el mismo
+directorio, lo sincroniza según `FSYNC_POLICY` y lo renombra encima
+(`os.replace`, atómico). Antes del rename la versión anterior queda como
+`<archivo>.bak` (una generación).
+
+`read_json` distingue "no existe" (devuelve el default) de "está corrupto":
+en ese caso recupera desde el `.bak` y deja el archivo dañado como
+`<archivo>.corrupt` en vez de pisarlo con un estado vacío.
+
+Escrituras agrupadas: con `debounce > 0` (o `CLWABOT_WRITE_DEBOUNCE_MS`) una
+ráfaga de escrituras al mismo archivo sale en un solo flush a lo más
+`debounce` segundos después de la primera; las lecturas del mismo proceso ven
+lo pendiente. `flush()` (también al salir) escribe todo lo pendiente.
+
+Políticas de fsync (`CLWABOT_FSYNC`):
+  always  fsync del archivo y del directorio (sobrevive a un corte de luz)
+  file    fsync del archivo antes del rename (por defecto)
+  never   solo rename atómico (protege de un crash del proceso, no del SO)
+
+Versiones: los stores compartidos entre procesos (`state.json`, sesiones,
+urgencias, pendientes) llevan un contador `_version`. `write_json(...,
+versioned=True)` toma el lock del archivo (`core.file_lock`), compara la
+versión con la que se leyó el documento y, si otro proceso escribió entre
+medio, levanta `StaleWriteError` en vez de pisarlo; quien escribe vuelve a
+leer y reintenta (ver `unit_of_work.run_unit_of_work`). La versión en disco se
+recuerda por (inodo, mtime, tamaño): mientras nadie más escriba no se re-parsea.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .file_lock import locked
+
+FSYNC_POLICIES = ("always", "file", "never")
+FSYNC_POLICY = os.environ.get("CLWABOT_FSYNC", "file").strip().lower()
+if FSYNC_POLICY not in FSYNC_POLICIES:
+    FSYNC_POLICY = "file"
+
+try:
+    DEBOUNCE_SECONDS = max(0.0, float(os.environ.get("CLWABOT_WRITE_DEBOUNCE_MS", "0") or 0) / 1000.0)
+except ValueError:
+    DEBOUNCE_SECONDS = 0.0
+
+VERSION_KEY = "_version"
+
+
+class StaleWriteError(RuntimeError):
+    """Otro proceso escribió el archivo después de que se leyó el documento."""
+
+    def __init__(self, path: Path, expected: int, found: int) -> None:
+        super().__init__(f"{path.name}: versión leída {expected}, en disco {found}")
+        self.path = path
+        self.expected = expected
+        self.found = found
+
+
+def backup_path(path: Path) -> Path:
+    return path.with_name(path.name + ".bak")
+
+
+def _encode(obj: Any) -> Any:
+    # Objetos con su propia forma en disco (p. ej. core.contact_record).
+    encode = getattr(obj, "__json__", None)
+    if encode is None:
+        raise TypeError(f"{type(obj).__name__} no es serializable a JSON")
+    return encode()
+
+
+def dumps(doc: Any, indent: Optional[int] = 2) -> bytes:
+    return json.dumps(doc, ensure_ascii=False, indent=indent, default=_encode).encode("utf-8")
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _backup(path: Path) -> None:
+    """`path` -> `path.bak` sin dejar ventana sin respaldo (hard link + rename)."""
+    bak = backup_path(path)
+    tmp = bak.with_name(f"{bak.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        os.link(path, tmp)
+    except FileNotFoundError:
+        return
+    except OSError:
+        try:
+            shutil.copy2(path, tmp)
+        except FileNotFoundError:
+            return
+    try:
+        os.replace(tmp, bak)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _valid_json(path: Path) -> bool:
+    try:
+        json.loads(path.read_bytes())
+        return True
+    except FileNotFoundError:
+        return False
+    except Exception:
+        return False
+
+
+class WriteCoalescer:
+    """Escrituras atómicas por archivo, opcionalmente agrupadas en el tiempo."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Condition()
+        # path -> (bytes, deadline monotónico, seq)
+        self._pending: Dict[Path, Tuple[bytes, float, int]] = {}
+        self._inflight: Dict[Path, Tuple[bytes, int]] = {}
+        self._path_locks: Dict[Path, threading.Lock] = {}
+        self._written_seq: Dict[Path, int] = {}
+        # Archivos que ya sabemos válidos: se respaldan sin re-parsearlos.
+        self._known_good: set[Path] = set()
+        self._seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.coalesced = 0
+
+    def pending(self, path: Path) -> Optional[bytes]:
+        with self._lock:
+            entry = self._pending.get(path)
+            if entry is not None:
+                return entry[0]
+            inflight = self._inflight.get(path)
+            return inflight[0] if inflight is not None else None
+
+    def mark_good(self, path: Path) -> None:
+        with self._lock:
+            self._known_good.add(path)
+
+    def mark_bad(self, path: Path) -> None:
+        with self._lock:
+            self._known_good.discard(path)
+
+    def submit(self, path: Path, data: bytes, delay: float) -> None:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            if delay <= 0:
+                # Una escritura inmediata reemplaza lo que estaba pendiente.
+                if self._pending.pop(path, None) is not None:
+                    self.coalesced += 1
+                self._inflight[path] = (data, seq)
+            else:
+                previous = self._pending.get(path)
+                deadline = previous[1] if previous is not None else time.monotonic() + delay
+                if previous is not None:
+                    self.coalesced += 1
+                self._pending[path] = (data, deadline, seq)
+                self._ensure_thread()
+                self._lock.notify()
+                return
+        self._write(path, data, seq)
+
+    def flush(self, path: Optional[Path] = None) -> None:
+        with self._lock:
+            paths = [path] if path is not None else list(self._pending)
+            due = []
+            for key in paths:
+                entry = self._pending.pop(key, None)
+                if entry is not None:
+                    self._inflight[key] = (entry[0], entry[2])
+                    due.append((key, entry[0], entry[2]))
+        for key, data, seq in due:
+            self._write(key, data, seq)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="json-write-coalescer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+                now = time.monotonic()
+                wait = min(entry[1] for entry in self._pending.values()) - now
+                if wait > 0:
+                    self._lock.wait(wait)
+                    continue
+                due = []
+                for key, (data, deadline, seq) in list(self._pending.items()):
+                    if deadline <= now:
+                        del self._pending[key]
+                        self._inflight[key] = (data, seq)
+                        due.append((key, data, seq))
+            for key, data, seq in due:
+                try:
+                    self._write(key, data, seq)
+                except Exception as exc:
+                    print(f"[persist] no se pudo escribir {key}: {exc}", file=sys.stderr)
+
+    def _path_lock(self, path: Path) -> threading.Lock:
+        with self._lock:
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = self._path_locks[path] = threading.Lock()
+            return lock
+
+    def _write(self, path: Path, data: bytes, seq: int) -> None:
+        try:
+            with self._path_lock(path):
+                # Otra escritura más nueva del mismo archivo ya llegó a disco.
+                if seq < self._written_seq.get(path, 0):
+                    return
+                _atomic_write(path, data, keep_backup=self._backup_ok(path))
+                self._written_seq[path] = seq
+                with self._lock:
+                    self._known_good.add(path)
+                    self.flushes += 1
+        finally:
+            with self._lock:
+                inflight = self._inflight.get(path)
+                if inflight is not None and inflight[1] == seq:
+                    del self._inflight[path]
+
+    def _backup_ok(self, path: Path) -> bool:
+        with self._lock:
+            if path in self._known_good:
+                return True
+        # Un archivo corrupto no debe pisar un `.bak` bueno.
+        return _valid_json(path)
+
+
+def _atomic_write(path: Path, data: bytes, keep_backup: bool = True, fsync: Optional[str] = None) -> None:
+    policy = fsync or FSYNC_POLICY
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            if policy != "never":
+                os.fsync(fh.fileno())
+        if keep_backup:
+            _backup(path)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+    if policy == "always":
+        _fsync_dir(path.parent)
+
+
+COALESCER = WriteCoalescer()
+atexit.register(COALESCER.flush)
+
+
+def write_json(
+    path: Path,
+    doc: Any,
+    indent: Optional[int] = 2,
+    debounce: Optional[float] = None,
+    versioned: bool = False,
+) -> None:
+    """Serializa ya (el doc puede seguir mutando) y escribe atómicamente.
+
+    Con `versioned` la escritura es inmediata y falla con `StaleWriteError`
+    si `doc` no parte de la versión que está en disco.
+    """
+    if versioned:
+        _write_versioned(path, doc, indent)
+        return
+    delay = DEBOUNCE_SECONDS if debounce is None else debounce
+    COALESCER.submit(path, dumps(doc, indent=indent), delay)
+
+
+def _write_versioned(path: Path, doc: Dict[str, Any], indent: Optional[int]) -> None:
+    with locked(path):
+        verify_version(path, doc)
+        previous = doc.get(VERSION_KEY)
+        doc[VERSION_KEY] = _doc_version(doc) + 1
+        try:
+            COALESCER.submit(path, dumps(doc, indent=indent), 0)
+        except BaseException:
+            if previous is None:
+                doc.pop(VERSION_KEY, None)
+            else:
+                doc[VERSION_KEY] = previous
+            raise
+        _remember_version(path, os.stat(path), doc[VERSION_KEY])
+
+
+def read_json(path: Path, default: Callable[[], Any]) -> Any:
+    """Lee `path`; si está corrupto recupera desde `.bak` (o `default()`)."""
+    pending = COALESCER.pending(path)
+    if pending is not None:
+        return json.loads(pending)
+    try:
+        with open(path, "rb") as fh:
+            st = os.fstat(fh.fileno())
+            raw = fh.read()
+    except FileNotFoundError:
+        return default()
+    except OSError as exc:
+        print(f"[persist] no se pudo leer {path}: {exc}", file=sys.stderr)
+        return default()
+    try:
+        doc = json.loads(raw)
+    except ValueError:
+        return _recover(path, default)
+    COALESCER.mark_good(path)
+    if isinstance(doc, dict):
+        _remember_version(path, st, _doc_version(doc))
+    return doc
+
+
+def _recover(path: Path, default: Callable[[], Any]) -> Any:
+    COALESCER.mark_bad(path)
+    corrupt = path.with_name(path.name + ".corrupt")
+    try:
+        shutil.copy2(path, corrupt)
+    except OSError:
+        pass
+    bak = backup_path(path)
+    try:
+        doc = json.loads(bak.read_text(encoding="utf-8"))
+    except Exception:
+        print(f"[persist] {path.name} corrupto y sin respaldo válido; copia en {corrupt.name}", file=sys.stderr)
+        return default()
+    print(f"[persist] {path.name} corrupto; recuperado desde {bak.name} (copia en {corrupt.name})", file=sys.stderr)
+    return doc
+
+
+def flush(path: Optional[Path] = None) -> None:
+    """Escribe ya lo pendiente (de `path` o de todos)."""
+    COALESCER.flush(path)
+
+
+# path -> ((inodo, mtime_ns, tamaño), versión) del último archivo leído/escrito.
+_VERSIONS: Dict[Path, Tuple[Tuple[int, int, int], int]] = {}
+_VERSIONS_LOCK = threading.Lock()
+
+
+def _stat_key(st: os.stat_result) -> Tuple[int, int, int]:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _remember_version(path: Path, st: os.stat_result, version: int) -> None:
+    with _VERSIONS_LOCK:
+        _VERSIONS[path] = (_stat_key(st), version)
+
+
+def _doc_version(doc: Any) -> int:
+    try:
+        return int(doc.get(VERSION_KEY) or 0)
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def stored_version(path: Path) -> int:
+    """Versión del archivo en disco (0 si no existe o no tiene)."""
+    COALESCER.flush(path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    with _VERSIONS_LOCK:
+        cached = _VERSIONS.get(path)
+    if cached is not None and cached[0] == _stat_key(st):
+        return cached[1]
+    return _doc_version(read_json(path, dict))
+
+
+def verify_version(path: Path, doc: Any) -> None:
+    """`StaleWriteError` si `doc` no parte de la versión en disco; llamar con el lock tomado."""
+    found = stored_version(path)
+    expected = _doc_version(doc)
+    if found != expected:
+        raise StaleWriteError(path, expected, found)
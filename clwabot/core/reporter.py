@@ -4,6 +4,7 @@ from collections import Counter
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from .metrics_log import iter_events
 from .state_store import load_state, save_state
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -12,20 +13,9 @@ REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def _events_since(hours: int) -> list[dict]:
-    state = load_state()
-    events = state.get("metrics", {}).get("events", [])
+    # Solo se abren los segmentos diarios que cubren la ventana.
     cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-    out = []
-    for ev in events:
-        try:
-            at = datetime.fromisoformat(ev.get("at", ""))
-        except Exception:
-            continue
-        if at.tzinfo is None:
-            at = at.replace(tzinfo=timezone.utc)
-        if at >= cutoff:
-            out.append(ev)
-    return out
+    return list(iter_events(since=cutoff))
 
 
 def _write_report(filename_prefix: str, text: str) -> Path:
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""Backend sqlite del estado (`data/state.sqlite3`, WAL, stdlib).
+
+Alternativa a `state.json` detrás de la misma API de `state_store`
+(`CLWABOT_STATE_BACKEND=sqlite`). Con JSON cada `save_state` reserializa todo
+el archivo; acá cada parte vive en su tabla:
+
+  settings   secciones chicas (`assistant`, `vip`, `reports`, ...)
+  contacts   un registro por msisdn (stats en columnas, el resto en `extra`)
+  messages   `last_messages` de cada contacto
+
+Las métricas no pasan por acá: van al log segmentado (`core.metrics_log`).
+
+`state["contacts"]` se carga a pedido: un mensaje lee solo su contacto,
+iterar los contactos lee solo las claves y `save()` escribe solo lo que
+cambió (contactos tocados, secciones distintas a lo último leído/escrito).
+Como en los JSON, `state["_version"]` es la versión leída (`meta.version`):
+`save()` de un estado que otro proceso ya actualizó levanta `StaleWriteError`.
+
+Migración única desde el JSON (también se hace sola al abrir una base vacía):
+
+  python3 -m clwabot.core.state_db migrate
+  python3 -m clwabot.core.state_db export > /tmp/state.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .contact_record import ContactRecord
+from .persist import VERSION_KEY, StaleWriteError
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STATE_DB_PATH = BASE_DIR / "data" / "state.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contacts (
+    msisdn TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    priority TEXT NOT NULL DEFAULT 'normal',
+    last_seen_at TEXT NOT NULL DEFAULT '',
+    last_intent TEXT NOT NULL DEFAULT '',
+    inbound INTEGER NOT NULL DEFAULT 0,
+    auto_replies INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    msisdn TEXT NOT NULL,
+    at TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS messages_contact ON messages (msisdn, id);
+"""
+
+_CONTACT_TEXT = (("name", ""), ("priority", "normal"), ("last_seen_at", ""), ("last_intent", ""))
+_CONTACT_STATS = ("inbound", "auto_replies")
+_CONTACT_COLUMNS = "msisdn, name, priority, last_seen_at, last_intent, inbound, auto_replies, extra"
+_INSERT_CONTACT = f"INSERT OR REPLACE INTO contacts ({_CONTACT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_MESSAGE = "INSERT INTO messages (msisdn, at, text) VALUES (?, ?, ?)"
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _contact_row(msisdn: str, contact: Dict[str, Any]) -> tuple:
+    extra = {k: v for k, v in contact.items() if k not in dict(_CONTACT_TEXT) and k != "last_messages"}
+    stats = dict(extra.pop("stats", None) or {})
+    counters = [_int(stats.pop(key, 0)) for key in _CONTACT_STATS]
+    if stats:
+        extra["stats"] = stats
+    text = [str(contact.get(key, default) or "") for key, default in _CONTACT_TEXT]
+    return (msisdn, *text, *counters, _dump(extra))
+
+
+def _message_rows(msisdn: str, contact: Dict[str, Any]) -> List[tuple]:
+    rows = []
+    for msg in contact.get("last_messages") or []:
+        if isinstance(msg, dict):
+            rows.append((msisdn, str(msg.get("at", "")), str(msg.get("text", ""))))
+    return rows
+
+
+def _contact_from_row(row: tuple, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    _msisdn, name, priority, last_seen_at, last_intent, inbound, auto_replies, extra_raw = row
+    try:
+        extra = json.loads(extra_raw)
+    except Exception:
+        extra = {}
+    stats = {"inbound": inbound, "auto_replies": auto_replies}
+    stats.update(extra.pop("stats", None) or {})
+    contact = {
+        "name": name,
+        "priority": priority,
+        "last_seen_at": last_seen_at,
+        "last_intent": last_intent,
+        "last_messages": messages,
+        "tags": [],
+    }
+    contact.update(extra)
+    contact["stats"] = stats
+    return contact
+
+
+class _Contacts(MutableMapping):
+    """`state["contacts"]` a pedido: cada contacto se lee al primer acceso."""
+
+    def __init__(self, db: "StateDB") -> None:
+        self._db = db
+        self._loaded: Dict[str, Any] = {}
+        # msisdn -> (fila, mensajes) tal como están en la base.
+        self._stored: Dict[str, tuple] = {}
+        self._deleted: set[str] = set()
+
+    def __getitem__(self, msisdn: str) -> ContactRecord:
+        contact = self._loaded.get(msisdn)
+        if contact is not None:
+            return contact
+        if msisdn in self._deleted:
+            raise KeyError(msisdn)
+        row = self._db.fetch_contact(msisdn)
+        if row is None:
+            raise KeyError(msisdn)
+        contact = self._loaded[msisdn] = ContactRecord.from_dict(row)
+        self._stored[msisdn] = (_contact_row(msisdn, contact), _message_rows(msisdn, contact))
+        return contact
+
+    def __setitem__(self, msisdn: str, contact: Dict[str, Any]) -> None:
+        self._loaded[msisdn] = contact
+        self._deleted.discard(msisdn)
+
+    def __delitem__(self, msisdn: str) -> None:
+        self[msisdn]
+        del self._loaded[msisdn]
+        self._deleted.add(msisdn)
+
+    def __iter__(self) -> Iterator[str]:
+        stored = self._db.contact_keys()
+        for msisdn in stored:
+            if msisdn not in self._deleted:
+                yield msisdn
+        known = set(stored)
+        for msisdn in list(self._loaded):
+            if msisdn not in known:
+                yield msisdn
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"<contacts sqlite: {len(self._loaded)} cargados>"
+
+    def flush(self, conn: sqlite3.Connection) -> Callable[[], None]:
+        written: Dict[str, tuple] = {}
+        for msisdn in self._deleted:
+            conn.execute("DELETE FROM contacts WHERE msisdn = ?", (msisdn,))
+            conn.execute("DELETE FROM messages WHERE msisdn = ?", (msisdn,))
+        for msisdn, contact in self._loaded.items():
+            row, messages = _contact_row(msisdn, contact), _message_rows(msisdn, contact)
+            before = self._stored.get(msisdn)
+            if before is None or before[0] != row:
+                conn.execute(_INSERT_CONTACT, row)
+            if before is None or before[1] != messages:
+                conn.execute("DELETE FROM messages WHERE msisdn = ?", (msisdn,))
+                conn.executemany(_INSERT_MESSAGE, messages)
+            written[msisdn] = (row, messages)
+
+        def done() -> None:
+            self._stored.update(written)
+            self._deleted.clear()
+
+        return done
+
+
+class StateDB:
+    """Estado en sqlite (WAL), compartible entre procesos."""
+
+    def __init__(self, path: Path = STATE_DB_PATH) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(path), timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # key -> JSON de la sección según lo último leído/escrito.
+        self._settings: Dict[str, str] = {}
+
+    # -- lectura --------------------------------------------------------------
+
+    def load_settings(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM settings").fetchall()
+        out: Dict[str, Any] = {}
+        seen: Dict[str, str] = {}
+        for key, raw in rows:
+            try:
+                out[key] = json.loads(raw)
+            except Exception:
+                continue
+            seen[key] = raw
+        self._settings = seen
+        return out
+
+    def version(self) -> int:
+        with self._lock:
+            return int(self._meta("version") or 0)
+
+    def verify_version(self, state: Dict[str, Any]) -> None:
+        found = self.version()
+        expected = int(state.get(VERSION_KEY) or 0)
+        if found != expected:
+            raise StaleWriteError(self.path, expected, found)
+
+    def contacts(self) -> _Contacts:
+        return _Contacts(self)
+
+    def fetch_contact(self, msisdn: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE msisdn = ?", (msisdn,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = self._conn.execute(
+                "SELECT at, text FROM messages WHERE msisdn = ? ORDER BY id", (msisdn,)
+            ).fetchall()
+        return _contact_from_row(row, [{"at": at, "text": text} for at, text in messages])
+
+    def contact_keys(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT msisdn FROM contacts ORDER BY rowid")]
+
+    def all_contacts(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {_CONTACT_COLUMNS} FROM contacts ORDER BY rowid").fetchall()
+            messages: Dict[str, List[Dict[str, str]]] = {}
+            for msisdn, at, text in self._conn.execute("SELECT msisdn, at, text FROM messages ORDER BY id"):
+                messages.setdefault(msisdn, []).append({"at": at, "text": text})
+        return {row[0]: _contact_from_row(row, messages.get(row[0], [])) for row in rows}
+
+    # -- escritura ------------------------------------------------------------
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """Escribe en una transacción solo lo que cambió desde la carga."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Dentro de la transacción: nadie puede escribir entre la revisión y el commit.
+                self.verify_version(state)
+                changes = self._conn.total_changes
+                done = [self._flush_settings(state)]
+                done.append(self._flush_contacts(state.get("contacts")))
+                version = int(state.get(VERSION_KEY) or 0)
+                if self._conn.total_changes != changes:
+                    version += 1
+                    self._set_meta("version", str(version))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            for callback in done:
+                callback()
+            state[VERSION_KEY] = version
+
+    def _flush_settings(self, state: Dict[str, Any]) -> Callable[[], None]:
+        written: Dict[str, str] = {}
+        for key, value in state.items():
+            if key in ("contacts", VERSION_KEY):
+                continue
+            if key == "metrics" and isinstance(value, dict):
+                value = {k: v for k, v in value.items() if k != "events"}
+            raw = _dump(value)
+            if self._settings.get(key) != raw:
+                self._conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, raw))
+                written[key] = raw
+        removed = [key for key in self._settings if key not in state]
+        for key in removed:
+            self._conn.execute("DELETE FROM settings WHERE key = ?", (key,))
+
+        def done() -> None:
+            self._settings.update(written)
+            for key in removed:
+                self._settings.pop(key, None)
+
+        return done
+
+    def _flush_contacts(self, contacts: Any) -> Callable[[], None]:
+        if isinstance(contacts, _Contacts) and contacts._db is self:
+            return contacts.flush(self._conn)
+        # Dict plano (estado armado a mano / migración): reemplazo completo.
+        items = dict(contacts or {})
+        self._conn.execute("DELETE FROM contacts")
+        self._conn.execute("DELETE FROM messages")
+        self._conn.executemany(_INSERT_CONTACT, (_contact_row(k, v) for k, v in items.items()))
+        self._conn.executemany(_INSERT_MESSAGE, (row for k, v in items.items() for row in _message_rows(k, v)))
+        return lambda: None
+
+    def migrate_once(self, json_path: Path, loader: Callable[[Path], Dict[str, Any]]) -> bool:
+        """Importa `json_path` la primera vez que se abre la base; True si migró."""
+        with self._lock:
+            if self._meta("migrated_at") is not None:
+                return False
+            state = loader(json_path) if json_path.exists() else None
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Otro proceso pudo migrar mientras tanto.
+                if self._meta("migrated_at") is not None:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                if state is not None:
+                    self._import(state)
+                self._set_meta("migrated_at", str(time.time()))
+                self._set_meta("migrated_from", str(json_path) if state is not None else "")
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return state is not None
+
+    def import_state(self, state: Dict[str, Any]) -> None:
+        """Reemplaza todo el contenido por `state` (dict plano)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._import(state)
+                self._set_meta("migrated_at", str(time.time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _import(self, state: Dict[str, Any]) -> None:
+        self._conn.execute("DELETE FROM settings")
+        self._settings.clear()
+        self._flush_settings(state)()
+        self._flush_contacts(state.get("contacts"))
+        self._set_meta("version", str(int(self._meta("version") or 0) + 1))
+
+    def export(self) -> Dict[str, Any]:
+        """Estado completo como dict plano (serializable a JSON)."""
+        state = self.load_settings()
+        state["contacts"] = self.all_contacts()
+        return state
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                table: int(self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+                for table in ("settings", "contacts", "messages")
+            }
+
+    def backup_to(self, path: Path) -> None:
+        """Copia consistente (incluye lo que siga en el WAL)."""
+        with self._lock:
+            dest = sqlite3.connect(str(path))
+            try:
+                self._conn.backup(dest)
+            finally:
+                dest.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_DBS: Dict[str, StateDB] = {}
+_DBS_LOCK = threading.Lock()
+
+
+def open_state_db(path: Path = STATE_DB_PATH) -> StateDB:
+    """Una conexión por archivo y por proceso (se reusa entre mensajes)."""
+    key = str(path)
+    with _DBS_LOCK:
+        db = _DBS.get(key)
+        if db is None:
+            db = _DBS[key] = StateDB(path)
+        return db
+
+
+def close_state_db(path: Optional[Path] = None) -> None:
+    """Cierra la conexión de `path` (o todas) abierta por `open_state_db`."""
+    with _DBS_LOCK:
+        keys = [str(path)] if path is not None else list(_DBS)
+        dbs = [_DBS.pop(key) for key in keys if key in _DBS]
+    for db in dbs:
+        db.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from clwabot.core import state_store
+
+    parser = argparse.ArgumentParser(description="Estado en sqlite: migración y export")
+    parser.add_argument("--db", type=Path, default=None, help="base sqlite (por defecto data/state.sqlite3)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    migrate = sub.add_parser("migrate", help="importa state.json (una sola vez)")
+    migrate.add_argument("--json", type=Path, default=None, help="por defecto data/state.json")
+    migrate.add_argument("--force", action="store_true", help="reimporta aunque ya se haya migrado")
+    sub.add_parser("export", help="imprime el estado como JSON")
+    sub.add_parser("stats", help="filas por tabla")
+    args = parser.parse_args(argv)
+
+    db = StateDB(args.db or state_store.STATE_DB_PATH)
+    try:
+        if args.cmd == "migrate":
+            json_path = args.json or state_store.STATE_PATH
+            if not json_path.exists():
+                print(f"[state_db] no existe {json_path}", file=sys.stderr)
+                return 1
+            if args.force:
+                db.import_state(state_store._read_state(json_path))
+                migrated = True
+            else:
+                migrated = db.migrate_once(json_path, state_store._read_state)
+            if migrated:
+                state_store.migrate_legacy_metrics(json_path)
+            status = "migrado" if migrated else "ya migrado (usa --force para reimportar)"
+            print(f"{json_path} -> {db.path}: {status}")
+            print(json.dumps(db.counts(), ensure_ascii=False))
+        elif args.cmd == "export":
+            print(json.dumps(db.export(), ensure_ascii=False, indent=2))
+        else:
+            print(json.dumps(db.counts(), ensure_ascii=False))
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
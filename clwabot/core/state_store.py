@@ -1,13 +1,31 @@
 from __future__ import annotations
 
-import json
+import os
+import threading
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from functools import partial
+from typing import Any, Dict, Iterable, Optional
+
+from .contact_record import ContactRecord, ContactTable
+from .file_lock import locked
+from .metrics_log import append_events
+from .persist import VERSION_KEY, StaleWriteError, read_json, verify_version, write_json
+from .state_db import STATE_DB_PATH, open_state_db
+from .unit_of_work import read_store, write_store
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATE_PATH = BASE_DIR / "data" / "state.json"
 
+# "json" (por defecto, `state.json`) | "sqlite" (`state.sqlite3`, ver core.state_db).
+STATE_BACKEND = os.environ.get("CLWABOT_STATE_BACKEND", "json").strip().lower()
+
+# Para read-modify-write chicos fuera de un unit of work (p. ej. presencia del
+# owner). Las decisiones no lo toman: entre hilos y entre procesos cuidan los
+# locks por archivo y las versiones de cada documento (ver core.persist).
+STORE_LOCK = threading.RLock()
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -28,26 +46,112 @@ def default_state() -> Dict[str, Any]:
             },
         },
         "contacts": {},
+        # Solo eventos aún no guardados: `save_state` los pasa a core.metrics_log.
         "metrics": {"events": []},
     }
 
 
 def load_state() -> Dict[str, Any]:
-    if not STATE_PATH.exists():
-        return default_state()
-    try:
-        raw = json.loads(STATE_PATH.read_text(encoding="utf-8"))
-    except Exception:
+    """Estado completo; dentro de un `unit_of_work()` se lee una sola vez.
+
+    Con el backend sqlite `contacts` se lee a pedido. `metrics.events` parte
+    vacío (salvo los de un `state.json` antiguo, que el próximo `save_state`
+    pasa al log): las métricas viven en `core.metrics_log`.
+    """
+    if STATE_BACKEND == "sqlite":
+        return read_store(STATE_DB_PATH, partial(_read_state_db, STATE_DB_PATH, STATE_PATH))
+    return read_store(STATE_PATH, partial(_read_state, STATE_PATH))
+
+
+def save_state(state: Dict[str, Any]) -> None:
+    if STATE_BACKEND == "sqlite":
+        write_store(
+            STATE_DB_PATH,
+            state,
+            partial(_write_state_db, STATE_DB_PATH),
+            verify=partial(_verify_state_db, STATE_DB_PATH),
+        )
+        return
+    write_store(STATE_PATH, state, partial(_write_state, STATE_PATH), verify=partial(verify_version, STATE_PATH))
+
+
+def _read_state(path: Path) -> Dict[str, Any]:
+    raw = read_json(path, default_state)
+    if not isinstance(raw, dict):
         return default_state()
 
     merged = default_state()
     _deep_merge(merged, raw)
+    merged["contacts"] = ContactTable(merged["contacts"] if isinstance(merged["contacts"], dict) else {})
+    # Un state.json de antes del log de métricas trae `metrics.events`: no se
+    # tocan al leer; el próximo `save_state` (o `migrate_legacy_metrics`) los
+    # pasa al log.
     return merged
 
 
-def save_state(state: Dict[str, Any]) -> None:
-    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+def migrate_legacy_metrics(path: Optional[Path] = None) -> int:
+    """Pasa al log los `metrics.events` de un `state.json` antiguo; devuelve cuántos.
+
+    Con el backend json basta el próximo `save_state`; esto es para quien ya
+    no vuelve a escribir `state.json` (la migración a sqlite).
+    """
+    path = path or STATE_PATH
+    while True:
+        state = _read_state(path)
+        moved = len(state["metrics"]["events"])
+        if not moved:
+            return 0
+        try:
+            _write_state(path, state)
+            return moved
+        except StaleWriteError:
+            # Otro proceso lo reescribió (y quizá migró) entre medio.
+            continue
+
+
+def _flush_metric_events(state: Dict[str, Any]) -> None:
+    metrics = state.get("metrics")
+    events = metrics.get("events") if isinstance(metrics, dict) else None
+    if events:
+        append_events(events)
+        del events[:]
+
+
+def _write_state(path: Path, state: Dict[str, Any]) -> None:
+    with locked(path):
+        # Primero la versión: un estado obsoleto no debe dejar sus eventos en el log.
+        verify_version(path, state)
+        _flush_metric_events(state)
+        # Sin indentar: los contactos son arreglos compactos y con indent cada campo iría en su línea.
+        write_json(path, state, indent=None, versioned=True)
+
+
+def _read_state_db(db_path: Path, json_path: Path) -> Dict[str, Any]:
+    db = open_state_db(db_path)
+    # Primera apertura: importa state.json si existe.
+    if db.migrate_once(json_path, _read_state):
+        migrate_legacy_metrics(json_path)
+    state = default_state()
+    # La versión antes que los datos: si alguien escribe entre medio, el save falla.
+    state[VERSION_KEY] = db.version()
+    _deep_merge(state, db.load_settings())
+    state["contacts"] = db.contacts()
+    if not isinstance(state.get("metrics"), dict):
+        state["metrics"] = {}
+    state["metrics"]["events"] = []
+    return state
+
+
+def _verify_state_db(db_path: Path, state: Dict[str, Any]) -> None:
+    open_state_db(db_path).verify_version(state)
+
+
+def _write_state_db(db_path: Path, state: Dict[str, Any]) -> None:
+    db = open_state_db(db_path)
+    with locked(db_path):
+        db.verify_version(state)
+        _flush_metric_events(state)
+        db.save(state)
 
 
 def _deep_merge(target: Dict[str, Any], src: Dict[str, Any]) -> None:
@@ -58,48 +162,39 @@ def _deep_merge(target: Dict[str, Any], src: Dict[str, Any]) -> None:
             target[k] = v
 
 
-def ensure_contact(state: Dict[str, Any], msisdn: str) -> Dict[str, Any]:
+def ensure_contact(state: Dict[str, Any], msisdn: str) -> ContactRecord:
+    """Registro del contacto (ver core.contact_record); lo crea si no existe."""
     contacts = state.setdefault("contacts", {})
-    contact = contacts.setdefault(
-        msisdn,
-        {
-            "name": "",
-            "priority": "normal",  # low | normal | high | critical
-            "last_seen_at": "",
-            "last_intent": "",
-            "last_messages": [],
-            "tags": [],
-            "stats": {"inbound": 0, "auto_replies": 0},
-        },
-    )
+    contact = contacts.get(msisdn)
+    if not isinstance(contact, ContactRecord):
+        # Nuevo, o un dict legacy puesto a mano: se pasa a registro.
+        contact = contacts[msisdn] = ContactRecord.load(contact)
     return contact
 
 
 def append_contact_message(state: Dict[str, Any], msisdn: str, text: str) -> None:
     contact = ensure_contact(state, msisdn)
-    contact["last_seen_at"] = _now_iso()
-    contact.setdefault("stats", {}).setdefault("inbound", 0)
-    contact["stats"]["inbound"] += 1
-    msgs = contact.setdefault("last_messages", [])
-    msgs.append({"at": _now_iso(), "text": text})
-    if len(msgs) > 10:
-        del msgs[:-10]
+    now = int(time.time())
+    contact.last_seen = now
+    contact.inbound += 1
+    contact.push_message(now, text)
 
 
 def set_contact_intent(state: Dict[str, Any], msisdn: str, intent: str) -> None:
-    contact = ensure_contact(state, msisdn)
-    contact["last_intent"] = intent
+    ensure_contact(state, msisdn).intent = intent
 
 
 def increment_auto_reply(state: Dict[str, Any], msisdn: str) -> None:
-    contact = ensure_contact(state, msisdn)
-    contact.setdefault("stats", {}).setdefault("auto_replies", 0)
-    contact["stats"]["auto_replies"] += 1
+    ensure_contact(state, msisdn).auto_replies += 1
 
 
 def add_metric_event(state: Dict[str, Any], event: Dict[str, Any]) -> None:
+    """Deja el evento pendiente en `state`; `save_state` lo agrega al log."""
     metrics = state.setdefault("metrics", {}).setdefault("events", [])
-    payload = {"at": _now_iso(), **event}
-    metrics.append(payload)
-    if len(metrics) > 5000:
-        del metrics[:-5000]
+    metrics.append({"at": _now_iso(), **event})
+
+
+def record_metric_events(events: Iterable[Dict[str, Any]]) -> int:
+    """Agrega varios eventos de métricas al log, sin pasar por el estado."""
+    at = _now_iso()
+    return append_events([{"at": at, **event} for event in events])
@@ -0,0 +1,196 @@
+"""Registro de plantillas de respuesta precompiladas.
+
+`config/scripts.yaml` se lee una vez; los guiones (`scripts`) quedan tal cual
+y las plantillas de mensajes (intro/resumen de reunión, confirmación de
+urgencia...) se precompilan a piezas: texto fijo + campos. Los campos de
+`identity` (`agent_name`, `user_name`) se resuelven al compilar, así una
+plantilla sin campos variables queda como un string cacheado y el resto se
+arma con un solo `join`.
+
+Las plantillas por defecto viven en `BUILTIN_TEMPLATES` y se pueden
+sobrescribir con una sección `templates:` en `scripts.yaml` (mismo formato
+`{campo}` de `str.format`). Si el archivo cambia (mtime/tamaño, revisado a lo
+más cada `CHECK_INTERVAL_SECONDS`) se recompila todo.
+"""
+
+from __future__ import annotations
+
+import string
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+import yaml
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SCRIPTS_PATH = BASE_DIR / "config" / "scripts.yaml"
+CHECK_INTERVAL_SECONDS = 1.0
+
+DEFAULT_IDENTITY = {"agent_name": "asistente", "user_name": "Lucas"}
+
+BUILTIN_TEMPLATES: Dict[str, str] = {
+    "meeting.intro": (
+        "Hola 👋 Soy {agent_name}, asistente de {user_name}.\n"
+        "Te ayudo a agendar una reunión en formato rápido.\n\n"
+        "Ejemplo de respuesta para tema:\n"
+        "Revisión de propuesta comercial\n\n"
+        "Primero: ¿cuál es el tema de la reunión?"
+    ),
+    "meeting.summary": (
+        "Perfecto, este es el borrador de la reunión:\n"
+        "- Tema: {topic}\n"
+        "- Fecha: {date_text}\n"
+        "- Hora: {time_text}\n"
+        "- Duración: {duration_text}\n"
+        "- Modalidad: {mode_text}\n\n"
+        "Responde:\n"
+        "1) Confirmar y agendar\n"
+        "2) Editar datos\n"
+        "o escribe 'cancelar'."
+    ),
+    "urgencia.confirmation": (
+        "Perfecto, te resumo lo que registré:\n"
+        "- Tipo: {kind}\n"
+        "- Detalle: {detail}\n\n"
+        "Responde:\n"
+        "1) Confirmar\n"
+        "2) Editar\n"
+        "3) Cancelar"
+    ),
+    "urgencia.retry": (
+        "⚠️ REINTENTO AUTOMÁTICO: urgencia inmediata pendiente de atención.\n"
+        "Resumen: {summary}"
+    ),
+}
+
+_FORMATTER = string.Formatter()
+
+
+class Template:
+    """Plantilla partida en texto fijo y campos, compilada una sola vez."""
+
+    __slots__ = ("name", "pieces", "fields", "static")
+
+    def __init__(self, name: str, source: str, bound: Optional[Dict[str, Any]] = None) -> None:
+        bound = bound or {}
+        pieces: list = []
+        literal = ""
+        for text, field, spec, conversion in _FORMATTER.parse(source):
+            literal += text
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"campo no soportado: {{{field}}}")
+            if field in bound:
+                literal += str(bound[field])
+                continue
+            pieces.append(literal)
+            pieces.append(_Field(field))
+            literal = ""
+        pieces.append(literal)
+        self.name = name
+        self.pieces = tuple(p for p in pieces if p != "")
+        self.fields = tuple(p.name for p in pieces if isinstance(p, _Field))
+        self.static = literal if not self.fields else None
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        if self.static is not None:
+            return self.static
+        try:
+            return "".join([p if p.__class__ is str else str(values[p.name]) for p in self.pieces])
+        except KeyError as exc:
+            raise KeyError(f"plantilla {self.name}: falta el campo {exc.args[0]}") from None
+
+
+class _Field:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+
+class TemplateRegistry:
+    def __init__(self, path: Path = SCRIPTS_PATH, check_interval: float = CHECK_INTERVAL_SECONDS) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature: Optional[tuple] = None
+        self._next_check = 0.0
+        self._identity: Dict[str, str] = dict(DEFAULT_IDENTITY)
+        self._scripts: Dict[str, str] = {}
+        self._templates: Dict[str, Template] = {}
+        self.loads = 0
+
+    def render(self, name: str, **values: Any) -> str:
+        return self._current()[name].render(values)
+
+    def render_map(self, name: str, values: Mapping[str, Any]) -> str:
+        """Como `render`, pero toma un mapping ya armado (p. ej. `obj.__dict__`)."""
+        return self._current()[name].render(values)
+
+    def script(self, name: str) -> str:
+        """Guion crudo de `scripts:` ('' si no existe)."""
+        self._current()
+        return self._scripts.get(name, "")
+
+    def identity(self, key: str) -> str:
+        self._current()
+        return self._identity.get(key, DEFAULT_IDENTITY.get(key, ""))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._signature = None
+            self._next_check = 0.0
+
+    def _current(self) -> Dict[str, Template]:
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._templates
+        with self._lock:
+            self._next_check = now + self.check_interval
+            signature = self._stat()
+            if signature != self._signature or not self._templates:
+                self._load()
+                self._signature = signature
+            return self._templates
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> None:
+        raw: Dict[str, Any] = {}
+        if self.path.exists():
+            try:
+                raw = yaml.safe_load(self.path.read_text(encoding="utf-8")) or {}
+            except Exception as exc:
+                print(f"[templates] no se pudo leer {self.path}: {exc}", file=sys.stderr)
+                raw = {}
+        identity = dict(DEFAULT_IDENTITY)
+        identity.update({k: str(v) for k, v in (raw.get("identity") or {}).items()})
+        scripts = {str(k): str(v) for k, v in (raw.get("scripts") or {}).items() if v is not None}
+        sources = dict(BUILTIN_TEMPLATES)
+        sources.update({str(k): str(v) for k, v in (raw.get("templates") or {}).items() if v is not None})
+        templates = {}
+        for name, source in sources.items():
+            try:
+                templates[name] = Template(name, source, bound=identity)
+            except ValueError as exc:
+                print(f"[templates] plantilla {name} inválida ({exc}); se usa la por defecto", file=sys.stderr)
+                templates[name] = Template(name, BUILTIN_TEMPLATES.get(name, ""), bound=identity)
+        self._identity = identity
+        self._scripts = scripts
+        self._templates = templates
+        self.loads += 1
+
+
+TEMPLATES = TemplateRegistry()
+
+
+def render(name: str, **values: Any) -> str:
+    return TEMPLATES.render(name, **values)
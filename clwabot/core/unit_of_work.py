@@ -0,0 +1,150 @@
+"""Unit of work por mensaje para los stores JSON locales.
+
+Dentro de `with unit_of_work():` cada store (`state.json`, sesiones de
+reunión/urgencia, `urgencias.json`) se lee a lo más una vez: las lecturas
+siguientes devuelven el mismo documento en memoria, y los `save_*` solo lo
+marcan como sucio. Al salir sin excepción se escriben una vez los stores
+sucios, en el orden en que se ensuciaron; si hubo excepción se descartan.
+
+Fuera de un unit of work `read_store`/`write_store` van directo a disco, igual
+que antes. El contexto vive en un `ContextVar`: no se comparte entre hilos y
+un `unit_of_work()` anidado se une al que ya está abierto.
+
+Entre procesos: el commit toma el lock (`core.file_lock`) de todos los stores
+sucios y revisa sus versiones (`verify`) antes de escribir el primero; si otro
+proceso escribió alguno desde que se leyó, no se escribe nada y sale
+`StaleWriteError`. `run_unit_of_work` repite la función completa con datos
+frescos hasta que el commit pasa.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+
+from .file_lock import locked
+from .persist import StaleWriteError
+
+T = TypeVar("T")
+
+STALE_RETRIES = 20
+
+_CURRENT: ContextVar[Optional["UnitOfWork"]] = ContextVar("clwabot_unit_of_work", default=None)
+
+
+class UnitOfWork:
+    def __init__(self) -> None:
+        self._docs: Dict[Path, Any] = {}
+        # path -> writer; dict para mantener el orden en que se ensuciaron.
+        self._dirty: Dict[Path, Callable[[Any], None]] = {}
+        self._verify: Dict[Path, Callable[[Any], None]] = {}
+        self.reads = 0
+        self.writes = 0
+
+    def read(self, path: Path, loader: Callable[[], Any]) -> Any:
+        if path not in self._docs:
+            self._docs[path] = loader()
+            self.reads += 1
+        return self._docs[path]
+
+    def write(
+        self,
+        path: Path,
+        doc: Any,
+        writer: Callable[[Any], None],
+        verify: Optional[Callable[[Any], None]] = None,
+    ) -> None:
+        self._docs[path] = doc
+        self._dirty.pop(path, None)
+        self._dirty[path] = writer
+        if verify is not None:
+            self._verify[path] = verify
+
+    @property
+    def dirty(self) -> list[Path]:
+        return list(self._dirty)
+
+    def commit(self) -> None:
+        dirty, self._dirty = self._dirty, {}
+        checks = {path: self._verify[path] for path in dirty if path in self._verify}
+        with locked(*checks):
+            # Todo o nada: se revisan todas las versiones antes de escribir.
+            for path, verify in checks.items():
+                verify(self._docs[path])
+            for path, writer in dirty.items():
+                writer(self._docs[path])
+                self.writes += 1
+
+    def rollback(self) -> None:
+        self._dirty = {}
+        self._verify = {}
+        self._docs = {}
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def unit_of_work() -> Iterator[UnitOfWork]:
+    active = _CURRENT.get()
+    if active is not None:
+        yield active
+        return
+    uow = UnitOfWork()
+    token = _CURRENT.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        uow.rollback()
+        raise
+    else:
+        uow.commit()
+    finally:
+        _CURRENT.reset(token)
+
+
+def run_unit_of_work(fn: Callable[..., T], *args: Any, attempts: int = STALE_RETRIES, **kwargs: Any) -> T:
+    """`fn` dentro de un unit of work; si el commit queda obsoleto, la repite.
+
+    `fn` debe dejar sus efectos en los stores: se ejecuta otra vez desde cero.
+    Dentro de un unit of work ya abierto solo se une (reintenta el de afuera).
+    """
+    if _CURRENT.get() is not None:
+        return fn(*args, **kwargs)
+    attempt = 0
+    while True:
+        try:
+            with unit_of_work():
+                return fn(*args, **kwargs)
+        except StaleWriteError:
+            attempt += 1
+            if attempt >= attempts:
+                raise
+            # Backoff corto con jitter para que los procesos no choquen de nuevo.
+            time.sleep(random.uniform(0, 0.002 * attempt))
+
+
+def read_store(path: Path, loader: Callable[[], Any]) -> Any:
+    uow = _CURRENT.get()
+    if uow is None:
+        return loader()
+    return uow.read(path, loader)
+
+
+def write_store(
+    path: Path,
+    doc: Any,
+    writer: Callable[[Any], None],
+    verify: Optional[Callable[[Any], None]] = None,
+) -> None:
+    """Fuera de un unit of work escribe ya (`writer` revisa su propia versión)."""
+    uow = _CURRENT.get()
+    if uow is None:
+        writer(doc)
+    else:
+        uow.write(path, doc, writer, verify)
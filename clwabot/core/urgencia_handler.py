@@ -1,12 +1,15 @@
-import json
 import uuid
 import re
 from difflib import SequenceMatcher
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from pathlib import Path
 from typing import Optional
 
+from .persist import read_json, verify_version, write_json
+from .unit_of_work import read_store, write_store
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_PATH = BASE_DIR / "data" / "urgencias.json"
 CALENDAR_DIR = BASE_DIR / "calendar"
@@ -35,18 +38,19 @@ class Urgencia:
 
 
 def _load_state() -> dict:
-  if not DATA_PATH.exists():
-    return {"urgencias": []}
-  try:
-    return json.loads(DATA_PATH.read_text(encoding="utf-8"))
-  except Exception:
-    # fallback defensivo
-    return {"urgencias": []}
+  return read_store(DATA_PATH, partial(_read_urgencias, DATA_PATH))
 
 
 def _save_state(state: dict) -> None:
-  DATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-  DATA_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+  write_store(DATA_PATH, state, partial(_write_urgencias, DATA_PATH), verify=partial(verify_version, DATA_PATH))
+
+
+def _read_urgencias(path: Path) -> dict:
+  return read_json(path, lambda: {"urgencias": []})
+
+
+def _write_urgencias(path: Path, state: dict) -> None:
+  write_json(path, state, versioned=True)
 
 
 def _normalize_for_match(text: str) -> str:
@@ -81,7 +85,7 @@ def _normalize_text(value: str) -> str:
   return " ".join((value or "").strip().lower().split())
 
 
-def _severity_for_kind(kind: str) -> str:
+def severity_for_kind(kind: str) -> str:
   if kind == "inmediata":
     return "critical"
   if kind in {"evento", "recordatorio"}:
@@ -131,7 +135,7 @@ def registrar_urgencia(from_msisdn: str, text: str, source: str = "whatsapp", ki
       source=duplicate.get("source", source),
       kind=duplicate.get("kind", kind),
       seen_by_owner=duplicate.get("seen_by_owner", False),
-      severity=duplicate.get("severity", _severity_for_kind(kind)),
+      severity=duplicate.get("severity", severity_for_kind(kind)),
       is_duplicate=True,
       duplicate_of=duplicate.get("id", ""),
     )
@@ -145,7 +149,7 @@ def registrar_urgencia(from_msisdn: str, text: str, source: str = "whatsapp", ki
     created_at=now_iso,
     source=source,
     kind=kind,
-    severity=_severity_for_kind(kind),
+    severity=severity_for_kind(kind),
   )
   state.setdefault("urgencias", []).append(urg.__dict__)
   _save_state(state)
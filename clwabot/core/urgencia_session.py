@@ -2,16 +2,20 @@
 
 from __future__ import annotations
 
-import json
+import os
 import re
 import unicodedata
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import partial
 from pathlib import Path
 from typing import Dict, Optional, Tuple
 
 from .ics_maker import TZ, make_ics
-from .urgencia_handler import manejar_urgencia, mensaje_contiene_urgencia
+from .persist import read_json, verify_version, write_json
+from .templates import TEMPLATES
+from .unit_of_work import read_store, write_store
+from .urgencia_handler import manejar_urgencia, mensaje_contiene_urgencia, severity_for_kind
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 SESSIONS_PATH = BASE_DIR / "data" / "urgencia_sessions.json"
@@ -72,17 +76,24 @@ def _empty_response() -> Dict[str, str]:
 
 
 def _load_sessions() -> Dict[str, dict]:
-    if not SESSIONS_PATH.exists():
-        return {"sessions": []}
-    try:
-        return json.loads(SESSIONS_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return {"sessions": []}
+    return read_store(SESSIONS_PATH, partial(_read_sessions, SESSIONS_PATH))
 
 
 def _save_sessions(state: Dict[str, dict]) -> None:
-    SESSIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    SESSIONS_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_store(
+        SESSIONS_PATH,
+        state,
+        partial(_write_sessions, SESSIONS_PATH),
+        verify=partial(verify_version, SESSIONS_PATH),
+    )
+
+
+def _read_sessions(path: Path) -> Dict[str, dict]:
+    return read_json(path, lambda: {"sessions": []})
+
+
+def _write_sessions(path: Path, state: Dict[str, dict]) -> None:
+    write_json(path, state, versioned=True)
 
 
 def _new_session_id() -> str:
@@ -98,6 +109,43 @@ def get_active_session(msisdn: str) -> Optional[UrgenciaSession]:
     return None
 
 
+class ActiveSessionView:
+    """Vista en memoria de los msisdn con sesión activa.
+
+    Para procesos de larga vida (watchers): solo re-lee `SESSIONS_PATH` cuando
+    cambia su firma (inode/mtime/tamaño) o tras `invalidate()`.
+    """
+
+    def __init__(self) -> None:
+        self._signature: Optional[tuple] = None
+        self._active: set[str] = set()
+        self.reloads = 0
+
+    def invalidate(self) -> None:
+        self._signature = None
+
+    def is_active(self, msisdn: str) -> bool:
+        self._refresh()
+        return msisdn in self._active
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(SESSIONS_PATH)
+            signature = (str(SESSIONS_PATH), st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = (str(SESSIONS_PATH), None)
+        if signature == self._signature:
+            return
+        state = _load_sessions()
+        self._active = {
+            raw.get("msisdn")
+            for raw in state.get("sessions", [])
+            if raw.get("state") in ACTIVE_STATES
+        }
+        self._signature = signature
+        self.reloads += 1
+
+
 def start_session(msisdn: str) -> UrgenciaSession:
     state = _load_sessions()
     sess = UrgenciaSession(
@@ -280,15 +328,7 @@ def _short_summary(text: str, max_len: int = 140) -> str:
 
 
 def _build_confirmation_message(kind: str, detail: str) -> str:
-    return (
-        "Perfecto, te resumo lo que registré:\n"
-        f"- Tipo: {kind}\n"
-        f"- Detalle: {_short_summary(detail, 220)}\n\n"
-        "Responde:\n"
-        "1) Confirmar\n"
-        "2) Editar\n"
-        "3) Cancelar"
-    )
+    return TEMPLATES.render("urgencia.confirmation", kind=kind, detail=_short_summary(detail, 220))
 
 
 def _finalize_simple(kind: str, msisdn: str, detail: str) -> Dict[str, str]:
@@ -300,12 +340,10 @@ def _finalize_simple(kind: str, msisdn: str, detail: str) -> Dict[str, str]:
         "owner_ics_path": "",
         "owner_retry_message": "",
         "owner_retry_delay_sec": "0",
+        "severity": severity_for_kind(kind),
     }
     if kind == "inmediata":
-        resp["owner_retry_message"] = (
-            "⚠️ REINTENTO AUTOMÁTICO: urgencia inmediata pendiente de atención.\n"
-            f"Resumen: {_short_summary(detail)}"
-        )
+        resp["owner_retry_message"] = TEMPLATES.render("urgencia.retry", summary=_short_summary(detail))
         resp["owner_retry_delay_sec"] = "120"
         resp["vip_message"] = "Ya lo marqué como URGENCIA INMEDIATA y lo estoy escalando a Lucas."
     return resp
@@ -329,6 +367,7 @@ def _finalize_recordatorio(msisdn: str, detail: str) -> Dict[str, str]:
         "owner_ics_path": str(ics_path),
         "owner_retry_message": "",
         "owner_retry_delay_sec": "0",
+        "severity": severity_for_kind("recordatorio"),
     }
 
 
@@ -354,6 +393,7 @@ def _finalize_event(msisdn: str, detail: str, all_day: bool) -> Dict[str, str]:
         "owner_ics_path": str(ics_path),
         "owner_retry_message": "",
         "owner_retry_delay_sec": "0",
+        "severity": severity_for_kind("evento"),
     }
 
 
@@ -10,6 +10,10 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
 
 from .meeting_session import get_active_meeting_session
+from .metrics_log import event_count, recent_events
+from .outbox import OUTBOX_PATH, UNDELIVERED, Outbox
+from .file_lock import locked
+from .persist import StaleWriteError, read_json, write_json
 from .state_store import load_state, save_state
 from .urgencia_session import get_active_session
 
@@ -33,17 +37,11 @@ def _json_response(handler: BaseHTTPRequestHandler, payload: dict, code: int = 2
 
 
 def _load_json(path: Path, fallback: dict) -> dict:
-    if not path.exists():
-        return fallback
-    try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return fallback
+    return read_json(path, lambda: fallback)
 
 
 def _save_json(path: Path, payload: dict) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(path, payload, versioned=True)
 
 
 def _parse_iso(value: str) -> datetime | None:
@@ -159,9 +157,8 @@ def _build_meetings() -> list[dict]:
 
 
 def _build_timeline(limit: int = 40) -> list[dict]:
-    state = load_state()
     events = []
-    for ev in state.get("metrics", {}).get("events", []):
+    for ev in recent_events(max(1, min(limit, 200))):
         at = ev.get("at", "")
         kind = ev.get("kind", "metric")
         events.append({"at": at, "kind": kind, "summary": _compact(json.dumps(ev, ensure_ascii=False), 180)})
@@ -191,6 +188,33 @@ def _build_timeline(limit: int = 40) -> list[dict]:
     return events[: max(1, min(limit, 200))]
 
 
+def _build_outbox(limit: int = 30) -> dict:
+    if not OUTBOX_PATH.exists():
+        return {"counts": {}, "undelivered_total": 0, "undelivered": []}
+    outbox = Outbox(OUTBOX_PATH)
+    try:
+        rows = []
+        for item in outbox.undelivered(limit=limit):
+            rows.append(
+                {
+                    "key": item.key,
+                    "created_at": datetime.fromtimestamp(item.created_ts, timezone.utc).isoformat(),
+                    "target": item.target,
+                    "role": item.role,
+                    "status": item.status,
+                    "attempts": item.attempts,
+                    "next_attempt_at": datetime.fromtimestamp(item.next_attempt_ts, timezone.utc).isoformat(),
+                    "summary": _compact(item.message, 120),
+                    "last_error": _compact(item.last_error, 120),
+                }
+            )
+        counts = outbox.counts()
+        total = sum(counts.get(status, 0) for status in UNDELIVERED)
+        return {"counts": counts, "undelivered_total": total, "undelivered": rows}
+    finally:
+        outbox.close()
+
+
 def _build_status(range_days: int, kind: str) -> dict:
     state = load_state()
     contacts = state.get("contacts", {})
@@ -212,7 +236,7 @@ def _build_status(range_days: int, kind: str) -> dict:
         "contacts_total": len(contacts),
         "active_urgencias": [msisdn for msisdn in contacts if get_active_session(msisdn)],
         "active_meetings": [msisdn for msisdn in contacts if get_active_meeting_session(msisdn)],
-        "metrics_count": len(state.get("metrics", {}).get("events", [])),
+        "metrics_count": event_count(days_back=max(1, min(365, range_days))),
         "urgencias": urgencias,
         "urgencias_week": {
             "total": len(weekly_urg),
@@ -223,6 +247,7 @@ def _build_status(range_days: int, kind: str) -> dict:
         },
         "meetings": meetings,
         "timeline": _build_timeline(),
+        "outbox": _build_outbox(),
         "services": {
             "openclaw_gateway": _service_status("openclaw-gateway.service"),
             "clwabot_router": _service_status("clwabot-router.service"),
@@ -347,6 +372,7 @@ function render(data){
       <div class="card"><div class="muted">Reuniones</div><div class="kpi">${(data.meetings || []).length}</div></div>
       <div class="card"><div class="muted">Gateway</div><div class="pill ${serviceClass(data.services.openclaw_gateway)}">${esc(data.services.openclaw_gateway)}</div></div>
       <div class="card"><div class="muted">Router</div><div class="pill ${serviceClass(data.services.clwabot_router)}">${esc(data.services.clwabot_router)}</div></div>
+      <div class="card"><div class="muted">Envíos sin entregar</div><div class="kpi ${data.outbox?.undelivered_total ? "warn" : ""}">${data.outbox?.undelivered_total ?? 0}</div></div>
     </div>
 
     <div class="card">
@@ -422,6 +448,23 @@ function render(data){
       </tbody></table>
     </div>
 
+    <div class="card">
+      <h3>Outbox (sin entregar)</h3>
+      <table><thead><tr><th>Hora</th><th>Destino</th><th>Texto</th><th>Estado</th><th>Intentos</th><th>Próximo</th><th>Error</th><th>Acción</th></tr></thead><tbody>
+      ${(data.outbox?.undelivered || []).map(x => `
+        <tr>
+          <td>${esc(x.created_at)}</td>
+          <td>${esc(x.target)} <span class="muted">${esc(x.role)}</span></td>
+          <td>${esc(x.summary)}</td>
+          <td class="${x.status === "dead" ? "bad" : "warn"}">${esc(x.status)}</td>
+          <td>${esc(x.attempts)}</td>
+          <td>${esc(x.next_attempt_at)}</td>
+          <td>${esc(x.last_error || "-")}</td>
+          <td><button onclick="retryOutbox('${esc(x.key)}')">reintentar</button></td>
+        </tr>`).join("")}
+      </tbody></table>
+    </div>
+
     <div class="card">
       <h3>Timeline</h3>
       <ul class="timeline">
@@ -482,6 +525,11 @@ async function setMeetingStatus(queue_index, status){
   await refresh();
 }
 
+async function retryOutbox(key){
+  await api("/api/outbox/retry", "POST", { key });
+  await refresh();
+}
+
 async function serviceAction(service, action){
   await api("/api/services/action", "POST", { service, action });
   await refresh();
@@ -499,6 +547,13 @@ refresh();
         self.wfile.write(body)
 
     def do_POST(self):  # noqa: N802
+        try:
+            self._post()
+        except StaleWriteError:
+            # Otro proceso escribió el store mientras tanto: el panel puede reintentar.
+            _json_response(self, {"ok": False, "error": "conflict, retry"}, code=409)
+
+    def _post(self) -> None:
         path, _ = self._route()
         body = _read_json_body(self)
         state = load_state()
@@ -541,17 +596,19 @@ refresh();
 
         if path == "/api/urgencias/seen":
             urg_id = str(body.get("id", "")).strip()
-            data = _load_json(URGENCIAS_PATH, {"urgencias": []})
-            found = False
-            for row in data.get("urgencias", []):
-                if row.get("id") == urg_id:
-                    row["seen_by_owner"] = True
-                    found = True
-                    break
+            with locked(URGENCIAS_PATH):
+                data = _load_json(URGENCIAS_PATH, {"urgencias": []})
+                found = False
+                for row in data.get("urgencias", []):
+                    if row.get("id") == urg_id:
+                        row["seen_by_owner"] = True
+                        found = True
+                        break
+                if found:
+                    _save_json(URGENCIAS_PATH, data)
             if not found:
                 _json_response(self, {"ok": False, "error": "urgencia not found"}, code=404)
                 return
-            _save_json(URGENCIAS_PATH, data)
             _json_response(self, {"ok": True, "id": urg_id})
             return
 
@@ -564,16 +621,35 @@ refresh();
             if status not in MEETING_STATUS_OPTIONS:
                 _json_response(self, {"ok": False, "error": "invalid status"}, code=400)
                 return
-            data = _load_json(QUEUE_PATH, {"events": []})
-            events = data.get("events", [])
-            if idx < 0 or idx >= len(events):
+            with locked(QUEUE_PATH):
+                data = _load_json(QUEUE_PATH, {"events": []})
+                events = data.get("events", [])
+                valid = 0 <= idx < len(events)
+                if valid:
+                    events[idx]["status"] = status
+                    _save_json(QUEUE_PATH, data)
+            if not valid:
                 _json_response(self, {"ok": False, "error": "invalid queue_index"}, code=400)
                 return
-            events[idx]["status"] = status
-            _save_json(QUEUE_PATH, data)
             _json_response(self, {"ok": True, "queue_index": idx, "status": status})
             return
 
+        if path == "/api/outbox/retry":
+            key = str(body.get("key", "")).strip()
+            if not key or not OUTBOX_PATH.exists():
+                _json_response(self, {"ok": False, "error": "outbox item not found"}, code=404)
+                return
+            outbox = Outbox(OUTBOX_PATH)
+            try:
+                ok = outbox.requeue(key)
+            finally:
+                outbox.close()
+            if not ok:
+                _json_response(self, {"ok": False, "error": "outbox item not found"}, code=404)
+                return
+            _json_response(self, {"ok": True, "key": key})
+            return
+
         if path == "/api/services/action":
             service = str(body.get("service", "")).strip()
             action = str(body.get("action", "")).strip()
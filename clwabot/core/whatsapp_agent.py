@@ -5,12 +5,10 @@ La idea es que el runtime de OpenClaw (o cualquier listener) haga:
     from clwabot.core.whatsapp_agent import handle_incoming
 
     decision = handle_incoming(msisdn, text)
-    if decision["policy"] == "owner":
+    if decision.policy == "owner":
         # dejar que el agente responda libremente al owner
-    elif decision["policy"] == "alert_owner":
-        # enviar decision["message"] al owner
-    elif decision["policy"] == "reply_to_vip":
-        # enviar decision["message"] al VIP (catálogo, preguntas, etc.)
+    elif decision.policy in {"alert_owner", "reply_to_vip"}:
+        # despachar decision.actions (ya planificados)
     else:
         # silencio
 
@@ -24,11 +22,12 @@ esta misma función (por ejemplo usando una pequeña máquina de estados
 persistida en JSON).
 """
 
-from typing import Dict, Literal
+from typing import Any
 
 from .assistant_control import handle_owner_command, is_within_business_hours
 from .auto_reply import pick_auto_reply
 from .intent_router import classify_intent, classify_priority
+from .decision import SILENCE, Decision, delay_seconds
 from .validator import validate_message, OWNER_MSISDN, VIP_MSISDN
 from .meeting_session import get_active_meeting_session, handle_meeting_message
 from .state_store import (
@@ -39,16 +38,18 @@ from .state_store import (
   save_state,
   set_contact_intent,
 )
+from .unit_of_work import run_unit_of_work
 from .urgencia_session import get_active_session, handle_vip_urgency_message
 
 
-Policy = Literal["owner", "alert_owner", "reply_to_vip", "silence"]
+def _decision(**values: Any) -> Decision:
+  return Decision.make(OWNER_MSISDN, VIP_MSISDN, **values)
 
 
-def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
+def handle_incoming(msisdn: str, text: str) -> Decision:
   """Devuelve una decisión de alto nivel sobre qué hacer con el mensaje.
 
-  Estructura del dict de respuesta:
+  Campos principales de `Decision` (ver `core.decision`):
   - policy:
       - "owner"        → el runtime deja que el agente responda normal al owner
       - "reply_to_vip" → hay que mandar message al VIP; owner_message opcional
@@ -57,8 +58,24 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
   - target_msisdn: destinatario principal de `message` (owner o vip)
   - message: texto principal a enviar (puede ir al owner o al vip según policy)
   - owner_message: texto adicional SOLO para el owner (puede ser "")
+  - severity: severidad de la urgencia VIP cuando aplica (normal | high | critical)
+  - actions: envíos ya planificados, con los delays como enteros
+
+  `decision.to_dict()` entrega el dict de antes para integraciones legacy.
+
+  Todo corre en un unit of work: `state.json` y los archivos de sesiones se
+  leen a lo más una vez por mensaje y se escriben una vez al final. Si otro
+  proceso escribió alguno entre medio, el mensaje se vuelve a procesar sobre
+  los datos frescos (`run_unit_of_work`) en vez de pisar su escritura.
+
+  No toma un lock global: hilos del mismo proceso chocan igual que procesos
+  distintos (lock por archivo + `_version`), así decisiones de contactos
+  distintos corren en paralelo hasta el commit.
   """
+  return run_unit_of_work(_handle_incoming, msisdn, text)
+
 
+def _handle_incoming(msisdn: str, text: str) -> Decision:
   v = validate_message(msisdn, text)
   clean_text = text or ""
   state = load_state()
@@ -76,34 +93,15 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
   if v.role == "owner":
     cmd_resp = handle_owner_command(clean_text)
     if cmd_resp:
-      return {
-        "policy": "reply_to_vip",
-        "target_msisdn": OWNER_MSISDN,
-        "message": cmd_resp,
-        "owner_message": "",
-        "vip_ics_path": "",
-        "owner_ics_path": "",
-        "owner_retry_message": "",
-        "owner_retry_delay_sec": "0",
-      }
-    return {
-      "policy": "owner",
-      "target_msisdn": OWNER_MSISDN,
-      "message": clean_text,
-      "owner_message": "",
-    }
+      return _decision(policy="reply_to_vip", target_msisdn=OWNER_MSISDN, message=cmd_resp)
+    return Decision(policy="owner", target_msisdn=OWNER_MSISDN, message=clean_text)
 
   assistant_cfg = state.get("assistant", {})
   features = assistant_cfg.get("features", {})
   auto_meetings_enabled = features.get("auto_meetings", True)
   urgency_protocol_enabled = features.get("urgency_protocol", True)
   if assistant_cfg.get("paused", False):
-    return {
-      "policy": "silence",
-      "target_msisdn": "",
-      "message": "",
-      "owner_message": "",
-    }
+    return SILENCE
 
   # VIP con urgencia o sesión activa → usar flujo 1–4 de sesiones
   if v.role == "vip" and urgency_protocol_enabled and (v.is_urgency or get_active_session(msisdn) is not None):
@@ -113,31 +111,23 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
     vip_ics_path = sess_decision.get("vip_ics_path", "")
     owner_ics_path = sess_decision.get("owner_ics_path", "")
     owner_retry_message = sess_decision.get("owner_retry_message", "")
-    owner_retry_delay_sec = sess_decision.get("owner_retry_delay_sec", "0")
+    owner_retry_delay_sec = delay_seconds(sess_decision.get("owner_retry_delay_sec"))
 
     if vip_msg or owner_msg or vip_ics_path or owner_ics_path or owner_retry_message:
-      return {
-        "policy": "reply_to_vip",
-        "target_msisdn": VIP_MSISDN,
-        "message": vip_msg,
-        "owner_message": owner_msg,
-        "vip_ics_path": vip_ics_path,
-        "owner_ics_path": owner_ics_path,
-        "owner_retry_message": owner_retry_message,
-        "owner_retry_delay_sec": owner_retry_delay_sec,
-      }
+      return _decision(
+        policy="reply_to_vip",
+        target_msisdn=VIP_MSISDN,
+        message=vip_msg,
+        owner_message=owner_msg,
+        vip_ics_path=vip_ics_path,
+        owner_ics_path=owner_ics_path,
+        owner_retry_message=owner_retry_message,
+        owner_retry_delay_sec=owner_retry_delay_sec,
+        severity=sess_decision.get("severity", ""),
+      )
 
     # Sin acción específica
-    return {
-      "policy": "silence",
-      "target_msisdn": "",
-      "message": "",
-      "owner_message": "",
-      "vip_ics_path": "",
-      "owner_ics_path": "",
-      "owner_retry_message": "",
-      "owner_retry_delay_sec": "0",
-    }
+    return SILENCE
 
   # Contactos externos: formulario de reunión + respuestas contextuales.
   if v.role == "other" and (get_active_meeting_session(msisdn) is not None or clean_text):
@@ -155,16 +145,7 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
       increment_auto_reply(state, msisdn)
       add_metric_event(state, {"kind": "auto_reply_off_hours", "msisdn": msisdn})
       save_state(state)
-      return {
-        "policy": "reply_to_vip",
-        "target_msisdn": msisdn,
-        "message": off_msg,
-        "owner_message": "",
-        "vip_ics_path": "",
-        "owner_ics_path": "",
-        "owner_retry_message": "",
-        "owner_retry_delay_sec": "0",
-      }
+      return _decision(policy="reply_to_vip", target_msisdn=msisdn, message=off_msg)
 
     meeting = {
       "contact_message": "",
@@ -181,24 +162,22 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
     contact_ics_path = meeting.get("contact_ics_path", "")
     owner_ics_path = meeting.get("owner_ics_path", "")
     followup_message = meeting.get("followup_message", "")
-    followup_delay_sec = meeting.get("followup_delay_sec", "0")
+    followup_delay_sec = delay_seconds(meeting.get("followup_delay_sec"))
 
     if contact_msg or owner_msg or contact_ics_path or owner_ics_path:
       increment_auto_reply(state, msisdn)
       add_metric_event(state, {"kind": "meeting_flow_reply", "msisdn": msisdn})
       save_state(state)
-      return {
-        "policy": "reply_to_vip",
-        "target_msisdn": msisdn,
-        "message": contact_msg,
-        "owner_message": owner_msg,
-        "vip_ics_path": contact_ics_path,
-        "owner_ics_path": owner_ics_path,
-        "followup_message": followup_message,
-        "followup_delay_sec": followup_delay_sec,
-        "owner_retry_message": "",
-        "owner_retry_delay_sec": "0",
-      }
+      return _decision(
+        policy="reply_to_vip",
+        target_msisdn=msisdn,
+        message=contact_msg,
+        owner_message=owner_msg,
+        vip_ics_path=contact_ics_path,
+        owner_ics_path=owner_ics_path,
+        followup_message=followup_message,
+        followup_delay_sec=followup_delay_sec,
+      )
 
     # Si no hay flujo de reunión activo y no es meeting, usar guion contextual.
     if intent != "meeting":
@@ -207,23 +186,7 @@ def handle_incoming(msisdn: str, text: str) -> Dict[str, str]:
         increment_auto_reply(state, msisdn)
         add_metric_event(state, {"kind": "scripted_reply", "msisdn": msisdn, "intent": intent})
         save_state(state)
-        return {
-          "policy": "reply_to_vip",
-          "target_msisdn": msisdn,
-          "message": scripted,
-          "owner_message": "",
-          "vip_ics_path": "",
-          "owner_ics_path": "",
-          "followup_message": "",
-          "followup_delay_sec": "0",
-          "owner_retry_message": "",
-          "owner_retry_delay_sec": "0",
-        }
+        return _decision(policy="reply_to_vip", target_msisdn=msisdn, message=scripted)
 
   # Cualquier otro caso: silencio total
-  return {
-    "policy": "silence",
-    "target_msisdn": "",
-    "message": "",
-    "owner_message": "",
-  }
+  return SILENCE
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+"""Runtime asyncio del pipeline inbound -> decisión -> envíos.
+
+Un solo proceso y un solo event loop para:
+- leer el stream (stdin o `--log-file` con checkpoint) y rutear cada línea
+  con el mismo parser/dedup/journal que `whatsapp_router_watch`,
+- carriles por contacto como tareas asyncio (no hilos): orden estricto por
+  msisdn y contactos distintos en paralelo,
+- gates diferidos como timers del loop (sin `bash sleep` ni un hilo por
+  espera),
+- envíos al gateway por `AsyncGatewayClient` (muchos requests en vuelo sobre
+  una sola conexión) y el drainer del outbox como tarea periódica; los envíos
+  diferidos salen por el outbox.
+
+La decisión (`process_inbound` -> `handle_incoming`) sigue siendo código
+síncrono con I/O de archivos y corre en un pool acotado de hilos
+(`--io-workers`). El journal, el checkpoint del tail, el outbox, el dedup y
+los baldes del rate limit también escriben fuera del loop.
+
+  openclaw logs --follow | python3 -m clwabot.hooks.async_runtime
+  python3 -m clwabot.hooks.async_runtime --log-file '/tmp/openclaw/openclaw-*.log'
+
+Los entry points síncronos (`whatsapp_router_watch`, `whatsapp_listener`)
+siguen disponibles sin cambios.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from clwabot.core.inbound_journal import JOURNAL_DIR, InboundJournal
+from clwabot.core.outbox import DRAIN_INTERVAL_SECONDS, OUTBOX_PATH, Outbox, OutboxDrainer
+from clwabot.hooks import gateway_client
+from clwabot.hooks.dedup import ROUTER_DEDUP_PATH, DedupIndex
+from clwabot.hooks.dispatcher import (
+    DEFAULT_MAX_BACKLOG,
+    DispatchJob,
+    LaneBookkeeping,
+    MetricBuffer,
+    ShedRecorder,
+    lane_key,
+)
+from clwabot.hooks.gateway_client import (
+    CONNECT_TIMEOUT_SECONDS,
+    REQUEST_TIMEOUT_SECONDS,
+    AsyncGatewayClient,
+    GatewayError,
+)
+from clwabot.hooks.inbound_event import InboundEvent
+from clwabot.hooks.log_tailer import CHECKPOINT_PATH, LogTailer
+from clwabot.hooks.rate_limit import RATE_LIMITS_PATH, TokenBucketLimiter
+from clwabot.hooks.whatsapp_router_watch import DEDUP_WINDOW_SECONDS, route_line
+
+DEFAULT_IO_WORKERS = 8
+
+
+def _run_logged(fn: Callable[[], None]) -> None:
+    try:
+        fn()
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+
+
+class _LoopDelays:
+    """`call_later` de `DelayScheduler` sobre el loop; el callback va al pool.
+
+    Tras `close()` no agenda ni corre nada: el pool ya está cerrado y el flush
+    final de `aclose` se llevó lo que quedaba.
+    """
+
+    def __init__(self, dispatcher: "AsyncLaneDispatcher") -> None:
+        self._dispatcher = dispatcher
+        self._closed = False
+
+    def call_later(self, delay_sec: float, fn: Callable[[], None]) -> None:
+        if self._closed:
+            return
+        loop = self._dispatcher.loop
+        loop.call_soon_threadsafe(loop.call_later, delay_sec, self._fire, fn)
+
+    def close(self) -> None:
+        self._closed = True
+
+    def _fire(self, fn: Callable[[], None]) -> None:
+        if not self._closed:
+            self._dispatcher.loop.run_in_executor(self._dispatcher.io, _run_logged, fn)
+
+
+class AsyncLaneDispatcher(LaneBookkeeping):
+    """Carriles por contacto sobre asyncio; la decisión corre en el pool de I/O.
+
+    Misma semántica y contabilidad que `LaneDispatcher` (`LaneBookkeeping`):
+    FIFO estricto por msisdn, contactos en paralelo, gate diferido por
+    `grace_seconds` y descarte por `shed_rank` con el backlog lleno (métrica
+    `inbound_shed`). Todo el estado se toca solo desde el hilo del loop.
+    """
+
+    mode = "asyncio"
+    log_prefix = "[async_runtime]"
+    latency_tags = {"runtime": "asyncio"}
+
+    def __init__(
+        self,
+        handler: Optional[Callable[..., int]] = None,
+        grace_seconds: Optional[float] = None,
+        io_workers: int = DEFAULT_IO_WORKERS,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+        latency_metrics: bool = True,
+        log_dispatch: bool = True,
+        on_shed: Optional[Callable[[DispatchJob, str], None]] = None,
+    ) -> None:
+        listener = None
+        if handler is None or grace_seconds is None:
+            from clwabot.hooks import whatsapp_listener as listener
+
+            handler = handler or listener.process_inbound
+            if grace_seconds is None:
+                grace_seconds = listener.AUTO_RESPONSE_GRACE_SECONDS
+        self._handler = handler
+        self._listener = listener if listener is not None and handler is listener.process_inbound else None
+        self._log_dispatch = log_dispatch
+        self.io = ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="clwabot-io")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._delays = _LoopDelays(self)
+        super().__init__(
+            grace_seconds=grace_seconds,
+            max_backlog=max_backlog,
+            on_shed=on_shed or ShedRecorder(self._delays),
+            metrics=MetricBuffer(self._delays),
+            latency_metrics=latency_metrics,
+            guard=contextlib.nullcontext(),
+        )
+        self._tasks: set[asyncio.Task] = set()
+        self._gate_timers: dict[int, asyncio.TimerHandle] = {}
+        self._gates_open = True
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.loop = loop or asyncio.get_running_loop()
+        if self._listener is not None:
+            # Las métricas de entrega de cada decisión van al lote del dispatcher.
+            self._listener.set_metric_buffer(self._metrics)
+
+    # -- API del router (hilo del loop) ---------------------------------------
+
+    def submit(self, msisdn: str, text: str) -> None:
+        self.submit_event(InboundEvent(msisdn=msisdn, text=text))
+
+    def submit_event(self, event: InboundEvent) -> None:
+        if self._log_dispatch:
+            suffix = f" id={event.message_id}" if event.message_id else ""
+            print(f"[async_runtime] dispatch: {event.msisdn}{suffix}", file=sys.stderr)
+        self.enqueue(DispatchJob.from_event(event))
+
+    def enqueue(self, job: DispatchJob) -> bool:
+        """Encola el job; devuelve False si se descartó por backlog lleno."""
+        victim, new_lane = self._admit(job)
+        if victim is not None:
+            self._report_shed(victim)
+        if victim is job:
+            return False
+        if new_lane:
+            key = lane_key(job.msisdn)
+            self._spawn(self._drain_lane(key, self._lanes[key]))
+        return True
+
+    # -- gates (se piden desde los hilos del pool) ---------------------------
+
+    def schedule_gate(self, msisdn: str, text: str, trigger_ts: int) -> None:
+        job = DispatchJob(msisdn=msisdn, text=text, deferred_auto=True, trigger_ts=trigger_ts)
+        self.loop.call_soon_threadsafe(self._arm_gate, job, self._grace_seconds)
+
+    def rearm_gate(self, msisdn: str, text: str, trigger_ts: int) -> None:
+        """Re-arma (desde el loop) un gate de un runtime anterior con lo que le quedaba."""
+        job = DispatchJob(msisdn=msisdn, text=text, deferred_auto=True, trigger_ts=trigger_ts)
+        self._arm_gate(job, max(0.0, trigger_ts + self._grace_seconds - time.time()))
+
+    def cancel_gates(self) -> int:
+        """Suelta los gates sin disparar; siguen en `pending_inbox` y se re-arman al arrancar.
+
+        Desde aquí tampoco se arman los que pidan los jobs que aún corren.
+        """
+        self._gates_open = False
+        timers, self._gate_timers = self._gate_timers, {}
+        for timer in timers.values():
+            timer.cancel()
+            self._gate_done()
+        return len(timers)
+
+    def _arm_gate(self, job: DispatchJob, delay: float) -> None:
+        if not self._gates_open:
+            return
+        self._gate_armed()
+        self._gate_timers[id(job)] = self.loop.call_later(delay, self._fire_gate, job)
+
+    def _fire_gate(self, job: DispatchJob) -> None:
+        self._gate_timers.pop(id(job), None)
+        self.enqueue(job)
+        self._gate_done()
+
+    # -- carriles -------------------------------------------------------------
+
+    async def _drain_lane(self, key: str, lane: deque[DispatchJob]) -> None:
+        # Sin `await` entre el último chequeo y el borrado del carril (en
+        # `_finish_job`): un enqueue nuevo siempre encuentra carril con tarea
+        # viva o crea uno.
+        more = bool(lane)
+        while more:
+            job = self._start_job(key, lane)
+            started = time.monotonic()
+            self._record_latency(job)
+            try:
+                await self.loop.run_in_executor(self.io, self._call_handler, job)
+            except Exception:
+                print(f"{self.log_prefix} worker error ({job.msisdn}):", file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                more = self._finish_job(key, lane, int((time.monotonic() - started) * 1000))
+
+    def _call_handler(self, job: DispatchJob) -> None:
+        self._handler(
+            msisdn=job.msisdn,
+            text=job.text,
+            deferred_auto=job.deferred_auto,
+            trigger_ts=job.trigger_ts,
+            gate_scheduler=self.schedule_gate,
+            event=job.event,
+        )
+
+    def _spawn(self, coro) -> None:
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _add_outstanding(self) -> None:
+        super()._add_outstanding()
+        self._idle.clear()
+
+    def _done_outstanding(self) -> None:
+        super()._done_outstanding()
+        if self._outstanding <= 0:
+            self._idle.set()
+
+    # -- cierre ---------------------------------------------------------------
+
+    async def drain(self) -> None:
+        """Espera a que no queden jobs ni gates pendientes."""
+        await self._idle.wait()
+
+    async def aclose(self, wait: bool = True) -> None:
+        if wait:
+            await self.drain()
+        if self._listener is not None:
+            self._listener.set_metric_buffer(None)
+        self._delays.close()
+        await self.loop.run_in_executor(self.io, self._metrics.flush)
+        flush = getattr(self._on_shed, "flush", None)
+        if flush is not None:
+            await self.loop.run_in_executor(self.io, flush)
+        self.io.shutdown(wait=wait)
+
+
+class LoopGatewayBridge:
+    """Interfaz síncrona de `GatewayClient` para los hilos del pool.
+
+    El listener la usa como cualquier cliente; el I/O de red corre en el loop
+    sobre `AsyncGatewayClient`, así los envíos de distintos hilos comparten la
+    conexión sin serializarse.
+    """
+
+    def __init__(self, client: AsyncGatewayClient, loop: asyncio.AbstractEventLoop) -> None:
+        self.client = client
+        self.loop = loop
+        self.timeout = REQUEST_TIMEOUT_SECONDS + CONNECT_TIMEOUT_SECONDS
+
+    @property
+    def sent(self) -> int:
+        return self.client.sent
+
+    def send_message(
+        self,
+        target: str,
+        message: str,
+        media_path: str = "",
+        channel: str = "whatsapp",
+        media_id: str = "",
+        idempotency_key: str = "",
+    ) -> dict:
+        return self._run(
+            self.client.send_message(
+                target,
+                message,
+                media_path=media_path,
+                channel=channel,
+                media_id=media_id,
+                idempotency_key=idempotency_key,
+            )
+        )
+
+    def upload_media(self, path: str, channel: str = "whatsapp") -> str:
+        return self._run(self.client.upload_media(path, channel=channel))
+
+    def close(self) -> None:
+        self._run(self.client.close())
+
+    def _run(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(self.timeout)
+        except concurrent.futures.TimeoutError as exc:
+            future.cancel()
+            raise GatewayError("timeout esperando al gateway") from exc
+
+
+class _JournalWriter:
+    """Journal con las escrituras en un hilo propio (orden FIFO preservado)."""
+
+    def __init__(self, journal: InboundJournal) -> None:
+        self._journal = journal
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clwabot-journal")
+
+    def append(self, event, ts: Optional[float] = None) -> None:
+        self._io.submit(_run_logged, lambda: self._journal.append(event, ts=ts))
+
+    def close(self) -> None:
+        self._io.shutdown(wait=True)
+        self._journal.close()
+
+
+class AsyncRuntime:
+    """Arma router, carriles, gateway y outbox sobre el loop en curso."""
+
+    def __init__(
+        self,
+        dispatcher: Optional[AsyncLaneDispatcher] = None,
+        dedup: Optional[DedupIndex] = None,
+        journal: Optional[InboundJournal] = None,
+        outbox_path: Optional[Path] = None,
+        owner_coalesce_sec: float = 0.0,
+        gateway_url: Optional[str] = None,
+    ) -> None:
+        self.dispatcher = dispatcher or AsyncLaneDispatcher()
+        self.dedup = dedup if dedup is not None else DedupIndex(window_seconds=DEDUP_WINDOW_SECONDS)
+        self.journal = _JournalWriter(journal) if journal is not None else None
+        self.outbox_path = outbox_path
+        self.owner_coalesce_sec = owner_coalesce_sec
+        self.gateway_url = gateway_client.GATEWAY_URL if gateway_url is None else gateway_url
+        self.gateway: Optional[AsyncGatewayClient] = None
+        self.drainer: Optional[OutboxDrainer] = None
+        self._outbox_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clwabot-outbox")
+        # Dedup y baldes del rate limit se escriben acá (FIFO), nunca en el loop.
+        self.dedup.auto_flush = False
+        self.limiter: Optional[TokenBucketLimiter] = None
+        self._state_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clwabot-state")
+        self._drain_task: Optional[asyncio.Task] = None
+        self._lines = 0
+        self._inbound = 0
+
+    async def start(self) -> None:
+        from clwabot.hooks import whatsapp_listener
+
+        loop = asyncio.get_running_loop()
+        self.dispatcher.start(loop)
+        self.limiter = await loop.run_in_executor(
+            self._state_io, partial(TokenBucketLimiter, persist_path=RATE_LIMITS_PATH, auto_flush=False)
+        )
+        whatsapp_listener.set_rate_limiter(self.limiter)
+        # Gates que un runtime anterior soltó al detenerse (ver `stop`).
+        for msisdn, text, trigger_ts in await loop.run_in_executor(
+            self.dispatcher.io, whatsapp_listener.waiting_pending_events
+        ):
+            self.dispatcher.rearm_gate(msisdn, text, trigger_ts)
+        if self.gateway_url:
+            self.gateway = AsyncGatewayClient(self.gateway_url)
+            whatsapp_listener.set_gateway_client(LoopGatewayBridge(self.gateway, loop))
+        if self.outbox_path is not None:
+            outbox = await loop.run_in_executor(self._outbox_io, Outbox, self.outbox_path)
+            self.drainer = OutboxDrainer(outbox, whatsapp_listener.deliver_message)
+            whatsapp_listener.set_outbox(outbox, self.drainer, owner_coalesce_sec=self.owner_coalesce_sec)
+            self._drain_task = loop.create_task(self._drain_outbox())
+
+    async def route(self, raw) -> bool:
+        self._lines += 1
+        from clwabot.hooks import whatsapp_listener
+
+        sent = route_line(raw, self.dispatcher, self.dedup, self.journal, whatsapp_listener.allow_inbound)
+        if sent:
+            self._inbound += 1
+        self._persist_in_background()
+        return sent
+
+    def _persist_in_background(self) -> None:
+        snapshot = self.dedup.take_snapshot()
+        if snapshot is not None:
+            self._state_io.submit(_run_logged, lambda: self.dedup.write_snapshot(snapshot))
+        if self.limiter is not None and self.limiter.flush_due():
+            self._state_io.submit(_run_logged, self.limiter.flush)
+
+    async def run_stream(self, lines: Iterable, on_line: Optional[Callable[[bool], None]] = None) -> int:
+        """Lee `lines` en un hilo daemon y rutea cada una en el loop.
+
+        `on_line(sent)` corre en ese mismo hilo (p. ej. el commit del
+        checkpoint), fuera del loop.
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def pump() -> None:
+            error = None
+            try:
+                for raw in lines:
+                    sent = asyncio.run_coroutine_threadsafe(self.route(raw), loop).result()
+                    if on_line is not None:
+                        on_line(sent)
+            except Exception as exc:
+                error = exc
+            loop.call_soon_threadsafe(_settle, done, error)
+
+        threading.Thread(target=pump, name="clwabot-reader", daemon=True).start()
+        await done
+        return 0
+
+    async def stop(self) -> None:
+        from clwabot.hooks import whatsapp_listener
+
+        # No esperamos el grace period de los gates: cada uno sigue en
+        # `pending_inbox` y el próximo `start` lo re-arma. Sí terminamos los
+        # jobs que están corriendo o en cola.
+        dropped = self.dispatcher.cancel_gates()
+        if dropped:
+            print(f"[async_runtime] {dropped} gate(s) pendientes quedan para el próximo arranque", file=sys.stderr)
+        await self.dispatcher.aclose(wait=True)
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            try:
+                await self._drain_task
+            except asyncio.CancelledError:
+                pass
+        loop = asyncio.get_running_loop()
+        if self.drainer is not None:
+            # Último pase: lo que venció mientras se cerraba.
+            await loop.run_in_executor(self._outbox_io, self.drainer.drain_once)
+        self._outbox_io.shutdown(wait=True)
+        await loop.run_in_executor(self._state_io, whatsapp_listener.flush_rate_limiter)
+        await loop.run_in_executor(self._state_io, self.dedup.flush)
+        self._state_io.shutdown(wait=True)
+        if self.limiter is not None:
+            whatsapp_listener.set_rate_limiter(None)
+        if self.gateway is not None:
+            whatsapp_listener.set_gateway_client(None)
+            await self.gateway.close()
+        if self.journal is not None:
+            self.journal.close()
+
+    def stats(self) -> dict:
+        stats = {"lines": self._lines, "inbound": self._inbound, **self.dispatcher.stats()}
+        if self.gateway is not None:
+            stats["gateway_sent"] = self.gateway.sent
+        if self.drainer is not None:
+            stats["outbox_delivered"] = self.drainer.delivered
+            stats["outbox_failed"] = self.drainer.failed
+        return stats
+
+    def print_stats(self) -> None:
+        stats = " ".join(f"{k}={v}" for k, v in self.stats().items())
+        print(f"[async_runtime] stats: {stats}", file=sys.stderr)
+
+    async def _drain_outbox(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                handled = await loop.run_in_executor(self._outbox_io, self.drainer.drain_once)
+            except Exception as exc:
+                print(f"[async_runtime] outbox: {exc}", file=sys.stderr)
+                handled = 0
+            if handled < self.drainer.batch:
+                await asyncio.sleep(DRAIN_INTERVAL_SECONDS)
+
+
+def _settle(future: asyncio.Future, error: Optional[BaseException]) -> None:
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(None)
+
+
+async def _amain(args: argparse.Namespace) -> int:
+    loop = asyncio.get_running_loop()
+    dispatcher = AsyncLaneDispatcher(io_workers=args.io_workers, max_backlog=args.max_backlog)
+    runtime = AsyncRuntime(
+        dispatcher=dispatcher,
+        dedup=DedupIndex(
+            window_seconds=args.dedup_window,
+            persist_path=Path(args.dedup_file) if args.dedup_file else None,
+        ),
+        journal=InboundJournal(Path(args.journal_dir)) if args.journal_dir else None,
+        outbox_path=Path(args.outbox) if args.outbox else None,
+        owner_coalesce_sec=args.coalesce_owner,
+    )
+    await runtime.start()
+
+    tailer = None
+    if args.log_file:
+        tailer = LogTailer(args.log_file, checkpoint_path=args.checkpoint, from_start=args.from_start)
+        lines, on_line, source = tailer.lines(), (lambda sent: tailer.commit(force=sent)), f"log file {args.log_file}"
+    else:
+        lines, on_line, source = sys.stdin.buffer, None, "stdin"
+    print(f"[async_runtime] listening {source} for WhatsApp inbound...", file=sys.stderr)
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    if hasattr(signal, "SIGUSR1"):
+        loop.add_signal_handler(signal.SIGUSR1, runtime.print_stats)
+
+    stream = loop.create_task(runtime.run_stream(lines, on_line=on_line))
+    stopper = loop.create_task(stop.wait())
+    try:
+        await asyncio.wait({stream, stopper}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopper.cancel()
+        await runtime.stop()
+        if tailer is not None:
+            await loop.run_in_executor(None, lambda: tailer.commit(force=True))
+        runtime.print_stats()
+    if stream.done() and stream.exception() is not None:
+        raise stream.exception()
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runtime asyncio: inbound WhatsApp -> clwabot -> envíos")
+    parser.add_argument("--log-file", default="", help="leer directo del log del gateway (path o glob) en vez de stdin")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH, help="archivo de offset para --log-file")
+    parser.add_argument("--from-start", action="store_true", help="sin checkpoint previo, leer desde el inicio")
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=DEFAULT_IO_WORKERS,
+        help="hilos para la decisión y el I/O de archivos bloqueante",
+    )
+    parser.add_argument(
+        "--max-backlog",
+        type=int,
+        default=DEFAULT_MAX_BACKLOG,
+        help="tope de mensajes en espera; sobre él se descartan los que no son owner/VIP (0 = sin tope)",
+    )
+    parser.add_argument("--dedup-window", type=float, default=DEDUP_WINDOW_SECONDS)
+    parser.add_argument("--dedup-file", default=str(ROUTER_DEDUP_PATH), help="persistencia del dedup ('' = memoria)")
+    parser.add_argument("--journal-dir", default=str(JOURNAL_DIR), help="journal de inbound ('' = desactivado)")
+    parser.add_argument("--outbox", default=str(OUTBOX_PATH), help="outbox sqlite ('' = sin outbox)")
+    parser.add_argument("--coalesce-owner", type=float, default=0.0, help="ventana de agrupación de alertas al owner")
+    args = parser.parse_args(argv)
+    return asyncio.run(_amain(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Índice de dedup de inbound compartido por los watchers.
+
+Reemplaza el `deque` + `any(...)` lineal: lookup O(1) en un dict
+clave -> último visto, con expiración por buckets de tiempo (solo se
+revisan los buckets vencidos, no todo el índice).
+
+Opcionalmente persiste a un JSON chico para que un reinicio del stream de
+logs no vuelva a despachar mensajes recientes. Las claves se guardan como
+digest, así el archivo no contiene texto de los mensajes. Con
+`auto_flush=False` `seen()` no escribe nunca: quien la usa toma
+`take_snapshot()` y lo escribe donde no bloquee (el runtime asyncio).
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+from hashlib import sha1
+from pathlib import Path
+from typing import Optional
+
+from clwabot.core.persist import read_json, write_json
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+ROUTER_DEDUP_PATH = BASE_DIR / "data" / "router_dedup.json"
+VIP_WATCH_DEDUP_PATH = BASE_DIR / "data" / "vip_watch_dedup.json"
+DEFAULT_WINDOW_SECONDS = 4.0
+BUCKET_SECONDS = 1.0
+FLUSH_INTERVAL_SECONDS = 1.0
+
+
+def dedup_key(*parts: str) -> str:
+    raw = "\x00".join(parts)
+    return sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+class DedupIndex:
+    def __init__(
+        self,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        persist_path: Optional[Path] = None,
+        bucket_seconds: float = BUCKET_SECONDS,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        auto_flush: bool = True,
+    ) -> None:
+        self.window_seconds = max(0.0, float(window_seconds))
+        self.persist_path = persist_path
+        self.auto_flush = auto_flush
+        self._bucket_seconds = max(0.001, bucket_seconds)
+        self._flush_interval = flush_interval
+        self._last_seen: dict[str, float] = {}
+        self._buckets: deque[tuple[int, list[str]]] = deque()
+        self._dirty = False
+        self._last_flush = 0.0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def __contains__(self, key: str) -> bool:
+        ts = self._last_seen.get(key)
+        return ts is not None and (time.time() - ts) <= self.window_seconds
+
+    def seen(self, key: str, now: Optional[float] = None) -> bool:
+        """True si `key` ya pasó dentro de la ventana; si no, la registra."""
+        now = time.time() if now is None else now
+        self._expire(now)
+        last = self._last_seen.get(key)
+        if last is not None and (now - last) <= self.window_seconds:
+            return True
+        self._add(key, now)
+        self._maybe_flush(now)
+        return False
+
+    def flush(self) -> None:
+        snapshot = self.take_snapshot(force=True)
+        if snapshot is not None:
+            self.write_snapshot(snapshot)
+
+    def take_snapshot(self, force: bool = False) -> Optional[dict]:
+        """Copia de lo que hay que persistir si toca flush (y lo da por escrito)."""
+        if self.persist_path is None or not self._dirty:
+            return None
+        if not force and (time.monotonic() - self._last_flush) < self._flush_interval:
+            return None
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        return {
+            "window_seconds": self.window_seconds,
+            "entries": dict(self._last_seen),
+        }
+
+    def write_snapshot(self, snapshot: dict) -> None:
+        write_json(self.persist_path, snapshot, indent=None)
+
+    def _add(self, key: str, ts: float) -> None:
+        self._last_seen[key] = ts
+        bucket = math.floor(ts / self._bucket_seconds)
+        if self._buckets and self._buckets[-1][0] == bucket:
+            self._buckets[-1][1].append(key)
+        else:
+            self._buckets.append((bucket, [key]))
+        self._dirty = True
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._buckets and (self._buckets[0][0] + 1) * self._bucket_seconds < cutoff:
+            _, keys = self._buckets.popleft()
+            for key in keys:
+                # La clave pudo re-registrarse en un bucket más nuevo.
+                ts = self._last_seen.get(key)
+                if ts is not None and ts < cutoff:
+                    del self._last_seen[key]
+                    self._dirty = True
+
+    def _maybe_flush(self, now: float) -> None:
+        if not self.auto_flush:
+            return
+        snapshot = self.take_snapshot()
+        if snapshot is not None:
+            self.write_snapshot(snapshot)
+
+    def _load(self) -> None:
+        if self.persist_path is None:
+            return
+        raw = read_json(self.persist_path, dict)
+        now = time.time()
+        entries = raw.get("entries", {}) if isinstance(raw, dict) else {}
+        for key, ts in sorted(entries.items(), key=lambda kv: kv[1]):
+            try:
+                ts = float(ts)
+            except (TypeError, ValueError):
+                continue
+            if (now - ts) <= self.window_seconds:
+                self._add(str(key), ts)
+        self._dirty = False
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""Dispatchers de inbound para el router de WhatsApp.
+
+- `InProcessDispatcher`: importa la lógica de `whatsapp_listener` una sola vez
+  y la ejecuta en un pool acotado de workers "calientes" (sin arrancar un
+  intérprete nuevo por mensaje).
+- `SubprocessDispatcher`: modo legacy, un `python3 -m ...whatsapp_listener`
+  por mensaje. Se mantiene como fallback (`--subprocess` en el router). El hijo
+  no re-dispara su gate de pendientes: lo pide por stdout (`--emit-gate`) y el
+  router lo agenda en el carril del contacto.
+
+Ambos reparten el trabajo en carriles por msisdn normalizado: un contacto se
+procesa en orden estricto y contactos distintos en paralelo.
+"""
+
+from __future__ import annotations
+
+import abc
+import heapq
+import json
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, ContextManager, Optional
+
+from clwabot.core.intent_router import classify_intent
+from clwabot.core.state_store import record_metric_events
+from clwabot.core.validator import validate_message
+from clwabot.hooks.inbound_event import InboundEvent
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_BACKLOG = 200
+# Muestras de latencia que se guardan para p50/p95 en `stats()`.
+LATENCY_SAMPLES = 512
+# Línea de stdout con que un listener hijo (`--emit-gate`) pide su gate.
+GATE_REQUEST_PREFIX = "clwabot-gate "
+
+
+def listener_cmd(
+    msisdn: str,
+    text: str,
+    deferred_auto: bool = False,
+    trigger_ts: int = 0,
+    emit_gate: bool = False,
+    rate_limit: bool = True,
+) -> list[str]:
+    cmd = [
+        "python3",
+        "-m",
+        "clwabot.hooks.whatsapp_listener",
+        "--msisdn",
+        msisdn,
+        "--text",
+        text,
+    ]
+    if deferred_auto:
+        cmd += ["--deferred-auto", "--trigger-ts", str(int(trigger_ts))]
+    if emit_gate:
+        cmd.append("--emit-gate")
+    if not rate_limit:
+        cmd.append("--no-rate-limit")
+    return cmd
+
+
+def gate_request_line(msisdn: str, text: str, trigger_ts: int) -> str:
+    payload = {"msisdn": msisdn, "text": text, "trigger_ts": int(trigger_ts)}
+    return GATE_REQUEST_PREFIX + json.dumps(payload, ensure_ascii=False)
+
+
+def parse_gate_request(line: str) -> Optional[tuple[str, str, int]]:
+    """(msisdn, text, trigger_ts) si la línea es un pedido de gate; si no, None."""
+    if not line.startswith(GATE_REQUEST_PREFIX):
+        return None
+    try:
+        data = json.loads(line[len(GATE_REQUEST_PREFIX):])
+        return str(data["msisdn"]), str(data["text"]), int(data["trigger_ts"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class DelayScheduler:
+    """Un único hilo que ejecuta callbacks diferidos (en vez de `bash sleep`)."""
+
+    def __init__(self, name: str = "clwabot-delay") -> None:
+        self._heap: list[tuple[float, int, Callable[[], None]]] = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay_sec: float, fn: Callable[[], None]) -> None:
+        with self._cond:
+            self._seq += 1
+            heapq.heappush(self._heap, (time.monotonic() + max(0.0, delay_sec), self._seq, fn))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def close(self, wait: bool = True) -> None:
+        """Detiene el hilo; con `wait=True` primero ejecuta lo pendiente."""
+        with self._cond:
+            self._closing = True
+            if not wait:
+                self._heap.clear()
+            self._cond.notify()
+        self._thread.join()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        if self._closing:
+                            return
+                        self._cond.wait()
+                        continue
+                    due, _, fn = self._heap[0]
+                    wait_for = due - time.monotonic()
+                    if wait_for <= 0:
+                        heapq.heappop(self._heap)
+                        break
+                    self._cond.wait(wait_for)
+            try:
+                fn()
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+
+
+@dataclass
+class DispatchJob:
+    msisdn: str
+    text: str
+    deferred_auto: bool = False
+    trigger_ts: int = 0
+    role: str = ""
+    intent: str = ""
+    event: Optional[InboundEvent] = None
+
+    @classmethod
+    def from_event(cls, event: InboundEvent) -> "DispatchJob":
+        return cls(msisdn=event.msisdn, text=event.text, event=event)
+
+    def classify(self) -> None:
+        """Calcula rol/intención una sola vez (solo se usa al descartar)."""
+        if self.role:
+            return
+        self.role = validate_message(self.msisdn, self.text).role
+        self.intent = classify_intent(self.text) if self.role == "other" else "general"
+
+
+def lane_key(msisdn: str) -> str:
+    """Clave de carril: msisdn normalizado (solo dígitos)."""
+    return re.sub(r"\D", "", msisdn or "") or (msisdn or "")
+
+
+def shed_rank(job: DispatchJob) -> Optional[int]:
+    """Orden de descarte con backlog lleno (menor = se descarta antes).
+
+    owner/VIP nunca se descartan (None), ni el re-disparo de un gate: su
+    entrada en `pending_inbox` quedaría en `waiting_owner_check` para siempre.
+    Luego "other" con intent general y después el resto de "other".
+    """
+    if job.deferred_auto:
+        return None
+    job.classify()
+    if job.role in {"owner", "vip"}:
+        return None
+    return 0 if job.intent == "general" else 1
+
+
+class ShedCandidates:
+    """Jobs en espera que se pueden descartar, agrupados por `shed_rank`.
+
+    El rango se calcula recién cuando hace falta una víctima, y una sola vez
+    por job: con el backlog lleno cada enqueue no vuelve a recorrer todos los
+    carriles. Quien lo usa saca el job al empezar a correr o al descartarlo.
+    """
+
+    def __init__(self) -> None:
+        # id(job) -> job; dicts para mantener el orden de llegada.
+        self._unranked: dict[int, DispatchJob] = {}
+        self._ranked: dict[int, dict[int, DispatchJob]] = {0: {}, 1: {}}
+
+    def add(self, job: DispatchJob) -> None:
+        self._unranked[id(job)] = job
+
+    def discard(self, job: DispatchJob) -> None:
+        self._unranked.pop(id(job), None)
+        for bucket in self._ranked.values():
+            bucket.pop(id(job), None)
+
+    def pick(self, incoming: DispatchJob) -> Optional[DispatchJob]:
+        """Menor rango; entre iguales, el más reciente (el entrante gana los empates).
+
+        None si todo es owner/VIP o gates: se acepta por sobre el tope.
+        """
+        rank = shed_rank(incoming)
+        if rank == 0:
+            return incoming
+        # Los sin rango llegaron después que los ya clasificados: van al final.
+        for job in self._unranked.values():
+            job_rank = shed_rank(job)
+            if job_rank is not None:
+                self._ranked[job_rank][id(job)] = job
+        self._unranked.clear()
+        for bucket_rank, bucket in sorted(self._ranked.items()):
+            if rank is not None and bucket_rank >= rank:
+                break
+            if bucket:
+                return bucket[next(reversed(bucket))]
+        return incoming if rank is not None else None
+
+
+class MetricBuffer:
+    """Agrupa eventos de métrica y los persiste en un solo load/save.
+
+    Bajo carga no queremos reescribir `state.json` por cada evento: el primero
+    de una ráfaga agenda un flush y el resto se suma al mismo lote.
+    """
+
+    def __init__(self, delays: "DelayScheduler", flush_after_sec: float = 1.0) -> None:
+        self._delays = delays
+        self._flush_after_sec = flush_after_sec
+        self._lock = threading.Lock()
+        self._buffer: list[dict] = []
+
+    def record(self, event: dict) -> None:
+        with self._lock:
+            first = not self._buffer
+            self._buffer.append(event)
+        if first:
+            self._delays.call_later(self._flush_after_sec, self.flush)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            record_metric_events(batch)
+
+
+class ShedRecorder(MetricBuffer):
+    """Registra un evento de métrica `inbound_shed` por mensaje descartado."""
+
+    def __call__(self, job: DispatchJob, reason: str) -> None:
+        self.record(
+            {
+                "kind": "inbound_shed",
+                "msisdn": job.msisdn,
+                "role": job.role,
+                "intent": job.intent,
+                "reason": reason,
+            }
+        )
+
+
+class LaneBookkeeping:
+    """Carriles, descarte y estadísticas comunes a `LaneDispatcher` y al de asyncio.
+
+    No sabe de hilos ni de event loop: cada subclase decide cómo corre un
+    carril y llama a estos métodos con `_guard` tomado (un `Condition` en el
+    pool de hilos; nada en asyncio, donde todo pasa en el hilo del loop).
+    `_queued` cuenta solo los jobs en espera (no el que corre en su carril) y
+    `_outstanding` los jobs en carriles más los gates aún no disparados.
+    """
+
+    log_prefix = "[whatsapp_router_watch]"
+    # Campos extra del evento `inbound_latency`.
+    latency_tags: dict[str, str] = {}
+
+    def __init__(
+        self,
+        grace_seconds: float,
+        max_backlog: int,
+        on_shed: Callable[[DispatchJob, str], None],
+        metrics: MetricBuffer,
+        latency_metrics: bool,
+        guard: ContextManager,
+    ) -> None:
+        self._grace_seconds = grace_seconds
+        self._max_backlog = max(0, max_backlog)
+        self._on_shed = on_shed
+        self._metrics = metrics
+        self._latency_metrics = latency_metrics
+        self._guard = guard
+        self._latencies: deque[int] = deque(maxlen=LATENCY_SAMPLES)
+        self._queue_waits: deque[int] = deque(maxlen=LATENCY_SAMPLES)
+        self._service_times: deque[int] = deque(maxlen=LATENCY_SAMPLES)
+        self._lanes: dict[str, deque[DispatchJob]] = {}
+        self._candidates = ShedCandidates()
+        self._outstanding = 0
+        self._queued = 0
+        self._running = 0
+        self._running_keys: set[str] = set()
+        self._pending_gates = 0
+        self._processed = 0
+        self._shed = 0
+        self._max_lane_depth = 0
+
+    def _add_outstanding(self) -> None:
+        self._outstanding += 1
+
+    def _done_outstanding(self) -> None:
+        self._outstanding -= 1
+
+    def _admit(self, job: DispatchJob) -> tuple[Optional[DispatchJob], bool]:
+        """Encola `job` en su carril: (víctima descartada o None, carril nuevo).
+
+        Si la víctima es el mismo `job` no se encoló. Con `_guard` tomado.
+        """
+        victim = None
+        if self._max_backlog and self._queued >= self._max_backlog:
+            # Nunca un job que ya está corriendo: salen de los candidatos al partir.
+            victim = self._candidates.pick(job)
+            if victim is not None and victim is not job:
+                self._remove_queued(victim)
+        if victim is not None:
+            self._shed += 1
+        if victim is job:
+            return victim, False
+        key = lane_key(job.msisdn)
+        lane = self._lanes.get(key)
+        new_lane = lane is None
+        if new_lane:
+            lane = self._lanes[key] = deque()
+        lane.append(job)
+        self._candidates.add(job)
+        self._queued += 1
+        self._add_outstanding()
+        self._max_lane_depth = max(self._max_lane_depth, len(lane))
+        return victim, new_lane
+
+    def _report_shed(self, victim: DispatchJob) -> None:
+        print(
+            f"{self.log_prefix} backlog lleno: descartado {victim.msisdn} "
+            f"(role={victim.role}, intent={victim.intent})",
+            file=sys.stderr,
+        )
+        self._on_shed(victim, "backlog_full")
+
+    def _remove_queued(self, job: DispatchJob) -> None:
+        key = lane_key(job.msisdn)
+        lane = self._lanes[key]
+        lane.remove(job)
+        self._candidates.discard(job)
+        if not lane:
+            # Quien drena este carril lo encontrará vacío.
+            del self._lanes[key]
+        self._queued -= 1
+        self._done_outstanding()
+
+    def _start_job(self, key: str, lane: deque[DispatchJob]) -> DispatchJob:
+        """Saca de la espera el primer job del carril y lo marca corriendo."""
+        job = lane[0]
+        self._candidates.discard(job)
+        self._running_keys.add(key)
+        self._running += 1
+        self._queued -= 1
+        return job
+
+    def _finish_job(self, key: str, lane: deque[DispatchJob], service_ms: int) -> bool:
+        """Cierra el job en curso del carril; True si quedan más en él."""
+        self._service_times.append(service_ms)
+        lane.popleft()
+        self._processed += 1
+        self._running -= 1
+        self._running_keys.discard(key)
+        self._done_outstanding()
+        if lane:
+            return True
+        if self._lanes.get(key) is lane:
+            del self._lanes[key]
+        return False
+
+    def _gate_armed(self) -> None:
+        self._pending_gates += 1
+        self._add_outstanding()
+
+    def _gate_done(self) -> None:
+        self._pending_gates -= 1
+        self._done_outstanding()
+
+    def _record_latency(self, job: DispatchJob) -> None:
+        """Latencia recepción -> handler del primer procesamiento del inbound."""
+        event = job.event
+        if event is None or job.deferred_auto:
+            return
+        latency = event.latency_ms()
+        if not latency:
+            return
+        total = latency.get("total_ms", latency.get("router_to_handler_ms", 0))
+        with self._guard:
+            self._latencies.append(total)
+            if "router_to_handler_ms" in latency:
+                self._queue_waits.append(latency["router_to_handler_ms"])
+        if not self._latency_metrics:
+            return
+        self._metrics.record(
+            {
+                "kind": "inbound_latency",
+                "msisdn": event.msisdn,
+                "message_id": event.message_id,
+                "chat_type": event.chat_type,
+                "has_media": event.has_media,
+                **self.latency_tags,
+                **latency,
+            }
+        )
+
+    def lane_depths(self) -> dict[str, int]:
+        """Jobs por carril (incluye el que está corriendo)."""
+        with self._guard:
+            return {key: len(lane) for key, lane in self._lanes.items()}
+
+    def stats(self) -> dict[str, int]:
+        with self._guard:
+            depths = [len(lane) for lane in self._lanes.values()]
+            latencies = sorted(self._latencies)
+            queue_waits = sorted(self._queue_waits)
+            service_times = sorted(self._service_times)
+            return {
+                "lanes_active": len(depths),
+                "queued": sum(depths),
+                "running": self._running,
+                "backlog": self._queued,
+                "shed": self._shed,
+                "max_lane_depth": max(depths, default=0),
+                "max_lane_depth_seen": self._max_lane_depth,
+                "pending_gates": self._pending_gates,
+                "processed": self._processed,
+                "latency_p50_ms": percentile(latencies, 0.50),
+                "latency_p95_ms": percentile(latencies, 0.95),
+                "latency_max_ms": latencies[-1] if latencies else 0,
+                "queue_p50_ms": percentile(queue_waits, 0.50),
+                "queue_p95_ms": percentile(queue_waits, 0.95),
+                "service_p50_ms": percentile(service_times, 0.50),
+                "service_p95_ms": percentile(service_times, 0.95),
+            }
+
+
+class LaneDispatcher(LaneBookkeeping, abc.ABC):
+    """Pool acotado con un carril FIFO por contacto.
+
+    Los mensajes de un mismo msisdn se ejecutan estrictamente en orden (nunca
+    dos a la vez), mientras que contactos distintos corren en paralelo. Un
+    carril ocupa a lo más un worker; al terminar cada job se re-encola al
+    final del pool para no acaparar workers frente a otros contactos. Las
+    subclases definen cómo se procesa un job (`run_job`).
+    """
+
+    mode = "lanes"
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        grace_seconds: int = 15,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+        on_shed: Optional[Callable[[DispatchJob, str], None]] = None,
+        latency_metrics: bool = True,
+    ) -> None:
+        # `workers` es el tope de dispatches en vuelo; `max_backlog` el de
+        # jobs esperando (0 = sin tope). `latency_metrics=False` solo mide en
+        # memoria (backfill: los timestamps del gateway son históricos).
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="clwabot-worker")
+        self._delays = DelayScheduler()
+        self._cond = threading.Condition()
+        super().__init__(
+            grace_seconds=grace_seconds,
+            max_backlog=max_backlog,
+            on_shed=on_shed or ShedRecorder(self._delays),
+            metrics=MetricBuffer(self._delays),
+            latency_metrics=latency_metrics,
+            guard=self._cond,
+        )
+
+    def submit(self, msisdn: str, text: str) -> None:
+        self.submit_event(InboundEvent(msisdn=msisdn, text=text))
+
+    def submit_event(self, event: InboundEvent) -> None:
+        self.enqueue(DispatchJob.from_event(event))
+
+    def enqueue(self, job: DispatchJob) -> bool:
+        """Encola el job; devuelve False si se descartó por backlog lleno."""
+        with self._cond:
+            victim, start = self._admit(job)
+        if victim is not None:
+            self._report_shed(victim)
+        if victim is job:
+            return False
+        if start:
+            self._pool.submit(self._drain, lane_key(job.msisdn))
+        return True
+
+    def _done_outstanding(self) -> None:
+        super()._done_outstanding()
+        self._cond.notify_all()
+
+    def schedule_gate(self, msisdn: str, text: str, trigger_ts: int) -> None:
+        """Re-encola el mensaje en su carril luego del grace period."""
+        with self._cond:
+            self._gate_armed()
+
+        def fire() -> None:
+            self.enqueue(DispatchJob(msisdn=msisdn, text=text, deferred_auto=True, trigger_ts=trigger_ts))
+            with self._cond:
+                self._gate_done()
+
+        self._delays.call_later(self._grace_seconds, fire)
+
+    def wait_for_capacity(self, limit: int) -> None:
+        """Bloquea al productor mientras haya `limit` o más jobs en espera."""
+        if limit <= 0:
+            return
+        with self._cond:
+            while self._queued >= limit:
+                self._cond.wait()
+
+    def close(self, wait: bool = True) -> None:
+        if wait:
+            # Los workers pueden agendar gates y los gates encolan trabajo:
+            # esperamos hasta que no quede nada vivo antes de apagar.
+            with self._cond:
+                while self._outstanding > 0:
+                    self._cond.wait()
+        self._delays.close(wait=wait)
+        self._pool.shutdown(wait=wait)
+        self._metrics.flush()
+        flush = getattr(self._on_shed, "flush", None)
+        if flush is not None:
+            flush()
+
+    @abc.abstractmethod
+    def run_job(self, job: DispatchJob) -> None:
+        """Procesa un job en un worker del pool; los gates van a `schedule_gate`."""
+
+    def _drain(self, key: str) -> None:
+        with self._cond:
+            lane = self._lanes.get(key)
+            if not lane or key in self._running_keys:
+                # Drain obsoleto (carril vaciado por descarte o ya atendido).
+                return
+            job = self._start_job(key, lane)
+            # Un lugar menos en espera: despierta a `wait_for_capacity`.
+            self._cond.notify_all()
+        started = time.monotonic()
+        try:
+            self._record_latency(job)
+            self.run_job(job)
+        except Exception:
+            print(f"{self.log_prefix} worker error ({job.msisdn}):", file=sys.stderr)
+            traceback.print_exc(file=sys.stderr)
+        finally:
+            service_ms = int((time.monotonic() - started) * 1000)
+            with self._cond:
+                more = self._finish_job(key, lane, service_ms)
+            if more:
+                self._pool.submit(self._drain, key)
+
+
+class SubprocessDispatcher(LaneDispatcher):
+    """Modo legacy: un proceso listener por mensaje (ordenado por carril)."""
+
+    mode = "subprocess"
+
+    def run_job(self, job: DispatchJob) -> None:
+        cmd = listener_cmd(
+            job.msisdn,
+            job.text,
+            deferred_auto=job.deferred_auto,
+            trigger_ts=job.trigger_ts,
+            emit_gate=True,
+            rate_limit=False,
+        )
+        print(f"[whatsapp_router_watch] dispatch: {shlex.join(cmd)}", file=sys.stderr)
+        # Esperamos al hijo para que el siguiente mensaje del carril no compita
+        # por los mismos archivos de sesión. Su gate vuelve por stdout y se
+        # re-encola en este mismo carril (no con un `bash sleep` suelto).
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=False)
+        for line in (proc.stdout or "").splitlines():
+            request = parse_gate_request(line)
+            if request is not None:
+                self.schedule_gate(*request)
+            elif line.strip():
+                print(line)
+
+
+class InProcessDispatcher(LaneDispatcher):
+    """Ejecuta `whatsapp_listener.process_inbound` en el pool de carriles."""
+
+    mode = "inprocess"
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        handler: Optional[Callable[..., int]] = None,
+        grace_seconds: Optional[int] = None,
+        max_backlog: int = DEFAULT_MAX_BACKLOG,
+        on_shed: Optional[Callable[[DispatchJob, str], None]] = None,
+        latency_metrics: bool = True,
+        log_dispatch: bool = True,
+    ) -> None:
+        listener = None
+        if handler is None or grace_seconds is None:
+            # Import único: yaml/pytz/clwabot.core se cargan una sola vez.
+            from clwabot.hooks import whatsapp_listener as listener
+
+            handler = handler or listener.process_inbound
+            if grace_seconds is None:
+                grace_seconds = listener.AUTO_RESPONSE_GRACE_SECONDS
+        super().__init__(
+            workers=workers,
+            grace_seconds=grace_seconds,
+            max_backlog=max_backlog,
+            on_shed=on_shed,
+            latency_metrics=latency_metrics,
+        )
+        self._handler = handler
+        self._log_dispatch = log_dispatch
+        self._listener = listener if listener is not None and handler is listener.process_inbound else None
+        if self._listener is not None:
+            # Las métricas de entrega de cada decisión van al lote del dispatcher.
+            self._listener.set_metric_buffer(self._metrics)
+
+    def submit_event(self, event: InboundEvent) -> None:
+        if self._log_dispatch:
+            suffix = f" id={event.message_id}" if event.message_id else ""
+            print(f"[whatsapp_router_watch] dispatch(inprocess): {event.msisdn}{suffix}", file=sys.stderr)
+        super().submit_event(event)
+
+    def close(self, wait: bool = True) -> None:
+        super().close(wait=wait)
+        if self._listener is not None:
+            self._listener.set_metric_buffer(None)
+            # Lo que alcanzó a entrar al lote después del flush del cierre.
+            self._metrics.flush()
+
+    def run_job(self, job: DispatchJob) -> None:
+        self._handler(
+            msisdn=job.msisdn,
+            text=job.text,
+            deferred_auto=job.deferred_auto,
+            trigger_ts=job.trigger_ts,
+            gate_scheduler=self.schedule_gate,
+            event=job.event,
+        )
+
+
+def percentile(sorted_values: list[int], q: float) -> int:
+    if not sorted_values:
+        return 0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Fan-out de los envíos de una decisión y reporte de entrega.
+
+Una decisión de `handle_incoming` puede producir varios envíos (respuesta
+al VIP/contacto, alerta al owner con o sin .ics, reintento o follow-up
+diferidos). Antes salían en serie; ahora los inmediatos se despachan en
+paralelo sobre un pool chico y compartido. Las alertas al owner de severidad
+`critical` se despachan primero, y todos los resultados quedan en un
+`DeliveryReport` por decisión. El plan de envíos viene ya armado en
+`Decision.actions`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Mapping, Optional, Sequence, Union
+
+from clwabot.core.decision import Decision, OutboundMessage, as_decision
+
+FANOUT_WORKERS = 4
+
+# (target, message, ics_path) -> (transporte, ok)
+SendFn = Callable[[str, str, str], "tuple[str, bool]"]
+# (target, message, delay_sec) -> None
+ScheduleFn = Callable[[str, str, int], None]
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="clwabot-fanout")
+        return _POOL
+
+
+@dataclass
+class DeliveryResult:
+    target: str
+    role: str
+    transport: str  # gateway | cli | sink | delayed
+    ok: bool
+    elapsed_ms: int = 0
+    ics: bool = False
+    delay_sec: int = 0
+    error: str = ""
+
+
+@dataclass
+class DeliveryReport:
+    msisdn: str
+    policy: str
+    severity: str = ""
+    results: list[DeliveryResult] = field(default_factory=list)
+    elapsed_ms: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return all(r.ok for r in self.results)
+
+    def to_metric(self) -> dict:
+        return {
+            "kind": "delivery_report",
+            "msisdn": self.msisdn,
+            "policy": self.policy,
+            "severity": self.severity,
+            "sent": sum(1 for r in self.results if r.ok),
+            "failed": sum(1 for r in self.results if not r.ok),
+            "elapsed_ms": self.elapsed_ms,
+            "deliveries": [
+                {
+                    "role": r.role,
+                    "transport": r.transport,
+                    "ok": r.ok,
+                    "elapsed_ms": r.elapsed_ms,
+                    **({"delay_sec": r.delay_sec} if r.delay_sec else {}),
+                    **({"error": r.error} if r.error else {}),
+                }
+                for r in self.results
+            ],
+        }
+
+    def summary(self) -> str:
+        parts = [
+            f"{r.role}:{r.transport}:{'ok' if r.ok else 'FAIL'}"
+            + (f"+{r.delay_sec}s" if r.delay_sec else f"@{r.elapsed_ms}ms")
+            for r in self.results
+        ]
+        return f"policy={self.policy} severity={self.severity or '-'} {self.elapsed_ms}ms " + " ".join(parts)
+
+
+def plan_outbound(
+    decision: Union[Decision, Mapping[str, Any]],
+    owner_msisdn: str,
+    vip_msisdn: str,
+) -> list[OutboundMessage]:
+    """Envíos de una decisión (acepta también el dict legacy)."""
+    return list(as_decision(decision, owner_msisdn, vip_msisdn).actions)
+
+
+def deliver(
+    plan: Sequence[OutboundMessage],
+    send: SendFn,
+    schedule: ScheduleFn,
+    msisdn: str = "",
+    policy: str = "",
+    severity: str = "",
+) -> DeliveryReport:
+    """Envía lo inmediato en paralelo (por prioridad) y agenda lo diferido."""
+    report = DeliveryReport(msisdn=msisdn, policy=policy, severity=severity)
+    start = time.monotonic()
+    immediate = sorted((m for m in plan if not m.delay_sec), key=lambda m: m.priority)
+
+    def run(msg: OutboundMessage) -> DeliveryResult:
+        t0 = time.monotonic()
+        try:
+            transport, ok = send(msg.target, msg.message, msg.ics_path)
+            error = ""
+        except Exception as exc:
+            transport, ok, error = "error", False, str(exc)
+        return DeliveryResult(
+            target=msg.target,
+            role=msg.role,
+            transport=transport,
+            ok=ok,
+            elapsed_ms=int((time.monotonic() - t0) * 1000),
+            ics=bool(msg.ics_path),
+            error=error,
+        )
+
+    if len(immediate) == 1:
+        report.results.append(run(immediate[0]))
+    elif immediate:
+        pool = _pool()
+        futures: list[Future] = [pool.submit(run, msg) for msg in immediate]
+        report.results.extend(f.result() for f in futures)
+
+    for msg in plan:
+        if not msg.delay_sec:
+            continue
+        try:
+            schedule(msg.target, msg.message, msg.delay_sec)
+            ok, error = True, ""
+        except Exception as exc:
+            ok, error = False, str(exc)
+        report.results.append(
+            DeliveryResult(msg.target, msg.role, "delayed", ok, delay_sec=msg.delay_sec, error=error)
+        )
+
+    report.elapsed_ms = int((time.monotonic() - start) * 1000)
+    return report
@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+"""Cliente persistente al gateway local de OpenClaw (WebSocket, :18789).
+
+Reemplaza un `node openclaw.mjs message send` por envío: se abre una sola
+conexión, se autentica una vez (`connect`) y cada envío es un request
+`send` sobre el mismo socket. Es stdlib pura (RFC 6455 mínimo: frames de
+texto, fragmentados o no, sin extensiones).
+
+Protocolo (frames JSON):
+  -> {"type": "req", "id": ..., "method": "connect", "params": {...}}
+  -> {"type": "req", "id": ..., "method": "send", "params": {"channel", "to", "message", ...}}
+  -> {"type": "req", "id": ..., "method": "media.upload", "params": {"fileName", "mimeType", "data"}}
+  <- {"type": "res", "id": ..., "ok": true|false, "payload"|"error": ...}
+  <- {"type": "event", ...}   (se ignoran)
+
+Si no se pudo conectar (connect, handshake o backoff) sale `GatewayUnavailable`:
+el request no llegó a escribirse y el listener cae al CLI. Cualquier otro
+`GatewayError` (sin respuesta, conexión cortada) llega después de escribir el
+frame: el envío pudo salir y no debe repetirse por otro transporte. Un
+`ok: false` es `GatewayRequestError`, con `retryable` si el gateway lo marca
+así o por código/status (5xx, 429...): ese envío no salió. Tras una
+falla de conexión no se reintenta por `RECONNECT_BACKOFF_SECONDS` para no
+pagar un timeout por mensaje.
+
+`AsyncGatewayClient` es la variante asyncio (runtime `async_runtime`): los
+requests no se serializan con un lock, se escriben al socket y cada respuesta
+se entrega a su future por `id`, así muchos envíos quedan en vuelo a la vez.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import mimetypes
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+from typing import Optional
+from urllib.parse import urlparse
+
+GATEWAY_URL = os.environ.get("OPENCLAW_GATEWAY_URL", "ws://127.0.0.1:18789")
+GATEWAY_TOKEN = os.environ.get("OPENCLAW_GATEWAY_TOKEN", "")
+PROTOCOL_VERSION = 3
+CONNECT_TIMEOUT_SECONDS = 2.0
+REQUEST_TIMEOUT_SECONDS = 15.0
+# Rechazos pasajeros: sin `retryable` explícito, se reconocen por código o status.
+RETRYABLE_ERROR_CODES = frozenset({"UNAVAILABLE", "TIMEOUT", "RATE_LIMITED", "BUSY", "NOT_CONNECTED"})
+RETRYABLE_STATUSES = frozenset({408, 425, 429})
+RECONNECT_BACKOFF_SECONDS = 30.0
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+class GatewayError(RuntimeError):
+    pass
+
+
+class GatewayRequestError(GatewayError):
+    """El gateway respondió `ok: false`; la conexión sigue sana.
+
+    `retryable` dice si el rechazo es pasajero (gateway ocupado, canal caído,
+    5xx/429): el envío no salió y se puede volver a intentar.
+    """
+
+    def __init__(self, message: str, code: str = "", status: int = 0, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.retryable = retryable
+
+
+def request_error(method: str, error) -> GatewayRequestError:
+    """`GatewayRequestError` desde el campo `error` de una respuesta `ok: false`."""
+    if not isinstance(error, dict):
+        return GatewayRequestError(f"{method} falló: {error}")
+    code = str(error.get("code") or "")
+    try:
+        status = int(error.get("status") or 0)
+    except (TypeError, ValueError):
+        status = 0
+    retryable = error.get("retryable")
+    if not isinstance(retryable, bool):
+        retryable = code.upper() in RETRYABLE_ERROR_CODES or status in RETRYABLE_STATUSES or status >= 500
+    return GatewayRequestError(f"{method} falló: {error}", code=code, status=status, retryable=retryable)
+
+
+class GatewayUnavailable(GatewayError):
+    """Sin conexión al gateway: el request no se escribió al socket."""
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = True, fin: bool = True) -> bytes:
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack("!H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack("!Q", length)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    masked = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return bytes(header) + key + masked
+
+
+def read_frame(sock_file) -> tuple[int, bytes]:
+    """Un frame suelto; los clientes juntan fragmentos con `FrameAssembler`."""
+    _, opcode, payload = read_frame_fin(sock_file)
+    return opcode, payload
+
+
+def read_frame_fin(sock_file) -> tuple[bool, int, bytes]:
+    head = _read_exact(sock_file, 2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(sock_file, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(sock_file, 8))[0]
+    key = _read_exact(sock_file, 4) if masked else b""
+    payload = _read_exact(sock_file, length)
+    if masked:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+class FrameAssembler:
+    """Junta un mensaje fragmentado (frame sin FIN + `OP_CONT`...) hasta el FIN.
+
+    Los frames de control (ping, close) pueden llegar entre fragmentos y pasan
+    solos. Un `OP_CONT` sin mensaje abierto es un error de protocolo.
+    """
+
+    def __init__(self) -> None:
+        self._opcode = OP_TEXT
+        self._parts: list[bytes] = []
+
+    def feed(self, fin: bool, opcode: int, payload: bytes) -> Optional[tuple[int, bytes]]:
+        """(opcode, payload) del mensaje completo, o None si faltan fragmentos."""
+        if opcode & 0x8:
+            return opcode, payload
+        if opcode == OP_CONT:
+            if not self._parts:
+                raise GatewayError("frame de continuación sin mensaje abierto")
+            self._parts.append(payload)
+        elif self._parts:
+            raise GatewayError("mensaje nuevo antes de terminar el fragmentado")
+        elif fin:
+            return opcode, payload
+        else:
+            self._opcode, self._parts = opcode, [payload]
+            return None
+        if not fin:
+            return None
+        message = (self._opcode, b"".join(self._parts))
+        self._parts = []
+        return message
+
+
+def _read_exact(sock_file, size: int) -> bytes:
+    data = sock_file.read(size)
+    if data is None or len(data) < size:
+        raise GatewayError("conexión cerrada por el gateway")
+    return data
+
+
+class GatewayClient:
+    """Una conexión viva al gateway, compartida por los workers (con lock)."""
+
+    def __init__(
+        self,
+        url: str = GATEWAY_URL,
+        token: str = GATEWAY_TOKEN,
+        request_timeout: float = REQUEST_TIMEOUT_SECONDS,
+        reconnect_backoff: float = RECONNECT_BACKOFF_SECONDS,
+    ) -> None:
+        self.url = url
+        self.token = token
+        self.request_timeout = request_timeout
+        self.reconnect_backoff = reconnect_backoff
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+        self._assembler = FrameAssembler()
+        self._down_until = 0.0
+        self.sent = 0
+        self.connects = 0
+
+    # -- API ----------------------------------------------------------------
+
+    def send_message(
+        self,
+        target: str,
+        message: str,
+        media_path: str = "",
+        channel: str = "whatsapp",
+        media_id: str = "",
+        idempotency_key: str = "",
+    ) -> dict:
+        """Envía un mensaje; con la misma `idempotency_key` el gateway no lo duplica.
+
+        La clave debe salir de la identidad del envío (p. ej. la del outbox)
+        para que un reintento tras un ack perdido no salga dos veces; sin
+        clave cada llamada es un envío nuevo.
+        """
+        params = {
+            "channel": channel,
+            "to": target,
+            "message": message,
+            "idempotencyKey": idempotency_key or uuid.uuid4().hex,
+        }
+        if media_id:
+            params["mediaId"] = media_id
+        elif media_path:
+            params["mediaPath"] = media_path
+        payload = self.request("send", params)
+        self.sent += 1
+        return payload
+
+    def upload_media(self, path: str, channel: str = "whatsapp") -> str:
+        """Sube un adjunto y devuelve su `mediaId` para reusarlo en varios envíos."""
+        with open(path, "rb") as fh:
+            data = fh.read()
+        payload = self.request(
+            "media.upload",
+            {
+                "channel": channel,
+                "fileName": os.path.basename(path),
+                "mimeType": mimetypes.guess_type(path)[0] or "application/octet-stream",
+                "data": base64.b64encode(data).decode("ascii"),
+            },
+        )
+        media_id = str(payload.get("mediaId") or "")
+        if not media_id:
+            raise GatewayRequestError("media.upload sin mediaId")
+        return media_id
+
+    def request(self, method: str, params: dict) -> dict:
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                return self._call(method, params)
+            except GatewayRequestError:
+                raise
+            except GatewayError:
+                self._close()
+                raise
+            except OSError as exc:
+                self._close()
+                raise GatewayError(f"{method} sin respuesta: {exc}") from exc
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    # -- conexión -----------------------------------------------------------
+
+    def _connect(self) -> None:
+        now = time.monotonic()
+        if now < self._down_until:
+            raise GatewayUnavailable("gateway no disponible (backoff)")
+        parsed = urlparse(self.url)
+        host = parsed.hostname or "127.0.0.1"
+        port = parsed.port or 18789
+        try:
+            sock = socket.create_connection((host, port), timeout=CONNECT_TIMEOUT_SECONDS)
+            sock.settimeout(self.request_timeout)
+            # Frames chicos de request/response: sin Nagle cada envío espera
+            # el ACK diferido (~40 ms).
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._file = sock.makefile("rb")
+            self._assembler = FrameAssembler()
+            self._handshake(host, port, parsed.path or "/")
+            self._call(
+                "connect",
+                {
+                    "minProtocol": PROTOCOL_VERSION,
+                    "maxProtocol": PROTOCOL_VERSION,
+                    "client": {"id": "clwabot", "mode": "backend", "platform": sys.platform},
+                    "auth": {"token": self.token} if self.token else {},
+                },
+            )
+        except (OSError, GatewayError) as exc:
+            self._close()
+            self._down_until = now + self.reconnect_backoff
+            raise GatewayUnavailable(f"no se pudo conectar a {self.url}: {exc}") from exc
+        self.connects += 1
+
+    def _handshake(self, host: str, port: int, path: str) -> None:
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        self._sock.sendall(request.encode("ascii"))
+        status = self._file.readline()
+        if b" 101 " not in status:
+            raise GatewayError(f"handshake rechazado: {status.decode('latin-1').strip()}")
+        while self._file.readline() not in (b"\r\n", b"\n", b""):
+            pass
+
+    def _call(self, method: str, params: dict) -> dict:
+        req_id = uuid.uuid4().hex
+        frame = {"type": "req", "id": req_id, "method": method, "params": params}
+        self._sock.sendall(encode_frame(OP_TEXT, json.dumps(frame, ensure_ascii=False).encode("utf-8")))
+        while True:
+            message = self._assembler.feed(*read_frame_fin(self._file))
+            if message is None:
+                continue
+            opcode, data = message
+            if opcode == OP_PING:
+                self._sock.sendall(encode_frame(OP_PONG, data))
+                continue
+            if opcode == OP_CLOSE:
+                raise GatewayError("el gateway cerró la conexión")
+            if opcode != OP_TEXT:
+                continue
+            try:
+                msg = json.loads(data)
+            except Exception:
+                continue
+            if msg.get("type") != "res" or msg.get("id") != req_id:
+                continue
+            if not msg.get("ok"):
+                raise request_error(method, msg.get("error"))
+            return msg.get("payload") or {}
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.sendall(encode_frame(OP_CLOSE, b""))
+            except OSError:
+                pass
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+
+class AsyncGatewayClient:
+    """Conexión única al gateway sobre asyncio, con requests en paralelo."""
+
+    def __init__(
+        self,
+        url: str = GATEWAY_URL,
+        token: str = GATEWAY_TOKEN,
+        request_timeout: float = REQUEST_TIMEOUT_SECONDS,
+        reconnect_backoff: float = RECONNECT_BACKOFF_SECONDS,
+    ) -> None:
+        self.url = url
+        self.token = token
+        self.request_timeout = request_timeout
+        self.reconnect_backoff = reconnect_backoff
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: dict[str, asyncio.Future] = {}
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._down_until = 0.0
+        self.sent = 0
+        self.connects = 0
+
+    async def send_message(
+        self,
+        target: str,
+        message: str,
+        media_path: str = "",
+        channel: str = "whatsapp",
+        media_id: str = "",
+        idempotency_key: str = "",
+    ) -> dict:
+        """Igual que `GatewayClient.send_message`."""
+        params = {
+            "channel": channel,
+            "to": target,
+            "message": message,
+            "idempotencyKey": idempotency_key or uuid.uuid4().hex,
+        }
+        if media_id:
+            params["mediaId"] = media_id
+        elif media_path:
+            params["mediaPath"] = media_path
+        payload = await self.request("send", params)
+        self.sent += 1
+        return payload
+
+    async def upload_media(self, path: str, channel: str = "whatsapp") -> str:
+        data = await asyncio.get_running_loop().run_in_executor(None, _read_bytes, path)
+        payload = await self.request(
+            "media.upload",
+            {
+                "channel": channel,
+                "fileName": os.path.basename(path),
+                "mimeType": mimetypes.guess_type(path)[0] or "application/octet-stream",
+                "data": base64.b64encode(data).decode("ascii"),
+            },
+        )
+        media_id = str(payload.get("mediaId") or "")
+        if not media_id:
+            raise GatewayRequestError("media.upload sin mediaId")
+        return media_id
+
+    async def request(self, method: str, params: dict) -> dict:
+        await self._ensure_connected()
+        try:
+            return await self._call(method, params)
+        except (GatewayRequestError, GatewayUnavailable):
+            raise
+        except (OSError, GatewayError, asyncio.TimeoutError) as exc:
+            await self._close()
+            raise GatewayError(f"{method} sin respuesta: {exc}") from exc
+
+    async def close(self) -> None:
+        await self._close()
+
+    # -- conexión -----------------------------------------------------------
+
+    async def _ensure_connected(self) -> None:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            now = time.monotonic()
+            if now < self._down_until:
+                raise GatewayUnavailable("gateway no disponible (backoff)")
+            parsed = urlparse(self.url)
+            host = parsed.hostname or "127.0.0.1"
+            port = parsed.port or 18789
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port), CONNECT_TIMEOUT_SECONDS
+                )
+                sock = self._writer.get_extra_info("socket")
+                if sock is not None:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                await self._handshake(host, port, parsed.path or "/")
+                self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+                await self._call(
+                    "connect",
+                    {
+                        "minProtocol": PROTOCOL_VERSION,
+                        "maxProtocol": PROTOCOL_VERSION,
+                        "client": {"id": "clwabot", "mode": "backend", "platform": sys.platform},
+                        "auth": {"token": self.token} if self.token else {},
+                    },
+                )
+            except (OSError, GatewayError, asyncio.TimeoutError) as exc:
+                await self._close()
+                self._down_until = now + self.reconnect_backoff
+                raise GatewayUnavailable(f"no se pudo conectar a {self.url}: {exc}") from exc
+            self.connects += 1
+
+    async def _handshake(self, host: str, port: int, path: str) -> None:
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self._writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {host}:{port}\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Key: {key}\r\n"
+                "Sec-WebSocket-Version: 13\r\n\r\n"
+            ).encode("ascii")
+        )
+        await self._writer.drain()
+        status = await asyncio.wait_for(self._reader.readline(), CONNECT_TIMEOUT_SECONDS)
+        if b" 101 " not in status:
+            raise GatewayError(f"handshake rechazado: {status.decode('latin-1').strip()}")
+        while (await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+    async def _call(self, method: str, params: dict) -> dict:
+        if self._writer is None:
+            raise GatewayUnavailable("sin conexión")
+        req_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = future
+        frame = {"type": "req", "id": req_id, "method": method, "params": params}
+        try:
+            self._writer.write(encode_frame(OP_TEXT, json.dumps(frame, ensure_ascii=False).encode("utf-8")))
+            await self._writer.drain()
+            msg = await asyncio.wait_for(future, self.request_timeout)
+        finally:
+            self._pending.pop(req_id, None)
+        if not msg.get("ok"):
+            raise request_error(method, msg.get("error"))
+        return msg.get("payload") or {}
+
+    async def _read_loop(self) -> None:
+        error: Exception = GatewayError("conexión cerrada por el gateway")
+        assembler = FrameAssembler()
+        try:
+            while True:
+                message = assembler.feed(*await _read_frame_async(self._reader))
+                if message is None:
+                    continue
+                opcode, data = message
+                if opcode == OP_PING:
+                    self._writer.write(encode_frame(OP_PONG, data))
+                    continue
+                if opcode == OP_CLOSE:
+                    break
+                if opcode != OP_TEXT:
+                    continue
+                try:
+                    msg = json.loads(data)
+                except Exception:
+                    continue
+                if msg.get("type") != "res":
+                    continue
+                future = self._pending.get(msg.get("id"))
+                if future is not None and not future.done():
+                    future.set_result(msg)
+        except (OSError, GatewayError, asyncio.IncompleteReadError) as exc:
+            error = GatewayError(str(exc) or "conexión cerrada por el gateway")
+        except asyncio.CancelledError:
+            error = GatewayError("conexión cerrada")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+    async def _close(self) -> None:
+        writer, self._writer = self._writer, None
+        task, self._reader_task = self._reader_task, None
+        if writer is not None:
+            try:
+                writer.write(encode_frame(OP_CLOSE, b""))
+                writer.close()
+                await writer.wait_closed()
+            except (OSError, RuntimeError):
+                pass
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+async def _read_frame_async(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    head = await reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    key = await reader.readexactly(4) if masked else b""
+    payload = await reader.readexactly(length)
+    if masked:
+        payload = bytes(b ^ key[i % 4] for i, b in enumerate(payload))
+    return fin, opcode, payload
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as fh:
+        return fh.read()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Gateway local de mentira para tests y benchmarks del cliente WebSocket.
+
+Habla el mismo subconjunto de protocolo que `gateway_client`: acepta
+`connect` (valida token si se configuró), `media.upload` y `send`, y guarda
+cada envío en `messages` (y cada subida en `uploads`) en vez de tocar
+WhatsApp. Para tests puede rechazar envíos, perder el ack de uno ya
+entregado o fragmentar sus respuestas.
+
+  python3 -m clwabot.hooks.gateway_stub --port 18789
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import socketserver
+import sys
+import threading
+from hashlib import sha1
+from typing import Optional
+
+from clwabot.hooks.gateway_client import (
+    OP_CLOSE,
+    OP_CONT,
+    OP_PING,
+    OP_PONG,
+    OP_TEXT,
+    GatewayError,
+    encode_frame,
+    read_frame,
+)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "_Server"
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        if not self._handshake():
+            return
+        authed = False
+        while True:
+            try:
+                opcode, data = read_frame(self.rfile)
+            except (GatewayError, OSError):
+                return
+            if opcode == OP_CLOSE:
+                return
+            if opcode == OP_PING:
+                self._write(OP_PONG, data)
+                continue
+            if opcode != OP_TEXT:
+                continue
+            req = json.loads(data)
+            method = req.get("method")
+            params = req.get("params") or {}
+            if method == "connect":
+                token = (params.get("auth") or {}).get("token", "")
+                authed = not self.server.token or token == self.server.token
+                self._reply(req, authed, {"protocol": params.get("maxProtocol")}, "unauthorized")
+                if not authed:
+                    return
+            elif not authed:
+                self._reply(req, False, None, "connect required")
+                return
+            elif method == "media.upload":
+                with self.server.lock:
+                    self.server.uploads.append(params)
+                    media_id = f"media-{len(self.server.uploads)}"
+                self._reply(req, True, {"mediaId": media_id}, "")
+            elif method == "send":
+                ok = not self.server.fail_sends
+                media_id = params.get("mediaId")
+                if media_id and media_id not in {f"media-{i + 1}" for i in range(len(self.server.uploads))}:
+                    self._reply(req, False, None, f"unknown media {media_id}")
+                    continue
+                if ok:
+                    with self.server.lock:
+                        # Como el gateway real: una clave ya vista no se reenvía.
+                        key = params.get("idempotencyKey")
+                        if key not in self.server.idempotency_keys:
+                            self.server.messages.append(params)
+                        if key:
+                            self.server.idempotency_keys.add(key)
+                        drop = self.server.drop_acks > 0
+                        self.server.drop_acks -= int(drop)
+                    if drop:
+                        # Entregado, pero el ack se pierde: se corta la conexión.
+                        return
+                self._reply(
+                    req, ok, {"messageId": f"stub-{len(self.server.messages)}"}, "send failed", self.server.fail_status
+                )
+            else:
+                self._reply(req, False, None, f"unknown method {method}")
+
+    def _handshake(self) -> bool:
+        headers = {}
+        if not self.rfile.readline().startswith(b"GET "):
+            return False
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.wfile.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode("ascii")
+        )
+        with self.server.lock:
+            self.server.connections += 1
+        return True
+
+    def _reply(self, req: dict, ok: bool, payload: Optional[dict], error: str, status: int = 0) -> None:
+        msg = {"type": "res", "id": req.get("id"), "ok": ok}
+        if ok:
+            msg["payload"] = payload or {}
+        else:
+            msg["error"] = {"message": error}
+            if status:
+                msg["error"]["status"] = status
+        # Un evento intercalado, como hace el gateway real.
+        self._write(OP_TEXT, json.dumps({"type": "event", "event": "tick"}).encode("utf-8"))
+        data = json.dumps(msg).encode("utf-8")
+        if not self.server.fragment_replies:
+            self._write(OP_TEXT, data)
+            return
+        # Respuesta en tres fragmentos, con un ping entre medio.
+        third = max(1, len(data) // 3)
+        self.wfile.write(encode_frame(OP_TEXT, data[:third], mask=False, fin=False))
+        self._write(OP_PING, b"hb")
+        self.wfile.write(encode_frame(OP_CONT, data[third : 2 * third], mask=False, fin=False))
+        self.wfile.write(encode_frame(OP_CONT, data[2 * third :], mask=False))
+
+    def _write(self, opcode: int, payload: bytes) -> None:
+        self.wfile.write(encode_frame(opcode, payload, mask=False))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, token: str) -> None:
+        super().__init__(addr, _Handler)
+        self.token = token
+        self.lock = threading.Lock()
+        self.messages: list[dict] = []
+        self.uploads: list[dict] = []
+        self.connections = 0
+        self.fail_sends = False
+        self.fail_status = 0
+        self.drop_acks = 0
+        self.fragment_replies = False
+        self.idempotency_keys: set[str] = set()
+
+
+class StubGateway:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token: str = "") -> None:
+        self._server = _Server((host, port), token)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            name="gateway-stub",
+            daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"ws://{host}:{port}"
+
+    @property
+    def messages(self) -> list[dict]:
+        return self._server.messages
+
+    @property
+    def uploads(self) -> list[dict]:
+        return self._server.uploads
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    def set_fail_sends(self, value: bool, status: int = 0) -> None:
+        """Rechaza los envíos (`status` va en el error, p. ej. 503 = reintentable)."""
+        self._server.fail_sends = value
+        self._server.fail_status = status
+
+    def set_fragment_replies(self, value: bool) -> None:
+        self._server.fragment_replies = value
+
+    def drop_next_acks(self, count: int = 1) -> None:
+        """Los próximos `count` envíos se guardan pero sin responder (corta la conexión)."""
+        with self._server.lock:
+            self._server.drop_acks = count
+
+    def start(self) -> "StubGateway":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Gateway OpenClaw de prueba")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18789)
+    parser.add_argument("--token", default="")
+    args = parser.parse_args(argv)
+    stub = StubGateway(args.host, args.port, args.token)
+    print(f"[gateway_stub] escuchando {stub.url}", file=sys.stderr)
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[gateway_stub] envíos recibidos: {len(stub.messages)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Registro tipado de un inbound, del router al handler en proceso.
+
+Reemplaza el par `--msisdn/--text`: conserva lo que trae el payload
+estructurado de OpenClaw (id del mensaje, timestamp de recepción, tipo de
+chat, media) y viaja tal cual por el dispatcher hasta `process_inbound`.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from clwabot.hooks.dedup import dedup_key
+
+
+@dataclass(frozen=True, slots=True)
+class InboundEvent:
+    msisdn: str
+    text: str
+    message_id: str = ""
+    # Epoch en segundos: `received_ts` lo fija el gateway, `routed_ts` el router.
+    received_ts: float = 0.0
+    routed_ts: float = 0.0
+    chat_type: str = ""
+    has_media: bool = False
+
+    @property
+    def dedup_key(self) -> str:
+        """El id del gateway si viene; si no, (msisdn, texto)."""
+        if self.message_id:
+            return dedup_key("id", self.message_id)
+        return dedup_key(self.msisdn, self.text)
+
+    def latency_ms(self, now: Optional[float] = None) -> dict[str, int]:
+        """Latencias gateway->router->handler (solo las que se pueden medir)."""
+        now = time.time() if now is None else now
+        out: dict[str, int] = {}
+        if self.routed_ts:
+            out["router_to_handler_ms"] = max(0, int((now - self.routed_ts) * 1000))
+            if self.received_ts:
+                out["gateway_to_router_ms"] = max(0, int((self.routed_ts - self.received_ts) * 1000))
+        if self.received_ts:
+            out["total_ms"] = max(0, int((now - self.received_ts) * 1000))
+        return out
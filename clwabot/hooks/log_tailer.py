@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Tail nativo del archivo de log del gateway, con checkpoint de offset.
+
+Reemplaza `openclaw logs --follow --max-bytes ...` + el loop `while true` de
+bash: leemos el archivo directamente, seguimos rotaciones (renombrado,
+truncado o archivo nuevo que calce con el patrón) y persistimos el offset de
+la última línea procesada. Al reiniciar se retoma exactamente desde ahí.
+
+El checkpoint guarda path, inode, offset y el sha1 de la última línea; si al
+reanudar el contenido no calza (archivo reemplazado), se parte desde 0 del
+archivo actual en vez de saltar a un offset ajeno.
+"""
+
+from __future__ import annotations
+
+import glob
+import os
+import time
+from hashlib import sha1
+from pathlib import Path
+from typing import Iterator, Optional
+
+from clwabot.core.persist import read_json, write_json
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+CHECKPOINT_PATH = BASE_DIR / "data" / "router_checkpoint.json"
+POLL_INTERVAL_SECONDS = 0.5
+# Las líneas de ruido solo adelantan el checkpoint cada tanto; los inbound
+# despachados lo persisten de inmediato.
+IDLE_COMMIT_SECONDS = 5.0
+
+
+def _load_checkpoint(path: Optional[Path]) -> dict:
+    if path is None:
+        return {}
+    raw = read_json(path, dict)
+    return raw if isinstance(raw, dict) else {}
+
+
+def _save_checkpoint(path: Path, payload: dict) -> None:
+    write_json(path, payload)
+
+
+class LogTailer:
+    """Sigue un archivo (o el más reciente de un glob) línea a línea."""
+
+    def __init__(
+        self,
+        pattern: str,
+        checkpoint_path: Optional[Path] = CHECKPOINT_PATH,
+        from_start: bool = False,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+    ) -> None:
+        self.pattern = pattern
+        self.checkpoint_path = checkpoint_path
+        self.from_start = from_start
+        self.poll_interval = poll_interval
+        self._fh = None
+        self._path = ""
+        self._inode = 0
+        self._offset = 0
+        self._last_line = b""
+        self._last_commit = 0.0
+        self._committed_offset = -1
+
+    # -- posición -----------------------------------------------------------
+
+    @property
+    def position(self) -> dict:
+        return {
+            "path": self._path,
+            "inode": self._inode,
+            "offset": self._offset,
+            "last_line_len": len(self._last_line),
+            "last_line_sha1": sha1(self._last_line).hexdigest() if self._last_line else "",
+            "saved_at": time.time(),
+        }
+
+    def commit(self, force: bool = False) -> None:
+        """Persiste el offset ya procesado (llamar luego de manejar la línea)."""
+        if self.checkpoint_path is None or not self._path:
+            return
+        if self._offset == self._committed_offset:
+            return
+        now = time.monotonic()
+        if not force and (now - self._last_commit) < IDLE_COMMIT_SECONDS:
+            return
+        _save_checkpoint(self.checkpoint_path, self.position)
+        self._committed_offset = self._offset
+        self._last_commit = now
+
+    # -- archivos -----------------------------------------------------------
+
+    def _candidates(self) -> list[str]:
+        if not glob.has_magic(self.pattern):
+            return [self.pattern] if os.path.exists(self.pattern) else []
+        stamped = []
+        for path in glob.glob(self.pattern):
+            try:
+                stamped.append((os.stat(path).st_mtime_ns, path))
+            except FileNotFoundError:
+                continue
+        return [path for _, path in sorted(stamped)]
+
+    def _open(self, path: str, offset: int, last_line: bytes = b"") -> None:
+        self._close()
+        self._fh = open(path, "rb")
+        st = os.fstat(self._fh.fileno())
+        self._path = path
+        self._inode = st.st_ino
+        self._offset = min(offset, st.st_size)
+        self._last_line = last_line
+        self._fh.seek(self._offset)
+
+    def _close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _resume(self) -> bool:
+        """Abre el archivo inicial según checkpoint; False si aún no existe."""
+        candidates = self._candidates()
+        cp = _load_checkpoint(self.checkpoint_path)
+        if cp:
+            offset = int(cp.get("offset") or 0)
+            inode = int(cp.get("inode") or 0)
+            # El archivo del checkpoint puede seguir en su path o haber sido
+            # renombrado por la rotación: lo buscamos por inode.
+            paths = [cp.get("path", "")] + candidates
+            for path in paths:
+                if not path or not os.path.exists(path):
+                    continue
+                st = os.stat(path)
+                if st.st_ino != inode or st.st_size < offset:
+                    continue
+                last_line = self._verify_line(path, offset, cp)
+                if last_line is not None:
+                    self._open(path, offset, last_line)
+                    self._committed_offset = offset
+                    return True
+
+            # Archivo del checkpoint perdido o reemplazado: tomamos desde 0 el
+            # primero que haya sido escrito luego del checkpoint.
+            saved_at_ns = int(float(cp.get("saved_at") or 0) * 1e9)
+            newer = [p for p in candidates if os.stat(p).st_mtime_ns > saved_at_ns]
+            if newer:
+                self._open(newer[0], 0)
+                return True
+
+        if not candidates:
+            return False
+        newest = candidates[-1]
+        size = 0 if self.from_start else os.path.getsize(newest)
+        self._open(newest, size)
+        return True
+
+    @staticmethod
+    def _verify_line(path: str, offset: int, cp: dict) -> Optional[bytes]:
+        length = int(cp.get("last_line_len") or 0)
+        expected = cp.get("last_line_sha1", "")
+        if offset == 0 or not length or not expected:
+            return b""
+        if length > offset:
+            return None
+        with open(path, "rb") as fh:
+            fh.seek(offset - length)
+            data = fh.read(length)
+        if sha1(data).hexdigest() != expected:
+            return None
+        return data
+
+    def _next_file(self) -> Optional[str]:
+        """Estando en EOF: siguiente archivo si el actual rotó, o None."""
+        candidates = self._candidates()
+        inodes = []
+        for path in candidates:
+            try:
+                inodes.append(os.stat(path).st_ino)
+            except FileNotFoundError:
+                inodes.append(-1)
+        if self._inode in inodes:
+            idx = inodes.index(self._inode)
+            return candidates[idx + 1] if idx + 1 < len(candidates) else None
+        # El actual salió del patrón (renombrado): seguimos con el más antiguo
+        # de los escritos después de él, que es el que se creó tras la rotación.
+        current_mtime = os.fstat(self._fh.fileno()).st_mtime_ns
+        for path in candidates:
+            try:
+                if os.stat(path).st_mtime_ns >= current_mtime:
+                    return path
+            except FileNotFoundError:
+                continue
+        return None
+
+    # -- lectura ------------------------------------------------------------
+
+    def lines(self, follow: bool = True) -> Iterator[bytes]:
+        """Genera líneas completas (bytes). Con `follow=False` corta al EOF."""
+        while self._fh is None:
+            if self._resume():
+                break
+            if not follow:
+                return
+            time.sleep(self.poll_interval)
+
+        partial = b""
+        while True:
+            chunk = self._fh.readline()
+            if chunk:
+                if not chunk.endswith(b"\n"):
+                    # Línea aún en escritura: esperamos el resto.
+                    partial += chunk
+                    if not follow:
+                        # Sin follow no esperamos: se relee en la próxima llamada.
+                        self._fh.seek(self._offset)
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+                line = partial + chunk
+                partial = b""
+                self._offset += len(line)
+                self._last_line = line
+                yield line
+                continue
+
+            if os.fstat(self._fh.fileno()).st_size < self._offset:
+                # Truncado en el mismo archivo (copytruncate).
+                self._open(self._path, 0)
+                partial = b""
+                continue
+            target = self._next_file()
+            if target is not None:
+                self._open(target, 0)
+                partial = b""
+                continue
+            if not follow:
+                return
+            self.commit()
+            time.sleep(self.poll_interval)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Caché de adjuntos subidos al gateway (subir una vez, reusar el handle).
+
+El mismo `.ics` suele ir a VIP/contacto y owner, y un reintento del outbox lo
+vuelve a mandar. En vez de subir el archivo en cada envío (`mediaPath`), se
+sube una vez (`media.upload`) y los envíos siguientes usan el `mediaId`.
+
+La clave es el sha256 del contenido, así dos paths con el mismo archivo
+comparten handle y un archivo reescrito no reusa uno viejo. Las entradas
+vencen a los `MEDIA_TTL_SECONDS` de subidas y, sobre `MEDIA_MAX_ENTRIES`, se
+desaloja la usada hace más tiempo (LRU).
+
+Si el gateway no conoce `media.upload` se deja de intentar por
+`UNSUPPORTED_RETRY_SECONDS` y los envíos vuelven a `mediaPath`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from clwabot.hooks.gateway_client import GatewayRequestError
+
+MEDIA_TTL_SECONDS = 6 * 3600
+MEDIA_MAX_ENTRIES = 256
+UNSUPPORTED_RETRY_SECONDS = 600
+
+# path -> handle del gateway
+UploadFn = Callable[[str], str]
+
+
+@dataclass
+class MediaEntry:
+    handle: str
+    uploaded_ts: float
+    size: int
+    uses: int = 0
+
+
+def content_key(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """Handles de adjuntos por hash de contenido, con TTL y desalojo LRU."""
+
+    def __init__(self, ttl_seconds: float = MEDIA_TTL_SECONDS, max_entries: int = MEDIA_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, MediaEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Un lock por contenido: VIP y owner en paralelo suben una sola vez.
+        self._uploading: dict[str, threading.Lock] = {}
+        self._unsupported_until = 0.0
+        self.hits = 0
+        self.uploads = 0
+        self.evictions = 0
+
+    def handle_for(self, path: str, upload: UploadFn, now: Optional[float] = None) -> str:
+        """Handle del adjunto (subiéndolo si hace falta); '' = usar `mediaPath`."""
+        now = time.time() if now is None else now
+        if now < self._unsupported_until or not Path(path).is_file():
+            return ""
+        key = content_key(path)
+        handle = self._lookup(key, now)
+        if handle:
+            return handle
+        with self._lock:
+            upload_lock = self._uploading.setdefault(key, threading.Lock())
+        with upload_lock:
+            try:
+                handle = self._lookup(key, now)
+                if handle:
+                    return handle
+                try:
+                    handle = upload(path)
+                except GatewayRequestError as exc:
+                    if exc.retryable:
+                        raise
+                    self._unsupported_until = now + UNSUPPORTED_RETRY_SECONDS
+                    print(f"[media_cache] upload no soportado ({exc}); se usa mediaPath", file=sys.stderr)
+                    return ""
+                if handle:
+                    self._store(key, MediaEntry(handle=handle, uploaded_ts=now, size=Path(path).stat().st_size), now)
+            finally:
+                # Recién con el handle guardado: quien llegue después lo encuentra en la caché.
+                with self._lock:
+                    if self._uploading.get(key) is upload_lock:
+                        del self._uploading[key]
+        return handle or ""
+
+    def invalidate(self, handle: str) -> None:
+        """Descarta un handle que el gateway ya no reconoce."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.handle == handle:
+                    del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "uploads": self.uploads,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str, now: float) -> str:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return ""
+            if now - entry.uploaded_ts >= self.ttl_seconds:
+                del self._entries[key]
+                self.evictions += 1
+                return ""
+            self._entries.move_to_end(key)
+            entry.uses += 1
+            self.hits += 1
+            return entry.handle
+
+    def _store(self, key: str, entry: MediaEntry, now: float) -> None:
+        with self._lock:
+            self.uploads += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            for old_key in [k for k, e in self._entries.items() if now - e.uploaded_ts >= self.ttl_seconds]:
+                del self._entries[old_key]
+                self.evictions += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
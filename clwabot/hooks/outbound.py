@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Destinos alternativos para los envíos del listener.
+
+Por defecto `whatsapp_listener` envía con `openclaw message send`. Para
+backfill/benchmarks (`whatsapp_router_watch --batch`) los envíos se desvían a
+un `OutboundSink`: una línea JSON por envío, sin tocar WhatsApp.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+
+
+class OutboundSink:
+    """Registra envíos en un archivo JSONL (seguro para varios hilos)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def send(self, target: str, message: str, path: str = "", delay_sec: int = 0) -> None:
+        record = {"ts": time.time(), "target": target, "message": message}
+        if path:
+            record["path"] = path
+        if delay_sec:
+            record["delay_sec"] = int(delay_sec)
+        with self._lock:
+            self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Rate limiting por contacto (token bucket) al despachar cada inbound.
+
+Cada msisdn tiene un balde de `burst` fichas que se recarga a `per_minute`
+fichas por minuto; el router revisa la ficha antes de journal y carril, y un
+inbound sin ficha se descarta sin ocupar worker. Los límites van por rol en `config/contacts.yaml`:
+
+  rate_limits:
+    owner: {per_minute: 0}
+    vip:   {per_minute: 0}
+    other: {per_minute: 6, burst: 4}
+
+`per_minute: 0` desactiva el límite para ese rol (por defecto owner y VIP: a
+ellos no se les descarta nada). Los baldes viven en memoria
+y se persisten cada `FLUSH_INTERVAL_SECONDS` (un reinicio no regala fichas a
+un flood en curso). Los descartes se acumulan por contacto y se registran
+como métrica `inbound_throttled` en el mismo flush: un flood no se convierte
+en una escritura de `state.json` por mensaje.
+
+Varios procesos pueden compartir `rate_limits.json` (router en modo
+`--subprocess`, un listener por mensaje): el flush toma el lock del archivo,
+relee los baldes, les descuenta las fichas que este proceso gastó desde el
+flush anterior y deja el resultado también en memoria. Entre dos flushes
+cada proceso decide con lo suyo. Con `auto_flush=False` `allow()` no hace
+I/O: el dueño revisa `flush_due()` y llama `flush()` desde otro hilo.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from clwabot.core.file_lock import locked
+from clwabot.core.persist import read_json, write_json
+from clwabot.core.state_store import record_metric_events
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+CONTACTS_PATH = BASE_DIR / "config" / "contacts.yaml"
+RATE_LIMITS_PATH = BASE_DIR / "data" / "rate_limits.json"
+FLUSH_INTERVAL_SECONDS = 5.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    per_minute: float
+    burst: float
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+
+DEFAULT_LIMITS = {
+    "owner": RateLimit(per_minute=0, burst=0),
+    "vip": RateLimit(per_minute=0, burst=0),
+    "other": RateLimit(per_minute=6, burst=4),
+}
+
+
+def load_limits(path: Path = CONTACTS_PATH) -> dict[str, RateLimit]:
+    """Límites por rol desde `contacts.yaml` (lo que falte usa DEFAULT_LIMITS)."""
+    limits = dict(DEFAULT_LIMITS)
+    try:
+        raw = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+    except Exception:
+        return limits
+    for role, cfg in (raw.get("rate_limits") or {}).items():
+        if not isinstance(cfg, dict):
+            continue
+        base = limits.get(role, DEFAULT_LIMITS["other"])
+        try:
+            per_minute = float(cfg.get("per_minute", base.per_minute))
+            burst = float(cfg.get("burst", base.burst))
+        except (TypeError, ValueError):
+            continue
+        limits[str(role)] = RateLimit(per_minute=per_minute, burst=max(1.0, burst))
+    return limits
+
+
+class TokenBucketLimiter:
+    def __init__(
+        self,
+        limits: Optional[dict[str, RateLimit]] = None,
+        persist_path: Optional[Path] = None,
+        flush_interval: float = FLUSH_INTERVAL_SECONDS,
+        auto_flush: bool = True,
+    ) -> None:
+        self.limits = limits if limits is not None else load_limits()
+        self.persist_path = persist_path
+        self.auto_flush = auto_flush
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # msisdn -> [fichas, ts de la última recarga, rol]
+        self._buckets: dict[str, list] = {}
+        # (msisdn, rol) -> descartes desde el último flush
+        self._throttled: dict[tuple[str, str], int] = {}
+        # msisdn -> fichas gastadas desde el último flush (para mezclar con el archivo)
+        self._spent: dict[str, int] = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._load()
+
+    def allow(self, msisdn: str, role: str, now: Optional[float] = None) -> bool:
+        """Consume una ficha de `msisdn`; False si el balde está vacío."""
+        limit = self._limit_for(role)
+        if limit.unlimited:
+            return True
+        now = time.time() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(msisdn)
+            if bucket is None:
+                bucket = self._buckets[msisdn] = [limit.burst, now, role]
+            tokens = min(limit.burst, bucket[0] + max(0.0, now - bucket[1]) * limit.per_minute / 60.0)
+            allowed = tokens >= 1.0
+            bucket[0] = tokens - 1.0 if allowed else tokens
+            bucket[1] = now
+            bucket[2] = role
+            self._dirty = True
+            if allowed:
+                self._spent[msisdn] = self._spent.get(msisdn, 0) + 1
+            else:
+                key = (msisdn, role)
+                first = key not in self._throttled
+                self._throttled[key] = self._throttled.get(key, 0) + 1
+        if not allowed and first:
+            print(f"[rate_limit] {msisdn} ({role}) sin fichas; descartando inbound", file=sys.stderr)
+        self._maybe_flush()
+        return allowed
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Persiste los baldes y registra los descartes acumulados."""
+        now = time.time() if now is None else now
+        with self._lock:
+            throttled, self._throttled = self._throttled, {}
+            # Un balde lleno es igual a no tener balde: no vale la pena guardarlo.
+            for msisdn, bucket in list(self._buckets.items()):
+                if self._is_full(bucket, now):
+                    del self._buckets[msisdn]
+                    self._dirty = True
+            snapshot = {msisdn: list(bucket) for msisdn, bucket in self._buckets.items()} if self._dirty else None
+            spent, self._spent = self._spent, {}
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        if snapshot is not None and self.persist_path is not None:
+            self._merge_and_write(snapshot, spent, now)
+        if throttled:
+            record_metric_events(
+                {
+                    "kind": "inbound_throttled",
+                    "msisdn": msisdn,
+                    "role": role,
+                    "dropped": count,
+                    "per_minute": self._limit_for(role).per_minute,
+                    "burst": self._limit_for(role).burst,
+                }
+                for (msisdn, role), count in throttled.items()
+            )
+
+    def flush_due(self) -> bool:
+        """True si pasó el intervalo de flush; reinicia la cuenta (un solo flush por intervalo)."""
+        with self._lock:
+            if (time.monotonic() - self._last_flush) < self._flush_interval:
+                return False
+            self._last_flush = time.monotonic()
+            return True
+
+    def _merge_and_write(self, snapshot: dict[str, list], spent: dict[str, int], now: float) -> None:
+        """Read-merge-write de `rate_limits.json` bajo el lock del archivo."""
+        with locked(self.persist_path):
+            on_disk = self._read_buckets()
+            merged: dict[str, list] = {}
+            for msisdn in on_disk.keys() | snapshot.keys():
+                ours = snapshot.get(msisdn)
+                if msisdn in on_disk:
+                    # Lo que dejaron todos, menos lo que gastamos acá desde entonces.
+                    role = ours[2] if ours is not None else on_disk[msisdn][2]
+                    tokens = self._refilled(on_disk[msisdn], now) - spent.get(msisdn, 0)
+                else:
+                    role = ours[2]
+                    tokens = self._refilled(ours, now)
+                bucket = [max(0.0, tokens), now, role]
+                if not self._is_full(bucket, now):
+                    merged[msisdn] = bucket
+            write_json(self.persist_path, {"buckets": merged}, indent=None)
+        with self._lock:
+            for msisdn, (tokens, ts, role) in merged.items():
+                # Lo gastado mientras tanto sigue contando.
+                self._buckets[msisdn] = [max(0.0, tokens - self._spent.get(msisdn, 0)), ts, role]
+
+    def _refilled(self, bucket: list, now: float) -> float:
+        limit = self._limit_for(bucket[2])
+        return min(limit.burst, bucket[0] + max(0.0, now - bucket[1]) * limit.per_minute / 60.0)
+
+    def _is_full(self, bucket: list, now: float) -> bool:
+        limit = self._limit_for(bucket[2])
+        return limit.unlimited or self._refilled(bucket, now) >= limit.burst
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _limit_for(self, role: str) -> RateLimit:
+        return self.limits.get(role) or self.limits.get("other") or DEFAULT_LIMITS["other"]
+
+    def _maybe_flush(self) -> None:
+        if self.auto_flush and self.flush_due():
+            self.flush()
+
+    def _load(self) -> None:
+        if self.persist_path is None:
+            return
+        self._buckets.update(self._read_buckets())
+
+    def _read_buckets(self) -> dict[str, list]:
+        raw = read_json(self.persist_path, dict)
+        buckets = raw.get("buckets") if isinstance(raw, dict) else None
+        out = {}
+        for msisdn, bucket in (buckets or {}).items():
+            try:
+                tokens, ts, role = float(bucket[0]), float(bucket[1]), str(bucket[2])
+            except (TypeError, ValueError, IndexError):
+                continue
+            out[str(msisdn)] = [tokens, ts, role]
+        return out
@@ -12,15 +12,14 @@ Uso recomendado:
 openclaw logs --follow | python3 -m clwabot.hooks.vip_urgency_watch
 """
 
-from collections import deque
 import re
 import shlex
 import subprocess
 import sys
-import time
 
 from clwabot.core.urgencia_handler import mensaje_contiene_urgencia
-from clwabot.core.urgencia_session import get_active_session
+from clwabot.core.urgencia_session import ActiveSessionView
+from clwabot.hooks.dedup import VIP_WATCH_DEDUP_PATH, DedupIndex, dedup_key
 from clwabot.hooks.whatsapp_router_watch import parse_inbound_line
 
 VIP_MSISDN = "+56975551112"
@@ -70,7 +69,10 @@ def should_dispatch(line: str, session_active: bool) -> str | None:
     msg = extract_vip_message(line)
     if not msg:
         return None
+    return _dispatch_message(line, msg, session_active)
 
+
+def _dispatch_message(line: str, msg: str, session_active: bool) -> str | None:
     # Puede venir truncado en logs: revisamos mensaje + línea completa.
     has_urgency = mensaje_contiene_urgencia(msg) or mensaje_contiene_urgencia(line)
     if not has_urgency and not session_active:
@@ -83,31 +85,37 @@ def main() -> int:
         "[vip_urgency_watch] escuchando stdin para VIP + trigger de urgencia/sesion activa",
         file=sys.stderr,
     )
-    recent = deque()
+    dedup = DedupIndex(window_seconds=DEDUP_WINDOW_SECONDS, persist_path=VIP_WATCH_DEDUP_PATH)
+    sessions = ActiveSessionView()
 
     for raw in sys.stdin:
         line = raw.strip()
         if not line:
             continue
 
-        session_active = get_active_session(VIP_MSISDN) is not None
-        msg = should_dispatch(line, session_active=session_active)
+        # El ruido del log se descarta antes de mirar sesiones: solo las
+        # líneas del VIP consultan la vista (y esta solo re-lee si cambió).
+        vip_msg = extract_vip_message(line)
+        if not vip_msg:
+            continue
+        session_active = sessions.is_active(VIP_MSISDN)
+        msg = _dispatch_message(line, vip_msg, session_active=session_active)
         if msg is None:
             continue
 
-        now = time.time()
-        while recent and (now - recent[0][1]) > DEDUP_WINDOW_SECONDS:
-            recent.popleft()
-        if any(sig == msg for sig, _ in recent):
+        if dedup.seen(dedup_key(VIP_MSISDN, msg)):
             continue
-        recent.append((msg, now))
 
         print(
             f"[vip_urgency_watch] detectado mensaje VIP (urgencia/sesion): {msg}",
             file=sys.stderr,
         )
         run_listener(VIP_MSISDN, msg)
+        # El listener va a tocar las sesiones: forzamos re-lectura en la
+        # próxima línea VIP aunque el mtime no alcance a cambiar.
+        sessions.invalidate()
 
+    dedup.flush()
     return 0
 
 
@@ -11,25 +11,36 @@ Uso manual de prueba:
 
 El script:
 - llama a clwabot.core.whatsapp_agent.handle_incoming
-- según la decisión, usa `openclaw message send` para:
+- según la decisión, envía por la conexión persistente al gateway
+  (`gateway_client`, fallback `openclaw message send`) para:
   - responder al VIP (catálogo, preguntas, cierre)
   - enviar alerta al owner (+56954764325)
+- cada envío de una decisión pasa por el outbox durable (`core.outbox`):
+  si falla queda pendiente y lo reintenta el drainer del router
 """
 
 import argparse
-import json
 import shlex
 import subprocess
 import sys
+import threading
 import time
+from bisect import insort
 from hashlib import sha1
 from pathlib import Path
+from typing import Callable, Optional
 
 OWNER_MSISDN = "+56954764325"
 VIP_MSISDN = "+56975551112"
 AUTO_RESPONSE_GRACE_SECONDS = 15
 OWNER_CONNECTED_IDLE_SECONDS = 20
+# Marcas recientes de actividad del owner: en batch los carriles corren en
+# paralelo y una línea posterior del owner puede llegar antes que un gate.
+OWNER_ACTIVITY_HISTORY = 64
 MAX_PENDING_EVENTS = 500
+# Un gate que quedó sin disparar (runtime detenido) se re-arma al arrancar solo
+# si el mensaje es más nuevo que esto; uno más viejo ya no se auto-responde.
+PENDING_GATE_MAX_AGE_SECONDS = 15 * 60
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 if str(BASE_DIR) not in sys.path:
@@ -40,12 +51,204 @@ OPENCLAW_MJS = "/home/stredesmers/.npm-global/lib/node_modules/openclaw/openclaw
 
 PRESENCE_PATH = BASE_DIR / "clwabot" / "data" / "owner_presence.json"
 PENDING_PATH = BASE_DIR / "clwabot" / "data" / "pending_inbox.json"
+PRESENCE_DEBOUNCE_SECONDS = 0.25
 
+# (msisdn, text, trigger_ts) -> None; re-dispara el gate de pendientes.
+GateScheduler = Callable[[str, str, int], None]
+
+
+from clwabot.core.decision import as_decision  # noqa: E402
+from clwabot.core.file_lock import locked  # noqa: E402
 from clwabot.core.meeting_session import get_active_meeting_session  # noqa: E402
+from clwabot.core.outbox import OUTBOX_PATH, Outbox, OutboxDrainer, outbox_key, send_item  # noqa: E402
+from clwabot.core.persist import read_json, write_json  # noqa: E402
 from clwabot.core.intent_router import classify_intent  # noqa: E402
+from clwabot.core.state_store import STORE_LOCK as _STORE_LOCK  # noqa: E402
+from clwabot.core.state_store import record_metric_events  # noqa: E402
 from clwabot.core.urgencia_session import get_active_session  # noqa: E402
 from clwabot.core.validator import validate_message  # noqa: E402
 from clwabot.core.whatsapp_agent import handle_incoming  # noqa: E402
+from clwabot.hooks.inbound_event import InboundEvent  # noqa: E402
+from clwabot.hooks import gateway_client  # noqa: E402
+from clwabot.hooks.dispatcher import MetricBuffer, gate_request_line  # noqa: E402
+from clwabot.hooks.fanout import DeliveryReport, ScheduleFn, SendFn, deliver  # noqa: E402
+from clwabot.hooks.gateway_client import (  # noqa: E402
+    GatewayClient,
+    GatewayError,
+    GatewayRequestError,
+    GatewayUnavailable,
+)
+from clwabot.hooks.media_cache import MediaCache  # noqa: E402
+from clwabot.hooks.outbound import OutboundSink  # noqa: E402
+from clwabot.hooks.rate_limit import RATE_LIMITS_PATH, TokenBucketLimiter  # noqa: E402
+
+# Con un sink activo (modo batch del router) ningún envío sale por openclaw.
+_OUTBOUND_SINK: Optional[OutboundSink] = None
+
+
+def set_outbound_sink(sink: Optional[OutboundSink]) -> None:
+    global _OUTBOUND_SINK
+    _OUTBOUND_SINK = sink
+
+
+# Métricas de entrega: dentro de un router van al `MetricBuffer` de su
+# dispatcher (un append al log por lote); un listener suelto las escribe directo.
+_METRIC_BUFFER: Optional[MetricBuffer] = None
+
+
+def set_metric_buffer(buffer: Optional[MetricBuffer]) -> None:
+    global _METRIC_BUFFER
+    _METRIC_BUFFER = buffer
+
+
+# Conexión única al gateway para todo el proceso (workers incluidos). Si no
+# hay gateway (`OPENCLAW_GATEWAY_URL=""` o caído) se envía con el CLI.
+_GATEWAY: Optional[GatewayClient] = None
+_GATEWAY_LOCK = threading.Lock()
+
+
+def set_gateway_client(client: Optional[GatewayClient]) -> None:
+    global _GATEWAY
+    with _GATEWAY_LOCK:
+        _GATEWAY = client
+
+
+def _gateway() -> Optional[GatewayClient]:
+    global _GATEWAY
+    with _GATEWAY_LOCK:
+        if _GATEWAY is None and gateway_client.GATEWAY_URL:
+            _GATEWAY = GatewayClient(gateway_client.GATEWAY_URL)
+        return _GATEWAY
+
+
+# Token bucket por msisdn. El router lo cobra al despachar (`allow_inbound`);
+# `process_inbound` solo lo revisa si lo llaman sin evento del router. Se crea
+# a demanda; con sink (batch) no se limita: el backfill reproduce ráfagas.
+_RATE_LIMITER: Optional[TokenBucketLimiter] = None
+_RATE_LIMITER_LOCK = threading.Lock()
+
+
+def set_rate_limiter(limiter: Optional[TokenBucketLimiter]) -> None:
+    global _RATE_LIMITER
+    with _RATE_LIMITER_LOCK:
+        _RATE_LIMITER = limiter
+
+
+def _rate_limiter() -> Optional[TokenBucketLimiter]:
+    global _RATE_LIMITER
+    if _OUTBOUND_SINK is not None:
+        return None
+    with _RATE_LIMITER_LOCK:
+        if _RATE_LIMITER is None:
+            _RATE_LIMITER = TokenBucketLimiter(persist_path=RATE_LIMITS_PATH)
+        return _RATE_LIMITER
+
+
+def allow_inbound(msisdn: str, role: str) -> bool:
+    """Cobra la ficha de `msisdn` al despachar; False si hay que descartarlo."""
+    limiter = _rate_limiter()
+    return limiter is None or limiter.allow(msisdn, role)
+
+
+def flush_rate_limiter() -> None:
+    """Persiste baldes y métricas de throttling pendientes (al salir)."""
+    with _RATE_LIMITER_LOCK:
+        limiter = _RATE_LIMITER
+    if limiter is not None:
+        limiter.flush()
+
+
+# Outbox durable. Se abre a demanda (salvo con sink); si además hay un drainer
+# en este proceso, los envíos diferidos quedan en el outbox en vez de un
+# `bash sleep`, y las alertas no críticas al owner pueden agruparse.
+_OUTBOX: Optional[Outbox] = None
+_OUTBOX_DRAINER: Optional[OutboxDrainer] = None
+_OUTBOX_LOCK = threading.Lock()
+# Ventana de coalescing de alertas al owner (0 = cada alerta sale sola).
+_OWNER_COALESCE_SECONDS = 0.0
+
+
+def set_outbox(
+    outbox: Optional[Outbox],
+    drainer: Optional[OutboxDrainer] = None,
+    owner_coalesce_sec: float = 0.0,
+) -> None:
+    global _OUTBOX, _OUTBOX_DRAINER, _OWNER_COALESCE_SECONDS
+    with _OUTBOX_LOCK:
+        _OUTBOX = outbox
+        _OUTBOX_DRAINER = drainer
+        _OWNER_COALESCE_SECONDS = max(0.0, float(owner_coalesce_sec)) if drainer is not None else 0.0
+
+
+def _outbox() -> Optional[Outbox]:
+    global _OUTBOX
+    if _OUTBOUND_SINK is not None:
+        return None
+    with _OUTBOX_LOCK:
+        if _OUTBOX is None:
+            try:
+                _OUTBOX = Outbox(OUTBOX_PATH)
+            except Exception as exc:
+                print(f"[whatsapp_listener] outbox no disponible: {exc}", file=sys.stderr)
+                return None
+        return _OUTBOX
+
+
+# Adjuntos (.ics) subidos al gateway: se reusa el handle entre destinatarios
+# y reintentos.
+_MEDIA_CACHE = MediaCache()
+
+
+def _send_via_gateway(
+    target: str,
+    message: str,
+    media_path: str = "",
+    idempotency_key: str = "",
+) -> Optional[bool]:
+    """True entregado; False si falló con el frame ya escrito; None si no salió nada.
+
+    Solo con None se puede probar otro transporte: sin conexión o con un rechazo
+    pasajero del gateway (`retryable`) el mensaje no salió. Un rechazo
+    definitivo es False. Tras escribir, un ack lento o perdido no dice si el
+    mensaje salió, y el CLI lo duplicaría: ese envío queda como fallido y lo
+    reintenta quien llamó (el outbox, con la misma `idempotency_key`, que el
+    gateway usa para no duplicarlo).
+    """
+    client = _gateway()
+    if client is None:
+        return None
+    try:
+        media_id = _MEDIA_CACHE.handle_for(media_path, client.upload_media) if media_path else ""
+    except GatewayError as exc:
+        # Subir el adjunto no envía nada: el CLI manda el archivo directo.
+        print(f"[whatsapp_listener] gateway (adjunto): {exc}; usando CLI", file=sys.stderr)
+        return None
+    try:
+        if not media_id:
+            client.send_message(target, message, media_path=media_path, idempotency_key=idempotency_key)
+            return True
+        try:
+            client.send_message(target, message, media_id=media_id, idempotency_key=idempotency_key)
+        except GatewayRequestError as exc:
+            if exc.retryable:
+                raise
+            # Handle vencido en el gateway: se descarta y va el archivo.
+            _MEDIA_CACHE.invalidate(media_id)
+            client.send_message(target, message, media_path=media_path, idempotency_key=idempotency_key)
+        return True
+    except GatewayUnavailable as exc:
+        print(f"[whatsapp_listener] gateway: {exc}; usando CLI", file=sys.stderr)
+        return None
+    except GatewayRequestError as exc:
+        if exc.retryable:
+            # Rechazo pasajero: el gateway no lo envió, se puede probar otro transporte.
+            print(f"[whatsapp_listener] gateway: {exc}; rechazo pasajero, usando CLI", file=sys.stderr)
+            return None
+        print(f"[whatsapp_listener] gateway: {exc}; envío rechazado", file=sys.stderr)
+        return False
+    except GatewayError as exc:
+        print(f"[whatsapp_listener] gateway: {exc}; envío sin confirmar", file=sys.stderr)
+        return False
 
 
 def run_cmd(cmd: list[str]) -> int:
@@ -62,31 +265,35 @@ def openclaw_cmd(*args: str) -> list[str]:
     return [NODE_BIN, OPENCLAW_MJS, *args]
 
 
-def send_whatsapp_text(target: str, message: str) -> None:
-    """Envía un texto simple por WhatsApp usando openclaw CLI."""
+def deliver_message(target: str, message: str, ics_path: str = "", idempotency_key: str = "") -> tuple[str, bool]:
+    """Envía por el mejor transporte disponible; devuelve (transporte, ok).
+
+    `idempotency_key` identifica el envío ante el gateway (ver `_send_via_gateway`).
+    """
+    if _OUTBOUND_SINK is not None:
+        _OUTBOUND_SINK.send(target, message, path=ics_path)
+        return ("sink", True)
+    sent = _send_via_gateway(target, message, media_path=ics_path, idempotency_key=idempotency_key)
+    if sent is not None:
+        return ("gateway", sent)
+    args = ["message", "send", "--channel", "whatsapp", "--target", target, "--message", message]
+    if ics_path:
+        args += ["--path", ics_path]
+    return ("cli", run_cmd(openclaw_cmd(*args)) == 0)
+
+
+def send_whatsapp_text(target: str, message: str) -> bool:
+    """Envía un texto simple por WhatsApp (gateway o, si no, openclaw CLI)."""
     if not message.strip():
-        return
-    cmd = openclaw_cmd("message", "send", "--channel", "whatsapp", "--target", target, "--message", message)
-    run_cmd(cmd)
+        return False
+    return deliver_message(target, message)[1]
 
 
-def send_whatsapp_with_ics(target: str, message: str, ics_path: str) -> None:
+def send_whatsapp_with_ics(target: str, message: str, ics_path: str) -> bool:
     """Envía texto + archivo .ics como documento por WhatsApp."""
     if not message.strip():
         message = "Evento de calendario"
-    cmd = openclaw_cmd(
-        "message",
-        "send",
-        "--channel",
-        "whatsapp",
-        "--target",
-        target,
-        "--message",
-        message,
-        "--path",
-        ics_path,
-    )
-    run_cmd(cmd)
+    return deliver_message(target, message, ics_path)[1]
 
 
 def schedule_delayed_whatsapp_text(target: str, message: str, delay_sec: int) -> None:
@@ -94,6 +301,9 @@ def schedule_delayed_whatsapp_text(target: str, message: str, delay_sec: int) ->
     if not message.strip():
         return
     delay = max(1, min(int(delay_sec), 900))
+    if _OUTBOUND_SINK is not None:
+        _OUTBOUND_SINK.send(target, message, delay_sec=delay)
+        return
     cmd = " ".join(
         shlex.quote(part)
         for part in openclaw_cmd("message", "send", "--channel", "whatsapp", "--target", target, "--message", message)
@@ -102,49 +312,137 @@ def schedule_delayed_whatsapp_text(target: str, message: str, delay_sec: int) ->
     subprocess.Popen(["bash", "-lc", shell_cmd])
 
 
+def _decision_origin(msisdn: str, text: str, trigger_ts: int, event: Optional[InboundEvent]) -> str:
+    """Identidad del inbound que originó la decisión (base de las claves del outbox)."""
+    if event is not None and event.message_id:
+        return f"id:{event.message_id}"
+    if not trigger_ts and event is not None and event.received_ts:
+        trigger_ts = int(event.received_ts)
+    return _pending_id(msisdn, text, trigger_ts or int(time.time()))
+
+
+def _target_role(target: str) -> str:
+    if target == OWNER_MSISDN:
+        return "owner"
+    return "vip" if target == VIP_MSISDN else "contact"
+
+
+def _durable_send(outbox: Outbox, origin: str, msisdn: str, policy: str, severity: str) -> SendFn:
+    """Envío inline con registro previo en el outbox (idempotente por clave).
+
+    La clave del outbox viaja hasta el gateway como `idempotency_key`: si el
+    ack se pierde, el reintento del drainer no duplica el mensaje.
+    """
+
+    def send(target: str, message: str, ics_path: str = "") -> tuple[str, bool]:
+        key = outbox_key(origin, target, message, ics_path)
+        role = _target_role(target)
+        priority = 0 if role == "owner" and severity == "critical" else 1
+        # Alertas no críticas al owner: a lo más una por ventana, el resto se
+        # agrupa en un resumen que despacha el drainer.
+        batch_key = ""
+        if role == "owner" and severity != "critical" and not ics_path and _OWNER_COALESCE_SECONDS > 0:
+            batch_key = f"owner:{target}"
+            due = outbox.coalesce_due(batch_key, _OWNER_COALESCE_SECONDS)
+            if due is not None:
+                outbox.enqueue(
+                    key,
+                    target,
+                    message,
+                    role=role,
+                    msisdn=msisdn,
+                    policy=policy,
+                    delay_sec=max(0.0, due - time.time()),
+                    batch_key=batch_key,
+                )
+                return ("coalesced", True)
+        outbox.enqueue(
+            key,
+            target,
+            message,
+            ics_path=ics_path,
+            role=role,
+            msisdn=msisdn,
+            policy=policy,
+            priority=priority,
+            batch_key=batch_key,
+        )
+        if not outbox.claim(key):
+            # Ya entregado por una corrida anterior, o en manos del drainer.
+            item = outbox.get(key)
+            delivered = item is not None and item.status == "delivered"
+            return ("duplicate" if delivered else "outbox", delivered)
+        item = outbox.get(key)
+        transport, ok, _ = send_item(outbox, item, deliver_message)
+        return (transport, ok)
+
+    return send
+
+
+def _durable_schedule(outbox: Outbox, origin: str, msisdn: str, policy: str) -> ScheduleFn:
+    """Diferidos al outbox si este proceso tiene drainer; si no, `bash sleep`."""
+
+    def schedule(target: str, message: str, delay_sec: int) -> None:
+        if _OUTBOX_DRAINER is None or not message.strip():
+            schedule_delayed_whatsapp_text(target, message, delay_sec)
+            return
+        delay = max(1, min(int(delay_sec), 900))
+        key = outbox_key(origin, target, message, delay_sec=delay)
+        role = _target_role(target)
+        outbox.enqueue(key, target, message, role=role, msisdn=msisdn, policy=policy, delay_sec=delay)
+
+    return schedule
+
+
 def _load_presence() -> dict:
-    if not PRESENCE_PATH.exists():
-        return {"last_owner_activity_ts": 0}
-    try:
-        return json.loads(PRESENCE_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return {"last_owner_activity_ts": 0}
+    return read_json(PRESENCE_PATH, lambda: {"last_owner_activity_ts": 0})
 
 
 def _save_presence(state: dict) -> None:
-    PRESENCE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    PRESENCE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Cada línea del owner marca actividad: las ráfagas salen en un solo flush.
+    write_json(PRESENCE_PATH, state, debounce=PRESENCE_DEBOUNCE_SECONDS)
 
 
-def mark_owner_activity() -> None:
-    state = _load_presence()
-    state["last_owner_activity_ts"] = int(time.time())
-    _save_presence(state)
+def mark_owner_activity(ts: Optional[float] = None) -> None:
+    """Marca actividad del owner a la hora `ts` del log (por defecto, ahora)."""
+    stamp = int(time.time() if ts is None else min(ts, time.time()))
+    with _STORE_LOCK:
+        state = _load_presence()
+        recent = [int(t) for t in state.get("recent_activity_ts") or []]
+        insort(recent, stamp)
+        state["recent_activity_ts"] = recent[-OWNER_ACTIVITY_HISTORY:]
+        state["last_owner_activity_ts"] = max(int(state.get("last_owner_activity_ts") or 0), stamp)
+        _save_presence(state)
 
 
-def owner_is_connected() -> bool:
-    state = _load_presence()
-    last = int(state.get("last_owner_activity_ts") or 0)
-    if last <= 0:
-        return False
-    return (int(time.time()) - last) <= OWNER_CONNECTED_IDLE_SECONDS
+def owner_is_connected(now_ts: Optional[float] = None) -> bool:
+    now = int(time.time() if now_ts is None else now_ts)
+    return _owner_active_between(now - OWNER_CONNECTED_IDLE_SECONDS, now)
 
 
-def owner_activity_since(trigger_ts: int) -> bool:
+def owner_activity_since(trigger_ts: int, until_ts: Optional[float] = None) -> bool:
     if trigger_ts <= 0:
         return False
+    return _owner_active_between(trigger_ts, int(time.time() if until_ts is None else until_ts))
+
+
+def _owner_active_between(start_ts: int, end_ts: int) -> bool:
     state = _load_presence()
-    last = int(state.get("last_owner_activity_ts") or 0)
-    return last >= trigger_ts
+    # Un archivo anterior al historial solo trae la última marca.
+    stamps = [int(t) for t in state.get("recent_activity_ts") or []]
+    stamps.append(int(state.get("last_owner_activity_ts") or 0))
+    return any(start_ts <= stamp <= end_ts for stamp in stamps if stamp > 0)
+
+
+def _gate_clock(trigger_ts: int) -> int:
+    """Hora a la que se juzga el gate: en batch (sink) es la del log, no la del reloj."""
+    if _OUTBOUND_SINK is not None:
+        return trigger_ts + AUTO_RESPONSE_GRACE_SECONDS
+    return int(time.time())
 
 
 def _load_pending() -> dict:
-    if not PENDING_PATH.exists():
-        return {"events": []}
-    try:
-        return json.loads(PENDING_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        return {"events": []}
+    return read_json(PENDING_PATH, lambda: {"events": []})
 
 
 def _save_pending(state: dict) -> None:
@@ -152,7 +450,7 @@ def _save_pending(state: dict) -> None:
     events = state.get("events", [])
     if len(events) > MAX_PENDING_EVENTS:
         state["events"] = events[-MAX_PENDING_EVENTS:]
-    PENDING_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(PENDING_PATH, state, versioned=True)
 
 
 def _pending_id(msisdn: str, text: str, trigger_ts: int) -> str:
@@ -161,46 +459,64 @@ def _pending_id(msisdn: str, text: str, trigger_ts: int) -> str:
 
 
 def add_pending_event(msisdn: str, text: str, trigger_ts: int) -> None:
-    state = _load_pending()
-    event_id = _pending_id(msisdn, text, trigger_ts)
-    events = state.setdefault("events", [])
-    for item in events:
-        if item.get("id") == event_id:
-            return
-    events.append(
-        {
-            "id": event_id,
-            "msisdn": msisdn,
-            "text": text,
-            "trigger_ts": int(trigger_ts),
-            "status": "waiting_owner_check",
-            "updated_ts": int(time.time()),
-        }
-    )
-    _save_pending(state)
-
-
-def resolve_pending_event(msisdn: str, text: str, trigger_ts: int, status: str) -> None:
-    state = _load_pending()
-    event_id = _pending_id(msisdn, text, trigger_ts)
-    events = state.setdefault("events", [])
-    for item in events:
-        if item.get("id") == event_id:
-            item["status"] = status
-            item["updated_ts"] = int(time.time())
-            break
-    else:
+    # Lock del archivo: otros hilos y procesos del listener leen y escriben el mismo inbox.
+    with locked(PENDING_PATH):
+        state = _load_pending()
+        event_id = _pending_id(msisdn, text, trigger_ts)
+        events = state.setdefault("events", [])
+        for item in events:
+            if item.get("id") == event_id:
+                return
         events.append(
             {
                 "id": event_id,
                 "msisdn": msisdn,
                 "text": text,
                 "trigger_ts": int(trigger_ts),
-                "status": status,
+                "status": "waiting_owner_check",
                 "updated_ts": int(time.time()),
             }
         )
-    _save_pending(state)
+        _save_pending(state)
+
+
+def resolve_pending_event(msisdn: str, text: str, trigger_ts: int, status: str) -> None:
+    with locked(PENDING_PATH):
+        state = _load_pending()
+        event_id = _pending_id(msisdn, text, trigger_ts)
+        events = state.setdefault("events", [])
+        for item in events:
+            if item.get("id") == event_id:
+                item["status"] = status
+                item["updated_ts"] = int(time.time())
+                break
+        else:
+            events.append(
+                {
+                    "id": event_id,
+                    "msisdn": msisdn,
+                    "text": text,
+                    "trigger_ts": int(trigger_ts),
+                    "status": status,
+                    "updated_ts": int(time.time()),
+                }
+            )
+        _save_pending(state)
+
+
+def waiting_pending_events(now_ts: Optional[float] = None) -> list[tuple[str, str, int]]:
+    """(msisdn, text, trigger_ts) de los pendientes cuyo gate no alcanzó a correr.
+
+    Solo los de hace menos de `PENDING_GATE_MAX_AGE_SECONDS`; no escribe nada.
+    """
+    now_ts = time.time() if now_ts is None else now_ts
+    out = []
+    for item in _load_pending().get("events", []):
+        trigger_ts = int(item.get("trigger_ts") or 0)
+        if item.get("status") != "waiting_owner_check" or now_ts - trigger_ts > PENDING_GATE_MAX_AGE_SECONDS:
+            continue
+        out.append((str(item.get("msisdn") or ""), str(item.get("text") or ""), trigger_ts))
+    return out
 
 
 def should_handle_as_pending(msisdn: str, text: str, role: str, is_urgency: bool) -> bool:
@@ -218,7 +534,11 @@ def should_handle_as_pending(msisdn: str, text: str, role: str, is_urgency: bool
 
 
 def schedule_pending_gate(msisdn: str, text: str, trigger_ts: int) -> None:
-    """Re-ejecuta listener luego de grace period para decidir si auto-responder."""
+    """Re-ejecuta listener luego de grace period para decidir si auto-responder.
+
+    Solo para corridas manuales: fuera de cualquier carril, así que no queda
+    ordenado respecto de otros mensajes del mismo contacto.
+    """
     cmd = (
         "python3 -m clwabot.hooks.whatsapp_listener "
         f"--msisdn {shlex.quote(msisdn)} "
@@ -230,22 +550,45 @@ def schedule_pending_gate(msisdn: str, text: str, trigger_ts: int) -> None:
     subprocess.Popen(["bash", "-lc", shell_cmd])
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--msisdn", required=True)
-    parser.add_argument("--text", required=True)
-    parser.add_argument("--deferred-auto", action="store_true")
-    parser.add_argument("--trigger-ts", type=int, default=0)
-    args = parser.parse_args()
-
-    msisdn = args.msisdn
-    text = args.text
-    is_deferred_auto = bool(args.deferred_auto)
-    trigger_ts = int(args.trigger_ts or 0)
+def emit_gate_request(msisdn: str, text: str, trigger_ts: int) -> None:
+    """Pide el gate al router que lanzó este proceso (`--emit-gate`)."""
+    print(gate_request_line(msisdn, text, trigger_ts), flush=True)
+
+
+def process_inbound(
+    msisdn: str,
+    text: str,
+    deferred_auto: bool = False,
+    trigger_ts: int = 0,
+    gate_scheduler: Optional[GateScheduler] = None,
+    event: Optional[InboundEvent] = None,
+    rate_limit: bool = True,
+) -> int:
+    """Procesa un inbound completo: gate de pendientes, decisión y envíos.
+
+    Es la misma lógica que `main()`, pero invocable en proceso (por ejemplo
+    desde los workers del router). `gate_scheduler` permite reemplazar el
+    re-disparo diferido vía `bash sleep` por un scheduler propio. `event` es
+    el registro del router: si trae hora de recepción, el grace period de
+    pendientes se cuenta desde ahí y no desde que el worker lo tomó.
+
+    Un inbound que llega con `event` ya pagó su ficha en el router
+    (`allow_inbound`). Sin evento, y salvo `rate_limit=False` (hijo de
+    `--subprocess`, que también viene del router), antes de todo pasa por el
+    rate limiting: sin ficha se descarta y queda como `inbound_throttled`.
+    """
+    is_deferred_auto = bool(deferred_auto)
+    trigger_ts = int(trigger_ts or 0)
+    schedule_gate = gate_scheduler or schedule_pending_gate
 
     validation = validate_message(msisdn, text)
+    # El re-disparo diferido ya pagó su ficha en la primera pasada.
+    charged = is_deferred_auto or event is not None or not rate_limit
+    limiter = None if charged else _rate_limiter()
+    if limiter is not None and not limiter.allow(msisdn, validation.role):
+        return 0
     if validation.role == "owner":
-        mark_owner_activity()
+        mark_owner_activity(event.received_ts if event is not None and event.received_ts else None)
 
     # Mensajes de terceros se tratan como "pendientes": solo se responde
     # si pasan por keywords/tipo y no hubo actividad reciente del owner.
@@ -258,72 +601,52 @@ def main() -> int:
     if validation.role != "owner" and pending_candidate:
         if not is_deferred_auto:
             now_ts = int(time.time())
+            if event is not None and event.received_ts:
+                now_ts = min(now_ts, int(event.received_ts))
             add_pending_event(msisdn=msisdn, text=text, trigger_ts=now_ts)
-            schedule_pending_gate(msisdn=msisdn, text=text, trigger_ts=now_ts)
+            schedule_gate(msisdn, text, now_ts)
             return 0
-        if owner_activity_since(trigger_ts) or owner_is_connected():
+        gate_ts = _gate_clock(trigger_ts)
+        if owner_activity_since(trigger_ts, until_ts=gate_ts) or owner_is_connected(now_ts=gate_ts):
             resolve_pending_event(msisdn=msisdn, text=text, trigger_ts=trigger_ts, status="seen_by_owner")
             return 0
         resolve_pending_event(msisdn=msisdn, text=text, trigger_ts=trigger_ts, status="processing")
     elif validation.role != "owner":
         return 0
 
-    decision = handle_incoming(msisdn, text)
-
-    policy = decision.get("policy")
-    target_msisdn = decision.get("target_msisdn", "") or ""
-    vip_msg = decision.get("message", "") or ""
-    owner_msg = decision.get("owner_message", "") or ""
-    vip_ics_path = decision.get("vip_ics_path", "") or ""
-    owner_ics_path = decision.get("owner_ics_path", "") or ""
-    owner_retry_msg = decision.get("owner_retry_message", "") or ""
-    owner_retry_delay_raw = decision.get("owner_retry_delay_sec", "0") or "0"
-    followup_msg = decision.get("followup_message", "") or ""
-    followup_delay_raw = decision.get("followup_delay_sec", "0") or "0"
-    try:
-        owner_retry_delay = int(owner_retry_delay_raw)
-    except ValueError:
-        owner_retry_delay = 0
-    try:
-        followup_delay = int(followup_delay_raw)
-    except ValueError:
-        followup_delay = 0
+    decision = as_decision(handle_incoming(msisdn, text), OWNER_MSISDN, VIP_MSISDN)
+
+    policy = decision.policy
 
     # 1) Mensajes del owner: los maneja el agente normal
     if policy == "owner":
         return 0
 
-    # 2) Flujo VIP (catálogo/preguntas/cierre) + posible .ics
-    if policy == "reply_to_vip":
-        reply_target = target_msisdn or VIP_MSISDN
-        if vip_msg:
-            if vip_ics_path:
-                send_whatsapp_with_ics(reply_target, vip_msg, vip_ics_path)
-            else:
-                send_whatsapp_text(reply_target, vip_msg)
-
-        if owner_msg:
-            if owner_ics_path and not vip_ics_path:
-                send_whatsapp_with_ics(OWNER_MSISDN, owner_msg, owner_ics_path)
-            else:
-                send_whatsapp_text(OWNER_MSISDN, owner_msg)
-        if owner_retry_msg and owner_retry_delay > 0:
-            schedule_delayed_whatsapp_text(OWNER_MSISDN, owner_retry_msg, owner_retry_delay)
-        if followup_msg and followup_delay > 0:
-            schedule_delayed_whatsapp_text(reply_target, followup_msg, followup_delay)
-        if validation.role != "owner" and trigger_ts > 0:
-            resolve_pending_event(msisdn=msisdn, text=text, trigger_ts=trigger_ts, status="auto_replied")
-        return 0
-
-    # 3) Solo alerta al owner
-    if policy == "alert_owner":
-        if owner_msg:
-            if owner_ics_path:
-                send_whatsapp_with_ics(OWNER_MSISDN, owner_msg, owner_ics_path)
-            else:
-                send_whatsapp_text(OWNER_MSISDN, owner_msg)
+    # 2) Flujo VIP/contacto (catálogo/preguntas/cierre, posible .ics) y
+    # 3) alerta al owner: todos los envíos de la decisión salen en paralelo.
+    if policy in {"reply_to_vip", "alert_owner"}:
+        plan = decision.actions
+        if plan:
+            severity = decision.severity
+            send: SendFn = deliver_message
+            schedule: ScheduleFn = schedule_delayed_whatsapp_text
+            outbox = _outbox()
+            if outbox is not None:
+                origin = _decision_origin(msisdn, text, trigger_ts, event)
+                send = _durable_send(outbox, origin, msisdn, policy, severity)
+                schedule = _durable_schedule(outbox, origin, msisdn, policy)
+            report = deliver(
+                plan,
+                send=send,
+                schedule=schedule,
+                msisdn=msisdn,
+                policy=policy,
+                severity=severity,
+            )
+            _record_delivery(report)
         if validation.role != "owner" and trigger_ts > 0:
-            resolve_pending_event(msisdn=msisdn, text=text, trigger_ts=trigger_ts, status="alerted_owner")
+            status = "auto_replied" if policy == "reply_to_vip" else "alerted_owner"
+            resolve_pending_event(msisdn=msisdn, text=text, trigger_ts=trigger_ts, status=status)
         return 0
 
     # 4) Silencio
@@ -332,5 +655,37 @@ def main() -> int:
     return 0
 
 
+def _record_delivery(report: DeliveryReport) -> None:
+    print(f"[whatsapp_listener] delivery {report.msisdn}: {report.summary()}", file=sys.stderr)
+    buffer = _METRIC_BUFFER
+    if buffer is not None:
+        buffer.record(report.to_metric())
+    else:
+        record_metric_events([report.to_metric()])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--msisdn", required=True)
+    parser.add_argument("--text", required=True)
+    parser.add_argument("--deferred-auto", action="store_true")
+    parser.add_argument("--trigger-ts", type=int, default=0)
+    parser.add_argument("--emit-gate", action="store_true", help="pedir el gate al router por stdout")
+    parser.add_argument("--no-rate-limit", action="store_true", help="la ficha ya la cobró el router")
+    args = parser.parse_args()
+
+    try:
+        return process_inbound(
+            msisdn=args.msisdn,
+            text=args.text,
+            deferred_auto=bool(args.deferred_auto),
+            trigger_ts=int(args.trigger_ts or 0),
+            gate_scheduler=emit_gate_request if args.emit_gate else None,
+            rate_limit=not args.no_rate_limit,
+        )
+    finally:
+        flush_rate_limiter()
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
@@ -3,77 +3,166 @@
 
 Uso recomendado:
   openclaw logs --follow | python3 -m clwabot.hooks.whatsapp_router_watch
+
+Por defecto el listener corre en proceso, sobre un pool acotado de workers
+(`--workers N`). `--subprocess` vuelve al modo legacy: un `python3` por mensaje.
+Con más de `--max-backlog` mensajes en espera se descarta por prioridad
+(owner/VIP nunca) y cada descarte queda como métrica `inbound_shed`.
+
+Modo tail nativo (sin `openclaw logs` ni loop bash de reinicio):
+  python3 -m clwabot.hooks.whatsapp_router_watch --log-file '/tmp/openclaw/openclaw-*.log'
+El offset procesado se guarda en `--checkpoint` y se retoma al reiniciar.
+
+Dedup: mismo (msisdn, texto) dentro de `--dedup-window` segundos se ignora.
+El índice se persiste en `--dedup-file` ('' = solo memoria), así un reinicio
+del stream no re-despacha lo recién visto.
+
+Backfill / benchmark sobre un log histórico (sin envíos reales: van al sink):
+  python3 -m clwabot.hooks.whatsapp_router_watch --batch openclaw.log --sink /tmp/outbox.jsonl
+El estado que escribe la decisión (presencia, pendientes, sesiones, métricas)
+va a `--data-dir` (por defecto una copia temporal de `data/`): el estado vivo
+no se toca, y la presencia del owner se juzga con la hora del log.
+
+Cada inbound despachado queda en el journal diario (`--journal-dir`, '' lo
+desactiva); ver `python3 -m clwabot.core.inbound_journal replay --help`.
+
+Los envíos fallidos y los diferidos quedan en el outbox (`--outbox`, '' lo
+desactiva) y un hilo del router los reintenta con backoff. Con
+`--coalesce-owner N` las alertas no críticas al owner salen a lo más una cada
+N segundos; las que llegan entre medio se agrupan en un resumen.
 """
 
 from __future__ import annotations
 
+import argparse
 import json
 import re
-import shlex
-import subprocess
+import signal
 import sys
 import time
-from collections import deque
-from dataclasses import dataclass
-from typing import Optional
-
-from clwabot.core.validator import VIP_MSISDN
+from contextlib import contextmanager
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from clwabot.core.inbound_journal import JOURNAL_DIR, InboundJournal, sandboxed_data
+from clwabot.core.outbox import OUTBOX_PATH, Outbox, OutboxDrainer
+from clwabot.core.validator import VIP_MSISDN, validate_message
+from clwabot.hooks.dedup import ROUTER_DEDUP_PATH, DedupIndex
+from clwabot.hooks.dispatcher import (
+    DEFAULT_MAX_BACKLOG,
+    DEFAULT_WORKERS,
+    InProcessDispatcher,
+    SubprocessDispatcher,
+)
+from clwabot.hooks.inbound_event import InboundEvent
+from clwabot.hooks.log_tailer import CHECKPOINT_PATH, LogTailer
+from clwabot.hooks.outbound import OutboundSink
 
-INBOUND_TAG = "[whatsapp]"
-FROM_RE = re.compile(r"from\s+(\+?\d{8,15})", re.IGNORECASE)
-ANY_PHONE_RE = re.compile(r"(\+?\d{8,15})")
-QUOTED_RE = re.compile(r'"([^"]+)"')
 DEDUP_WINDOW_SECONDS = 4
+BATCH_SINK_PATH = CHECKPOINT_PATH.with_name("batch_outbound.jsonl")
+# En batch el productor espera si hay más de esto en cola (sin descartes).
+BATCH_MAX_QUEUED = 1000
+
+# Pre-filtro a nivel de bytes: casi ninguna línea de `openclaw logs --follow`
+# es un inbound, así que las descartamos antes de decodificar/parsear. Sin
+# distinguir mayúsculas (inbound, Inbound, InBound...), igual que el parser;
+# `lower()` + `in` sale más barato que una regex con IGNORECASE.
+INBOUND_MARKER = b"inbound"
+
+# Parser legacy en una sola pasada: tag, inbound, remitente, primer teléfono
+# y textos entre comillas salen del mismo recorrido.
+LEGACY_TOKEN_RE = re.compile(
+    r'(?P<tag>\[whatsapp\])'
+    r"|(?P<inbound>inbound)"
+    r"|from\s+(?P<from>\+?\d{8,15})"
+    r"|(?P<phone>\+?\d{8,15})"
+    r'|"(?P<quoted>[^"]+)"',
+    re.IGNORECASE,
+)
+
+MEDIA_KEYS = ("hasMedia", "mediaType", "mediaPath", "mediaUrl")
 
+# Nombre histórico: el parser ahora produce el registro tipado completo.
+InboundMessage = InboundEvent
 
-@dataclass
-class InboundMessage:
-    msisdn: str
-    text: str
+
+def is_inbound_candidate(raw: bytes) -> bool:
+    return INBOUND_MARKER in raw.lower()
+
+
+def parse_inbound_bytes(raw: bytes) -> Optional[InboundMessage]:
+    """Parsea una línea cruda del stream; rechaza ruido sin decodificar."""
+    if not is_inbound_candidate(raw):
+        return None
+    line = raw.decode("utf-8", errors="replace").strip()
+    if not line:
+        return None
+    return _parse_candidate(line)
 
 
 def parse_inbound_line(line: str) -> Optional[InboundMessage]:
+    if "inbound" not in line.lower():
+        return None
+    return _parse_candidate(line)
+
+
+def _parse_candidate(line: str) -> Optional[InboundMessage]:
     # Newer OpenClaw logs can be JSON objects with structured payload.
-    structured = _parse_structured_json_line(line)
-    if structured is not None:
-        return structured
+    if line.startswith("{"):
+        structured = _parse_structured_json_line(line)
+        if structured is not None:
+            return structured
 
     # Fallback for legacy plain-text log lines.
-    lower = line.lower()
-    if INBOUND_TAG not in lower or "inbound" not in lower:
+    return _parse_legacy_line(line)
+
+
+def _parse_legacy_line(line: str) -> Optional[InboundMessage]:
+    has_tag = has_inbound = False
+    from_msisdn = first_phone = last_quoted = None
+    for m in LEGACY_TOKEN_RE.finditer(line):
+        kind = m.lastgroup
+        if kind == "tag":
+            has_tag = True
+        elif kind == "inbound":
+            has_inbound = True
+        elif kind == "from":
+            if from_msisdn is None:
+                from_msisdn = m.group("from")
+        elif kind == "phone":
+            if first_phone is None:
+                first_phone = m.group("phone")
+        else:
+            last_quoted = m.group("quoted")
+
+    if not has_tag or not has_inbound:
         return None
 
-    m_from = FROM_RE.search(line)
-    if m_from:
-        msisdn = m_from.group(1)
-    else:
-        m_phone = ANY_PHONE_RE.search(line)
-        if not m_phone:
-            return None
-        msisdn = m_phone.group(1)
-
-    quoted = QUOTED_RE.findall(line)
-    if quoted:
-        text = quoted[-1].strip()
+    msisdn = from_msisdn or first_phone
+    if not msisdn:
+        return None
+
+    if last_quoted is not None:
+        text = last_quoted.strip()
+    elif ":" in line:
+        text = line.split(":", 1)[1].strip()
     else:
-        if ":" in line:
-            text = line.split(":", 1)[1].strip()
-        else:
-            text = line.strip()
+        text = line.strip()
 
     if not text:
         return None
 
-    return InboundMessage(msisdn=msisdn, text=text)
+    return InboundEvent(msisdn=msisdn, text=text)
 
 
 def _parse_structured_json_line(line: str) -> Optional[InboundMessage]:
-    if not line.startswith("{"):
-        return None
     try:
         payload = json.loads(line)
     except Exception:
         return None
+    if not isinstance(payload, dict):
+        return None
 
     level2 = str(payload.get("2", "")).lower()
     data = payload.get("1")
@@ -98,21 +187,25 @@ def _parse_structured_json_line(line: str) -> Optional[InboundMessage]:
     if not body:
         return None
 
-    return InboundMessage(msisdn=msisdn, text=body)
+    return InboundEvent(
+        msisdn=msisdn,
+        text=body,
+        message_id=str(data.get("id") or ""),
+        received_ts=_epoch_seconds(data.get("timestamp")),
+        chat_type=str(data.get("chatType") or ""),
+        has_media=any(data.get(key) for key in MEDIA_KEYS),
+    )
 
 
-def run_listener(msisdn: str, text: str) -> None:
-    cmd = [
-        "python3",
-        "-m",
-        "clwabot.hooks.whatsapp_listener",
-        "--msisdn",
-        msisdn,
-        "--text",
-        text,
-    ]
-    print(f"[whatsapp_router_watch] dispatch: {shlex.join(cmd)}", file=sys.stderr)
-    subprocess.Popen(cmd)
+def _epoch_seconds(value) -> float:
+    """Timestamp del gateway (ms o s) a epoch en segundos; 0 si no viene."""
+    try:
+        ts = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if ts <= 0:
+        return 0.0
+    return ts / 1000.0 if ts > 1e11 else ts
 
 
 def _normalize_msisdn(value: str) -> str:
@@ -124,38 +217,348 @@ def _is_plain_metadata_only(text: str) -> bool:
     return "[whatsapp]" in lowered and "inbound message" in lowered and "chars" in lowered
 
 
-def main() -> int:
-    print("[whatsapp_router_watch] listening stdin for WhatsApp inbound...", file=sys.stderr)
-    recent = deque()
-
-    for raw in sys.stdin:
-        line = raw.strip()
-        if not line:
-            continue
-
-        inbound = parse_inbound_line(line)
-        if inbound is None:
-            continue
-
-        now = time.time()
-        while recent and (now - recent[0][1]) > DEDUP_WINDOW_SECONDS:
-            recent.popleft()
-
-        signature = (inbound.msisdn, inbound.text)
-        if any(sig == signature for sig, _ in recent):
-            continue
-
-        text = inbound.text
+def build_dispatcher(
+    subprocess_mode: bool = False,
+    workers: int = DEFAULT_WORKERS,
+    max_backlog: int = DEFAULT_MAX_BACKLOG,
+):
+    if subprocess_mode:
+        return SubprocessDispatcher(workers=workers, max_backlog=max_backlog)
+    return InProcessDispatcher(workers=workers, max_backlog=max_backlog)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Router de inbound WhatsApp -> clwabot")
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="modo legacy: lanza un proceso listener por mensaje",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="tope de dispatches en vuelo (workers del pool)",
+    )
+    parser.add_argument(
+        "--max-backlog",
+        type=int,
+        default=DEFAULT_MAX_BACKLOG,
+        help="tope de mensajes en espera; al llenarse se descartan primero 'other' general (0 = sin tope)",
+    )
+    parser.add_argument(
+        "--log-file",
+        default="",
+        help="leer directo del log del gateway (path o glob) en vez de stdin",
+    )
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH, help="archivo de offset para --log-file")
+    parser.add_argument(
+        "--from-start",
+        action="store_true",
+        help="sin checkpoint previo, leer el log desde el inicio (por defecto: desde el final)",
+    )
+    parser.add_argument(
+        "--dedup-window",
+        type=float,
+        default=DEDUP_WINDOW_SECONDS,
+        help="segundos en que un mismo (msisdn, texto) se considera duplicado",
+    )
+    parser.add_argument(
+        "--dedup-file",
+        default=str(ROUTER_DEDUP_PATH),
+        help="persistencia del índice de dedup ('' = solo memoria)",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        default=str(JOURNAL_DIR),
+        help="directorio del journal de inbound despachados ('' = desactivado)",
+    )
+    parser.add_argument(
+        "--outbox",
+        default=str(OUTBOX_PATH),
+        help="outbox sqlite de envíos con reintentos ('' = sin drainer en el router)",
+    )
+    parser.add_argument(
+        "--coalesce-owner",
+        type=float,
+        default=0.0,
+        help="segundos de ventana para agrupar alertas no críticas al owner (0 = sin agrupar)",
+    )
+    parser.add_argument(
+        "--batch",
+        default="",
+        help="procesa un log histórico lo más rápido posible y termina (envíos al --sink)",
+    )
+    parser.add_argument("--sink", type=Path, default=BATCH_SINK_PATH, help="archivo JSONL de envíos en --batch")
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=None,
+        help="estado de --batch (presencia, pendientes, sesiones); por defecto uno temporal",
+    )
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        summary = run_batch(
+            Path(args.batch),
+            sink_path=args.sink,
+            workers=args.workers,
+            dedup_window=args.dedup_window,
+            data_dir=args.data_dir,
+        )
+        _print_batch_summary(summary)
+        return 0
+
+    journal = InboundJournal(Path(args.journal_dir)) if args.journal_dir else None
+    drainer = _start_outbox_drainer(Path(args.outbox), args.coalesce_owner) if args.outbox else None
+    dedup = DedupIndex(
+        window_seconds=args.dedup_window,
+        persist_path=Path(args.dedup_file) if args.dedup_file else None,
+    )
+    dispatcher = build_dispatcher(
+        subprocess_mode=args.subprocess,
+        workers=args.workers,
+        max_backlog=args.max_backlog,
+    )
+    tailer = None
+    if args.log_file:
+        tailer = LogTailer(args.log_file, checkpoint_path=args.checkpoint, from_start=args.from_start)
+        source = f"log file {args.log_file}"
+    else:
+        source = "stdin"
+    print(
+        f"[whatsapp_router_watch] listening {source} for WhatsApp inbound (mode={dispatcher.mode})...",
+        file=sys.stderr,
+    )
+    if hasattr(signal, "SIGUSR1"):
+        # `kill -USR1 <pid>` imprime profundidad de carriles sin detener el router.
+        signal.signal(signal.SIGUSR1, lambda *_: _print_stats(dispatcher))
+    # SIGTERM (systemd stop) sale por el `finally`: cierra workers y fija checkpoint.
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    from clwabot.hooks import whatsapp_listener
 
-        # En algunos builds de OpenClaw el body de inbound no se imprime en logs
-        # (solo metadata). Para VIP forzamos trigger para no perder urgencias.
-        if _normalize_msisdn(inbound.msisdn) == _normalize_msisdn(VIP_MSISDN) and _is_plain_metadata_only(text):
-            text = "urgencia"
+    try:
+        if tailer is not None:
+            # Los inbound despachados fijan el checkpoint al tiro; el ruido solo
+            # lo adelanta periódicamente.
+            return _route_stream(
+                tailer.lines(),
+                dispatcher,
+                on_line=lambda sent: tailer.commit(force=sent),
+                dedup=dedup,
+                journal=journal,
+                allow=whatsapp_listener.allow_inbound,
+            )
+        return _route_stream(
+            sys.stdin.buffer,
+            dispatcher,
+            dedup=dedup,
+            journal=journal,
+            allow=whatsapp_listener.allow_inbound,
+        )
+    finally:
+        dispatcher.close(wait=True)
+        dedup.flush()
+        if journal is not None:
+            journal.close()
+        if drainer is not None:
+            drainer.close()
+        whatsapp_listener.flush_rate_limiter()
+        if tailer is not None:
+            tailer.commit(force=True)
+        _print_stats(dispatcher)
+
+
+def _start_outbox_drainer(path: Path, owner_coalesce_sec: float = 0.0) -> OutboxDrainer:
+    """Outbox compartido con el listener en proceso + hilo de reintentos."""
+    from clwabot.hooks import whatsapp_listener
+
+    outbox = Outbox(path)
+    drainer = OutboxDrainer(outbox, whatsapp_listener.deliver_message).start()
+    whatsapp_listener.set_outbox(outbox, drainer, owner_coalesce_sec=owner_coalesce_sec)
+    pending = outbox.counts()
+    if pending.get("pending") or pending.get("sending"):
+        print(f"[whatsapp_router_watch] outbox al arrancar: {pending}", file=sys.stderr)
+    return drainer
+
+
+def run_batch(
+    log_path: Path,
+    sink_path: Path = BATCH_SINK_PATH,
+    workers: int = DEFAULT_WORKERS,
+    dedup_window: float = DEDUP_WINDOW_SECONDS,
+    handler: Optional[Callable[..., int]] = None,
+    data_dir: Optional[Path] = None,
+) -> dict:
+    """Backfill: todo el log por los carriles, sin gate de espera ni envíos reales.
+
+    El estado va a `data_dir` (o a una copia temporal de `data/` que se descarta).
+    """
+    with _batch_data(data_dir):
+        return _run_batch(log_path, sink_path, workers, dedup_window, handler)
+
+
+@contextmanager
+def _batch_data(data_dir: Optional[Path]) -> Iterator[Path]:
+    """`sandboxed_data` más la presencia y los pendientes del listener."""
+    from clwabot.core import persist
+    from clwabot.hooks import whatsapp_listener
+
+    with sandboxed_data(data_dir) as base:
+        saved = whatsapp_listener.PRESENCE_PATH, whatsapp_listener.PENDING_PATH
+        whatsapp_listener.PRESENCE_PATH = base / "owner_presence.json"
+        whatsapp_listener.PENDING_PATH = base / "pending_inbox.json"
+        try:
+            yield base
+        finally:
+            # La presencia se escribe con debounce: que quede en `base` antes de soltarlo.
+            persist.flush()
+            whatsapp_listener.PRESENCE_PATH, whatsapp_listener.PENDING_PATH = saved
+
+
+def _run_batch(
+    log_path: Path,
+    sink_path: Path,
+    workers: int,
+    dedup_window: float,
+    handler: Optional[Callable[..., int]],
+) -> dict:
+    from clwabot.hooks import whatsapp_listener
+
+    sink = OutboundSink(sink_path)
+    whatsapp_listener.set_outbound_sink(sink)
+    dispatcher = InProcessDispatcher(
+        workers=workers,
+        handler=handler,
+        grace_seconds=0,
+        max_backlog=0,
+        latency_metrics=False,
+        log_dispatch=False,
+    )
+    counts = {"lines": 0, "inbound": 0}
+
+    def on_line(sent: bool) -> None:
+        counts["lines"] += 1
+        if sent:
+            counts["inbound"] += 1
+            dispatcher.wait_for_capacity(BATCH_MAX_QUEUED)
+
+    start = time.perf_counter()
+    try:
+        with open(log_path, "rb") as fh:
+            _route_stream(fh, dispatcher, on_line=on_line, dedup=DedupIndex(window_seconds=dedup_window))
+        dispatcher.close(wait=True)
+    finally:
+        whatsapp_listener.set_outbound_sink(None)
+        sink.close()
+    elapsed = time.perf_counter() - start
+
+    stats = dispatcher.stats()
+    return {
+        "log": str(log_path),
+        "sink": str(sink_path),
+        "lines": counts["lines"],
+        "inbound": counts["inbound"],
+        "processed": stats["processed"],
+        "outbound": sink.count,
+        "elapsed_sec": round(elapsed, 3),
+        "lines_per_sec": round(counts["lines"] / elapsed, 1) if elapsed > 0 else 0.0,
+        "msgs_per_sec": round(stats["processed"] / elapsed, 1) if elapsed > 0 else 0.0,
+        "queue_p50_ms": stats["queue_p50_ms"],
+        "queue_p95_ms": stats["queue_p95_ms"],
+        "service_p50_ms": stats["service_p50_ms"],
+        "service_p95_ms": stats["service_p95_ms"],
+        "max_lane_depth_seen": stats["max_lane_depth_seen"],
+    }
+
+
+def _print_batch_summary(summary: dict) -> None:
+    print(
+        f"[whatsapp_router_watch] batch {summary['log']}: {summary['lines']} líneas, "
+        f"{summary['inbound']} inbound, {summary['processed']} procesados, "
+        f"{summary['outbound']} envíos -> {summary['sink']}",
+        file=sys.stderr,
+    )
+    print(
+        f"[whatsapp_router_watch] throughput: {summary['elapsed_sec']}s, "
+        f"{summary['lines_per_sec']} líneas/s, {summary['msgs_per_sec']} msg/s",
+        file=sys.stderr,
+    )
+    print(
+        f"[whatsapp_router_watch] latencia: cola p50={summary['queue_p50_ms']}ms p95={summary['queue_p95_ms']}ms, "
+        f"handler p50={summary['service_p50_ms']}ms p95={summary['service_p95_ms']}ms, "
+        f"carril max={summary['max_lane_depth_seen']}",
+        file=sys.stderr,
+    )
+
+
+def _print_stats(dispatcher) -> None:
+    stats = " ".join(f"{k}={v}" for k, v in dispatcher.stats().items())
+    print(f"[whatsapp_router_watch] stats: {stats}", file=sys.stderr)
+    for key, depth in sorted(dispatcher.lane_depths().items(), key=lambda kv: -kv[1])[:10]:
+        print(f"[whatsapp_router_watch]   lane {key}: depth={depth}", file=sys.stderr)
+
+
+def _route_stream(
+    stream,
+    dispatcher,
+    on_line: Optional[Callable[[bool], None]] = None,
+    dedup: Optional[DedupIndex] = None,
+    journal: Optional[InboundJournal] = None,
+    allow: Optional[Callable[[str, str], bool]] = None,
+) -> int:
+    if dedup is None:
+        dedup = DedupIndex(window_seconds=DEDUP_WINDOW_SECONDS)
+
+    for raw in stream:
+        sent = route_line(raw, dispatcher, dedup, journal, allow)
+        if on_line is not None:
+            on_line(sent)
+
+    dedup.flush()
+    return 0
 
-        recent.append((signature, now))
-        run_listener(inbound.msisdn, text)
 
-    return 0
+def route_line(
+    raw,
+    dispatcher,
+    dedup: DedupIndex,
+    journal: Optional[InboundJournal] = None,
+    allow: Optional[Callable[[str, str], bool]] = None,
+) -> bool:
+    """Procesa una línea del stream; True si despachó un inbound.
+
+    `allow(msisdn, rol)` es el rate limiting por contacto: se cobra antes de
+    journal y carril, así un flood descartado no ocupa workers.
+    """
+    if isinstance(raw, bytes):
+        inbound = parse_inbound_bytes(raw)
+    else:
+        inbound = parse_inbound_line(raw.strip())
+    if inbound is None:
+        return False
+
+    # Con id del gateway el dedup es exacto; las líneas legacy caen a
+    # (msisdn, texto) dentro de la ventana.
+    if dedup.seen(inbound.dedup_key):
+        return False
+
+    text = inbound.text
+
+    # En algunos builds de OpenClaw el body de inbound no se imprime en logs
+    # (solo metadata). Para VIP forzamos trigger para no perder urgencias.
+    if _normalize_msisdn(inbound.msisdn) == _normalize_msisdn(VIP_MSISDN) and _is_plain_metadata_only(text):
+        text = "urgencia"
+
+    if allow is not None and not allow(inbound.msisdn, validate_message(inbound.msisdn, text).role):
+        return False
+
+    event = replace(inbound, text=text, routed_ts=time.time())
+    if journal is not None:
+        # Antes de despachar: si el proceso cae, el inbound ya quedó registrado.
+        journal.append(event, ts=event.routed_ts)
+    dispatcher.submit_event(event)
+    return True
 
 
 if __name__ == "__main__":
@@ -7,6 +7,13 @@ cd "$WORKSPACE"
 # Refuerza PATH en systemd --user para evitar fallas intermitentes de node/openclaw.
 export PATH="/home/stredesmers/.nvm/versions/node/v24.13.1/bin:/home/stredesmers/.npm-global/bin:${PATH}"
 
+# Modo nativo: el router sigue el archivo de log del gateway con checkpoint de
+# offset, sin proceso node ni loop de reinicio que relea 1 MB de historia.
+if [[ -n "${OPENCLAW_LOG_FILE:-}" ]]; then
+  echo "[whatsapp_router_watch.sh] tail nativo de ${OPENCLAW_LOG_FILE}" >&2
+  exec python3 -m clwabot.hooks.whatsapp_router_watch --log-file "$OPENCLAW_LOG_FILE"
+fi
+
 OPENCLAW_BIN="${OPENCLAW_BIN:-}"
 if [[ -z "$OPENCLAW_BIN" ]]; then
   if command -v openclaw >/dev/null 2>&1; then
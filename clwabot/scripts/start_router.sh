@@ -7,6 +7,10 @@ NODE_BIN="/home/stredesmers/.nvm/versions/node/v24.13.1/bin/node"
 OPENCLAW_MJS="/home/stredesmers/.npm-global/lib/node_modules/openclaw/openclaw.mjs"
 PYTHON_BIN="/usr/bin/python3"
 
+if [[ -n "${OPENCLAW_LOG_FILE:-}" ]]; then
+  exec "$PYTHON_BIN" -m clwabot.hooks.whatsapp_router_watch --log-file "$OPENCLAW_LOG_FILE"
+fi
+
 while true; do
   "$NODE_BIN" "$OPENCLAW_MJS" logs --follow | "$PYTHON_BIN" -m clwabot.hooks.whatsapp_router_watch || true
   sleep 3
@@ -0,0 +1,18 @@
+"""Dobles de prueba compartidos por los tests del router."""
+
+
+class RecordingDispatcher:
+    """Dispatcher que solo anota lo que le rutean (sin carriles ni workers)."""
+
+    mode = "test"
+
+    def __init__(self):
+        self.calls = []
+        self.events = []
+
+    def submit_event(self, event):
+        self.calls.append((event.msisdn, event.text))
+        self.events.append(event)
+
+    def close(self, wait=True):
+        return None
@@ -0,0 +1,298 @@
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core.inbound_journal import InboundJournal
+from clwabot.hooks import whatsapp_listener
+from clwabot.hooks.async_runtime import AsyncLaneDispatcher, AsyncRuntime, LoopGatewayBridge
+from clwabot.hooks.dedup import DedupIndex
+from clwabot.hooks.dispatcher import lane_key
+from clwabot.hooks.gateway_client import AsyncGatewayClient
+from clwabot.hooks.gateway_stub import StubGateway
+
+
+def _line(msisdn: str, text: str) -> bytes:
+    return f'[whatsapp] inbound message from {msisdn}: "{text}"\n'.encode("utf-8")
+
+
+class AsyncLaneDispatcherTests(unittest.TestCase):
+    def test_lanes_keep_order_and_contacts_run_in_parallel(self):
+        running = {}
+        overlaps = []
+        order = []
+        lock = threading.Lock()
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            key = lane_key(msisdn)
+            with lock:
+                if running.get(key):
+                    overlaps.append(key)
+                running[key] = True
+                order.append((key, text))
+            time.sleep(0.05)
+            with lock:
+                running[key] = False
+            return 0
+
+        async def scenario():
+            dispatcher = AsyncLaneDispatcher(handler=handler, grace_seconds=0, io_workers=4, latency_metrics=False)
+            dispatcher.start()
+            t0 = time.monotonic()
+            for idx in range(3):
+                for msisdn in ("+56911111111", "+56922222222", "+56933333333", "+56944444444"):
+                    dispatcher.submit(msisdn, str(idx))
+            await dispatcher.aclose(wait=True)
+            return dispatcher, time.monotonic() - t0
+
+        dispatcher, elapsed = asyncio.run(scenario())
+        self.assertEqual(overlaps, [])
+        self.assertEqual([t for k, t in order if k == "56911111111"], ["0", "1", "2"])
+        self.assertEqual(dispatcher.stats()["processed"], 12)
+        # 12 jobs de 50ms en 4 carriles paralelos: ~150ms, no ~600ms.
+        self.assertLess(elapsed, 0.45)
+
+    def test_gate_fires_on_loop_timer(self):
+        calls = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            calls.append((text, deferred_auto, trigger_ts, threading.current_thread().name))
+            if not deferred_auto:
+                gate_scheduler(msisdn, text, 123)
+            return 0
+
+        async def scenario():
+            dispatcher = AsyncLaneDispatcher(handler=handler, grace_seconds=0.05, latency_metrics=False)
+            dispatcher.start()
+            dispatcher.submit("+56911111111", "quiero agendar")
+            await asyncio.sleep(0.01)
+            pending = dispatcher.stats()["pending_gates"]
+            await dispatcher.drain()
+            await dispatcher.aclose()
+            return dispatcher, pending
+
+        dispatcher, pending = asyncio.run(scenario())
+        self.assertEqual(pending, 1)
+        self.assertEqual(
+            [(c[0], c[1], c[2]) for c in calls],
+            [("quiero agendar", False, 0), ("quiero agendar", True, 123)],
+        )
+        self.assertTrue(all(c[3].startswith("clwabot-io") for c in calls))
+        self.assertEqual(dispatcher.stats()["pending_gates"], 0)
+
+    def test_full_backlog_sheds_general_others_never_owner_or_vip(self):
+        release = threading.Event()
+        handled = []
+        shed = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            if text == "bloquea":
+                release.wait(2)
+            handled.append((msisdn, text))
+            return 0
+
+        async def scenario():
+            dispatcher = AsyncLaneDispatcher(
+                handler=handler,
+                grace_seconds=0,
+                io_workers=1,
+                max_backlog=2,
+                latency_metrics=False,
+                on_shed=lambda job, reason: shed.append((job.msisdn, job.text, reason)),
+            )
+            dispatcher.start()
+            dispatcher.submit("+19990000000", "bloquea")
+            await asyncio.sleep(0.02)
+            dispatcher.submit("+19990000001", "hola")
+            dispatcher.submit("+19990000002", "tengo un error")
+            dispatcher.submit("+56975551112", "urgencia")  # desplaza a "hola"
+            dispatcher.submit("+56954764325", "/status")  # desplaza a "tengo un error"
+            dispatcher.submit("+19990000003", "buenas")  # entrante general: se descarta
+            backlog = dispatcher.stats()["backlog"]
+            release.set()
+            await dispatcher.aclose(wait=True)
+            return dispatcher, backlog
+
+        dispatcher, backlog = asyncio.run(scenario())
+        self.assertEqual(backlog, 2)
+        self.assertEqual(
+            shed,
+            [
+                ("+19990000001", "hola", "backlog_full"),
+                ("+19990000002", "tengo un error", "backlog_full"),
+                ("+19990000003", "buenas", "backlog_full"),
+            ],
+        )
+        self.assertIn(("+56954764325", "/status"), handled)
+        self.assertEqual(dispatcher.stats()["shed"], 3)
+
+    def test_delayed_flush_after_aclose_is_a_noop(self):
+        fired = []
+        errors = []
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(lambda _loop, ctx: errors.append(ctx))
+            dispatcher = AsyncLaneDispatcher(handler=lambda **_: 0, grace_seconds=0, latency_metrics=False)
+            dispatcher.start()
+            await dispatcher.aclose()
+            # Un hilo que registra una métrica tarde ya no debe tocar el pool cerrado.
+            dispatcher._delays.call_later(0, lambda: fired.append(True))
+            await asyncio.sleep(0.05)
+
+        asyncio.run(scenario())
+        self.assertEqual(fired, [])
+        self.assertEqual(errors, [])
+
+
+class AsyncGatewayTests(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGateway().start()
+
+    def tearDown(self):
+        self.stub.close()
+
+    def test_concurrent_sends_share_one_connection(self):
+        async def scenario():
+            client = AsyncGatewayClient(self.stub.url)
+            await asyncio.gather(*(client.send_message("+56911111111", f"hola {i}") for i in range(20)))
+            await client.close()
+            return client
+
+        client = asyncio.run(scenario())
+        self.assertEqual(client.sent, 20)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(sorted(m["message"] for m in self.stub.messages), sorted(f"hola {i}" for i in range(20)))
+
+    def test_bridge_sends_from_worker_threads(self):
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            client = AsyncGatewayClient(self.stub.url)
+            bridge = LoopGatewayBridge(client, loop)
+            await asyncio.gather(
+                *(loop.run_in_executor(None, bridge.send_message, "+56911111111", f"m{i}") for i in range(5))
+            )
+            await client.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.stub.messages), 5)
+        self.assertEqual(self.stub.connections, 1)
+
+
+class AsyncRuntimeTests(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGateway().start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pending = mock.patch.object(whatsapp_listener, "PENDING_PATH", Path(self.tmp.name) / "pending_inbox.json")
+        self.pending.start()
+
+    def tearDown(self):
+        self.pending.stop()
+        self.tmp.cleanup()
+        whatsapp_listener.set_gateway_client(None)
+        self.stub.close()
+
+    def test_stop_does_not_wait_for_gates_and_start_rearms_them(self):
+        calls = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            calls.append((text, deferred_auto, trigger_ts))
+            if not deferred_auto:
+                trigger_ts = int(time.time())
+                whatsapp_listener.add_pending_event(msisdn, text, trigger_ts)
+                gate_scheduler(msisdn, text, trigger_ts)
+            return 0
+
+        async def run(grace, lines):
+            runtime = AsyncRuntime(
+                dispatcher=AsyncLaneDispatcher(handler=handler, grace_seconds=grace, latency_metrics=False),
+                dedup=DedupIndex(window_seconds=60),
+                gateway_url="",
+            )
+            await runtime.start()
+            await runtime.run_stream(lines)
+            await asyncio.sleep(0.05)
+            t0 = time.monotonic()
+            await runtime.stop()
+            return time.monotonic() - t0
+
+        # Gate de 30 s: detener no lo espera, queda en pending_inbox.
+        elapsed = asyncio.run(run(30, [_line("+19990000001", "quiero agendar")]))
+        self.assertLess(elapsed, 1.0)
+        waiting = whatsapp_listener.waiting_pending_events()
+        self.assertEqual([(m, t) for m, t, _ in waiting], [("+19990000001", "quiero agendar")])
+
+        # El siguiente arranque lo re-arma y lo dispara (ya venció su grace).
+        asyncio.run(run(0, []))
+        self.assertEqual(calls[-1], ("quiero agendar", True, waiting[0][2]))
+        self.assertEqual(len(calls), 2)
+
+    def test_stream_is_deduped_journaled_and_sent_over_gateway(self):
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            whatsapp_listener.send_whatsapp_text(msisdn, f"eco {text}")
+            return 0
+
+        lines = [
+            b"ruido\n",
+            _line("+56911111111", "hola"),
+            _line("+56911111111", "hola"),
+            _line("+56922222222", "chao"),
+        ]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = InboundJournal(Path(tmp))
+
+            async def scenario():
+                runtime = AsyncRuntime(
+                    dispatcher=AsyncLaneDispatcher(handler=handler, grace_seconds=0, latency_metrics=False),
+                    dedup=DedupIndex(window_seconds=60),
+                    journal=journal,
+                    gateway_url=self.stub.url,
+                )
+                await runtime.start()
+                await runtime.run_stream(lines)
+                await runtime.stop()
+                return runtime.stats()
+
+            stats = asyncio.run(scenario())
+            journaled = list(Path(tmp).glob("*"))
+
+        self.assertEqual(stats["lines"], 4)
+        self.assertEqual(stats["inbound"], 2)
+        self.assertEqual(stats["gateway_sent"], 2)
+        self.assertEqual(sorted(m["message"] for m in self.stub.messages), ["eco chao", "eco hola"])
+        self.assertTrue(journaled)
+
+    def test_dedup_and_rate_limit_persist_off_the_loop(self):
+        writers = []
+        dedup = DedupIndex(window_seconds=60, persist_path=Path(self.tmp.name) / "dedup.json", flush_interval=0)
+        write_snapshot = dedup.write_snapshot
+
+        def recording_write(snapshot):
+            writers.append(threading.current_thread().name)
+            write_snapshot(snapshot)
+
+        dedup.write_snapshot = recording_write
+
+        async def scenario():
+            runtime = AsyncRuntime(
+                dispatcher=AsyncLaneDispatcher(handler=lambda **_: 0, grace_seconds=0, latency_metrics=False),
+                dedup=dedup,
+                gateway_url="",
+            )
+            await runtime.start()
+            await runtime.run_stream([_line("+56911111111", "hola"), _line("+56922222222", "chao")])
+            await runtime.stop()
+
+        with mock.patch("clwabot.hooks.async_runtime.RATE_LIMITS_PATH", Path(self.tmp.name) / "rate_limits.json"):
+            asyncio.run(scenario())
+        self.assertTrue(writers)
+        self.assertTrue(all(name.startswith("clwabot-state") for name in writers))
+        self.assertEqual(len(DedupIndex(window_seconds=60, persist_path=Path(self.tmp.name) / "dedup.json")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
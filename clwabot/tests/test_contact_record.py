@@ -0,0 +1,74 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import metrics_log, state_store
+from clwabot.core.contact_record import MESSAGE_HISTORY, ContactRecord
+
+LEGACY = {
+    "name": "Ana",
+    "priority": "high",
+    "last_seen_at": "2026-02-22T12:00:00+00:00",
+    "last_intent": "meeting",
+    "last_messages": [{"at": "2026-02-22T11:59:00+00:00", "text": "hola"}],
+    "tags": ["cliente"],
+    "stats": {"inbound": 4, "auto_replies": 1, "reopened": 2},
+    "notes": "llamar en la tarde",
+}
+
+
+class ContactRecordTests(unittest.TestCase):
+    def test_ring_buffer_codes_and_dict_view(self):
+        record = ContactRecord.from_dict(LEGACY)
+        for n in range(25):
+            record.push_message(1_771_761_600 + n, f"m{n}")
+        self.assertEqual([text for _, text in record.messages()], [f"m{n}" for n in range(15, 25)])
+        self.assertEqual(len(record["last_messages"]), MESSAGE_HISTORY)
+        self.assertEqual(record["last_messages"][-1], {"at": "2026-02-22T12:00:24+00:00", "text": "m24"})
+
+        # Intent conocido va como código; uno nuevo como string.
+        record.intent = "feedback"
+        packed = json.loads(json.dumps(record.pack()))
+        self.assertEqual(packed[:6], ["Ana", 2, 1_771_761_600, "feedback", 4, 1])
+        again = ContactRecord.unpack(packed)
+        self.assertEqual(again, record)
+        self.assertEqual(
+            (again["last_intent"], again["priority"], again["notes"]), ("feedback", "high", "llamar en la tarde")
+        )
+
+        again["stats"]["inbound"] += 1
+        again.update({"priority": "critical"})
+        self.assertEqual(dict(again["stats"]), {"inbound": 5, "auto_replies": 1, "reopened": 2})
+        self.assertEqual((again.inbound, again.priority_code), (5, 3))
+        with self.assertRaises(AttributeError):
+            again.unknown = 1
+
+    def test_state_json_loads_lazily_and_rewrites_compact(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "state.json"
+            legacy = state_store.default_state()
+            legacy["contacts"] = {f"+5690000000{i}": dict(LEGACY) for i in range(3)}
+            path.write_text(json.dumps(legacy, indent=2), encoding="utf-8")
+            with mock.patch.object(state_store, "STATE_PATH", path), mock.patch.object(
+                state_store, "STATE_BACKEND", "json"
+            ), mock.patch.object(metrics_log, "METRICS_DIR", Path(tmp) / "metrics"):
+                state = state_store.load_state()
+                state_store.append_contact_message(state, "+56900000001", "nuevo")
+                state_store.append_contact_message(state, "+56911111111", "primero")
+                self.assertEqual(len(state["contacts"]._loaded), 2)
+                state_store.save_state(state)
+
+                on_disk = json.loads(path.read_text(encoding="utf-8"))["contacts"]
+                self.assertTrue(all(isinstance(entry, list) for entry in on_disk.values()))
+                self.assertEqual(len(on_disk), 4)
+                again = state_store.load_state()["contacts"]
+                self.assertEqual(again["+56900000000"], ContactRecord.from_dict(LEGACY))
+                self.assertEqual([m["text"] for m in again["+56900000001"]["last_messages"]], ["hola", "nuevo"])
+                self.assertEqual(again["+56911111111"]["stats"]["inbound"], 1)
+            self.assertLess(path.stat().st_size, len(json.dumps(legacy, indent=2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
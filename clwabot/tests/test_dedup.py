@@ -0,0 +1,62 @@
+import io
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from clwabot.hooks.dedup import DedupIndex, dedup_key
+from clwabot.hooks.whatsapp_router_watch import _route_stream
+from clwabot.tests.helpers import RecordingDispatcher
+
+
+class DedupIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "dedup.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_window_and_bucket_expiry(self):
+        idx = DedupIndex(window_seconds=4)
+        key = dedup_key("+56911111111", "hola")
+        self.assertFalse(idx.seen(key, now=100.0))
+        self.assertTrue(idx.seen(key, now=103.5))
+        self.assertFalse(idx.seen(dedup_key("+56911111111", "chao"), now=103.5))
+        # Pasada la ventana, el bucket vencido se descarta y la clave vuelve a pasar.
+        self.assertFalse(idx.seen(dedup_key("+56922222222", "x"), now=110.0))
+        self.assertEqual(len(idx), 1)
+        self.assertFalse(idx.seen(key, now=110.5))
+
+    def test_persisted_index_survives_restart(self):
+        key = dedup_key("+56911111111", "hola")
+        first = DedupIndex(window_seconds=60, persist_path=self.path)
+        self.assertFalse(first.seen(key))
+        first.flush()
+
+        second = DedupIndex(window_seconds=60, persist_path=self.path)
+        self.assertTrue(second.seen(key))
+        self.assertNotIn("hola", self.path.read_text(encoding="utf-8"))
+
+    def test_expired_entries_are_not_reloaded(self):
+        key = dedup_key("+56911111111", "hola")
+        first = DedupIndex(window_seconds=2, persist_path=self.path)
+        first.seen(key, now=time.time() - 10)
+        first.flush()
+
+        second = DedupIndex(window_seconds=2, persist_path=self.path)
+        self.assertEqual(len(second), 0)
+        self.assertFalse(second.seen(key))
+
+    def test_router_restart_does_not_replay_recent_inbound(self):
+        line = '[whatsapp] inbound message from +56911111111: "hola"\n'
+        first = RecordingDispatcher()
+        _route_stream(io.StringIO(line), first, dedup=DedupIndex(window_seconds=60, persist_path=self.path))
+        second = RecordingDispatcher()
+        _route_stream(io.StringIO(line), second, dedup=DedupIndex(window_seconds=60, persist_path=self.path))
+        self.assertEqual(first.calls, [("+56911111111", "hola")])
+        self.assertEqual(second.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
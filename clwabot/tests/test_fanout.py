@@ -0,0 +1,108 @@
+import threading
+import time
+import unittest
+
+from clwabot.core.decision import SILENCE, Decision, as_decision
+from clwabot.hooks.fanout import deliver, plan_outbound
+
+OWNER = "+56954764325"
+VIP = "+56975551112"
+
+
+def _legacy_decision(severity="critical"):
+    return {
+        "policy": "reply_to_vip",
+        "target_msisdn": VIP,
+        "message": "Ya lo marqué como URGENCIA INMEDIATA",
+        "owner_message": "🚨 URGENCIA VIP [CRITICA]",
+        "vip_ics_path": "",
+        "owner_ics_path": "",
+        "owner_retry_message": "REINTENTO",
+        "owner_retry_delay_sec": "120",
+        "severity": severity,
+    }
+
+
+class FanoutTests(unittest.TestCase):
+    def _decision(self, severity="critical"):
+        return _legacy_decision(severity)
+
+    def test_plan_puts_critical_owner_alert_first(self):
+        plan = plan_outbound(self._decision(), owner_msisdn=OWNER, vip_msisdn=VIP)
+        self.assertEqual([(m.role, m.delay_sec) for m in plan], [("vip", 0), ("owner", 0), ("owner", 120)])
+        self.assertEqual(plan[1].priority, 0)
+        normal = plan_outbound(self._decision("normal"), owner_msisdn=OWNER, vip_msisdn=VIP)
+        self.assertEqual(normal[1].priority, 1)
+
+    def test_shared_ics_goes_to_vip_and_owner(self):
+        decision = dict(self._decision(), vip_ics_path="/tmp/a.ics", owner_ics_path="/tmp/a.ics")
+        plan = plan_outbound(decision, owner_msisdn=OWNER, vip_msisdn=VIP)
+        self.assertEqual([m.ics_path for m in plan[:2]], ["/tmp/a.ics", "/tmp/a.ics"])
+        only_owner = dict(self._decision(), owner_ics_path="/tmp/b.ics")
+        plan = plan_outbound(only_owner, owner_msisdn=OWNER, vip_msisdn=VIP)
+        self.assertEqual([m.ics_path for m in plan[:2]], ["", "/tmp/b.ics"])
+
+    def test_deliver_runs_sends_concurrently_and_reports(self):
+        started = []
+        lock = threading.Lock()
+        scheduled = []
+
+        def send(target, message, ics_path):
+            with lock:
+                started.append(target)
+            time.sleep(0.2)
+            return ("gateway", target != VIP)
+
+        plan = plan_outbound(self._decision(), owner_msisdn=OWNER, vip_msisdn=VIP)
+        t0 = time.monotonic()
+        report = deliver(
+            plan,
+            send=send,
+            schedule=lambda t, m, d: scheduled.append((t, d)),
+            msisdn=VIP,
+            policy="reply_to_vip",
+            severity="critical",
+        )
+        elapsed = time.monotonic() - t0
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(started[0], OWNER)
+        self.assertEqual(scheduled, [(OWNER, 120)])
+        self.assertEqual([(r.role, r.transport) for r in report.results], [("owner", "gateway"), ("vip", "gateway"), ("owner", "delayed")])
+        self.assertFalse(report.ok)
+        metric = report.to_metric()
+        self.assertEqual((metric["kind"], metric["sent"], metric["failed"]), ("delivery_report", 2, 1))
+
+    def test_send_exception_is_reported_not_raised(self):
+        def send(target, message, ics_path):
+            raise RuntimeError("sin red")
+
+        plan = plan_outbound({"policy": "alert_owner", "owner_message": "alerta"}, owner_msisdn=OWNER, vip_msisdn=VIP)
+        report = deliver(plan, send=send, schedule=lambda *a: None)
+        self.assertEqual(report.results[0].error, "sin red")
+        self.assertFalse(report.ok)
+
+
+
+class DecisionTests(unittest.TestCase):
+    def test_legacy_dict_becomes_typed_decision_with_actions(self):
+        legacy = _legacy_decision()
+        decision = as_decision(legacy, owner_msisdn=OWNER, vip_msisdn=VIP)
+        self.assertIsInstance(decision, Decision)
+        self.assertEqual(decision.owner_retry_delay_sec, 120)
+        self.assertEqual([(m.role, m.delay_sec) for m in decision.actions], [("vip", 0), ("owner", 0), ("owner", 120)])
+        self.assertFalse(hasattr(decision, "__dict__"))
+        # El adapter legacy sigue disponible.
+        self.assertEqual(decision["policy"], "reply_to_vip")
+        self.assertEqual(decision.get("no_existe", "x"), "x")
+        self.assertEqual(decision.to_dict()["owner_retry_delay_sec"], "120")
+        self.assertIs(as_decision(decision, owner_msisdn=OWNER, vip_msisdn=VIP), decision)
+
+    def test_silence_and_owner_have_no_actions(self):
+        self.assertEqual(SILENCE.actions, ())
+        owner = Decision.make(OWNER, VIP, policy="owner", target_msisdn=OWNER, message="hola")
+        self.assertEqual(owner.actions, ())
+
+
+if __name__ == "__main__":
+    unittest.main()
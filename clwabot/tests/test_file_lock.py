@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import meeting_session, metrics_log, state_store
+from clwabot.core.persist import StaleWriteError, write_json
+from clwabot.core.state_db import close_state_db, open_state_db
+from clwabot.core.unit_of_work import run_unit_of_work
+
+CONTACT = "+56911112222"
+WRITERS = 4
+MESSAGES = 25
+
+
+def _one_inbound(msisdn):
+    state = state_store.load_state()
+    state_store.append_contact_message(state, msisdn, "hola")
+    state_store.add_metric_event(state, {"kind": "inbound", "msisdn": msisdn})
+    state_store.save_state(state)
+
+
+def _writer(messages):
+    for _ in range(messages):
+        run_unit_of_work(_one_inbound, CONTACT)
+
+
+class CrossProcessWriteTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name)
+        self.patches = [
+            mock.patch.object(state_store, "STATE_PATH", base / "state.json"),
+            mock.patch.object(state_store, "STATE_DB_PATH", base / "state.sqlite3"),
+            mock.patch.object(meeting_session, "SESSIONS_PATH", base / "meeting_sessions.json"),
+            mock.patch.object(metrics_log, "METRICS_DIR", base / "metrics"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        close_state_db()
+        self.tmp.cleanup()
+
+    def _stress(self):
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=_writer, args=(MESSAGES,)) for _ in range(WRITERS)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join(120)
+        self.assertEqual([proc.exitcode for proc in procs], [0] * WRITERS)
+
+    def test_concurrent_writers_lose_no_increments(self):
+        for backend in ("json", "sqlite"):
+            with self.subTest(backend=backend), mock.patch.object(state_store, "STATE_BACKEND", backend):
+                state_store.STATE_PATH.unlink(missing_ok=True)
+                logged = metrics_log.event_count()
+                self._stress()
+                stats = state_store.load_state()["contacts"][CONTACT]["stats"]
+                self.assertEqual(stats["inbound"], WRITERS * MESSAGES)
+                # Un intento que quedó obsoleto no deja su evento en el log.
+                self.assertEqual(metrics_log.event_count() - logged, WRITERS * MESSAGES)
+        self.assertEqual(open_state_db(state_store.STATE_DB_PATH).version(), WRITERS * MESSAGES)
+
+    def test_threads_share_no_global_lock_and_lose_no_increments(self):
+        # Como los workers del router: cada hilo su unit of work, sin STORE_LOCK.
+        with mock.patch.object(state_store, "STATE_BACKEND", "json"):
+            threads = [threading.Thread(target=_writer, args=(MESSAGES,)) for _ in range(WRITERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(120)
+            stats = state_store.load_state()["contacts"][CONTACT]["stats"]
+        self.assertEqual(stats["inbound"], WRITERS * MESSAGES)
+
+    def test_stale_unit_of_work_writes_nothing_and_retries(self):
+        with mock.patch.object(state_store, "STATE_BACKEND", "json"):
+            _one_inbound(CONTACT)
+            attempts = []
+
+            def handle():
+                # Lo que dejó el intento anterior: nada, si quedó obsoleto.
+                attempts.append(meeting_session.SESSIONS_PATH.exists())
+                state = state_store.load_state()
+                sessions = meeting_session._load_sessions()
+                if len(attempts) == 1:
+                    # Otro proceso escribe state.json entre la lectura y el commit.
+                    other = state_store._read_state(state_store.STATE_PATH)
+                    other["contacts"][CONTACT].inbound += 1
+                    write_json(state_store.STATE_PATH, other, versioned=True)
+                sessions["sessions"].append({"msisdn": CONTACT})
+                meeting_session._save_sessions(sessions)
+                state_store.append_contact_message(state, CONTACT, "hola")
+                state_store.save_state(state)
+
+            with self.assertRaises(StaleWriteError):
+                run_unit_of_work(handle, attempts=1)
+            run_unit_of_work(handle)
+            on_disk = state_store._read_state(state_store.STATE_PATH)
+            sessions = json.loads(meeting_session.SESSIONS_PATH.read_text(encoding="utf-8"))
+        self.assertEqual(attempts, [False, False])
+        self.assertEqual(on_disk["contacts"][CONTACT].inbound, 3)
+        self.assertEqual((on_disk["_version"], sessions["_version"], len(sessions["sessions"])), (3, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
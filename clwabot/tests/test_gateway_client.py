@@ -0,0 +1,159 @@
+import asyncio
+import time
+import unittest
+
+from clwabot.hooks import whatsapp_listener
+from clwabot.hooks.gateway_client import (
+    AsyncGatewayClient,
+    GatewayClient,
+    GatewayError,
+    GatewayRequestError,
+    request_error,
+)
+from clwabot.hooks.gateway_stub import StubGateway
+
+
+class GatewayClientTests(unittest.TestCase):
+    def setUp(self):
+        self.stub = StubGateway(token="secreto").start()
+
+    def tearDown(self):
+        self.stub.close()
+
+    def test_many_sends_share_one_connection(self):
+        client = GatewayClient(self.stub.url, token="secreto")
+        for idx in range(5):
+            client.send_message("+56911111111", f"hola {idx}")
+        client.send_message("+56911111111", "evento", media_path="/tmp/evento.ics")
+        client.close()
+
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(client.sent, 6)
+        self.assertEqual([m["message"] for m in self.stub.messages][:2], ["hola 0", "hola 1"])
+        self.assertEqual(self.stub.messages[-1]["mediaPath"], "/tmp/evento.ics")
+        self.assertEqual(self.stub.messages[0]["channel"], "whatsapp")
+
+    def test_same_idempotency_key_is_sent_once(self):
+        client = GatewayClient(self.stub.url, token="secreto")
+        client.send_message("+56911111111", "hola", idempotency_key="outbox-1")
+        client.send_message("+56911111111", "hola", idempotency_key="outbox-1")
+        client.send_message("+56911111111", "hola")
+        client.send_message("+56911111111", "hola")
+        client.close()
+        self.assertEqual(len(self.stub.messages), 3)
+        self.assertEqual(self.stub.messages[0]["idempotencyKey"], "outbox-1")
+
+    def test_fragmented_responses_are_reassembled(self):
+        self.stub.set_fragment_replies(True)
+        started = time.monotonic()
+        client = GatewayClient(self.stub.url, token="secreto", request_timeout=2)
+        self.assertEqual(client.send_message("+56911111111", "uno"), {"messageId": "stub-1"})
+        client.close()
+
+        async def send_async():
+            aclient = AsyncGatewayClient(self.stub.url, token="secreto", request_timeout=2)
+            try:
+                return await aclient.send_message("+56911111111", "dos")
+            finally:
+                await aclient.close()
+
+        self.assertEqual(asyncio.run(send_async()), {"messageId": "stub-2"})
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_bad_token_is_a_connection_error_with_backoff(self):
+        client = GatewayClient(self.stub.url, token="otro", reconnect_backoff=60)
+        with self.assertRaises(GatewayError):
+            client.send_message("+56911111111", "hola")
+        # En backoff ni siquiera reintenta conectar.
+        with self.assertRaises(GatewayError):
+            client.send_message("+56911111111", "hola")
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_rejected_send_keeps_connection(self):
+        client = GatewayClient(self.stub.url, token="secreto")
+        client.send_message("+56911111111", "uno")
+        self.stub.set_fail_sends(True)
+        with self.assertRaises(GatewayRequestError) as rejected:
+            client.send_message("+56911111111", "dos")
+        self.assertFalse(rejected.exception.retryable)
+        self.stub.set_fail_sends(True, status=503)
+        with self.assertRaises(GatewayRequestError) as busy:
+            client.send_message("+56911111111", "dos")
+        self.assertEqual((busy.exception.status, busy.exception.retryable), (503, True))
+        self.stub.set_fail_sends(False)
+        client.send_message("+56911111111", "tres")
+        client.close()
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual([m["message"] for m in self.stub.messages], ["uno", "tres"])
+
+    def test_retryable_is_read_from_flag_code_or_status(self):
+        cases = [
+            ({"message": "x", "retryable": False, "status": 503}, False),
+            ({"message": "x", "code": "RATE_LIMITED"}, True),
+            ({"message": "x", "status": 429}, True),
+            ({"message": "x", "status": 400, "code": "INVALID_REQUEST"}, False),
+            ("unknown method", False),
+        ]
+        for error, retryable in cases:
+            with self.subTest(error=error):
+                self.assertEqual(request_error("send", error).retryable, retryable)
+
+
+class ListenerTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.cli_calls = []
+        self._orig_run_cmd = whatsapp_listener.run_cmd
+        whatsapp_listener.run_cmd = lambda cmd: self.cli_calls.append(cmd) or 0
+
+    def tearDown(self):
+        whatsapp_listener.run_cmd = self._orig_run_cmd
+        whatsapp_listener.set_gateway_client(None)
+
+    def test_listener_sends_over_gateway(self):
+        stub = StubGateway().start()
+        try:
+            whatsapp_listener.set_gateway_client(GatewayClient(stub.url))
+            whatsapp_listener.send_whatsapp_text("+56911111111", "hola")
+            whatsapp_listener.send_whatsapp_with_ics("+56911111111", "cal", "/tmp/x.ics")
+        finally:
+            stub.close()
+        self.assertEqual(len(stub.messages), 2)
+        self.assertEqual(self.cli_calls, [])
+
+    def test_lost_ack_after_write_is_a_failure_not_a_cli_resend(self):
+        stub = StubGateway().start()
+        try:
+            whatsapp_listener.set_gateway_client(GatewayClient(stub.url))
+            stub.drop_next_acks(1)
+            self.assertEqual(whatsapp_listener.deliver_message("+56911111111", "hola"), ("gateway", False))
+        finally:
+            stub.close()
+        self.assertEqual(len(stub.messages), 1)
+        self.assertEqual(self.cli_calls, [])
+
+    def test_transient_rejection_can_retry_but_a_permanent_one_fails(self):
+        stub = StubGateway().start()
+        try:
+            whatsapp_listener.set_gateway_client(GatewayClient(stub.url))
+            stub.set_fail_sends(True)
+            self.assertEqual(whatsapp_listener.deliver_message("+56911111111", "hola"), ("gateway", False))
+            self.assertEqual(self.cli_calls, [])
+            stub.set_fail_sends(True, status=503)
+            self.assertEqual(whatsapp_listener.deliver_message("+56911111111", "hola"), ("cli", True))
+        finally:
+            stub.close()
+        self.assertEqual(len(self.cli_calls), 1)
+        self.assertEqual(stub.messages, [])
+
+    def test_listener_falls_back_to_cli_when_gateway_is_down(self):
+        stub = StubGateway().start()
+        url = stub.url
+        stub.close()
+        whatsapp_listener.set_gateway_client(GatewayClient(url))
+        whatsapp_listener.send_whatsapp_text("+56911111111", "hola")
+        self.assertEqual(len(self.cli_calls), 1)
+        self.assertIn("--message", self.cli_calls[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
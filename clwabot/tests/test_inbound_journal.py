@@ -0,0 +1,86 @@
+import io
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+from clwabot.core import inbound_journal, state_store
+from clwabot.core.inbound_journal import InboundJournal, iter_day, load_index, replay
+from clwabot.hooks.inbound_event import InboundEvent
+from clwabot.hooks.whatsapp_router_watch import _route_stream
+from clwabot.tests.helpers import RecordingDispatcher
+
+
+class InboundJournalTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name) / "journal"
+        self.today = datetime.now().strftime("%Y-%m-%d")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_rotates_segments_and_indexes_by_day(self):
+        journal = InboundJournal(self.dir, max_segment_bytes=200)
+        for idx in range(6):
+            journal.append(InboundEvent(msisdn="+56911111111", text=f"mensaje {idx}", message_id=f"ID{idx}"))
+        journal.close()
+
+        entry = load_index(self.dir)[self.today]
+        self.assertGreater(len(entry["segments"]), 1)
+        self.assertEqual(entry["count"], 6)
+        records = list(iter_day(self.today, journal_dir=self.dir))
+        self.assertEqual([r["message_id"] for r in records], [f"ID{i}" for i in range(6)])
+
+    def test_reopen_appends_to_same_segment(self):
+        for text in ("a", "b"):
+            journal = InboundJournal(self.dir)
+            journal.append({"msisdn": "+56911111111", "text": text})
+            journal.close()
+        entry = load_index(self.dir)[self.today]
+        self.assertEqual(len(entry["segments"]), 1)
+        self.assertEqual(entry["count"], 2)
+
+    def test_router_journals_dispatched_inbound(self):
+        line = '[whatsapp] inbound message from +56911111111: "hola"\n'
+        journal = InboundJournal(self.dir)
+        _route_stream(io.StringIO("ruido\n" + line + line), RecordingDispatcher(), journal=journal)
+        journal.close()
+        records = list(iter_day(self.today, journal_dir=self.dir))
+        self.assertEqual([(r["msisdn"], r["text"]) for r in records], [("+56911111111", "hola")])
+
+    def test_dry_run_replay_does_not_touch_real_state(self):
+        journal = InboundJournal(self.dir)
+        journal.append({"msisdn": "+19990000001", "text": "quiero agendar una reunion"})
+        journal.append({"msisdn": "+19990000002", "text": "hola"})
+        journal.close()
+
+        real_state = Path(self.tmp.name) / "state.json"
+        real_state.write_text("{}", encoding="utf-8")
+        orig_state, orig_data = state_store.STATE_PATH, inbound_journal.DATA_DIR
+        state_store.STATE_PATH = real_state
+        inbound_journal.DATA_DIR = Path(self.tmp.name)
+        try:
+            report = replay(self.today, dry_run=True, journal_dir=self.dir)
+        finally:
+            state_store.STATE_PATH, inbound_journal.DATA_DIR = orig_state, orig_data
+
+        self.assertEqual(report.messages, 2)
+        self.assertEqual(report.errors, 0)
+        self.assertEqual(sum(report.policies.values()), 2)
+        self.assertEqual(real_state.read_text(encoding="utf-8"), "{}")
+        self.assertIs(state_store.STATE_PATH, orig_state)
+
+    def test_since_ts_skips_older_records(self):
+        journal = InboundJournal(self.dir)
+        now = time.time()
+        journal.append({"msisdn": "+56911111111", "text": "viejo"}, ts=now - 60)
+        journal.append({"msisdn": "+56911111111", "text": "nuevo"}, ts=now)
+        journal.close()
+        records = list(iter_day(self.today, journal_dir=self.dir, since_ts=now - 1))
+        self.assertEqual([r["text"] for r in records], ["nuevo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
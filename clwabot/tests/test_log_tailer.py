@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from clwabot.hooks.log_tailer import LogTailer
+
+
+class LogTailerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+        self.log = self.base / "openclaw.log"
+        self.checkpoint = self.base / "checkpoint.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _append(self, path: Path, *lines: str) -> None:
+        with open(path, "ab") as fh:
+            for line in lines:
+                fh.write(line.encode("utf-8") + b"\n")
+
+    def _drain(self, tailer: LogTailer) -> list[str]:
+        out = []
+        for raw in tailer.lines(follow=False):
+            out.append(raw.decode("utf-8").strip())
+            tailer.commit(force=True)
+        return out
+
+    def _tailer(self, pattern=None, **kwargs) -> LogTailer:
+        return LogTailer(str(pattern or self.log), checkpoint_path=self.checkpoint, **kwargs)
+
+    def test_resume_after_restart_without_replay(self):
+        self._append(self.log, "a", "b", "c")
+        self.assertEqual(self._drain(self._tailer(from_start=True)), ["a", "b", "c"])
+
+        self._append(self.log, "d", "e")
+        self.assertEqual(self._drain(self._tailer(from_start=True)), ["d", "e"])
+
+    def test_without_checkpoint_starts_at_end(self):
+        self._append(self.log, "historia vieja")
+        tailer = self._tailer()
+        self.assertEqual(self._drain(tailer), [])
+        self._append(self.log, "nuevo")
+        self.assertEqual(self._drain(tailer), ["nuevo"])
+
+    def test_partial_line_waits_for_newline(self):
+        self._append(self.log, "a")
+        tailer = self._tailer(from_start=True)
+        with open(self.log, "ab") as fh:
+            fh.write(b"incomple")
+        self.assertEqual(self._drain(tailer), ["a"])
+        with open(self.log, "ab") as fh:
+            fh.write(b"ta\n")
+        self.assertEqual(self._drain(tailer), ["incompleta"])
+
+    def test_follows_rename_rotation(self):
+        self._append(self.log, "a")
+        tailer = self._tailer(from_start=True)
+        self.assertEqual(self._drain(tailer), ["a"])
+
+        self._append(self.log, "b")
+        os.rename(self.log, self.base / "openclaw.log.1")
+        self._append(self.log, "c")
+        self.assertEqual(self._drain(tailer), ["b", "c"])
+
+    def test_resume_finds_rotated_file_by_inode(self):
+        self._append(self.log, "a")
+        self.assertEqual(self._drain(self._tailer(from_start=True)), ["a"])
+        # Mientras el router estaba abajo: más líneas, rotación y archivo nuevo.
+        self._append(self.log, "b")
+        os.rename(self.log, self.base / "openclaw-old.log")
+        self._append(self.log, "c")
+        pattern = self.base / "openclaw*.log"
+        self.assertEqual(self._drain(self._tailer(pattern)), ["b", "c"])
+
+    def test_replaced_file_is_read_from_start(self):
+        self._append(self.log, "linea uno", "linea dos")
+        self.assertEqual(self._drain(self._tailer(from_start=True)), ["linea uno", "linea dos"])
+        self.log.unlink()
+        self._append(self.log, "otro contenido distinto")
+        self.assertEqual(self._drain(self._tailer()), ["otro contenido distinto"])
+
+
+if __name__ == "__main__":
+    unittest.main()
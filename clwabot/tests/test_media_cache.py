@@ -0,0 +1,160 @@
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from clwabot.core.decision import Decision
+from clwabot.hooks import whatsapp_listener
+from clwabot.hooks.fanout import deliver
+from clwabot.hooks.gateway_client import GatewayClient, GatewayRequestError
+from clwabot.hooks.gateway_stub import StubGateway
+from clwabot.hooks.media_cache import MediaCache
+
+OWNER = "+56954764325"
+VIP = "+56975551112"
+ICS = "BEGIN:VCALENDAR\nBEGIN:VEVENT\nSUMMARY:Reunión\nEND:VEVENT\nEND:VCALENDAR\n"
+
+
+class MediaCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.uploads = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _file(self, name, content=ICS):
+        path = self.dir / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def _upload(self, path):
+        self.uploads.append(path)
+        return f"h{len(self.uploads)}"
+
+    def test_same_content_uploads_once(self):
+        cache = MediaCache()
+        a, b = self._file("a.ics"), self._file("b.ics")
+        self.assertEqual(cache.handle_for(a, self._upload), "h1")
+        self.assertEqual(cache.handle_for(b, self._upload), "h1")
+        Path(a).write_text(ICS.replace("Reunión", "Otra"), encoding="utf-8")
+        self.assertEqual(cache.handle_for(a, self._upload), "h2")
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_ttl_and_lru_eviction(self):
+        cache = MediaCache(ttl_seconds=60, max_entries=2)
+        now = time.time()
+        paths = [self._file(f"{i}.ics", ICS + str(i)) for i in range(3)]
+        cache.handle_for(paths[0], self._upload, now=now)
+        cache.handle_for(paths[1], self._upload, now=now)
+        cache.handle_for(paths[0], self._upload, now=now + 1)  # 0 pasa a ser el más reciente
+        cache.handle_for(paths[2], self._upload, now=now + 2)  # desaloja 1
+        self.assertEqual(len(cache), 2)
+        cache.handle_for(paths[1], self._upload, now=now + 3)
+        self.assertEqual(len(self.uploads), 4)
+        self.assertEqual(cache.handle_for(paths[2], self._upload, now=now + 62), "h5")
+
+    def test_parallel_recipients_share_one_upload(self):
+        cache = MediaCache()
+        path = self._file("a.ics")
+
+        def slow_upload(p):
+            time.sleep(0.05)
+            return self._upload(p)
+
+        handles = []
+        threads = [threading.Thread(target=lambda: handles.append(cache.handle_for(path, slow_upload))) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(handles, ["h1"] * 4)
+        self.assertEqual(len(self.uploads), 1)
+
+    def test_caller_arriving_while_the_handle_is_stored_does_not_upload_again(self):
+        cache = MediaCache()
+        path = self._file("a.ics")
+        store = cache._store
+        handles = []
+        late = threading.Thread(target=lambda: handles.append(cache.handle_for(path, self._upload)))
+
+        def store_with_late_caller(key, entry, now):
+            # Otro envío llega justo cuando el primero termina de subir.
+            late.start()
+            late.join(0.2)
+            store(key, entry, now)
+
+        cache._store = store_with_late_caller
+        self.assertEqual(cache.handle_for(path, self._upload), "h1")
+        late.join()
+        self.assertEqual(handles, ["h1"])
+        self.assertEqual(len(self.uploads), 1)
+
+    def test_unsupported_upload_falls_back_to_path(self):
+        cache = MediaCache()
+
+        def reject(path):
+            raise GatewayRequestError("unknown method media.upload")
+
+        path = self._file("a.ics")
+        self.assertEqual(cache.handle_for(path, reject), "")
+        self.assertEqual(cache.handle_for(path, self._upload), "")
+        self.assertEqual(self.uploads, [])
+
+
+class ListenerMediaTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stub = StubGateway().start()
+        self._orig_cache = whatsapp_listener._MEDIA_CACHE
+        whatsapp_listener._MEDIA_CACHE = MediaCache()
+        whatsapp_listener.set_gateway_client(GatewayClient(self.stub.url))
+
+    def tearDown(self):
+        whatsapp_listener.set_gateway_client(None)
+        whatsapp_listener._MEDIA_CACHE = self._orig_cache
+        self.stub.close()
+        self.tmp.cleanup()
+
+    def test_ics_is_uploaded_once_for_several_sends(self):
+        path = Path(self.tmp.name) / "evento.ics"
+        path.write_text(ICS, encoding="utf-8")
+        for target in ("+56975551112", "+56954764325", "+56975551112"):
+            self.assertTrue(whatsapp_listener.send_whatsapp_with_ics(target, "evento", str(path)))
+
+        self.assertEqual(len(self.stub.uploads), 1)
+        self.assertEqual(self.stub.uploads[0]["fileName"], "evento.ics")
+        self.assertEqual({m.get("mediaId") for m in self.stub.messages}, {"media-1"})
+        self.assertNotIn("mediaPath", self.stub.messages[0])
+
+    def test_shared_ics_reaches_vip_and_owner_with_one_upload(self):
+        path = Path(self.tmp.name) / "reunion.ics"
+        path.write_text(ICS, encoding="utf-8")
+        decision = Decision.make(
+            OWNER,
+            VIP,
+            policy="reply_to_vip",
+            target_msisdn=VIP,
+            message="listo",
+            owner_message="agendado",
+            vip_ics_path=str(path),
+            owner_ics_path=str(path),
+        )
+        report = deliver(
+            decision.actions,
+            send=whatsapp_listener.deliver_message,
+            schedule=lambda target, message, delay_sec: None,
+        )
+
+        self.assertTrue(all(result.ok for result in report.results))
+        self.assertEqual(len(self.stub.uploads), 1)
+        self.assertEqual(
+            sorted((m["to"], m.get("mediaId")) for m in self.stub.messages),
+            [(OWNER, "media-1"), (VIP, "media-1")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,7 @@ import tempfile
 import unittest
 from pathlib import Path
 
-from clwabot.core import ics_maker, meeting_session, whatsapp_agent
+from clwabot.core import calendar_sync, ics_maker, meeting_session, metrics_log, state_store, whatsapp_agent
 
 
 CONTACT = "+11111111111"
@@ -18,12 +18,21 @@ class MeetingFlowTests(unittest.TestCase):
 
         self.orig_sessions = meeting_session.SESSIONS_PATH
         self.orig_cal = ics_maker.CAL_DIR
+        self.orig_state = state_store.STATE_PATH
+        self.orig_metrics = metrics_log.METRICS_DIR
+        self.orig_queue = calendar_sync.QUEUE_PATH
         meeting_session.SESSIONS_PATH = self.sessions_path
         ics_maker.CAL_DIR = self.calendar_dir
+        state_store.STATE_PATH = self.base / "state.json"
+        metrics_log.METRICS_DIR = self.base / "metrics"
+        calendar_sync.QUEUE_PATH = self.base / "google_calendar_queue.json"
 
     def tearDown(self):
         meeting_session.SESSIONS_PATH = self.orig_sessions
         ics_maker.CAL_DIR = self.orig_cal
+        state_store.STATE_PATH = self.orig_state
+        metrics_log.METRICS_DIR = self.orig_metrics
+        calendar_sync.QUEUE_PATH = self.orig_queue
         self.tmp.cleanup()
 
     def _send(self, text: str):
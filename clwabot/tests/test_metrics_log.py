@@ -0,0 +1,110 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import metrics_log, reporter, state_store
+from clwabot.core.state_db import close_state_db
+
+
+def _at(days_ago: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).isoformat()
+
+
+class MetricsLogTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name) / "metrics"
+        self.patches = [
+            mock.patch.object(metrics_log, "METRICS_DIR", self.dir),
+            mock.patch.object(state_store, "STATE_PATH", Path(self.tmp.name) / "state.json"),
+            mock.patch.object(state_store, "STATE_BACKEND", "json"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def test_daily_segments_and_incremental_index(self):
+        metrics_log.append_events(
+            [
+                {"at": "2026-02-21T23:59:00+00:00", "kind": "inbound", "intent": "meeting"},
+                {"at": "2026-02-22T00:01:00+00:00", "kind": "inbound", "intent": "general"},
+                {"at": "2026-02-22T08:00:00+00:00", "kind": "scripted_reply"},
+            ]
+        )
+        self.assertEqual(metrics_log.days(), ["2026-02-21", "2026-02-22"])
+        index = metrics_log.day_index("2026-02-22")
+        self.assertEqual((index["count"], index["kinds"]), (2, {"inbound": 1, "scripted_reply": 1}))
+
+        covered = index["bytes"]
+        metrics_log.append_events([{"at": "2026-02-22T09:00:00+00:00", "kind": "inbound", "intent": "meeting"}])
+        with mock.patch.object(metrics_log.json, "loads", wraps=json.loads) as loads:
+            index = metrics_log.day_index("2026-02-22")
+        # Índice + solo la línea nueva.
+        self.assertEqual(loads.call_count, 2)
+        self.assertGreater(index["bytes"], covered)
+        total = metrics_log.summary()
+        self.assertEqual(total["count"], 4)
+        self.assertEqual(total["intents"], {"meeting": 2, "general": 1})
+        self.assertEqual([ev["at"][:10] for ev in metrics_log.recent_events(2)], ["2026-02-22"] * 2)
+
+    def test_window_reads_only_covering_segments(self):
+        ages = (0, 0.5, 3, 9, 30)
+        metrics_log.append_events(
+            [{"at": _at(d), "kind": "inbound", "msisdn": f"+56900000{n}"} for n, d in enumerate(ages)]
+        )
+        with mock.patch.object(metrics_log, "_read_segment", wraps=metrics_log._read_segment) as read:
+            events = reporter._events_since(24)
+        self.assertEqual(sorted(ev["msisdn"] for ev in events), ["+569000000", "+569000001"])
+        self.assertLessEqual(read.call_count, 2)
+        self.assertEqual(len(list(metrics_log.iter_events(since=datetime.now(timezone.utc) - timedelta(days=10)))), 4)
+        self.assertEqual(metrics_log.event_count(), 5)
+
+    def test_state_writes_events_to_log_and_migrates_legacy_json(self):
+        legacy = state_store.default_state()
+        legacy["metrics"]["events"] = [{"at": _at(2), "kind": "inbound"}, {"at": _at(1), "kind": "meeting_flow_reply"}]
+        state_store.STATE_PATH.write_text(json.dumps(legacy), encoding="utf-8")
+        before = state_store.STATE_PATH.read_bytes()
+
+        # Leer no escribe: los eventos antiguos salen al log con el próximo guardado.
+        state = state_store.load_state()
+        self.assertEqual(len(state["metrics"]["events"]), 2)
+        self.assertEqual(state_store.STATE_PATH.read_bytes(), before)
+        self.assertEqual(metrics_log.event_count(), 0)
+        state_store.add_metric_event(state, {"kind": "scripted_reply"})
+        state_store.save_state(state)
+        state_store.record_metric_events([{"kind": "inbound_throttled", "dropped": 2}])
+        state_store.load_state()
+
+        on_disk = json.loads(state_store.STATE_PATH.read_text(encoding="utf-8"))
+        self.assertEqual(on_disk["metrics"]["events"], [])
+        kinds = [ev["kind"] for ev in metrics_log.iter_events()]
+        self.assertEqual(kinds, ["inbound", "meeting_flow_reply", "scripted_reply", "inbound_throttled"])
+
+    def test_sqlite_migration_moves_legacy_events_once(self):
+        legacy = state_store.default_state()
+        legacy["metrics"]["events"] = [{"at": _at(1), "kind": "inbound"}]
+        state_store.STATE_PATH.write_text(json.dumps(legacy), encoding="utf-8")
+        db_path = Path(self.tmp.name) / "state.sqlite3"
+        with mock.patch.object(state_store, "STATE_BACKEND", "sqlite"), mock.patch.object(
+            state_store, "STATE_DB_PATH", db_path
+        ):
+            try:
+                state_store.load_state()
+                state_store.load_state()
+            finally:
+                close_state_db()
+        self.assertEqual([ev["kind"] for ev in metrics_log.iter_events()], ["inbound"])
+        on_disk = json.loads(state_store.STATE_PATH.read_text(encoding="utf-8"))
+        self.assertEqual(on_disk["metrics"]["events"], [])
+        self.assertEqual(state_store.migrate_legacy_metrics(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
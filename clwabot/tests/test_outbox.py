@@ -0,0 +1,161 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from clwabot.core import outbox as outbox_mod
+from clwabot.core.outbox import MAX_ATTEMPTS, Outbox, OutboxDrainer, backoff_delay, digest_message, outbox_key
+from clwabot.hooks import gateway_client, whatsapp_listener
+from clwabot.hooks.gateway_client import GatewayClient
+from clwabot.hooks.gateway_stub import StubGateway
+
+
+class OutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(Path(self.tmp.name) / "outbox.sqlite3")
+
+    def tearDown(self):
+        self.outbox.close()
+        self.tmp.cleanup()
+
+    def test_enqueue_is_idempotent_per_key(self):
+        key = outbox_key("id:ABC", "+56911111111", "hola")
+        self.assertTrue(self.outbox.enqueue(key, "+56911111111", "hola"))
+        self.assertFalse(self.outbox.enqueue(key, "+56911111111", "hola"))
+        self.assertNotEqual(key, outbox_key("id:ABD", "+56911111111", "hola"))
+        self.assertEqual(self.outbox.counts(), {"pending": 1})
+
+    def test_failures_back_off_until_dead_and_requeue(self):
+        now = time.time()
+        self.outbox.enqueue("k1", "+56911111111", "hola", now=now)
+        self.assertTrue(self.outbox.claim("k1", now=now))
+        self.assertFalse(self.outbox.claim("k1", now=now))
+
+        self.assertEqual(self.outbox.mark_failed("k1", "cli falló", now=now), "pending")
+        item = self.outbox.get("k1")
+        self.assertGreater(item.next_attempt_ts, now)
+        self.assertEqual(self.outbox.claim_due(now=now), [])
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            status = self.outbox.mark_failed("k1", "cli falló", now=now)
+        self.assertEqual(status, "dead")
+        self.assertEqual([i.key for i in self.outbox.undelivered()], ["k1"])
+        self.assertTrue(self.outbox.requeue("k1"))
+        self.assertEqual(self.outbox.get("k1").attempts, 0)
+
+    def test_backoff_grows_with_jitter_and_cap(self):
+        self.assertEqual(backoff_delay(1, rng=lambda: 0.0), outbox_mod.BACKOFF_BASE_SECONDS / 2)
+        self.assertEqual(backoff_delay(3, rng=lambda: 1.0), outbox_mod.BACKOFF_BASE_SECONDS * 4)
+        self.assertLessEqual(backoff_delay(50, rng=lambda: 1.0), outbox_mod.BACKOFF_CAP_SECONDS)
+
+    def test_drainer_sends_due_items_by_priority_and_reclaims_expired_lease(self):
+        now = time.time()
+        self.outbox.enqueue("later", "+56911111111", "diferido", delay_sec=120, now=now)
+        self.outbox.enqueue("normal", "+56911111111", "respuesta", now=now)
+        self.outbox.enqueue("critical", "+56954764325", "alerta", priority=0, now=now)
+        self.outbox.enqueue("stuck", "+56911111111", "colgado", now=now)
+        self.assertTrue(self.outbox.claim("stuck", now=now))
+
+        sent = []
+        drainer = OutboxDrainer(self.outbox, lambda t, m, p, k: sent.append(m) or ("gateway", True))
+        self.assertEqual(drainer.drain_once(now=now), 2)
+        self.assertEqual(sent, ["alerta", "respuesta"])
+
+        drainer.drain_once(now=now + outbox_mod.LEASE_SECONDS + 121)
+        self.assertEqual(sorted(sent[2:]), ["colgado", "diferido"])
+        self.assertEqual(self.outbox.counts(), {"delivered": 4})
+
+    def test_coalesced_items_go_out_as_one_digest_per_window(self):
+        now = time.time()
+        self.assertIsNone(self.outbox.coalesce_due("owner:+569", 10, now=now))
+        self.outbox.enqueue("a", "+569", "alerta 1", batch_key="owner:+569", now=now)
+        self.outbox.mark_delivered("a", "gateway", now=now)
+
+        due = self.outbox.coalesce_due("owner:+569", 10, now=now + 3)
+        self.assertEqual(due, now + 10)
+        self.outbox.enqueue("b", "+569", "alerta 2", batch_key="owner:+569", delay_sec=7, now=now + 3)
+        self.assertEqual(self.outbox.coalesce_due("owner:+569", 10, now=now + 8), now + 10)
+        self.outbox.enqueue("c", "+569", "alerta 3", batch_key="owner:+569", delay_sec=2, now=now + 8)
+
+        sent = []
+        drainer = OutboxDrainer(self.outbox, lambda t, m, p, k: sent.append(m) or ("gateway", True))
+        self.assertEqual(drainer.drain_once(now=now + 5), 0)
+        self.assertEqual(drainer.drain_once(now=now + 10), 2)
+        self.assertEqual(sent, [digest_message(["alerta 2", "alerta 3"])])
+        self.assertIn("2 alertas agrupadas", sent[0])
+        self.assertEqual(self.outbox.get("c").transport, "gateway+digest")
+
+
+class ListenerOutboxTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.outbox = Outbox(Path(self.tmp.name) / "outbox.sqlite3")
+        self.exit_code = 1
+        self.cli_calls = []
+        self._orig = (whatsapp_listener.run_cmd, gateway_client.GATEWAY_URL)
+        whatsapp_listener.run_cmd = lambda cmd: self.cli_calls.append(cmd) or self.exit_code
+        gateway_client.GATEWAY_URL = ""
+        whatsapp_listener.set_gateway_client(None)
+        whatsapp_listener.set_outbox(self.outbox)
+
+    def tearDown(self):
+        whatsapp_listener.run_cmd, gateway_client.GATEWAY_URL = self._orig
+        whatsapp_listener.set_outbox(None)
+        self.outbox.close()
+        self.tmp.cleanup()
+
+    def test_failed_send_stays_queued_and_is_not_duplicated(self):
+        send = whatsapp_listener._durable_send(self.outbox, "id:XYZ", "+56975551112", "reply_to_vip", "critical")
+        self.assertEqual(send("+56954764325", "alerta", ""), ("cli", False))
+        item = self.outbox.get(outbox_key("id:XYZ", "+56954764325", "alerta"))
+        self.assertEqual((item.status, item.attempts, item.priority), ("pending", 1, 0))
+
+        # Re-proceso de la misma decisión mientras espera backoff: no reenvía.
+        self.assertEqual(send("+56954764325", "alerta", ""), ("outbox", False))
+        self.assertEqual(len(self.cli_calls), 1)
+
+        self.exit_code = 0
+        drainer = OutboxDrainer(self.outbox, whatsapp_listener.deliver_message)
+        self.assertEqual(drainer.drain_once(now=item.next_attempt_ts + 1), 1)
+        self.assertEqual(send("+56954764325", "alerta", ""), ("duplicate", True))
+        self.assertEqual(len(self.cli_calls), 2)
+
+    def test_lost_ack_is_retried_with_the_same_key_and_sent_once(self):
+        stub = StubGateway().start()
+        try:
+            whatsapp_listener.set_gateway_client(GatewayClient(stub.url))
+            stub.drop_next_acks(1)
+            send = whatsapp_listener._durable_send(self.outbox, "id:ACK", "+56975551112", "reply_to_vip", "")
+            self.assertEqual(send("+56975551112", "catálogo", ""), ("gateway", False))
+            key = outbox_key("id:ACK", "+56975551112", "catálogo")
+            item = self.outbox.get(key)
+            self.assertEqual((item.status, item.attempts), ("pending", 1))
+
+            drainer = OutboxDrainer(self.outbox, whatsapp_listener.deliver_message)
+            self.assertEqual(drainer.drain_once(now=item.next_attempt_ts + 1), 1)
+        finally:
+            whatsapp_listener.set_gateway_client(None)
+            stub.close()
+        self.assertEqual(self.outbox.get(key).status, "delivered")
+        # El gateway vio la clave dos veces pero entregó una sola; nada por el CLI.
+        self.assertEqual([m["idempotencyKey"] for m in stub.messages], [key])
+        self.assertEqual(self.cli_calls, [])
+
+    def test_owner_alerts_coalesce_but_critical_bypasses_window(self):
+        self.exit_code = 0
+        drainer = OutboxDrainer(self.outbox, whatsapp_listener.deliver_message)
+        whatsapp_listener.set_outbox(self.outbox, drainer, owner_coalesce_sec=30)
+        owner = whatsapp_listener.OWNER_MSISDN
+
+        normal = whatsapp_listener._durable_send(self.outbox, "id:1", "+56911111111", "alert_owner", "")
+        self.assertEqual(normal(owner, "reunión 1", ""), ("cli", True))
+        self.assertEqual(normal(owner, "reunión 2", ""), ("coalesced", True))
+        critical = whatsapp_listener._durable_send(self.outbox, "id:2", "+56975551112", "reply_to_vip", "critical")
+        self.assertEqual(critical(owner, "🚨 URGENCIA", ""), ("cli", True))
+        self.assertEqual(len(self.cli_calls), 2)
+        self.assertEqual(self.outbox.counts(), {"delivered": 2, "pending": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
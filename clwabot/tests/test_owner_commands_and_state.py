@@ -2,7 +2,7 @@ import tempfile
 import unittest
 from pathlib import Path
 
-from clwabot.core import oscp_agent, state_store, whatsapp_agent
+from clwabot.core import metrics_log, oscp_agent, state_store, whatsapp_agent
 
 
 OWNER = "+56954764325"
@@ -16,7 +16,9 @@ class OwnerCommandStateTests(unittest.TestCase):
         self.oscp_path = Path(self.tmp.name) / "oscp.yaml"
         self.orig_state_path = state_store.STATE_PATH
         self.orig_oscp_path = oscp_agent.CONFIG_OSCP
+        self.orig_metrics_dir = metrics_log.METRICS_DIR
         state_store.STATE_PATH = self.state_path
+        metrics_log.METRICS_DIR = Path(self.tmp.name) / "metrics"
         oscp_agent.CONFIG_OSCP = self.oscp_path
         self.oscp_path.write_text(
             (
@@ -39,6 +41,7 @@ class OwnerCommandStateTests(unittest.TestCase):
     def tearDown(self):
         state_store.STATE_PATH = self.orig_state_path
         oscp_agent.CONFIG_OSCP = self.orig_oscp_path
+        metrics_log.METRICS_DIR = self.orig_metrics_dir
         self.tmp.cleanup()
 
     def test_owner_pause_resume(self):
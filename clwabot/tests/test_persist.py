@@ -0,0 +1,65 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import persist
+from clwabot.core.persist import COALESCER, backup_path, flush, read_json, write_json
+
+
+class PersistTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "store.json"
+
+    def tearDown(self):
+        flush()
+        self.tmp.cleanup()
+
+    def _disk(self, path=None):
+        return json.loads((path or self.path).read_text(encoding="utf-8"))
+
+    def test_atomic_write_keeps_backup_and_recovers_from_corruption(self):
+        write_json(self.path, {"v": 1})
+        with mock.patch.object(persist, "FSYNC_POLICY", "always"):
+            write_json(self.path, {"v": 2})
+        self.assertEqual(self._disk(backup_path(self.path)), {"v": 1})
+
+        # Crash a mitad de escritura: el archivo queda intacto y sin temporales.
+        with mock.patch.object(persist.os, "replace", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                write_json(self.path, {"v": 3})
+        self.assertEqual(self._disk(), {"v": 2})
+        self.assertEqual(sorted(p.name for p in self.path.parent.iterdir()), ["store.json", "store.json.bak"])
+
+        self.path.write_text('{"v": 2, "sessions": [', encoding="utf-8")
+        with mock.patch("sys.stderr"):
+            self.assertEqual(read_json(self.path, dict), {"v": 1})
+        self.assertTrue(self.path.with_name("store.json.corrupt").exists())
+        # El archivo corrupto no pisa el respaldo bueno.
+        write_json(self.path, {"v": 4})
+        self.assertEqual(self._disk(backup_path(self.path)), {"v": 1})
+        self.assertEqual(read_json(Path(self.tmp.name) / "missing.json", lambda: {"default": True}), {"default": True})
+
+    def test_bursts_are_coalesced_into_one_flush(self):
+        flushes = COALESCER.flushes
+        for n in range(50):
+            write_json(self.path, {"n": n}, debounce=30)
+        self.assertFalse(self.path.exists())
+        # Las lecturas del proceso ven lo pendiente.
+        self.assertEqual(read_json(self.path, dict), {"n": 49})
+
+        flush(self.path)
+        self.assertEqual(self._disk(), {"n": 49})
+        self.assertEqual(COALESCER.flushes - flushes, 1)
+
+        # Una escritura inmediata reemplaza la pendiente.
+        write_json(self.path, {"n": 50}, debounce=30)
+        write_json(self.path, {"n": 51}, debounce=0)
+        flush()
+        self.assertEqual(self._disk(), {"n": 51})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from clwabot.core import metrics_log, state_store
+from clwabot.hooks import whatsapp_listener
+from clwabot.hooks.inbound_event import InboundEvent
+from clwabot.hooks.rate_limit import DEFAULT_LIMITS, RateLimit, TokenBucketLimiter, load_limits
+from clwabot.hooks.whatsapp_router_watch import _route_stream
+from clwabot.tests.helpers import RecordingDispatcher
+
+
+class TokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self._orig_state = state_store.STATE_PATH, metrics_log.METRICS_DIR
+        state_store.STATE_PATH = self.dir / "state.json"
+        metrics_log.METRICS_DIR = self.dir / "metrics"
+
+    def tearDown(self):
+        state_store.STATE_PATH, metrics_log.METRICS_DIR = self._orig_state
+        self.tmp.cleanup()
+
+    def test_burst_then_refill(self):
+        limiter = TokenBucketLimiter(limits={"other": RateLimit(per_minute=60, burst=3)})
+        now = time.time()
+        results = [limiter.allow("+19990000001", "other", now=now) for _ in range(5)]
+        self.assertEqual(results, [True, True, True, False, False])
+        # Otro contacto tiene su propio balde.
+        self.assertTrue(limiter.allow("+19990000002", "other", now=now))
+        # 60/min = una ficha por segundo.
+        self.assertTrue(limiter.allow("+19990000001", "other", now=now + 1.0))
+        self.assertFalse(limiter.allow("+19990000001", "other", now=now + 1.5))
+
+    def test_limits_per_role_from_contacts_yaml(self):
+        cfg = self.dir / "contacts.yaml"
+        cfg.write_text("rate_limits:\n  owner: {per_minute: 0}\n  vip: {per_minute: 10, burst: 2}\n", encoding="utf-8")
+        limits = load_limits(cfg)
+        self.assertTrue(limits["owner"].unlimited)
+        self.assertEqual(limits["vip"], RateLimit(per_minute=10, burst=2))
+        self.assertEqual(limits["other"], load_limits(self.dir / "missing.yaml")["other"])
+
+        limiter = TokenBucketLimiter(limits=limits)
+        self.assertTrue(all(limiter.allow("+56954764325", "owner") for _ in range(100)))
+        self.assertEqual(len(limiter), 0)
+
+    def test_flush_persists_buckets_and_records_aggregated_metric(self):
+        path = self.dir / "rate_limits.json"
+        limits = {"other": RateLimit(per_minute=1, burst=2)}
+        limiter = TokenBucketLimiter(limits=limits, persist_path=path, flush_interval=3600)
+        now = time.time()
+        for _ in range(6):
+            limiter.allow("+19990000001", "other", now=now)
+        limiter.flush(now=now)
+
+        events = list(metrics_log.iter_events())
+        self.assertEqual([(e["kind"], e["dropped"]) for e in events], [("inbound_throttled", 4)])
+        # Tras reiniciar, el flood sigue sin fichas.
+        reloaded = TokenBucketLimiter(limits=limits, persist_path=path)
+        self.assertFalse(reloaded.allow("+19990000001", "other", now=now + 1))
+
+
+    def test_processes_sharing_the_file_merge_spent_tokens(self):
+        path = self.dir / "rate_limits.json"
+        limits = {"other": RateLimit(per_minute=1, burst=4)}
+        now = time.time()
+        # Dos listeners (modo subprocess) cargan el mismo archivo a la vez.
+        first = TokenBucketLimiter(limits=limits, persist_path=path, flush_interval=3600)
+        second = TokenBucketLimiter(limits=limits, persist_path=path, flush_interval=3600)
+        for limiter in (first, second):
+            self.assertTrue(limiter.allow("+19990000001", "other", now=now))
+            self.assertTrue(limiter.allow("+19990000001", "other", now=now))
+        first.flush(now=now)
+        second.flush(now=now)
+
+        # El segundo flush no pisa al primero: se gastaron las 4 fichas.
+        third = TokenBucketLimiter(limits=limits, persist_path=path)
+        self.assertFalse(third.allow("+19990000001", "other", now=now))
+        self.assertFalse(second.allow("+19990000001", "other", now=now))
+
+
+class ListenerRateLimitTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+        self._orig = (whatsapp_listener.handle_incoming, whatsapp_listener.PRESENCE_PATH)
+        whatsapp_listener.handle_incoming = lambda msisdn, text: self.calls.append(text) or {"policy": "owner"}
+        whatsapp_listener.PRESENCE_PATH = Path(self.tmp.name) / "presence.json"
+        whatsapp_listener.set_rate_limiter(TokenBucketLimiter(limits={"owner": RateLimit(per_minute=1, burst=2)}))
+
+    def tearDown(self):
+        whatsapp_listener.handle_incoming, whatsapp_listener.PRESENCE_PATH = self._orig
+        whatsapp_listener.set_rate_limiter(None)
+        self.tmp.cleanup()
+
+    def test_flood_is_cut_before_handle_incoming(self):
+        for idx in range(5):
+            whatsapp_listener.process_inbound(whatsapp_listener.OWNER_MSISDN, f"mensaje {idx}")
+        self.assertEqual(self.calls, ["mensaje 0", "mensaje 1"])
+
+    def test_router_event_was_already_charged(self):
+        event = InboundEvent(msisdn=whatsapp_listener.OWNER_MSISDN, text="x")
+        for idx in range(5):
+            whatsapp_listener.process_inbound(whatsapp_listener.OWNER_MSISDN, f"mensaje {idx}", event=event)
+        self.assertEqual(len(self.calls), 5)
+
+
+class RouterRateLimitTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._orig_state = state_store.STATE_PATH, metrics_log.METRICS_DIR
+        state_store.STATE_PATH = Path(self.tmp.name) / "state.json"
+        metrics_log.METRICS_DIR = Path(self.tmp.name) / "metrics"
+        whatsapp_listener.set_rate_limiter(TokenBucketLimiter(limits=dict(DEFAULT_LIMITS)))
+
+    def tearDown(self):
+        whatsapp_listener.set_rate_limiter(None)
+        state_store.STATE_PATH, metrics_log.METRICS_DIR = self._orig_state
+        self.tmp.cleanup()
+
+    def _route(self, msisdn, count):
+        lines = [f'[whatsapp] inbound message from {msisdn}: "mensaje {idx}"' for idx in range(count)]
+        dispatcher = RecordingDispatcher()
+        _route_stream(lines, dispatcher, allow=whatsapp_listener.allow_inbound)
+        return dispatcher.calls
+
+    def test_flood_is_shed_before_the_lane(self):
+        calls = self._route("+19990000001", 10)
+        self.assertEqual(len(calls), DEFAULT_LIMITS["other"].burst)
+
+    def test_owner_and_vip_are_unlimited_by_default(self):
+        self.assertEqual(len(self._route(whatsapp_listener.OWNER_MSISDN, 50)), 50)
+        self.assertEqual(len(self._route(whatsapp_listener.VIP_MSISDN, 50)), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,36 @@
+import io
+import json
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
+from pathlib import Path
+from unittest import mock
 
-from clwabot.hooks.whatsapp_router_watch import _is_plain_metadata_only, parse_inbound_line
+from clwabot.core import metrics_log
+from clwabot.hooks import dispatcher as dispatcher_mod
+from clwabot.hooks.dispatcher import (
+    DelayScheduler,
+    DispatchJob,
+    InProcessDispatcher,
+    ShedRecorder,
+    SubprocessDispatcher,
+    gate_request_line,
+    lane_key,
+)
+from clwabot.hooks.fanout import DeliveryReport
+from clwabot.hooks.inbound_event import InboundEvent
+from clwabot.hooks import whatsapp_listener
+from clwabot.hooks.whatsapp_router_watch import (
+    _is_plain_metadata_only,
+    _route_stream,
+    run_batch,
+    is_inbound_candidate,
+    parse_inbound_bytes,
+    parse_inbound_line,
+)
+from clwabot.tests.helpers import RecordingDispatcher
 
 
 class RouterWatchTests(unittest.TestCase):
@@ -41,10 +71,361 @@ class RouterWatchTests(unittest.TestCase):
         self.assertEqual(msg.msisdn, "+56911111111")
         self.assertEqual(msg.text, "hola mundo")
 
+    def test_prefilter_rejects_noise_and_outbound(self):
+        self.assertFalse(is_inbound_candidate(b'{"0":"{\\"subsystem\\":\\"gateway/ws\\"}","1":"res ok"}'))
+        self.assertFalse(is_inbound_candidate(b'[whatsapp] outbound message to +56911111111: "ok"'))
+        self.assertTrue(is_inbound_candidate(b"[whatsapp] Inbound message +56975551112 -> +56954764325"))
+
+    def test_parse_bytes_matches_text_parser(self):
+        raw = '[whatsapp] inbound message from +56911111111: "reunión mañana"\n'.encode("utf-8")
+        msg = parse_inbound_bytes(raw)
+        self.assertIsNotNone(msg)
+        assert msg is not None
+        self.assertEqual((msg.msisdn, msg.text), ("+56911111111", "reunión mañana"))
+        self.assertIsNone(parse_inbound_bytes(b"\xff\xfe inbound basura sin tag"))
+        self.assertIsNone(parse_inbound_line('["inbound", "lista json"]'))
+
+    def test_parse_legacy_metadata_line_uses_first_phone(self):
+        text = "2026-02-22T14:20:21.952Z [whatsapp] Inbound message +56975551112 -> +56954764325 (direct, text, 8 chars)"
+        msg = parse_inbound_line(text)
+        self.assertIsNotNone(msg)
+        assert msg is not None
+        self.assertEqual(msg.msisdn, "+56975551112")
+
+    def test_inbound_marker_is_case_insensitive(self):
+        line = '[whatsapp] InBound message from +56911111111: "hola"'
+        self.assertTrue(is_inbound_candidate(line.encode("utf-8")))
+        for msg in (parse_inbound_line(line), parse_inbound_bytes(line.encode("utf-8"))):
+            self.assertIsNotNone(msg)
+            assert msg is not None
+            self.assertEqual((msg.msisdn, msg.text), ("+56911111111", "hola"))
+
     def test_detect_plain_metadata_line(self):
         text = "2026-02-22T14:20:21.952Z [whatsapp] Inbound message +56975551112 -> +56954764325 (direct, text, 8 chars)"
         self.assertTrue(_is_plain_metadata_only(text))
 
 
+class InProcessDispatcherTests(unittest.TestCase):
+    def test_route_stream_dedups_and_dispatches(self):
+        line = '[whatsapp] inbound message from +56911111111: "hola"\n'
+        stream = io.StringIO("ruido sin inbound\n" + line + line)
+        dispatcher = RecordingDispatcher()
+        _route_stream(stream, dispatcher)
+        self.assertEqual(dispatcher.calls, [("+56911111111", "hola")])
+
+    def test_gate_is_rescheduled_in_process(self):
+        calls = []
+        lock = threading.Lock()
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            with lock:
+                calls.append((msisdn, text, deferred_auto, trigger_ts))
+            if not deferred_auto:
+                gate_scheduler(msisdn, text, 123)
+            return 0
+
+        dispatcher = InProcessDispatcher(workers=2, handler=handler, grace_seconds=0)
+        dispatcher.submit("+56911111111", "quiero agendar")
+        dispatcher.close(wait=True)
+        self.assertIn(("+56911111111", "quiero agendar", False, 0), calls)
+        self.assertIn(("+56911111111", "quiero agendar", True, 123), calls)
+
+    def test_same_contact_runs_in_order_other_contacts_in_parallel(self):
+        running = {}
+        overlaps = []
+        order = []
+        lock = threading.Lock()
+        gate = threading.Event()
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            key = lane_key(msisdn)
+            with lock:
+                if running.get(key):
+                    overlaps.append(key)
+                running[key] = True
+                order.append((key, text))
+            if text == "bloquea":
+                gate.wait(2)
+            time.sleep(0.01)
+            with lock:
+                running[key] = False
+            return 0
+
+        dispatcher = InProcessDispatcher(workers=4, handler=handler, grace_seconds=0)
+        dispatcher.submit("+56911111111", "bloquea")
+        dispatcher.submit("56911111111", "1")
+        dispatcher.submit("+56911111111", "confirmar")
+        self.assertEqual(dispatcher.lane_depths(), {"56911111111": 3})
+        # Otro contacto avanza aunque el primer carril esté bloqueado.
+        dispatcher.submit("+56922222222", "hola")
+        deadline = time.time() + 2
+        while ("56922222222", "hola") not in order and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIn(("56922222222", "hola"), order)
+        gate.set()
+        dispatcher.close(wait=True)
+
+        first_lane = [text for key, text in order if key == "56911111111"]
+        self.assertEqual(first_lane, ["bloquea", "1", "confirmar"])
+        self.assertEqual(overlaps, [])
+        self.assertEqual(dispatcher.stats()["processed"], 4)
+        self.assertEqual(dispatcher.stats()["max_lane_depth_seen"], 3)
+
+    def test_delivery_metrics_are_batched_by_the_dispatcher(self):
+        report = DeliveryReport(msisdn="+56911111111", policy="reply_to_vip")
+        with mock.patch.object(dispatcher_mod, "record_metric_events") as batched, mock.patch.object(
+            whatsapp_listener, "record_metric_events"
+        ) as direct:
+            dispatcher = InProcessDispatcher(workers=1, latency_metrics=False, log_dispatch=False)
+            for _ in range(3):
+                whatsapp_listener._record_delivery(report)
+            dispatcher.close()
+            direct.assert_not_called()
+            self.assertEqual([len(call.args[0]) for call in batched.call_args_list], [3])
+            # Sin dispatcher vivo, un listener suelto escribe directo.
+            whatsapp_listener._record_delivery(report)
+            direct.assert_called_once()
+
+
+class SubprocessDispatcherTests(unittest.TestCase):
+    def test_child_gate_request_is_requeued_in_the_contact_lane(self):
+        cmds = []
+
+        def fake_run(cmd, **kwargs):
+            cmds.append(cmd)
+            out = "log del hijo\n"
+            if "--deferred-auto" not in cmd:
+                out += gate_request_line(cmd[4], cmd[6], 123) + "\n"
+            return subprocess.CompletedProcess(cmd, 0, stdout=out)
+
+        with mock.patch.object(dispatcher_mod.subprocess, "run", fake_run), mock.patch("builtins.print"):
+            dispatcher = SubprocessDispatcher(workers=2, grace_seconds=0)
+            dispatcher.submit("+56911111111", "quiero agendar\nmañana")
+            dispatcher.close(wait=True)
+        self.assertEqual(len(cmds), 2)
+        # La ficha ya la cobró el router: el hijo no la vuelve a cobrar.
+        self.assertEqual(cmds[0][-2:], ["--emit-gate", "--no-rate-limit"])
+        self.assertEqual(cmds[1][6], "quiero agendar\nmañana")
+        self.assertEqual(cmds[1][7:], ["--deferred-auto", "--trigger-ts", "123", "--emit-gate", "--no-rate-limit"])
+
+
+class InboundEventTests(unittest.TestCase):
+    def _structured(self, msg_id: str, body: str) -> str:
+        return (
+            '{"0":"{\\"module\\":\\"web-inbound\\"}",'
+            '"1":{"from":"+56911111111","to":"+56922222222","body":"' + body + '",'
+            '"id":"' + msg_id + '","timestamp":1771770028000,"chatType":"direct","mediaType":"image"},'
+            '"2":"inbound message"}\n'
+        )
+
+    def test_structured_payload_keeps_gateway_metadata(self):
+        event = parse_inbound_line(self._structured("3EB0AA", "hola").strip())
+        self.assertIsInstance(event, InboundEvent)
+        assert event is not None
+        self.assertEqual(event.message_id, "3EB0AA")
+        self.assertEqual(event.received_ts, 1771770028.0)
+        self.assertEqual(event.chat_type, "direct")
+        self.assertTrue(event.has_media)
+
+    def test_message_id_is_the_dedup_key(self):
+        # Mismo texto con ids distintos son dos mensajes; el mismo id repetido no.
+        stream = io.StringIO(
+            self._structured("3EB0AA", "ok") + self._structured("3EB0BB", "ok") + self._structured("3EB0AA", "ok")
+        )
+        dispatcher = RecordingDispatcher()
+        _route_stream(stream, dispatcher)
+        self.assertEqual([e.message_id for e in dispatcher.events], ["3EB0AA", "3EB0BB"])
+        self.assertTrue(all(e.routed_ts > 0 for e in dispatcher.events))
+
+    def test_handler_gets_event_and_latency_is_recorded(self):
+        seen = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            seen.append(event)
+            return 0
+
+        now = time.time()
+        event = InboundEvent(msisdn="+56911111111", text="hola", message_id="X1", received_ts=now - 2, routed_ts=now - 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            orig = metrics_log.METRICS_DIR
+            metrics_log.METRICS_DIR = Path(tmp) / "metrics"
+            try:
+                dispatcher = InProcessDispatcher(workers=1, handler=handler, grace_seconds=0)
+                dispatcher.submit_event(event)
+                dispatcher.close(wait=True)
+                events = list(metrics_log.iter_events())
+            finally:
+                metrics_log.METRICS_DIR = orig
+
+        self.assertIs(seen[0], event)
+        self.assertGreaterEqual(dispatcher.stats()["latency_p50_ms"], 2000)
+        latency = [e for e in events if e["kind"] == "inbound_latency"]
+        self.assertEqual(len(latency), 1)
+        self.assertEqual(latency[0]["message_id"], "X1")
+        self.assertGreaterEqual(latency[0]["gateway_to_router_ms"], 1000)
+
+
+class BatchModeTests(unittest.TestCase):
+    def test_batch_routes_sends_to_sink_and_reports_throughput(self):
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            whatsapp_listener.send_whatsapp_text(msisdn, f"eco {text}")
+            return 0
+
+        lines = ["ruido\n"] + [
+            f'[whatsapp] inbound message from +5691111111{i % 3}: "mensaje {i}"\n' for i in range(9)
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "openclaw.log"
+            log.write_text("".join(lines), encoding="utf-8")
+            sink = Path(tmp) / "outbox.jsonl"
+            summary = run_batch(log, sink_path=sink, workers=3, handler=handler)
+            sent = sink.read_text(encoding="utf-8").splitlines()
+
+        self.assertEqual(summary["lines"], 10)
+        self.assertEqual(summary["inbound"], 9)
+        self.assertEqual(summary["processed"], 9)
+        self.assertEqual(summary["outbound"], 9)
+        self.assertEqual(len(sent), 9)
+        self.assertGreater(summary["msgs_per_sec"], 0)
+        self.assertIn("service_p95_ms", summary)
+        # El sink se desactiva al terminar: el listener vuelve a openclaw.
+        self.assertIsNone(whatsapp_listener._OUTBOUND_SINK)
+
+    def test_backfill_judges_owner_presence_in_log_time(self):
+        def line(msisdn, body, ts, message_id):
+            data = {"from": msisdn, "body": body, "timestamp": int(ts * 1000), "id": message_id}
+            return json.dumps({"0": '{"module":"web-inbound"}', "1": data, "2": "inbound message"}) + "\n"
+
+        owner = whatsapp_listener.OWNER_MSISDN
+        t0 = time.time() - 3 * 86400
+        lines = [
+            # El gate de este contacto vence antes de que el owner escriba: se auto-responde.
+            line("+56911111111", "hola, quiero agendar una reunión", t0, "a"),
+            line(owner, "vuelvo en un rato", t0 + 120, "b"),
+            # Este llega con el owner recién activo: no se auto-responde.
+            line("+56922222222", "hola, quiero agendar una reunión", t0 + 125, "c"),
+        ]
+        live_presence = whatsapp_listener.PRESENCE_PATH
+        before = live_presence.read_bytes() if live_presence.exists() else None
+        with tempfile.TemporaryDirectory() as tmp:
+            log = Path(tmp) / "openclaw.log"
+            log.write_text("".join(lines), encoding="utf-8")
+            data_dir = Path(tmp) / "data"
+            # Un worker: el gate del tercero corre después de la línea del owner.
+            summary = run_batch(log, sink_path=Path(tmp) / "outbox.jsonl", workers=1, data_dir=data_dir)
+            targets = [json.loads(raw)["target"] for raw in (Path(tmp) / "outbox.jsonl").read_text().splitlines()]
+            presence = json.loads((data_dir / "owner_presence.json").read_text(encoding="utf-8"))
+
+        self.assertEqual(summary["processed"], 5)
+        self.assertEqual(targets, ["+56911111111"])
+        self.assertEqual(presence["last_owner_activity_ts"], int(t0 + 120))
+        # El estado vivo no se toca.
+        self.assertEqual(whatsapp_listener.PRESENCE_PATH, live_presence)
+        self.assertEqual(live_presence.read_bytes() if live_presence.exists() else None, before)
+
+
+class LoadSheddingTests(unittest.TestCase):
+    OWNER = "+56954764325"
+    VIP = "+56975551112"
+
+    def test_backlog_full_sheds_general_others_first_never_owner_or_vip(self):
+        release = threading.Event()
+        handled = []
+        shed = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            if text == "bloquea":
+                release.wait(2)
+            handled.append((msisdn, text))
+            return 0
+
+        dispatcher = InProcessDispatcher(
+            workers=1,
+            handler=handler,
+            grace_seconds=0,
+            max_backlog=2,
+            on_shed=lambda job, reason: shed.append((job.msisdn, job.text, reason)),
+        )
+        dispatcher.submit("+19990000000", "bloquea")
+        deadline = time.time() + 2
+        while dispatcher.stats()["running"] == 0 and time.time() < deadline:
+            time.sleep(0.005)
+
+        dispatcher.submit("+19990000001", "hola")  # other/general
+        dispatcher.submit("+19990000002", "tengo un error")  # other/support
+        dispatcher.submit(self.VIP, "urgencia")  # desplaza a "hola"
+        dispatcher.submit(self.OWNER, "/status")  # desplaza a "tengo un error"
+        dispatcher.submit("+19990000003", "buenas")  # entrante general: se descarta
+        dispatcher.submit(self.VIP, "detalle")  # solo owner/VIP en cola: se acepta igual
+        self.assertEqual(dispatcher.stats()["backlog"], 3)
+
+        release.set()
+        dispatcher.close(wait=True)
+
+        self.assertEqual(
+            shed,
+            [
+                ("+19990000001", "hola", "backlog_full"),
+                ("+19990000002", "tengo un error", "backlog_full"),
+                ("+19990000003", "buenas", "backlog_full"),
+            ],
+        )
+        self.assertIn((self.OWNER, "/status"), handled)
+        self.assertEqual([t for m, t in handled if m == self.VIP], ["urgencia", "detalle"])
+        self.assertEqual(dispatcher.stats()["shed"], 3)
+
+    def test_deferred_gate_reruns_are_never_shed(self):
+        release = threading.Event()
+        handled = []
+        shed = []
+
+        def handler(msisdn, text, deferred_auto, trigger_ts, gate_scheduler, event=None):
+            if text == "bloquea":
+                release.wait(2)
+            handled.append((msisdn, text, deferred_auto))
+            return 0
+
+        dispatcher = InProcessDispatcher(
+            workers=1,
+            handler=handler,
+            grace_seconds=0,
+            max_backlog=1,
+            on_shed=lambda job, reason: shed.append((job.msisdn, job.text)),
+        )
+        dispatcher.submit("+19990000000", "bloquea")
+        deadline = time.time() + 2
+        while dispatcher.stats()["running"] == 0 and time.time() < deadline:
+            time.sleep(0.005)
+
+        # Gates de "other"/general: llenan el backlog pero no se descartan.
+        dispatcher.enqueue(DispatchJob("+19990000001", "hola", deferred_auto=True, trigger_ts=1))
+        dispatcher.submit("+19990000002", "hola")
+        dispatcher.enqueue(DispatchJob("+19990000003", "hola", deferred_auto=True, trigger_ts=1))
+        release.set()
+        dispatcher.close(wait=True)
+
+        self.assertEqual(shed, [("+19990000002", "hola")])
+        self.assertEqual([m for m, _, deferred in handled if deferred], ["+19990000001", "+19990000003"])
+
+    def test_shed_recorder_writes_one_metric_per_message(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            orig = metrics_log.METRICS_DIR
+            metrics_log.METRICS_DIR = Path(tmp) / "metrics"
+            delays = DelayScheduler()
+            try:
+                recorder = ShedRecorder(delays, flush_after_sec=60)
+                for text in ("a", "b"):
+                    job = DispatchJob(msisdn="+19990000001", text=text)
+                    job.classify()
+                    recorder(job, "backlog_full")
+                recorder.flush()
+                events = list(metrics_log.iter_events())
+            finally:
+                delays.close(wait=False)
+                metrics_log.METRICS_DIR = orig
+        self.assertEqual([e["kind"] for e in events], ["inbound_shed", "inbound_shed"])
+        self.assertEqual(events[0]["intent"], "general")
+
+
 if __name__ == "__main__":
     unittest.main()
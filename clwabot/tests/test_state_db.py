@@ -0,0 +1,89 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import metrics_log, state_store
+from clwabot.core.persist import dumps
+from clwabot.core.state_db import close_state_db, open_state_db
+
+
+class SqliteStateStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name)
+        self.json_path = base / "state.json"
+        self.db_path = base / "state.sqlite3"
+        self.patches = [
+            mock.patch.object(state_store, "STATE_BACKEND", "sqlite"),
+            mock.patch.object(state_store, "STATE_PATH", self.json_path),
+            mock.patch.object(state_store, "STATE_DB_PATH", self.db_path),
+            mock.patch.object(metrics_log, "METRICS_DIR", base / "metrics"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        close_state_db(self.db_path)
+        self.tmp.cleanup()
+
+    def _seed_json(self, contacts=3, events=4):
+        state = state_store.default_state()
+        for i in range(contacts):
+            msisdn = f"+5690000000{i}"
+            state_store.append_contact_message(state, msisdn, f"hola {i}")
+            state["contacts"][msisdn]["tags"] = ["cliente"]
+        state["assistant"]["mode"] = "busy"
+        # state.json de antes del log de métricas, con los eventos adentro.
+        state["metrics"]["events"] = [{"at": f"2026-02-2{i}T12:00:00+00:00", "kind": "inbound"} for i in range(events)]
+        self.json_path.write_bytes(dumps(state))
+        return state
+
+    def test_migrates_json_once_and_keeps_the_api(self):
+        seeded = self._seed_json()
+        state = state_store.load_state()
+        self.assertEqual(state["assistant"]["mode"], "busy")
+        self.assertEqual(sorted(state["contacts"]), sorted(seeded["contacts"]))
+        self.assertEqual(state["contacts"]["+56900000001"], seeded["contacts"]["+56900000001"])
+        self.assertEqual(state["metrics"]["events"], [])
+        self.assertEqual(list(metrics_log.iter_events()), seeded["metrics"]["events"])
+
+        state_store.append_contact_message(state, "+56900000001", "segundo")
+        state_store.set_contact_intent(state, "+56900000001", "meeting")
+        state_store.add_metric_event(state, {"kind": "inbound", "msisdn": "+56900000001"})
+        state_store.save_state(state)
+
+        # El JSON ya no se vuelve a importar aunque cambie.
+        self.json_path.write_text(json.dumps(state_store.default_state()), encoding="utf-8")
+        again = state_store.load_state()
+        contact = again["contacts"]["+56900000001"]
+        self.assertEqual([m["text"] for m in contact["last_messages"]], ["hola 1", "segundo"])
+        self.assertEqual(contact["last_intent"], "meeting")
+        self.assertEqual((contact["stats"]["inbound"], contact["tags"]), (2, ["cliente"]))
+        self.assertEqual(metrics_log.event_count(), 5)
+        self.assertEqual(again["assistant"]["mode"], "busy")
+
+    def test_save_writes_only_what_changed(self):
+        self._seed_json(contacts=50)
+        state = state_store.load_state()
+        state_store.append_contact_message(state, "+56900000007", "nuevo")
+        state_store.add_metric_event(state, {"kind": "inbound"})
+
+        conn = open_state_db(self.db_path)._conn
+        before = conn.total_changes
+        state_store.save_state(state)
+        # Fila del contacto + borrar su mensaje e insertar 2 + la versión; el evento va al log.
+        self.assertEqual(conn.total_changes - before, 1 + 1 + 2 + 1)
+        self.assertEqual(metrics_log.event_count(), 5)
+        self.assertEqual(len(state["contacts"]._loaded), 1)
+
+        before = conn.total_changes
+        state_store.save_state(state)
+        self.assertEqual(conn.total_changes, before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from clwabot.core.templates import TEMPLATES, TemplateRegistry
+
+
+class TemplateRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "scripts.yaml"
+        self.path.write_text(
+            "identity:\n  agent_name: bot\n  user_name: Ana\nscripts:\n  tech_help: ayuda\n",
+            encoding="utf-8",
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_identity_is_bound_at_compile_time(self):
+        registry = TemplateRegistry(self.path, check_interval=60)
+        intro = registry._current()["meeting.intro"]
+        self.assertIsNotNone(intro.static)
+        self.assertTrue(registry.render("meeting.intro").startswith("Hola 👋 Soy bot, asistente de Ana."))
+        self.assertEqual(registry.script("tech_help"), "ayuda")
+        self.assertEqual(registry.script("no_existe"), "")
+
+    def test_render_fields_and_missing_field(self):
+        registry = TemplateRegistry(self.path)
+        text = registry.render("urgencia.confirmation", kind="nota", detail="llamar {al} banco")
+        self.assertIn("- Tipo: nota\n- Detalle: llamar {al} banco\n", text)
+        with self.assertRaises(KeyError):
+            registry.render("urgencia.confirmation", kind="nota")
+
+    def test_file_change_recompiles(self):
+        registry = TemplateRegistry(self.path, check_interval=0)
+        registry.render("meeting.intro")
+        self.path.write_text(
+            "identity:\n  agent_name: otro\n"
+            "templates:\n  urgencia.retry: \"Reintento {summary} ({user_name})\"\n  meeting.summary: \"{roto\"\n",
+            encoding="utf-8",
+        )
+        # Misma marca de tiempo gruesa en algunos FS: forzamos un mtime distinto.
+        st = self.path.stat()
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+        self.assertIn("Soy otro", registry.render("meeting.intro"))
+        self.assertEqual(registry.render("urgencia.retry", summary="x"), "Reintento x (Lucas)")
+        # Una plantilla inválida en el YAML cae a la por defecto.
+        values = dict.fromkeys(["topic", "date_text", "time_text", "duration_text", "mode_text"], "?")
+        self.assertTrue(registry.render_map("meeting.summary", values).startswith("Perfecto, este es el borrador"))
+        self.assertEqual(registry.loads, 2)
+
+    def test_shared_registry_reads_repo_scripts(self):
+        self.assertTrue(TEMPLATES.script("welcome_general"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import json
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+from clwabot.core import (
+    calendar_sync,
+    ics_maker,
+    meeting_session,
+    metrics_log,
+    persist,
+    state_store,
+    urgencia_session,
+    whatsapp_agent,
+)
+from clwabot.core.unit_of_work import read_store, unit_of_work, write_store
+
+CONTACT = "+11111111111"
+
+
+class UnitOfWorkTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "store.json"
+        self.loads = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _load(self):
+        self.loads += 1
+        return json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {"n": 0}
+
+    def _write(self, doc):
+        self.path.write_text(json.dumps(doc), encoding="utf-8")
+
+    def test_reads_once_and_writes_once_at_the_end(self):
+        with unit_of_work() as uow:
+            doc = read_store(self.path, self._load)
+            doc["n"] += 1
+            write_store(self.path, doc, self._write)
+            # Anidado: se une al mismo unit of work.
+            with unit_of_work():
+                again = read_store(self.path, self._load)
+                again["n"] += 1
+                write_store(self.path, again, self._write)
+            self.assertIs(again, doc)
+            self.assertFalse(self.path.exists())
+            self.assertEqual(uow.dirty, [self.path])
+        self.assertEqual(self.loads, 1)
+        self.assertEqual((uow.reads, uow.writes), (1, 1))
+        self.assertEqual(json.loads(self.path.read_text(encoding="utf-8")), {"n": 2})
+
+    def test_exception_discards_pending_writes(self):
+        with self.assertRaises(RuntimeError):
+            with unit_of_work():
+                write_store(self.path, {"n": 99}, self._write)
+                raise RuntimeError("boom")
+        self.assertFalse(self.path.exists())
+        # Fuera de un unit of work se escribe directo.
+        write_store(self.path, {"n": 1}, self._write)
+        self.assertEqual(read_store(self.path, self._load), {"n": 1})
+
+
+class PerMessageIOTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        base = Path(self.tmp.name)
+        (base / "calendar").mkdir()
+        self.patches = [
+            mock.patch.object(state_store, "STATE_PATH", base / "state.json"),
+            mock.patch.object(meeting_session, "SESSIONS_PATH", base / "meeting_sessions.json"),
+            mock.patch.object(urgencia_session, "SESSIONS_PATH", base / "urgencia_sessions.json"),
+            mock.patch.object(calendar_sync, "QUEUE_PATH", base / "calendar_queue.json"),
+            mock.patch.object(ics_maker, "CAL_DIR", base / "calendar"),
+            mock.patch.object(metrics_log, "METRICS_DIR", base / "metrics"),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.base = base
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def _count_io(self, text):
+        reads, writes = Counter(), Counter()
+        orig_write = persist._atomic_write
+
+        def read_open(path, *args, **kwargs):
+            if Path(path).parent == self.base:
+                reads[Path(path).name] += 1
+            return open(path, *args, **kwargs)
+
+        def atomic_write(path, *args, **kwargs):
+            if path.parent == self.base:
+                writes[path.name] += 1
+            return orig_write(path, *args, **kwargs)
+
+        with mock.patch.object(persist, "open", read_open, create=True), mock.patch.object(
+            persist, "_atomic_write", atomic_write
+        ):
+            decision = whatsapp_agent.handle_incoming(CONTACT, text)
+        return decision, reads, writes
+
+    def test_each_store_is_read_and_written_at_most_once_per_message(self):
+        for text in ["quiero agendar una reunion", "Demo comercial", "lunes", "10:30", "1 hora", "videollamada", "1"]:
+            decision, reads, writes = self._count_io(text)
+            self.assertEqual(decision.policy, "reply_to_vip", text)
+            self.assertTrue(all(n == 1 for n in reads.values()), (text, reads))
+            self.assertTrue(all(n == 1 for n in writes.values()), (text, writes))
+            self.assertEqual(writes["state.json"], 1)
+        self.assertTrue(decision.vip_ics_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ import tempfile
 import unittest
 from pathlib import Path
 
-from clwabot.core import ics_maker, urgencia_handler, urgencia_session, whatsapp_agent
+from clwabot.core import ics_maker, metrics_log, state_store, urgencia_handler, urgencia_session, whatsapp_agent
 
 
 VIP = "+56975551112"
@@ -24,18 +24,24 @@ class UrgenciaFlowTests(unittest.TestCase):
             "us_sessions": urgencia_session.SESSIONS_PATH,
             "im_cal": ics_maker.CAL_DIR,
             "uh_cal": urgencia_handler.CALENDAR_DIR,
+            "ss_state": state_store.STATE_PATH,
+            "ml_metrics": metrics_log.METRICS_DIR,
         }
 
         urgencia_handler.DATA_PATH = self.urgencias_path
         urgencia_handler.CALENDAR_DIR = self.calendar_dir
         urgencia_session.SESSIONS_PATH = self.sessions_path
         ics_maker.CAL_DIR = self.calendar_dir
+        state_store.STATE_PATH = self.base / "state.json"
+        metrics_log.METRICS_DIR = self.base / "metrics"
 
     def tearDown(self):
         urgencia_handler.DATA_PATH = self._orig["uh_data"]
         urgencia_handler.CALENDAR_DIR = self._orig["uh_cal"]
         urgencia_session.SESSIONS_PATH = self._orig["us_sessions"]
         ics_maker.CAL_DIR = self._orig["im_cal"]
+        state_store.STATE_PATH = self._orig["ss_state"]
+        metrics_log.METRICS_DIR = self._orig["ml_metrics"]
         self.tmp.cleanup()
 
     def _send(self, text: str):
@@ -100,6 +106,7 @@ class UrgenciaFlowTests(unittest.TestCase):
         done = self._send("1")
         self.assertTrue(done.get("owner_retry_message"))
         self.assertGreater(int(done.get("owner_retry_delay_sec", "0")), 0)
+        self.assertEqual(done.get("severity"), "critical")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,12 @@
+import json
+import os
+import tempfile
 import unittest
+from pathlib import Path
 
+from clwabot.core import urgencia_session
 from clwabot.core.urgencia_handler import mensaje_contiene_urgencia
+from clwabot.core.urgencia_session import ActiveSessionView
 from clwabot.hooks.vip_urgency_watch import extract_vip_message, should_dispatch
 
 
@@ -39,6 +45,43 @@ class VipUrgencyWatchTests(unittest.TestCase):
         self.assertEqual(msg, "te mando detalle")
 
 
+class ActiveSessionViewTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "urgencia_sessions.json"
+        self.orig = urgencia_session.SESSIONS_PATH
+        urgencia_session.SESSIONS_PATH = self.path
+
+    def tearDown(self):
+        urgencia_session.SESSIONS_PATH = self.orig
+        self.tmp.cleanup()
+
+    def _write(self, state: str, mtime_ns: int) -> None:
+        payload = {"sessions": [{"id": "s1", "msisdn": "+56975551112", "state": state}]}
+        self.path.write_text(json.dumps(payload), encoding="utf-8")
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_reloads_only_when_file_changes(self):
+        view = ActiveSessionView()
+        self.assertFalse(view.is_active("+56975551112"))
+        self._write("esperando_opcion", 1_000_000_000)
+        for _ in range(5):
+            self.assertTrue(view.is_active("+56975551112"))
+        self.assertEqual(view.reloads, 2)
+
+        self._write("cerrada", 2_000_000_000)
+        self.assertFalse(view.is_active("+56975551112"))
+        self.assertEqual(view.reloads, 3)
+
+    def test_invalidate_forces_reload(self):
+        self._write("esperando_detalle", 1_000_000_000)
+        view = ActiveSessionView()
+        self.assertTrue(view.is_active("+56975551112"))
+        view.invalidate()
+        view.is_active("+56975551112")
+        self.assertEqual(view.reloads, 2)
+
+
 class UrgencyKeywordTests(unittest.TestCase):
     def test_detect_multiple_urgency_variants(self):
         self.assertTrue(mensaje_contiene_urgencia("esto es urgente"))